@@ -27,6 +27,12 @@ LOG = logging.getLogger(__name__)
 ROOT_HELPER_OPTS = [
     cfg.StrOpt('root_helper', default='sudo',
                help=_('Root helper application.')),
+    cfg.StrOpt('root_helper_daemon',
+               help=_('Root helper daemon application to use when '
+                      'possible. Privileged commands are then sent to a '
+                      'long-lived rootwrap daemon instead of forking '
+                      'root_helper for each of them. For example: "sudo '
+                      'neutron-rootwrap-daemon /etc/neutron/rootwrap.conf"')),
 ]
 
 AGENT_STATE_OPTS = [
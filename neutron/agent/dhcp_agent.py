@@ -26,6 +26,7 @@ from neutron.agent.common import config
 from neutron.agent.linux import dhcp
 from neutron.agent.linux import external_process
 from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib  # noqa
 from neutron.agent import rpc as agent_rpc
 from neutron.common import config as common_config
@@ -46,6 +47,15 @@ LOG = logging.getLogger(__name__)
 
 
 class DhcpAgent(manager.Manager):
+    """DHCP agent service manager.
+
+    API version history:
+        1.0 initial Version
+        1.1 - port_create_end_bulk added, to apply the ports created by a
+              bulk request with a single reload of their network.
+    """
+    RPC_API_VERSION = '1.1'
+
     OPTS = [
         cfg.IntOpt('resync_interval', default=5,
                    help=_("Interval to resync.")),
@@ -60,6 +70,15 @@ class DhcpAgent(manager.Manager):
                            "enable_isolated_metadata = True")),
         cfg.IntOpt('num_sync_threads', default=4,
                    help=_('Number of threads to use during sync process.')),
+        cfg.IntOpt('dhcp_ports_batch_size', default=100,
+                   help=_('Maximum number of networks whose DHCP ports are '
+                          'allocated in a single call during the sync '
+                          'process.')),
+        cfg.FloatOpt('reload_allocations_delay', default=0,
+                     help=_('Seconds to wait after a port event before '
+                            'reloading the DHCP allocations of its network, '
+                            'so that the events of a burst are applied with '
+                            'a single reload. 0 reloads immediately.')),
         cfg.StrOpt('metadata_proxy_socket',
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
@@ -69,6 +88,8 @@ class DhcpAgent(manager.Manager):
     def __init__(self, host=None):
         super(DhcpAgent, self).__init__(host=host)
         self.needs_resync_reasons = []
+        # ids of the networks with a delayed allocations reload pending
+        self.pending_reloads = set()
         self.conf = cfg.CONF
         self.cache = NetworkCache()
         self.root_helper = config.get_root_helper(self.conf)
@@ -167,6 +188,7 @@ class DhcpAgent(manager.Manager):
                     LOG.exception(_('Unable to sync network state on deleted '
                                     'network %s'), deleted_id)
 
+            self._allocate_dhcp_ports(active_networks)
             for network in active_networks:
                 pool.spawn(self.safe_configure_dhcp_for_network, network)
             pool.waitall()
@@ -176,6 +198,51 @@ class DhcpAgent(manager.Manager):
             self.schedule_resync(e)
             LOG.exception(_('Unable to sync network state.'))
 
+    def _needs_dhcp_port(self, network):
+        """Check whether the DHCP port of a network must be allocated.
+
+        This is the case when the network has no port for this host yet or
+        when its port lacks an address on one of the DHCP enabled subnets.
+        """
+        if not network.admin_state_up:
+            return False
+        subnet_ids = set(subnet.id for subnet in network.subnets
+                         if subnet.enable_dhcp)
+        if not subnet_ids:
+            return False
+        device_id = utils.get_dhcp_agent_device_id(network.id,
+                                                   self.conf.host)
+        for port in network.ports:
+            if getattr(port, 'device_id', None) == device_id:
+                return bool(subnet_ids - set(fixed_ip.subnet_id for fixed_ip
+                                             in port.fixed_ips))
+        return True
+
+    def _allocate_dhcp_ports(self, networks):
+        """Allocate the missing DHCP ports of many networks at once.
+
+        The allocated ports are added to the networks, so that the driver
+        finds them when it sets up the DHCP device and does not need to
+        allocate them one network at a time.
+        """
+        networks = [network for network in networks
+                    if self._needs_dhcp_port(network)]
+        batch_size = max(self.conf.dhcp_ports_batch_size, 1)
+        for i in range(0, len(networks), batch_size):
+            batch = dict((network.id, network)
+                         for network in networks[i:i + batch_size])
+            try:
+                ports = self.plugin_rpc.get_dhcp_ports(batch.keys())
+            except n_rpc.RemoteError:
+                # The ports are allocated when each network is configured.
+                LOG.debug(_('Bulk DHCP port allocation is not supported by '
+                            'the server.'))
+                return
+            for network_id, port in ports.iteritems():
+                network = batch[network_id]
+                network.ports = [p for p in network.ports
+                                 if p.id != port.id] + [port]
+
     def _periodic_resync_helper(self):
         """Resync the dhcp state at the configured interval."""
         while True:
@@ -309,11 +376,24 @@ class DhcpAgent(manager.Manager):
         network = self.cache.get_network_by_id(updated_port.network_id)
         if network:
             self.cache.put_port(updated_port)
-            self.call_driver('reload_allocations', network)
+            self.reload_allocations(network)
 
     # Use the update handler for the port create event.
     port_create_end = port_update_end
 
+    @utils.synchronized('dhcp-agent')
+    def port_create_end_bulk(self, context, payload):
+        """Handle the port.create.end notification of a bulk request."""
+        networks = {}
+        for port in payload['ports']:
+            created_port = dhcp.DictModel(port)
+            network = self.cache.get_network_by_id(created_port.network_id)
+            if network:
+                self.cache.put_port(created_port)
+                networks[network.id] = network
+        for network in networks.itervalues():
+            self.reload_allocations(network)
+
     @utils.synchronized('dhcp-agent')
     def port_delete_end(self, context, payload):
         """Handle the port.delete.end notification event."""
@@ -321,6 +401,28 @@ class DhcpAgent(manager.Manager):
         if port:
             network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
+            self.reload_allocations(network)
+
+    def reload_allocations(self, network):
+        """Reload the allocations of a network after a port event.
+
+        With a reload_allocations_delay, the reload is deferred and the
+        events received for the network in the meantime are all applied
+        by the same reload.
+        """
+        delay = self.conf.reload_allocations_delay
+        if delay <= 0:
+            self.call_driver('reload_allocations', network)
+        elif network.id not in self.pending_reloads:
+            self.pending_reloads.add(network.id)
+            eventlet.spawn_after(delay, self._delayed_reload_allocations,
+                                 network.id)
+
+    @utils.synchronized('dhcp-agent')
+    def _delayed_reload_allocations(self, network_id):
+        self.pending_reloads.discard(network_id)
+        network = self.cache.get_network_by_id(network_id)
+        if network:
             self.call_driver('reload_allocations', network)
 
     def enable_isolated_metadata_proxy(self, network):
@@ -384,6 +486,7 @@ class DhcpPluginApi(n_rpc.RpcProxy):
         1.0 - Initial version.
         1.1 - Added get_active_networks_info, create_dhcp_port,
               and update_dhcp_port methods.
+        1.4 - Added get_dhcp_ports method.
 
     """
 
@@ -422,6 +525,19 @@ class DhcpPluginApi(n_rpc.RpcProxy):
         if port:
             return dhcp.DictModel(port)
 
+    def get_dhcp_ports(self, network_ids):
+        """Make a remote process call to allocate the dhcp ports of networks.
+
+        Returns a dict mapping each network id to its dhcp port.
+        """
+        ports = self.call(self.context,
+                          self.make_msg('get_dhcp_ports',
+                                        network_ids=network_ids,
+                                        host=self.host),
+                          version='1.4')
+        return dict((network_id, dhcp.DictModel(port))
+                    for network_id, port in (ports or {}).iteritems())
+
     def create_dhcp_port(self, port):
         """Make a remote process call to create the dhcp port."""
         port = self.call(self.context,
@@ -551,7 +667,8 @@ class DhcpAgentWithStateReport(DhcpAgent):
             'configurations': {
                 'dhcp_driver': cfg.CONF.dhcp_driver,
                 'use_namespaces': cfg.CONF.use_namespaces,
-                'dhcp_lease_duration': cfg.CONF.dhcp_lease_duration},
+                'dhcp_lease_duration': cfg.CONF.dhcp_lease_duration,
+                'bulk_port_notifications': True},
             'start_flag': True,
             'agent_type': constants.AGENT_TYPE_DHCP}
         report_interval = cfg.CONF.AGENT.report_interval
@@ -599,6 +716,7 @@ def register_options():
     config.register_root_helper(cfg.CONF)
     cfg.CONF.register_opts(dhcp.OPTS)
     cfg.CONF.register_opts(interface.OPTS)
+    cfg.CONF.register_opts(ip_lib.OPTS)
 
 
 def main():
@@ -51,8 +51,13 @@ class FirewallDriver(object):
       if direction is egress:
         remote_group_id will be a list of dest_ip_prefix
       remote_group_id will also remaining membership update management
+      Note: drivers which set ipset_enabled get remote_group_id rules
+      unconverted; the members of each remote group are passed separately
+      through update_security_group_members instead
     """
 
+    ipset_enabled = False
+
     def prepare_port_filter(self, port):
         """Prepare filters for the port.
 
@@ -83,6 +88,14 @@ class FirewallDriver(object):
         """Stop filtering port."""
         raise NotImplementedError()
 
+    def update_security_group_members(self, sg_id, sg_members):
+        """Update the IP addresses which belong to a security group.
+
+        :param sg_members: dict of ethertype to list of ip addresses
+        Only called for drivers with ipset_enabled set.
+        """
+        raise NotImplementedError()
+
     def filter_defer_apply_on(self):
         """Defer application of filtering rule."""
         pass
@@ -14,6 +14,7 @@
 #
 
 import sys
+import time
 
 import datetime
 import eventlet
@@ -83,6 +84,7 @@ class L3PluginApi(n_rpc.RpcProxy):
               - get_agent_gateway_port
               Needed by the agent when operating in DVR/DVR_SNAT mode
         1.3 - Get the list of activated services
+        1.4 - Get the ids of the routers hosted by the agent
 
     """
 
@@ -99,6 +101,12 @@ class L3PluginApi(n_rpc.RpcProxy):
                          self.make_msg('sync_routers', host=self.host,
                                        router_ids=router_ids))
 
+    def get_router_ids(self, context):
+        """Make a remote process call to retrieve the hosted router ids."""
+        return self.call(context,
+                         self.make_msg('get_router_ids', host=self.host),
+                         version='1.4')
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -316,6 +324,10 @@ class RouterProcessingQueue(object):
     def add(self, update):
         self._queue.put(update)
 
+    def qsize(self):
+        """Returns the number of updates waiting to be processed."""
+        return self._queue.qsize()
+
     def each_update_to_next_router(self):
         """Grabs the next router from the queue and processes
 
@@ -395,6 +407,18 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.IntOpt('router_processing_workers', default=8,
+                   help=_("Number of routers which are processed "
+                          "concurrently. Updates to a single router are "
+                          "always processed in order.")),
+        cfg.IntOpt('sync_routers_chunk_size', default=256,
+                   help=_("Maximum number of routers fetched in a single "
+                          "call during a full resync. Set to 0 to fetch all "
+                          "the routers at once.")),
+        cfg.BoolOpt('router_ip_batch', default=False,
+                    help=_("Apply the link, address, route and neighbour "
+                           "changes of a router update with a single ip "
+                           "-batch, along with its iptables rules.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -437,6 +461,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.fip_priorities = set(range(FIP_PR_START, FIP_PR_END))
 
         self._queue = RouterProcessingQueue()
+        # router id -> seconds spent on the last update of the router
+        self.router_processing_times = {}
         super(L3NATAgent, self).__init__(conf=self.conf)
 
         self.target_ex_net_id = None
@@ -706,6 +732,19 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         return [ip_dev.name for ip_dev in ip_devs]
 
     def process_router(self, ri):
+        if not self.conf.router_ip_batch:
+            self._process_router(ri)
+            return
+        # The ip commands are only run when a later command needs them, which
+        # is mostly when the update is over
+        with ip_lib.IpBatch(self.root_helper, ri.ns_name):
+            try:
+                self._process_router(ri)
+            finally:
+                if ri.iptables_manager.iptables_apply_deferred:
+                    ri.iptables_manager.defer_apply_off()
+
+    def _process_router(self, ri):
         # TODO(mrsmith) - we shouldn't need to check here
         if 'distributed' not in ri.router:
             ri.router['distributed'] = False
@@ -934,6 +973,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                                  namespace=ri.ns_name)
         existing_cidrs = set([addr['cidr'] for addr in device.addr.list()])
         new_cidrs = set()
+        garp_ips = []
 
         # Loop once to ensure that floating ips are configured.
         for fip in floating_ips:
@@ -960,13 +1000,16 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                     # and ri.namespace to handle DVR based FIP
                     self.floating_ip_added_dist(ri, fip)
                 else:
-                    # As GARP is processed in a distinct thread the call below
-                    # won't raise an exception to be handled.
-                    self._send_gratuitous_arp_packet(
-                        ri.ns_name, interface_name, fip_ip)
+                    garp_ips.append(fip_ip)
             fip_statuses[fip['id']] = (
                 l3_constants.FLOATINGIP_STATUS_ACTIVE)
 
+        for fip_ip in garp_ips:
+            # As GARP is processed in a distinct thread the call below
+            # won't raise an exception to be handled.
+            self._send_gratuitous_arp_packet(ri.ns_name, interface_name,
+                                             fip_ip)
+
         # Clean up addresses that no longer belong on the gateway interface.
         for ip_cidr in existing_cidrs - new_cidrs:
             if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX):
@@ -1003,6 +1046,11 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     def _send_gratuitous_arp_packet(self, ns_name, interface_name, ip_address,
                                     distributed=False):
         if self.conf.send_arp_for_ha > 0:
+            # The address must be configured before it is announced, and the
+            # ip batch of the namespace is not seen by the arping thread
+            batch = ip_lib.IpBatch.get(ns_name)
+            if batch:
+                batch.flush()
             eventlet.spawn_n(self._arping, ns_name, interface_name, ip_address,
                              distributed)
 
@@ -1562,7 +1610,10 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
     def _process_router_update(self):
         for rp, update in self._queue.each_update_to_next_router():
-            LOG.debug("Starting router update for %s", update.id)
+            LOG.debug("Starting router update for %(id)s, %(depth)d "
+                      "updates queued",
+                      {'id': update.id, 'depth': self._queue.qsize()})
+            start = time.time()
             router = update.router
             if update.action != DELETE_ROUTER and not router:
                 try:
@@ -1580,15 +1631,27 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
             if not router:
                 self._router_removed(update.id)
+                self.router_processing_times.pop(update.id, None)
                 continue
 
             self._process_routers([router])
-            LOG.debug("Finished a router update for %s", update.id)
+            elapsed = time.time() - start
+            self.router_processing_times[update.id] = elapsed
+            LOG.debug("Finished a router update for %(id)s in %(time).3fs",
+                      {'id': update.id, 'time': elapsed})
             rp.fetched_and_processed(update.timestamp)
 
+    def get_router_processing_stats(self):
+        """Returns the queue depth and router processing times."""
+        times = self.router_processing_times.values()
+        return {'queue_depth': self._queue.qsize(),
+                'router_processing_time_avg':
+                sum(times) / len(times) if times else 0.0,
+                'router_processing_time_max': max(times) if times else 0.0}
+
     def _process_routers_loop(self):
         LOG.debug("Starting _process_routers_loop")
-        pool = eventlet.GreenPool(size=8)
+        pool = eventlet.GreenPool(size=self.conf.router_processing_workers)
         while True:
             pool.spawn_n(self._process_router_update)
 
@@ -1626,16 +1689,16 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self.updated_routers.clear()
             self.removed_routers.clear()
             timestamp = timeutils.utcnow()
-            routers = self.plugin_rpc.get_routers(
-                context, router_ids)
-
-            LOG.debug(_('Processing :%r'), routers)
-            for r in routers:
-                update = RouterUpdate(r['id'],
-                                      PRIORITY_SYNC_ROUTERS_TASK,
-                                      router=r,
-                                      timestamp=timestamp)
-                self._queue.add(update)
+            routers = []
+            for chunk in self._fetch_sync_routers(context, router_ids):
+                LOG.debug(_('Processing :%r'), chunk)
+                for r in chunk:
+                    update = RouterUpdate(r['id'],
+                                          PRIORITY_SYNC_ROUTERS_TASK,
+                                          router=r,
+                                          timestamp=timestamp)
+                    self._queue.add(update)
+                routers.extend(chunk)
             self.fullsync = False
             LOG.debug(_("_sync_routers_task successfully completed"))
         except n_rpc.RPCException:
@@ -1663,6 +1726,30 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 ids_to_keep = curr_router_ids | prev_router_ids
                 self._cleanup_namespaces(namespaces, ids_to_keep)
 
+    def _fetch_sync_routers(self, context, router_ids):
+        """Yields the routers to sync in chunks.
+
+        When all the routers hosted by the agent are needed, their ids
+        are fetched first and the routers themselves are then fetched
+        sync_routers_chunk_size at a time, so that no single reply has to
+        carry every router.  Routers of a chunk are queued for processing
+        as soon as it arrives.
+        """
+        chunk_size = self.conf.sync_routers_chunk_size
+        if router_ids is not None or chunk_size <= 0:
+            yield self.plugin_rpc.get_routers(context, router_ids)
+            return
+        try:
+            router_ids = self.plugin_rpc.get_router_ids(context)
+        except n_rpc.RemoteError:
+            LOG.warn(_("Server does not support fetching router ids, "
+                       "fetching all routers at once"))
+            yield self.plugin_rpc.get_routers(context)
+            return
+        for i in range(0, len(router_ids), chunk_size):
+            yield self.plugin_rpc.get_routers(
+                context, router_ids[i:i + chunk_size])
+
     def after_start(self):
         eventlet.spawn_n(self._process_routers_loop)
         LOG.info(_("L3 agent started"))
@@ -1741,6 +1828,7 @@ class L3NATAgentWithStateReport(L3NATAgent):
         configurations['ex_gw_ports'] = num_ex_gw_ports
         configurations['interfaces'] = num_interfaces
         configurations['floating_ips'] = num_floating_ips
+        configurations.update(self.get_router_processing_stats())
         try:
             self.state_rpc.report_state(self.context, self.agent_state,
                                         self.use_call)
@@ -1771,6 +1859,7 @@ def main(manager='neutron.agent.l3_agent.L3NATAgentWithStateReport'):
     config.register_root_helper(conf)
     conf.register_opts(interface.OPTS)
     conf.register_opts(external_process.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     common_config.init(sys.argv[1:])
     config.setup_logging(conf)
     server = neutron_service.Service.create(
@@ -304,6 +304,10 @@ class Dnsmasq(DhcpLocalProcess):
     NEUTRON_RELAY_SOCKET_PATH_KEY = 'NEUTRON_RELAY_SOCKET_PATH'
     MINIMUM_VERSION = 2.63
 
+    # The content of the hosts, addn_hosts and opts files as last written,
+    # by file name.  Driver instances are short lived, so this is shared.
+    _conf_file_contents = {}
+
     @classmethod
     def check_version(cls):
         ver = 0
@@ -417,6 +421,18 @@ class Dnsmasq(DhcpLocalProcess):
                                       self.network.namespace)
         ip_wrapper.netns.execute(cmd, addl_env=env)
 
+    def _remove_config_files(self):
+        super(Dnsmasq, self)._remove_config_files()
+        for kind in ('host', 'addn_hosts', 'opts'):
+            self._conf_file_contents.pop(self.get_conf_file_name(kind), None)
+
+    def _replace_conf_file(self, name, data):
+        """Write a config file, unless it already has the same content."""
+        if self._conf_file_contents.get(name) == data:
+            return
+        utils.replace_file(name, data)
+        self._conf_file_contents[name] = data
+
     def _release_lease(self, mac_address, ip):
         """Release a DHCP lease."""
         cmd = ['dhcp_release', self.interface_name, ip, mac_address]
@@ -434,11 +450,19 @@ class Dnsmasq(DhcpLocalProcess):
                         'turned off DHCP: %s'), self.network.id)
             return
 
+        conf_files = [self.get_conf_file_name(kind)
+                      for kind in ('host', 'addn_hosts', 'opts')]
+        old_contents = [self._conf_file_contents.get(name)
+                        for name in conf_files]
         self._release_unused_leases()
         self._output_hosts_file()
         self._output_addn_hosts_file()
         self._output_opts_file()
-        if self.active:
+        if old_contents == [self._conf_file_contents.get(name)
+                            for name in conf_files] and self.active:
+            LOG.debug(_('Allocations unchanged for network: %s'),
+                      self.network.id)
+        elif self.active:
             cmd = ['kill', '-HUP', self.pid]
             utils.execute(cmd, self.root_helper)
         else:
@@ -520,7 +544,7 @@ class Dnsmasq(DhcpLocalProcess):
                 buf.write('%s,%s,%s\n' %
                           (port.mac_address, name, ip_address))
 
-        utils.replace_file(filename, buf.getvalue())
+        self._replace_conf_file(filename, buf.getvalue())
         LOG.debug(_('Done building host file %s'), filename)
         return filename
 
@@ -561,7 +585,7 @@ class Dnsmasq(DhcpLocalProcess):
             # order to obtain it in PTR responses.
             buf.write('%s\t%s %s\n' % (alloc.ip_address, fqdn, hostname))
         addn_hosts = self.get_conf_file_name('addn_hosts')
-        utils.replace_file(addn_hosts, buf.getvalue())
+        self._replace_conf_file(addn_hosts, buf.getvalue())
         return addn_hosts
 
     def _output_opts_file(self):
@@ -642,7 +666,7 @@ class Dnsmasq(DhcpLocalProcess):
                                                    ','.join(ips)))
 
         name = self.get_conf_file_name('opts')
-        utils.replace_file(name, '\n'.join(options))
+        self._replace_conf_file(name, '\n'.join(options))
         return name
 
     def _make_subnet_interface_ip_map(self):
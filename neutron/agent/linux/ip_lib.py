@@ -13,17 +13,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import re
+import threading
+
 import netaddr
 from oslo.config import cfg
 
+from neutron.agent.linux import netlink
 from neutron.agent.linux import utils
 from neutron.common import exceptions
+from neutron.openstack.common import excutils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
 
 
 OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.BoolOpt('ip_lib_use_netlink',
+                default=False,
+                help=_('Manage links, addresses, routes and neighbours '
+                       'through netlink instead of running ip. The agent '
+                       'must run as root.')),
 ]
 
 
@@ -34,6 +47,101 @@ VLAN_INTERFACE_DETAIL = ['vlan protocol 802.1q',
                          'vlan protocol 802.1Q',
                          'vlan id']
 
+# The ip commands changing a namespace without output, which can be batched
+BATCH_COMMANDS = ('link', 'addr', 'route', 'neigh')
+BATCH_VERBS = ('add', 'set', 'del', 'delete', 'replace', 'append', 'change',
+               'flush')
+# The family of the addresses given to the batched commands is implied
+BATCH_OPTIONS = (4, 6, '4', '6')
+BATCH_UNSAFE_ARG = re.compile(r'[\s"\'#\\]')
+BATCH_FAILED_LINE = re.compile(r'Command failed -:(\d+)')
+
+_local = threading.local()
+
+
+class IpBatch(object):
+    """Records the ip commands changing a namespace, to run them at once.
+
+    While it is active, the link, addr, route and neigh changes made through
+    ip_lib in the namespace by the current thread are recorded, then run by a
+    single ip -batch when it exits.  Any other command run in the namespace
+    by the thread runs the recorded ones first, so that they still happen in
+    order.  A failure of a recorded command is raised when it runs.
+    """
+
+    def __init__(self, root_helper, namespace):
+        self.root_helper = root_helper
+        self.namespace = namespace
+        self.commands = []
+        self._previous = None
+
+    @staticmethod
+    def get(namespace):
+        """Return the batch of the namespace active in this thread."""
+        if namespace:
+            return getattr(_local, 'batches', {}).get(namespace)
+
+    def __enter__(self):
+        # The commands run outside of namespaces are never batched: the
+        # devices they change are also used by other commands, like ovs-vsctl
+        if self.namespace:
+            if not hasattr(_local, 'batches'):
+                _local.batches = {}
+            self._previous = _local.batches.get(self.namespace)
+            _local.batches[self.namespace] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.namespace:
+            if self._previous is None:
+                del _local.batches[self.namespace]
+            else:
+                _local.batches[self.namespace] = self._previous
+                self._previous = None
+        if exc_type is None:
+            self.flush()
+        else:
+            # The commands recorded before the failure are run all the same
+            with excutils.save_and_reraise_exception():
+                try:
+                    self.flush()
+                except RuntimeError:
+                    LOG.exception(_("Failed to run the ip commands batched "
+                                    "in namespace %s"), self.namespace)
+
+    def record(self, options, command, args, check_exit_code=True):
+        """Record a command if it can be batched, return whether it was."""
+        args = [str(arg) for arg in args]
+        if (command not in BATCH_COMMANDS or not args or
+                args[0] not in BATCH_VERBS or
+                any(option not in BATCH_OPTIONS for option in options) or
+                any(not arg or BATCH_UNSAFE_ARG.search(arg)
+                    for arg in args)):
+            return False
+        self.commands.append((' '.join([command] + args), check_exit_code))
+        return True
+
+    def flush(self):
+        """Run the recorded commands."""
+        if not self.commands:
+            return
+        commands, self.commands = self.commands, []
+        cmd = ['ip', '-force', '-batch', '-']
+        if self.namespace:
+            cmd = ['ip', 'netns', 'exec', self.namespace] + cmd
+        process_input = ''.join('%s\n' % line for line, check in commands)
+        try:
+            utils.execute(cmd, root_helper=self.root_helper,
+                          process_input=process_input)
+        except RuntimeError as e:
+            failed = [commands[int(number) - 1] for number in
+                      BATCH_FAILED_LINE.findall(str(e))
+                      if 0 < int(number) <= len(commands)]
+            # Ignore the failures of the commands run without checking
+            # their exit code, unless ip failed altogether
+            if not failed or any(check for line, check in failed):
+                raise
+
 
 class SubProcessBase(object):
     def __init__(self, root_helper=None, namespace=None):
@@ -41,10 +149,12 @@ class SubProcessBase(object):
         self.namespace = namespace
         try:
             self.force_root = cfg.CONF.ip_lib_force_root
+            self.use_netlink = cfg.CONF.ip_lib_use_netlink
         except cfg.NoSuchOptError:
-            # Only callers that need to force use of the root helper
-            # need to register the option.
+            # Only callers that need to force use of the root helper, or to
+            # use netlink, need to register the options.
             self.force_root = False
+            self.use_netlink = False
 
     def _run(self, options, command, args):
         if self.namespace:
@@ -71,6 +181,11 @@ class SubProcessBase(object):
     @classmethod
     def _execute(cls, options, command, args, root_helper=None,
                  namespace=None):
+        batch = IpBatch.get(namespace)
+        if batch:
+            if batch.record(options, command, args):
+                return ''
+            batch.flush()
         opt_list = ['-%s' % o for o in options]
         if namespace:
             ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
@@ -90,6 +205,13 @@ class IPWrapper(SubProcessBase):
         return IPDevice(name, self.root_helper, self.namespace)
 
     def get_devices(self, exclude_loopback=False):
+        if self.use_netlink:
+            with netlink.IPRoute(self.namespace) as ipr:
+                names = [link['name'] for link in ipr.get_links()]
+            return [IPDevice(name, self.root_helper, self.namespace)
+                    for name in names
+                    if not (exclude_loopback and name == LOOPBACK_DEVNAME)]
+
         retval = []
         output = self._execute(['o', 'd'], 'link', ('list',),
                                self.root_helper, self.namespace)
@@ -228,6 +350,17 @@ class IpCommandBase(object):
                                      args,
                                      kwargs.get('use_root_namespace', False))
 
+    @property
+    def _use_netlink(self):
+        return self._parent.use_netlink
+
+    def _netlink(self, method, *args, **kwargs):
+        batch = IpBatch.get(self._parent.namespace)
+        if batch:
+            batch.flush()
+        with netlink.IPRoute(self._parent.namespace) as ipr:
+            return getattr(ipr, method)(*args, **kwargs)
+
 
 class IpDeviceCommandBase(IpCommandBase):
     @property
@@ -239,16 +372,28 @@ class IpLinkCommand(IpDeviceCommandBase):
     COMMAND = 'link'
 
     def set_address(self, mac_address):
-        self._as_root('set', self.name, 'address', mac_address)
+        if self._use_netlink:
+            self._netlink('link_set', self.name, address=mac_address)
+        else:
+            self._as_root('set', self.name, 'address', mac_address)
 
     def set_mtu(self, mtu_size):
-        self._as_root('set', self.name, 'mtu', mtu_size)
+        if self._use_netlink:
+            self._netlink('link_set', self.name, mtu=mtu_size)
+        else:
+            self._as_root('set', self.name, 'mtu', mtu_size)
 
     def set_up(self):
-        self._as_root('set', self.name, 'up')
+        if self._use_netlink:
+            self._netlink('link_set', self.name, up=True)
+        else:
+            self._as_root('set', self.name, 'up')
 
     def set_down(self):
-        self._as_root('set', self.name, 'down')
+        if self._use_netlink:
+            self._netlink('link_set', self.name, up=False)
+        else:
+            self._as_root('set', self.name, 'down')
 
     def set_netns(self, namespace):
         self._as_root('set', self.name, 'netns', namespace)
@@ -290,8 +435,20 @@ class IpLinkCommand(IpDeviceCommandBase):
 
     @property
     def attributes(self):
+        if self._use_netlink:
+            return self._link_attributes(self._netlink('get_link', self.name))
         return self._parse_line(self._run('show', self.name, options='o'))
 
+    @staticmethod
+    def _link_attributes(link):
+        """Return the attributes of a link as ip shows them."""
+        retval = dict((key, link[key])
+                      for key in ('mtu', 'qdisc', 'state', 'qlen', 'alias')
+                      if link[key] is not None)
+        if link['type'] == netlink.ARPHRD_ETHER and link['address']:
+            retval['link/ether'] = link['address']
+        return retval
+
     def _parse_line(self, value):
         if not value:
             return {}
@@ -309,6 +466,9 @@ class IpAddrCommand(IpDeviceCommandBase):
     COMMAND = 'addr'
 
     def add(self, ip_version, cidr, broadcast, scope='global'):
+        if self._use_netlink:
+            self._netlink('addr_add', self.name, cidr, broadcast, scope)
+            return
         self._as_root('add',
                       cidr,
                       'brd',
@@ -320,6 +480,9 @@ class IpAddrCommand(IpDeviceCommandBase):
                       options=[ip_version])
 
     def delete(self, ip_version, cidr):
+        if self._use_netlink:
+            self._netlink('addr_del', self.name, cidr)
+            return
         self._as_root('del',
                       cidr,
                       'dev',
@@ -330,6 +493,9 @@ class IpAddrCommand(IpDeviceCommandBase):
         self._as_root('flush', self.name)
 
     def list(self, scope=None, to=None, filters=None):
+        if self._use_netlink and not filters:
+            return self._list_netlink(scope, to)
+
         if filters is None:
             filters = []
 
@@ -368,11 +534,35 @@ class IpAddrCommand(IpDeviceCommandBase):
                                dynamic=('dynamic' == parts[-1])))
         return retval
 
+    def _list_netlink(self, scope, to):
+        retval = []
+        for addr in self._netlink('get_addrs', self.name):
+            if scope and addr['scope'] != scope:
+                continue
+            if to and (netaddr.IPNetwork(addr['cidr']).ip not in
+                       netaddr.IPNetwork(to)):
+                continue
+            if addr['ip_version'] == 6:
+                broadcast = '::'
+            else:
+                broadcast = (addr['broadcast'] or
+                             str(netaddr.IPNetwork(addr['cidr']).broadcast))
+            retval.append(dict(cidr=addr['cidr'],
+                               broadcast=broadcast,
+                               scope=addr['scope'],
+                               ip_version=addr['ip_version'],
+                               dynamic=addr['dynamic']))
+        return retval
+
 
 class IpRouteCommand(IpDeviceCommandBase):
     COMMAND = 'route'
 
     def add_gateway(self, gateway, metric=None, table=None):
+        if self._use_netlink:
+            self._netlink('route_replace', self.name, gateway=gateway,
+                          metric=metric, table=table)
+            return
         args = ['replace', 'default', 'via', gateway]
         if metric:
             args += ['metric', metric]
@@ -382,6 +572,10 @@ class IpRouteCommand(IpDeviceCommandBase):
         self._as_root(*args)
 
     def delete_gateway(self, gateway=None, table=None):
+        if self._use_netlink:
+            self._netlink('route_del', self.name, gateway=gateway,
+                          table=table)
+            return
         args = ['del', 'default']
         if gateway:
             args += ['via', gateway]
@@ -401,12 +595,30 @@ class IpRouteCommand(IpDeviceCommandBase):
         return [x for x in iterate_routes()]
 
     def add_onlink_route(self, cidr):
-        self._as_root('replace', cidr, 'dev', self.name, 'scope', 'link')
+        if self._use_netlink:
+            self._netlink('route_replace', self.name, cidr=cidr,
+                          scope='link')
+        else:
+            self._as_root('replace', cidr, 'dev', self.name,
+                          'scope', 'link')
 
     def delete_onlink_route(self, cidr):
-        self._as_root('del', cidr, 'dev', self.name, 'scope', 'link')
+        if self._use_netlink:
+            self._netlink('route_del', self.name, cidr=cidr, scope='link')
+        else:
+            self._as_root('del', cidr, 'dev', self.name, 'scope', 'link')
 
     def get_gateway(self, scope=None, filters=None):
+        if self._use_netlink and not filters:
+            for route in self._netlink('get_routes', self.name):
+                if route['cidr'] == 'default' and (
+                        not scope or route['scope'] == scope):
+                    retval = dict(gateway=route['gateway'])
+                    if route['metric'] is not None:
+                        retval.update(metric=route['metric'])
+                    return retval
+            return None
+
         if filters is None:
             filters = []
 
@@ -470,12 +682,20 @@ class IpRouteCommand(IpDeviceCommandBase):
                                   'dev', device)
 
     def add_route(self, cidr, ip, table=None):
+        if self._use_netlink:
+            self._netlink('route_replace', self.name, cidr=cidr, gateway=ip,
+                          table=table)
+            return
         args = ['replace', cidr, 'via', ip, 'dev', self.name]
         if table:
             args += ['table', table]
         self._as_root(*args)
 
     def delete_route(self, cidr, ip, table=None):
+        if self._use_netlink:
+            self._netlink('route_del', self.name, cidr=cidr, gateway=ip,
+                          table=table)
+            return
         args = ['del', cidr, 'via', ip, 'dev', self.name]
         if table:
             args += ['table', table]
@@ -486,6 +706,10 @@ class IpNeighCommand(IpDeviceCommandBase):
     COMMAND = 'neigh'
 
     def add(self, ip_version, ip_address, mac_address):
+        if self._use_netlink:
+            self._netlink('neigh_replace', self.name, ip_address,
+                          mac_address)
+            return
         self._as_root('replace',
                       ip_address,
                       'lladdr',
@@ -497,6 +721,9 @@ class IpNeighCommand(IpDeviceCommandBase):
                       options=[ip_version])
 
     def delete(self, ip_version, ip_address, mac_address):
+        if self._use_netlink:
+            self._netlink('neigh_del', self.name, ip_address, mac_address)
+            return
         self._as_root('del',
                       ip_address,
                       'lladdr',
@@ -522,6 +749,12 @@ class IpNetnsCommand(IpCommandBase):
     def execute(self, cmds, addl_env={}, check_exit_code=True):
         if not self._parent.root_helper:
             raise exceptions.SudoRequired()
+        batch = IpBatch.get(self._parent.namespace)
+        if batch:
+            if (not addl_env and len(cmds) > 1 and cmds[0] == 'ip' and
+                    batch.record([], cmds[1], cmds[2:], check_exit_code)):
+                return ''
+            batch.flush()
         ns_params = []
         if self._parent.namespace:
             ns_params = ['ip', 'netns', 'exec', self._parent.namespace]
@@ -0,0 +1,119 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Implements ipset based membership sets using linux utilities."""
+
+from neutron.agent.linux import utils as linux_utils
+from neutron.common import constants
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# The kernel limits set names to 31 characters.
+IPSET_NAME_MAX_LENGTH = 31
+IPSET_TYPE = 'hash:net'
+IPSET_FAMILY = {constants.IPv4: 'inet',
+                constants.IPv6: 'inet6'}
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    One set is kept per (id, ethertype) pair. The members of every set
+    are mirrored in memory, so a membership update only sends the
+    difference to the kernel, in a single 'ipset restore' call.
+    """
+
+    def __init__(self, execute=None, root_helper=None, namespace=None):
+        if execute:
+            self.execute = execute
+        else:
+            self.execute = linux_utils.execute
+        self.root_helper = root_helper
+        self.namespace = namespace
+        # set name -> set of members currently programmed in the kernel
+        self.ipset_sets = {}
+
+    @staticmethod
+    def get_name(id, ethertype):
+        """Return the ipset name for an id/ethertype pair.
+
+        This is the name that iptables rules use to reference the set.
+        """
+        return ('%s%s' % (ethertype, id))[:IPSET_NAME_MAX_LENGTH]
+
+    def set_exists(self, id, ethertype):
+        return self.get_name(id, ethertype) in self.ipset_sets
+
+    def ensure_set(self, id, ethertype):
+        """Create an empty set unless it is already managed."""
+        if not self.set_exists(id, ethertype):
+            self.set_members(id, ethertype, [])
+
+    def set_members(self, id, ethertype, member_ips):
+        """Make the set contain exactly member_ips.
+
+        A set which is not managed yet is created (or flushed, if a set
+        with the same name is left over from a previous run) and filled.
+        Otherwise only the members which were added or removed since the
+        last call are sent to the kernel.
+        """
+        name = self.get_name(id, ethertype)
+        new_members = set(member_ips)
+        lines = []
+        if name not in self.ipset_sets:
+            lines.append('create %s %s family %s' %
+                         (name, IPSET_TYPE, IPSET_FAMILY[ethertype]))
+            lines.append('flush %s' % name)
+            to_add = new_members
+            to_del = set()
+        else:
+            old_members = self.ipset_sets[name]
+            to_add = new_members - old_members
+            to_del = old_members - new_members
+            if not to_add and not to_del:
+                return
+        lines += ['add %s %s' % (name, ip) for ip in sorted(to_add)]
+        lines += ['del %s %s' % (name, ip) for ip in sorted(to_del)]
+        LOG.debug(_("Updating ipset %(name)s: %(add)d added, "
+                    "%(del)d removed"),
+                  {'name': name, 'add': len(to_add), 'del': len(to_del)})
+        self._apply(['ipset', 'restore', '-exist'], '\n'.join(lines) + '\n')
+        self.ipset_sets[name] = new_members
+
+    def destroy(self, id, ethertype):
+        """Destroy a set once no iptables rule references it anymore."""
+        name = self.get_name(id, ethertype)
+        self.destroy_by_name(name)
+
+    def destroy_by_name(self, name):
+        if name not in self.ipset_sets:
+            return
+        try:
+            self._apply(['ipset', 'destroy', name])
+        except RuntimeError:
+            # The set stays managed so that destroying it is retried later.
+            LOG.warn(_('Failed to destroy ipset %s'), name)
+            return
+        del self.ipset_sets[name]
+
+    def get_set_names(self):
+        return set(self.ipset_sets)
+
+    def _apply(self, args, process_input=None):
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        return self.execute(args, process_input=process_input,
+                            root_helper=self.root_helper)
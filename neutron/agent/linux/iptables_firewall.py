@@ -17,6 +17,7 @@ import netaddr
 from oslo.config import cfg
 
 from neutron.agent import firewall
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_manager
 from neutron.common import constants
 from neutron.openstack.common import log as logging
@@ -30,8 +31,13 @@ SPOOF_FILTER = 'spoof-filter'
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
                      SPOOF_FILTER: 's'}
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
 LINUX_DEV_LEN = 14
 
+cfg.CONF.import_opt('enable_ipset', 'neutron.agent.securitygroups_rpc',
+                    group='SECURITYGROUP')
+
 
 class IptablesFirewallDriver(firewall.FirewallDriver):
     """Driver which enforces security groups through iptables rules."""
@@ -42,8 +48,13 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.iptables = iptables_manager.IptablesManager(
             root_helper=cfg.CONF.AGENT.root_helper,
             use_ipv6=True)
+        self.ipset_enabled = cfg.CONF.SECURITYGROUP.enable_ipset
+        self.ipset = ipset_manager.IpsetManager(
+            root_helper=cfg.CONF.AGENT.root_helper)
         # list of port which has security group
         self.filtered_ports = {}
+        # members of the remote security groups, by ethertype
+        self.sg_members = {}
         self._add_fallback_chain_v4v6()
         self._defer_apply = False
         self._pre_defer_filtered_ports = None
@@ -59,6 +70,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         # each security group has it own chains
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -70,6 +82,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports[port['device']] = port
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -81,6 +94,43 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports.pop(port['device'], None)
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
+
+    def update_security_group_members(self, sg_id, sg_members):
+        LOG.debug(_("Updating members of security group (%s)"), sg_id)
+        self.sg_members[sg_id] = sg_members
+        # Only sets which are referenced by a rule exist; the others are
+        # created with the stored members once a rule needs them.
+        for ethertype in (constants.IPv4, constants.IPv6):
+            if self.ipset.set_exists(sg_id, ethertype):
+                self.ipset.set_members(sg_id, ethertype,
+                                       sg_members.get(ethertype, []))
+
+    def _remote_group_ipset_names(self):
+        names = set()
+        for port in self.filtered_ports.values():
+            for rule in port.get('security_group_rules', []):
+                remote_group_id = rule.get('remote_group_id')
+                if remote_group_id:
+                    names.add(self.ipset.get_name(remote_group_id,
+                                                  rule['ethertype']))
+        return names
+
+    def _remove_unused_ipsets(self):
+        """Destroy the ipsets which are not referenced by any rule.
+
+        Must only be called once the iptables rules have been applied,
+        the kernel refuses to destroy a set which is still in use.
+        """
+        if not self.ipset_enabled or self._defer_apply:
+            return
+        in_use = self._remote_group_ipset_names()
+        for name in self.ipset.get_set_names() - in_use:
+            self.ipset.destroy_by_name(name)
+        for sg_id in self.sg_members.keys():
+            if not any(self.ipset.set_exists(sg_id, ethertype)
+                       for ethertype in (constants.IPv4, constants.IPv6)):
+                del self.sg_members[sg_id]
 
     def _setup_chains(self):
         """Setup ingress and egress chain for a port."""
@@ -297,6 +347,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                    rule.get('protocol'),
                                    rule.get('port_range_min'),
                                    rule.get('port_range_max'))
+            args += self._remote_group_arg(rule)
             args += ['-j RETURN']
             iptables_rules += [' '.join(args)]
 
@@ -351,6 +402,22 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             return ['-%s' % direction, ip_prefix]
         return []
 
+    def _remote_group_arg(self, rule):
+        #NOTE: with ipset enabled the server does not convert remote_group_id
+        # into a list of ip prefixes, the rule matches the group ipset instead
+        remote_group_id = rule.get('remote_group_id')
+        if (not self.ipset_enabled or not remote_group_id or
+                rule.get('source_ip_prefix') or rule.get('dest_ip_prefix')):
+            return []
+        ethertype = rule['ethertype']
+        if not self.ipset.set_exists(remote_group_id, ethertype):
+            members = self.sg_members.get(remote_group_id, {})
+            self.ipset.set_members(remote_group_id, ethertype,
+                                   members.get(ethertype, []))
+        return ['-m set --match-set',
+                self.ipset.get_name(remote_group_id, ethertype),
+                IPSET_DIRECTION[rule['direction']]]
+
     def _port_chain_name(self, port, direction):
         return iptables_manager.get_chain_name(
             '%s%s' % (CHAIN_NAME_PREFIX[direction], port['device'][3:]))
@@ -368,6 +435,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._pre_defer_filtered_ports = None
             self._setup_chains_apply(self.filtered_ports)
             self.iptables.defer_apply_off()
+            self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
@@ -19,10 +19,13 @@
 
 """Implements iptables rules using linux utilities."""
 
+import difflib
 import inspect
 import os
 import re
 
+from oslo.config import cfg
+
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
 from neutron.openstack.common import excutils
@@ -31,6 +34,15 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+iptables_opts = [
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_("Once the iptables rules have been fully applied, "
+                       "only send the wrapped chains changed since the "
+                       "last apply, through iptables-restore --noflush, "
+                       "instead of saving and restoring whole tables.")),
+]
+cfg.CONF.register_opts(iptables_opts, 'AGENT')
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -103,6 +115,8 @@ class IptablesTable(object):
         self.unwrapped_chains = set()
         self.remove_chains = set()
         self.wrap_name = binary_name[:16]
+        # (name, wrap) of the chains changed since the last apply
+        self.dirty_chains = set()
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -121,6 +135,7 @@ class IptablesTable(object):
             self.chains.add(name)
         else:
             self.unwrapped_chains.add(name)
+        self.dirty_chains.add((name, wrap))
 
     def _select_chain_set(self, wrap):
         if wrap:
@@ -159,6 +174,7 @@ class IptablesTable(object):
             return
 
         chain_set.remove(name)
+        self.dirty_chains.add((name, wrap))
 
         if not wrap:
             # non-wrapped chains and rules need to be dealt with specially,
@@ -180,6 +196,8 @@ class IptablesTable(object):
             jump_snippet = '-j %s-%s' % (self.wrap_name, name)
 
         # finally, remove rules from list that have a matching jump chain
+        self.dirty_chains.update((r.chain, r.wrap) for r in self.rules
+                                 if jump_snippet in r.rule)
         self.rules = [r for r in self.rules
                       if jump_snippet not in r.rule]
 
@@ -204,6 +222,7 @@ class IptablesTable(object):
 
         self.rules.append(IptablesRule(chain, rule, wrap, top, self.wrap_name,
                                        tag))
+        self.dirty_chains.add((chain, wrap))
 
     def _wrap_target_chain(self, s, wrap):
         if s.startswith('$'):
@@ -227,6 +246,7 @@ class IptablesTable(object):
 
             self.rules.remove(IptablesRule(chain, rule, wrap, top,
                                            self.wrap_name))
+            self.dirty_chains.add((chain, wrap))
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top,
                                                       self.wrap_name))
@@ -243,6 +263,7 @@ class IptablesTable(object):
                          if rule.chain == chain and rule.wrap == wrap]
         for rule in chained_rules:
             self.rules.remove(rule)
+        self.dirty_chains.add((chain, wrap))
 
     def clear_rules_by_tag(self, tag):
         if not tag:
@@ -250,6 +271,33 @@ class IptablesTable(object):
         rules = [rule for rule in self.rules if rule.tag == tag]
         for rule in rules:
             self.rules.remove(rule)
+            self.dirty_chains.add((rule.chain, rule.wrap))
+
+    def get_wrapped_chain_rules(self, chains=None):
+        """Return the rules of the wrapped chains, as they get applied.
+
+        Top rules come first and duplicates are dropped, keeping the last
+        occurrence, like IptablesManager._modify_rules does.
+
+        :param chains: only return these chains, all of them if None
+        """
+        if chains is None:
+            chains = self.chains
+        chain_rules = dict((name, []) for name in chains
+                           if name in self.chains)
+        rules = [r for r in self.rules
+                 if r.wrap and r.chain in chain_rules]
+        rules = ([r for r in rules if r.top] +
+                 [r for r in rules if not r.top])
+        seen = set()
+        for rule in reversed(rules):
+            if (rule.chain, rule.rule) in seen:
+                continue
+            seen.add((rule.chain, rule.rule))
+            chain_rules[rule.chain].append(rule.rule)
+        for rules in chain_rules.values():
+            rules.reverse()
+        return chain_rules
 
 
 class IptablesManager(object):
@@ -288,6 +336,10 @@ class IptablesManager(object):
         self.namespace = namespace
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
+        self.incremental_apply = cfg.CONF.AGENT.iptables_incremental_apply
+        # command -> table name -> wrapped chain name -> rules, as known to
+        # be in the kernel; only kept when incremental apply is enabled
+        self.applied_chain_rules = {}
 
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
@@ -381,51 +433,145 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        With iptables_incremental_apply, once the rules have been applied
+        this way, only the wrapped chains changed since then are sent.
+
         """
         s = [('iptables', self.ipv4)]
         if self.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            args = ['%s-save' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            all_tables = self.execute(args, root_helper=self.root_helper)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                    all_lines[start:end], table, table_name)
-
-            args = ['%s-restore' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
             try:
-                self.execute(args, process_input='\n'.join(all_lines),
-                             root_helper=self.root_helper)
-            except RuntimeError as r_error:
+                if cmd in self.applied_chain_rules:
+                    self._apply_incremental(cmd, tables)
+                else:
+                    self._apply_full(cmd, tables)
+            except Exception:
                 with excutils.save_and_reraise_exception():
-                    try:
-                        line_no = int(re.search(
-                            'iptables-restore: line ([0-9]+?) failed',
-                            str(r_error)).group(1))
-                        context = IPTABLES_ERROR_LINES_OF_CONTEXT
-                        log_start = max(0, line_no - context)
-                        log_end = line_no + context
-                    except AttributeError:
-                        # line error wasn't found, print all lines instead
-                        log_start = 0
-                        log_end = len(all_lines)
-                    log_lines = ('%7d. %s' % (idx, l)
-                                 for idx, l in enumerate(
-                                     all_lines[log_start:log_end],
-                                     log_start + 1)
-                                 )
-                    LOG.error(_("IPTablesManager.apply failed to apply the "
-                                "following set of iptables rules:\n%s"),
-                              '\n'.join(log_lines))
+                    # The kernel state is unknown, so save it again next time
+                    self.applied_chain_rules.pop(cmd, None)
+            finally:
+                for table in tables.values():
+                    table.dirty_chains.clear()
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _apply_full(self, cmd, tables):
+        args = ['%s-save' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        all_tables = self.execute(args, root_helper=self.root_helper)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                all_lines[start:end], table, table_name)
+
+        self._restore(cmd, all_lines, ['-c'])
+        if self.incremental_apply:
+            self.applied_chain_rules[cmd] = dict(
+                (table_name, table.get_wrapped_chain_rules())
+                for table_name, table in tables.iteritems())
+
+    def _apply_incremental(self, cmd, tables):
+        """Send only the wrapped chains changed since the last apply.
+
+        The kernel is known to hold the rules of the previous apply, so
+        no iptables-save is needed. Changes to unwrapped chains, which
+        other components share, still go through a full apply.
+        """
+        applied = self.applied_chain_rules[cmd]
+        for table in tables.values():
+            if any(not wrap for name, wrap in table.dirty_chains):
+                self._apply_full(cmd, tables)
+                return
+
+        all_lines = []
+        new_applied = {}
+        for table_name, table in tables.iteritems():
+            dirty = set(name for name, wrap in table.dirty_chains)
+            if not dirty:
+                continue
+            chain_rules = table.get_wrapped_chain_rules(dirty)
+            lines = self._get_incremental_table_lines(
+                applied[table_name], chain_rules, dirty)
+            if lines:
+                all_lines += ['*%s' % table_name] + lines + ['COMMIT']
+            new_applied[table_name] = (dirty, chain_rules)
+
+        if all_lines:
+            self._restore(cmd, all_lines, ['--noflush'])
+        for table_name, (dirty, chain_rules) in new_applied.iteritems():
+            for name in dirty:
+                applied[table_name].pop(name, None)
+            applied[table_name].update(chain_rules)
+
+    def _get_incremental_table_lines(self, applied, chain_rules, dirty):
+        declare_lines = []
+        rule_lines = []
+        remove_lines = []
+        for name in sorted(dirty):
+            chain = '%s-%s' % (self.wrap_name, name)
+            if name not in chain_rules:
+                if name in applied:
+                    remove_lines += ['-F %s' % chain, '-X %s' % chain]
+            elif name not in applied:
+                declare_lines.append(':%s - [0:0]' % chain)
+                rule_lines += ['-A %s %s' % (chain, rule)
+                               for rule in chain_rules[name]]
+            elif applied[name] != chain_rules[name]:
+                rule_lines += self._get_chain_diff_lines(
+                    chain, applied[name], chain_rules[name])
+        # Chains are removed last, once the jumps to them are gone
+        return declare_lines + rule_lines + remove_lines
+
+    def _get_chain_diff_lines(self, chain, old_rules, new_rules):
+        """Return the commands turning old_rules into new_rules in place.
+
+        Unchanged rules are left alone, so they keep their counters.
+        """
+        lines = []
+        matcher = difflib.SequenceMatcher(None, old_rules, new_rules,
+                                          autojunk=False)
+        # Working from the bottom of the chain up keeps the rule numbers
+        # of the following opcodes valid.
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                continue
+            lines += ['-D %s %d' % (chain, i1 + 1)] * (i2 - i1)
+            lines += ['-I %s %d %s' % (chain, i1 + 1 + offset, rule)
+                      for offset, rule in enumerate(new_rules[j1:j2])]
+        return lines
+
+    def _restore(self, cmd, all_lines, options):
+        args = ['%s-restore' % (cmd,)] + options
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        try:
+            self.execute(args, process_input='\n'.join(all_lines),
+                         root_helper=self.root_helper)
+        except RuntimeError as r_error:
+            with excutils.save_and_reraise_exception():
+                try:
+                    line_no = int(re.search(
+                        'iptables-restore: line ([0-9]+?) failed',
+                        str(r_error)).group(1))
+                    context = IPTABLES_ERROR_LINES_OF_CONTEXT
+                    log_start = max(0, line_no - context)
+                    log_end = line_no + context
+                except AttributeError:
+                    # line error wasn't found, print all lines instead
+                    log_start = 0
+                    log_end = len(all_lines)
+                log_lines = ('%7d. %s' % (idx, l)
+                             for idx, l in enumerate(
+                                 all_lines[log_start:log_end],
+                                 log_start + 1)
+                             )
+                LOG.error(_("IPTablesManager.apply failed to apply the "
+                            "following set of iptables rules:\n%s"),
+                          '\n'.join(log_lines))
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
@@ -0,0 +1,677 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Minimal rtnetlink client, managing links, addresses, routes and neighbours
+without running ip.
+
+The requests are sent on a netlink socket created in the network namespace
+they apply to, which requires the process to run as root.  LinkMonitor
+mirrors the links of a namespace from the kernel notifications instead.
+"""
+
+import binascii
+import ctypes
+import errno
+import os
+import socket
+import struct
+
+import eventlet
+from eventlet import queue
+import netaddr
+
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+NETNS_RUN_DIR = '/var/run/netns'
+CLONE_NEWNET = 0x40000000
+NETLINK_ROUTE = 0
+# Size of the requests sent in a single datagram
+SEND_SIZE = 16384
+RECV_SIZE = 65536
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+NLM_F_DUMP = 0x300
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+# Multicast group of the link notifications
+RTMGRP_LINK = 0x1
+AF_BRIDGE = 7
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_SETLINK = 19
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+
+IFF_UP = 0x1
+ARPHRD_ETHER = 1
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_QDISC = 6
+IFLA_MASTER = 10
+IFLA_TXQLEN = 13
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+IFLA_IFALIAS = 20
+IFLA_INFO_KIND = 1
+OPERSTATES = ['UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN',
+              'TESTING', 'DORMANT', 'UP']
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_BROADCAST = 4
+IFA_F_PERMANENT = 0x80
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+RT_TABLE_UNSPEC = 0
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RTN_UNICAST = 1
+SCOPES = {'global': 0, 'site': 200, 'link': 253, 'host': 254,
+          'nowhere': 255}
+SCOPE_NAMES = dict((value, name) for name, value in SCOPES.items())
+
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_PERMANENT = 0x80
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_NLMSGERR = struct.Struct('=i')
+_RTATTR = struct.Struct('=HH')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_IFADDRMSG = struct.Struct('=BBBBi')
+_RTMSG = struct.Struct('=BBBBBBBBI')
+_NDMSG = struct.Struct('=BxxxiHBB')
+_U32 = struct.Struct('=I')
+
+_libc = None
+
+
+class NetlinkError(RuntimeError):
+    """A netlink request failed.
+
+    It is a RuntimeError, as the failures of the ip commands are.
+    """
+
+    def __init__(self, code, request=None):
+        self.code = code
+        message = os.strerror(code)
+        if request:
+            message = '%s: %s' % (request, message)
+        super(NetlinkError, self).__init__(message)
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attr(attr_type, data):
+    length = _RTATTR.size + len(data)
+    return (_RTATTR.pack(length, attr_type) + data +
+            '\0' * (_align(length) - length))
+
+
+def _parse_attrs(data, offset):
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type & 0x3fff] = data[offset + _RTATTR.size:
+                                         offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _string(value):
+    if value is not None:
+        return value.rstrip('\0')
+
+
+def _u32(value):
+    if value is not None:
+        return _U32.unpack(value[:_U32.size])[0]
+
+
+def _family(address):
+    if netaddr.IPAddress(address).version == 4:
+        return socket.AF_INET
+    return socket.AF_INET6
+
+
+def _pack_ip(address):
+    return socket.inet_pton(_family(address), str(address))
+
+
+def _pack_mac(mac_address):
+    return binascii.unhexlify(str(mac_address).replace(':', ''))
+
+
+def _unpack_mac(value):
+    return ':'.join('%02x' % ord(c) for c in value)
+
+
+def _scope(scope):
+    return SCOPES.get(scope, scope)
+
+
+def _setns(fd):
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL('libc.so.6', use_errno=True)
+    if _libc.setns(fd, CLONE_NEWNET):
+        raise NetlinkError(ctypes.get_errno(), 'setns')
+
+
+def _open_fd(path):
+    try:
+        return os.open(path, os.O_RDONLY)
+    except OSError as e:
+        raise NetlinkError(e.errno, path)
+
+
+def _new_socket(groups=0):
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    sock.bind((0, groups))
+    return sock
+
+
+def open_socket(namespace=None, groups=0):
+    """Open a rtnetlink socket in a namespace.
+
+    A netlink socket remains bound to the namespace it was created in: the
+    process only enters the namespace while creating it, without yielding.
+    The socket receives the notifications of the multicast groups given.
+    """
+    if not namespace:
+        return _new_socket(groups)
+    target = _open_fd(os.path.join(NETNS_RUN_DIR, namespace))
+    try:
+        own = _open_fd('/proc/self/ns/net')
+        try:
+            _setns(target)
+            try:
+                return _new_socket(groups)
+            finally:
+                _setns(own)
+        finally:
+            os.close(own)
+    finally:
+        os.close(target)
+
+
+def _parse_messages(data):
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, pid = _NLMSGHDR.unpack_from(
+            data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        yield (msg_type, flags, seq,
+               data[offset + _NLMSGHDR.size:offset + length])
+        offset += _align(length)
+
+
+class IPRoute(object):
+    """rtnetlink requests in a network namespace.
+
+    Used as a context manager, the changes are sent together when the block
+    exits, then all of them are checked: the first failure is raised once
+    all of them are acknowledged.  Otherwise, each change is sent and
+    checked as it is requested.  Reads are always done right away.
+    """
+
+    def __init__(self, namespace=None):
+        self.namespace = namespace
+        self._sock = None
+        self._seq = 0
+        self._pending = None
+        self._indexes = {}
+
+    def __enter__(self):
+        self._pending = []
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pending, self._pending = self._pending, None
+        try:
+            if exc_type is None and pending:
+                self._transact(pending)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    @property
+    def sock(self):
+        if self._sock is None:
+            self._sock = open_socket(self.namespace)
+        return self._sock
+
+    def _request(self, msg_type, flags, body):
+        self._seq += 1
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(body), msg_type,
+                                flags | NLM_F_REQUEST, self._seq, 0)
+        return self._seq, header + body
+
+    def _recv(self):
+        return _parse_messages(self.sock.recv(RECV_SIZE))
+
+    @staticmethod
+    def _error_code(payload):
+        return -_NLMSGERR.unpack_from(payload)[0]
+
+    def _send(self, requests):
+        data = ''
+        for seq, request, description in requests:
+            if data and len(data) + len(request) > SEND_SIZE:
+                self.sock.sendall(data)
+                data = ''
+            data += request
+        self.sock.sendall(data)
+
+    def _transact(self, requests):
+        LOG.debug("Sending %(count)d netlink requests in namespace "
+                  "%(namespace)s",
+                  {'count': len(requests), 'namespace': self.namespace})
+        self._send(requests)
+        waiting = dict((seq, description)
+                       for seq, request, description in requests)
+        errors = []
+        while waiting:
+            for msg_type, flags, seq, payload in self._recv():
+                if msg_type != NLMSG_ERROR or seq not in waiting:
+                    continue
+                description = waiting.pop(seq)
+                code = self._error_code(payload)
+                if code:
+                    errors.append(NetlinkError(code, description))
+        for error in errors[1:]:
+            LOG.error(_("Netlink request failed: %s"), error)
+        if errors:
+            raise errors[0]
+
+    def _change(self, msg_type, flags, body, description):
+        seq, request = self._request(msg_type, flags | NLM_F_ACK, body)
+        change = (seq, request, description)
+        if self._pending is not None:
+            self._pending.append(change)
+        else:
+            self._transact([change])
+
+    def _read(self, msg_type, flags, body, description):
+        """Return the payloads replied to a get or dump request."""
+        seq, request = self._request(msg_type, flags, body)
+        self._send([(seq, request, description)])
+        payloads = []
+        while True:
+            for reply_type, reply_flags, reply_seq, payload in self._recv():
+                if reply_seq != seq:
+                    continue
+                if reply_type == NLMSG_DONE:
+                    return payloads
+                if reply_type == NLMSG_ERROR:
+                    code = self._error_code(payload)
+                    if code:
+                        raise NetlinkError(code, description)
+                    return payloads
+                payloads.append(payload)
+                if not reply_flags & NLM_F_MULTI:
+                    return payloads
+
+    def _index(self, ifname):
+        if ifname not in self._indexes:
+            self._indexes[ifname] = self.get_link(ifname)['index']
+        return self._indexes[ifname]
+
+    @staticmethod
+    def _parse_link(payload):
+        family, ifi_type, index, flags, change = _IFINFOMSG.unpack_from(
+            payload)
+        attrs = _parse_attrs(payload, _IFINFOMSG.size)
+        linkinfo = _parse_attrs(attrs.get(IFLA_LINKINFO, ''), 0)
+        address = attrs.get(IFLA_ADDRESS)
+        operstate = attrs.get(IFLA_OPERSTATE)
+        if operstate is not None:
+            operstate = ord(operstate[0])
+            if operstate < len(OPERSTATES):
+                operstate = OPERSTATES[operstate]
+        return {'index': index,
+                'name': _string(attrs.get(IFLA_IFNAME)),
+                'type': ifi_type,
+                'flags': flags,
+                'address': address and _unpack_mac(address),
+                'mtu': _u32(attrs.get(IFLA_MTU)),
+                'qdisc': _string(attrs.get(IFLA_QDISC)),
+                'qlen': _u32(attrs.get(IFLA_TXQLEN)),
+                'state': operstate,
+                'alias': _string(attrs.get(IFLA_IFALIAS)),
+                'master': _u32(attrs.get(IFLA_MASTER)),
+                'kind': _string(linkinfo.get(IFLA_INFO_KIND))}
+
+    def get_link(self, ifname):
+        body = (_IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+                _attr(IFLA_IFNAME, str(ifname) + '\0'))
+        payloads = self._read(RTM_GETLINK, 0, body, 'get link %s' % ifname)
+        link = self._parse_link(payloads[0])
+        self._indexes[ifname] = link['index']
+        return link
+
+    def get_links(self):
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        return [self._parse_link(payload) for payload in
+                self._read(RTM_GETLINK, NLM_F_DUMP, body, 'dump links')]
+
+    def link_set(self, ifname, up=None, mtu=None, address=None):
+        flags = change = 0
+        if up is not None:
+            change = IFF_UP
+            flags = IFF_UP if up else 0
+        body = (_IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, flags, change) +
+                _attr(IFLA_IFNAME, str(ifname) + '\0'))
+        if mtu is not None:
+            body += _attr(IFLA_MTU, _U32.pack(int(mtu)))
+        if address is not None:
+            body += _attr(IFLA_ADDRESS, _pack_mac(address))
+        self._change(RTM_SETLINK, 0, body, 'set link %s' % ifname)
+
+    def _addr_body(self, ifname, cidr, broadcast=None, scope='global'):
+        net = netaddr.IPNetwork(cidr)
+        family = _family(net.ip)
+        body = (_IFADDRMSG.pack(family, net.prefixlen, 0, _scope(scope),
+                                self._index(ifname)) +
+                _attr(IFA_LOCAL, _pack_ip(net.ip)) +
+                _attr(IFA_ADDRESS, _pack_ip(net.ip)))
+        if broadcast and family == socket.AF_INET:
+            body += _attr(IFA_BROADCAST, _pack_ip(broadcast))
+        return body
+
+    def addr_add(self, ifname, cidr, broadcast=None, scope='global'):
+        body = self._addr_body(ifname, cidr, broadcast, scope)
+        self._change(RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL, body,
+                     'add address %s to %s' % (cidr, ifname))
+
+    def addr_del(self, ifname, cidr):
+        body = self._addr_body(ifname, cidr)
+        self._change(RTM_DELADDR, 0, body,
+                     'delete address %s from %s' % (cidr, ifname))
+
+    def get_addrs(self, ifname=None, family=socket.AF_UNSPEC):
+        index = ifname and self._index(ifname)
+        addrs = []
+        for payload in self._read(RTM_GETADDR, NLM_F_DUMP,
+                                  _IFADDRMSG.pack(family, 0, 0, 0, 0),
+                                  'dump addresses'):
+            addr_family, prefixlen, flags, scope, addr_index = (
+                _IFADDRMSG.unpack_from(payload))
+            if index and addr_index != index:
+                continue
+            attrs = _parse_attrs(payload, _IFADDRMSG.size)
+            local = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+            if local is None:
+                continue
+            address = socket.inet_ntop(addr_family, local)
+            broadcast = attrs.get(IFA_BROADCAST)
+            addrs.append({
+                'index': addr_index,
+                'cidr': '%s/%d' % (address, prefixlen),
+                'broadcast': (broadcast and
+                              socket.inet_ntop(addr_family, broadcast)),
+                'scope': SCOPE_NAMES.get(scope, scope),
+                'ip_version': 4 if addr_family == socket.AF_INET else 6,
+                'dynamic': not flags & IFA_F_PERMANENT})
+        return addrs
+
+    def _route_body(self, msg_type, ifname, cidr, gateway, metric, table,
+                    scope):
+        if cidr in (None, 'default'):
+            dst = None
+            family = _family(gateway) if gateway else socket.AF_INET
+            dst_len = 0
+        else:
+            dst = netaddr.IPNetwork(cidr)
+            family = _family(dst.ip)
+            dst_len = dst.prefixlen
+        table = int(table) if table else RT_TABLE_MAIN
+        if msg_type == RTM_DELROUTE:
+            protocol = route_type = 0
+            default_scope = SCOPES['nowhere']
+        else:
+            protocol = RTPROT_BOOT
+            route_type = RTN_UNICAST
+            default_scope = SCOPES['global' if gateway else 'link']
+        if scope is None:
+            scope = default_scope
+        body = _RTMSG.pack(family, dst_len, 0, 0,
+                           table if table < 256 else RT_TABLE_UNSPEC,
+                           protocol, _scope(scope), route_type, 0)
+        if dst is not None:
+            body += _attr(RTA_DST, _pack_ip(dst.ip))
+        if gateway:
+            body += _attr(RTA_GATEWAY, _pack_ip(gateway))
+        if ifname:
+            body += _attr(RTA_OIF, _U32.pack(self._index(ifname)))
+        if metric:
+            body += _attr(RTA_PRIORITY, _U32.pack(int(metric)))
+        if table >= 256:
+            body += _attr(RTA_TABLE, _U32.pack(table))
+        return body
+
+    def route_replace(self, ifname, cidr=None, gateway=None, metric=None,
+                      table=None, scope=None):
+        body = self._route_body(RTM_NEWROUTE, ifname, cidr, gateway, metric,
+                                table, scope)
+        self._change(RTM_NEWROUTE, NLM_F_CREATE | NLM_F_REPLACE, body,
+                     'replace route %s via %s dev %s' %
+                     (cidr or 'default', gateway, ifname))
+
+    def route_del(self, ifname, cidr=None, gateway=None, table=None,
+                  scope=None):
+        body = self._route_body(RTM_DELROUTE, ifname, cidr, gateway, None,
+                                table, scope)
+        self._change(RTM_DELROUTE, 0, body,
+                     'delete route %s via %s dev %s' %
+                     (cidr or 'default', gateway, ifname))
+
+    def get_routes(self, ifname=None, family=socket.AF_INET,
+                   table=RT_TABLE_MAIN):
+        index = ifname and self._index(ifname)
+        routes = []
+        for payload in self._read(RTM_GETROUTE, NLM_F_DUMP,
+                                  _RTMSG.pack(family, 0, 0, 0, 0, 0, 0, 0, 0),
+                                  'dump routes'):
+            (route_family, dst_len, src_len, tos, route_table, protocol,
+             scope, route_type, flags) = _RTMSG.unpack_from(payload)
+            attrs = _parse_attrs(payload, _RTMSG.size)
+            route_table = _u32(attrs.get(RTA_TABLE)) or route_table
+            oif = _u32(attrs.get(RTA_OIF))
+            if (table and route_table != table) or (index and oif != index):
+                continue
+            dst = attrs.get(RTA_DST)
+            gateway = attrs.get(RTA_GATEWAY)
+            routes.append({
+                'cidr': ('%s/%d' % (socket.inet_ntop(route_family, dst),
+                                    dst_len)
+                         if dst is not None else 'default'),
+                'gateway': (gateway and
+                            socket.inet_ntop(route_family, gateway)),
+                'oif': oif,
+                'metric': _u32(attrs.get(RTA_PRIORITY)),
+                'table': route_table,
+                'protocol': protocol,
+                'scope': SCOPE_NAMES.get(scope, scope)})
+        return routes
+
+    def _neigh_body(self, ifname, ip_address, mac_address, state):
+        body = (_NDMSG.pack(_family(ip_address), self._index(ifname),
+                            state, 0, 0) +
+                _attr(NDA_DST, _pack_ip(ip_address)))
+        if mac_address:
+            body += _attr(NDA_LLADDR, _pack_mac(mac_address))
+        return body
+
+    def neigh_replace(self, ifname, ip_address, mac_address):
+        body = self._neigh_body(ifname, ip_address, mac_address,
+                                NUD_PERMANENT)
+        self._change(RTM_NEWNEIGH, NLM_F_CREATE | NLM_F_REPLACE, body,
+                     'replace neighbour %s dev %s' % (ip_address, ifname))
+
+    def neigh_del(self, ifname, ip_address, mac_address=None):
+        body = self._neigh_body(ifname, ip_address, mac_address, 0)
+        self._change(RTM_DELNEIGH, 0, body,
+                     'delete neighbour %s dev %s' % (ip_address, ifname))
+
+
+class LinkMonitor(object):
+    """Mirrors the links of a namespace.
+
+    The links are dumped once, then kept up to date by a greenthread reading
+    the RTM_NEWLINK and RTM_DELLINK notifications, so that the devices and
+    the ports of the bridges can be looked up without running ip or reading
+    sysfs.  Subscribing to the notifications does not require root.
+    """
+
+    def __init__(self, namespace=None):
+        self.namespace = namespace
+        # Links by name and by index
+        self.links = {}
+        self._indexes = {}
+        self._sock = None
+        self._thread = None
+        self._updated = False
+        self._waiter = queue.LightQueue()
+
+    @property
+    def is_active(self):
+        return self._thread is not None
+
+    def start(self):
+        # Subscribe before dumping, the changes racing with the dump are
+        # then applied after it.
+        self._sock = open_socket(self.namespace, RTMGRP_LINK)
+        self._reload()
+        self._thread = eventlet.spawn(self._run)
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.kill()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _reload(self):
+        ipr = IPRoute(self.namespace)
+        try:
+            links = ipr.get_links()
+        finally:
+            ipr.close()
+        self.links = dict((link['name'], link) for link in links)
+        self._indexes = dict((link['index'], link) for link in links)
+        self._notify()
+
+    def _notify(self):
+        self._updated = True
+        if self._waiter.empty():
+            self._waiter.put(None)
+
+    def _run(self):
+        while True:
+            try:
+                data = self._sock.recv(RECV_SIZE)
+                if data:
+                    self.process_events(data)
+            except socket.error as e:
+                if e.errno != errno.ENOBUFS:
+                    LOG.exception(_("Stopping the link monitor"))
+                    break
+                # The kernel dropped notifications which did not fit in the
+                # receive buffer.
+                LOG.warning(_("Link notifications were lost, dumping the "
+                              "links"))
+                try:
+                    self._reload()
+                except Exception:
+                    LOG.exception(_("Stopping the link monitor"))
+                    break
+        self._thread = None
+
+    def process_events(self, data):
+        """Apply the link notifications received."""
+        for msg_type, flags, seq, payload in _parse_messages(data):
+            if msg_type not in (RTM_NEWLINK, RTM_DELLINK):
+                continue
+            # The bridges also notify the changes of their ports in
+            # AF_BRIDGE messages, which do not describe the link itself.
+            if _IFINFOMSG.unpack_from(payload)[0] == AF_BRIDGE:
+                continue
+            link = IPRoute._parse_link(payload)
+            old = self._indexes.pop(link['index'], None)
+            if old is not None:
+                self.links.pop(old['name'], None)
+            if msg_type == RTM_NEWLINK:
+                self.links[link['name']] = link
+                self._indexes[link['index']] = link
+            self._notify()
+
+    def process_updates(self):
+        """Return whether the links changed since the previous call."""
+        updated, self._updated = self._updated, False
+        return updated
+
+    def wait(self, timeout):
+        """Wait at most timeout seconds for the links to change."""
+        try:
+            self._waiter.get(timeout=timeout)
+        except queue.Empty:
+            pass
+
+    def get_master(self, ifname):
+        """Return the link the link is enslaved to, if any."""
+        link = self.links.get(ifname)
+        if link and link['master']:
+            return self._indexes.get(link['master'])
+
+    def get_slaves(self, ifname):
+        """Return the names of the links enslaved to a link."""
+        link = self.links.get(ifname)
+        if not link:
+            return []
+        return [name for name, slave in self.links.items()
+                if slave['master'] == link['index']]
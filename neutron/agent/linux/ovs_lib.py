@@ -16,9 +16,11 @@
 import itertools
 import operator
 
+import eventlet
 from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import ovsdb_jsonrpc
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 from neutron.openstack.common import excutils
@@ -34,11 +36,29 @@ OPTS = [
     cfg.IntOpt('ovs_vsctl_timeout',
                default=DEFAULT_OVS_VSCTL_TIMEOUT,
                help=_('Timeout in seconds for ovs-vsctl commands')),
+    cfg.StrOpt('ovsdb_interface', default='vsctl',
+               choices=['vsctl', 'native'],
+               help=_('The interface used to access the OVS database. '
+                      'vsctl runs ovs-vsctl for every operation, native '
+                      'keeps a JSON-RPC connection to ovsdb-server open')),
+    cfg.StrOpt('ovsdb_connection',
+               default='unix:/var/run/openvswitch/db.sock',
+               help=_('The connection string of ovsdb-server, either '
+                      'unix:<path> or tcp:<ip>:<port>, used by the native '
+                      'ovsdb_interface. The unix socket must be accessible '
+                      'to the user the agent runs as')),
 ]
 cfg.CONF.register_opts(OPTS)
 
 LOG = logging.getLogger(__name__)
 
+# Tables whose records are looked up by name, as ovs-vsctl does.
+NATIVE_TABLES = {'bridge': 'Bridge',
+                 'port': 'Port',
+                 'interface': 'Interface'}
+# Interval between checks for the ofport of a port added natively.
+OFPORT_POLL_INTERVAL = 0.1
+
 
 class VifPort:
     def __init__(self, port_name, ofport, vif_id, vif_mac, switch):
@@ -60,6 +80,10 @@ class BaseOVS(object):
     def __init__(self, root_helper):
         self.root_helper = root_helper
         self.vsctl_timeout = cfg.CONF.ovs_vsctl_timeout
+        self.ovsdb = None
+        if cfg.CONF.ovsdb_interface == 'native':
+            self.ovsdb = ovsdb_jsonrpc.get_connection(
+                cfg.CONF.ovsdb_connection, self.vsctl_timeout)
 
     def run_vsctl(self, args, check_error=False):
         full_args = ["ovs-vsctl", "--timeout=%d" % self.vsctl_timeout] + args
@@ -73,6 +97,22 @@ class BaseOVS(object):
                 if not check_error:
                     ctxt.reraise = False
 
+    def run_ovsdb(self, ops, check_error=False):
+        try:
+            return self.ovsdb.transact(ops)
+        except ovsdb_jsonrpc.OvsdbError as e:
+            with excutils.save_and_reraise_exception() as ctxt:
+                LOG.error(_("Unable to run OVSDB transaction %(ops)s. "
+                            "Exception: %(exception)s"),
+                          {'ops': ops, 'exception': e})
+                if not check_error:
+                    ctxt.reraise = False
+
+    def _native_table(self, table):
+        """Return the OVSDB table name if it can be accessed natively."""
+        if self.ovsdb:
+            return NATIVE_TABLES.get(table.lower())
+
     def add_bridge(self, bridge_name):
         self.run_vsctl(["--", "--may-exist", "add-br", bridge_name])
         return OVSBridge(bridge_name, self.root_helper)
@@ -143,19 +183,130 @@ class OVSBridge(BaseOVS):
         self.create()
 
     def add_port(self, port_name):
+        if self.ovsdb:
+            return self._native_add_port(port_name)
         self.run_vsctl(["--", "--may-exist", "add-port", self.br_name,
                         port_name])
         return self.get_port_ofport(port_name)
 
     def delete_port(self, port_name):
+        if self.ovsdb:
+            return self._native_delete_port(port_name)
         self.run_vsctl(["--", "--if-exists", "del-port", self.br_name,
                         port_name])
 
+    def _native_add_port(self, port_name, iface_type=None, options=None):
+        """Add a port in a single transaction, like add-port --may-exist.
+
+        The interface type and options of an existing port are updated.
+        """
+        iface = {}
+        if iface_type:
+            iface['type'] = iface_type
+        if options:
+            iface['options'] = ['map', [[k, v] for k, v in
+                                        sorted(options.items())]]
+        where = [['name', '==', port_name]]
+        result = self.run_ovsdb([{'op': 'select', 'table': 'Port',
+                                  'where': where, 'columns': ['_uuid']}])
+        if result is None:
+            return constants.INVALID_OFPORT
+        if result[0]['rows']:
+            ops = []
+            if iface:
+                ops.append({'op': 'update', 'table': 'Interface',
+                            'where': where, 'row': iface})
+        else:
+            iface['name'] = port_name
+            ops = [
+                # Fails the transaction if the port was added meanwhile.
+                {'op': 'wait', 'table': 'Port', 'where': where,
+                 'columns': ['name'], 'until': '==', 'rows': [],
+                 'timeout': 0},
+                {'op': 'insert', 'table': 'Interface', 'row': iface,
+                 'uuid-name': 'iface'},
+                {'op': 'insert', 'table': 'Port',
+                 'row': {'name': port_name,
+                         'interfaces': ['named-uuid', 'iface']},
+                 'uuid-name': 'port'},
+                {'op': 'mutate', 'table': 'Bridge',
+                 'where': [['name', '==', self.br_name]],
+                 'mutations': [['ports', 'insert',
+                                ['set', [['named-uuid', 'port']]]]]}]
+        if ops:
+            result = self.run_ovsdb(ops)
+            if result is None:
+                return constants.INVALID_OFPORT
+            if ops[-1]['op'] == 'mutate' and not result[-1]['count']:
+                LOG.error(_("Unable to add port %(port)s: bridge %(br)s "
+                            "does not exist"),
+                          {'port': port_name, 'br': self.br_name})
+                return constants.INVALID_OFPORT
+        return self._native_wait_for_ofport(port_name)
+
+    def _native_wait_for_ofport(self, port_name):
+        # ovs-vsctl waits for ovs-vswitchd to apply the change, which
+        # assigns the ofport of new interfaces.
+        with eventlet.Timeout(self.vsctl_timeout, False):
+            while True:
+                ofport = self.get_port_ofport(port_name)
+                if ofport != constants.INVALID_OFPORT:
+                    return ofport
+                eventlet.sleep(OFPORT_POLL_INTERVAL)
+        return constants.INVALID_OFPORT
+
+    def _native_delete_port(self, port_name):
+        result = self.run_ovsdb([{'op': 'select', 'table': 'Port',
+                                  'where': [['name', '==', port_name]],
+                                  'columns': ['_uuid']}])
+        if not result or not result[0]['rows']:
+            return
+        port_uuid = result[0]['rows'][0]['_uuid']
+        # Unreferenced ports and interfaces are garbage collected.
+        self.run_ovsdb([{'op': 'mutate', 'table': 'Bridge',
+                         'where': [['name', '==', self.br_name]],
+                         'mutations': [['ports', 'delete',
+                                        ['set', [port_uuid]]]]}])
+
     def set_db_attribute(self, table_name, record, column, value):
+        table = self._native_table(table_name)
+        if table and not str(value).startswith(('[', '{')):
+            return self._native_set_db_attribute(table, record, column,
+                                                 value)
         args = ["set", table_name, record, "%s=%s" % (column, value)]
         self.run_vsctl(args)
 
+    def _native_set_db_attribute(self, table, record, column, value):
+        column, sep, key = column.partition(':')
+        where = [['name', '==', record]]
+        try:
+            col_type = self.ovsdb.get_column_type(table, column)
+        except (ovsdb_jsonrpc.OvsdbError, KeyError) as e:
+            LOG.error(_("Unable to set %(column)s in %(table)s: %(exc)s"),
+                      {'column': column, 'table': table, 'exc': e})
+            return
+        if key:
+            value = ovsdb_jsonrpc.encode_atom(col_type['value'], value)
+            op = {'op': 'mutate', 'table': table, 'where': where,
+                  'mutations': [[column, 'delete', ['set', [key]]],
+                                [column, 'insert',
+                                 ['map', [[key, value]]]]]}
+        else:
+            if isinstance(col_type, dict):
+                col_type = col_type['key']
+            value = ovsdb_jsonrpc.encode_atom(col_type, value)
+            op = {'op': 'update', 'table': table, 'where': where,
+                  'row': {column: value}}
+        self.run_ovsdb([op])
+
     def clear_db_attribute(self, table_name, record, column):
+        table = self._native_table(table_name)
+        if table:
+            op = {'op': 'update', 'table': table,
+                  'where': [['name', '==', record]],
+                  'row': {column: ['set', []]}}
+            self.run_ovsdb([op])
+            return
         args = ["clear", table_name, record, column]
         self.run_vsctl(args)
 
@@ -190,6 +341,9 @@ class OVSBridge(BaseOVS):
                                self.br_name, 'datapath_id').strip('"')
 
     def do_action_flows(self, action, kwargs_list):
+        # NOTE: flows are always sent through ovs-ofctl, the native
+        # ovsdb_interface only covers the OVSDB operations. Use deferred()
+        # to send the flows of an action with a single ovs-ofctl run.
         flow_strs = [_build_flow_expr_str(kw, action) for kw in kwargs_list]
         self.run_ofctl('%s-flows' % action, ['-'], '\n'.join(flow_strs))
 
@@ -218,22 +372,28 @@ class OVSBridge(BaseOVS):
                         tunnel_type=p_const.TYPE_GRE,
                         vxlan_udp_port=constants.VXLAN_UDP_PORT,
                         dont_fragment=True):
-        vsctl_command = ["--", "--may-exist", "add-port", self.br_name,
-                         port_name]
-        vsctl_command.extend(["--", "set", "Interface", port_name,
-                              "type=%s" % tunnel_type])
+        options = []
         if tunnel_type == p_const.TYPE_VXLAN:
             # Only set the VXLAN UDP port if it's not the default
             if vxlan_udp_port != constants.VXLAN_UDP_PORT:
-                vsctl_command.append("options:dst_port=%s" % vxlan_udp_port)
-        vsctl_command.append(("options:df_default=%s" %
-                             bool(dont_fragment)).lower())
-        vsctl_command.extend(["options:remote_ip=%s" % remote_ip,
-                              "options:local_ip=%s" % local_ip,
-                              "options:in_key=flow",
-                              "options:out_key=flow"])
-        self.run_vsctl(vsctl_command)
-        ofport = self.get_port_ofport(port_name)
+                options.append(('dst_port', str(vxlan_udp_port)))
+        options.extend([('df_default', str(bool(dont_fragment)).lower()),
+                        ('remote_ip', remote_ip),
+                        ('local_ip', local_ip),
+                        ('in_key', 'flow'),
+                        ('out_key', 'flow')])
+        if self.ovsdb:
+            ofport = self._native_add_port(port_name, tunnel_type,
+                                           dict(options))
+        else:
+            vsctl_command = ["--", "--may-exist", "add-port", self.br_name,
+                             port_name]
+            vsctl_command.extend(["--", "set", "Interface", port_name,
+                                  "type=%s" % tunnel_type])
+            vsctl_command.extend("options:%s=%s" % option
+                                 for option in options)
+            self.run_vsctl(vsctl_command)
+            ofport = self.get_port_ofport(port_name)
         if (tunnel_type == p_const.TYPE_VXLAN and
                 ofport == constants.INVALID_OFPORT):
             LOG.error(_('Unable to create VXLAN tunnel port. Please ensure '
@@ -242,12 +402,21 @@ class OVSBridge(BaseOVS):
         return ofport
 
     def add_patch_port(self, local_name, remote_name):
+        if self.ovsdb:
+            return self._native_add_port(local_name, 'patch',
+                                         {'peer': remote_name})
         self.run_vsctl(["add-port", self.br_name, local_name,
                         "--", "set", "Interface", local_name,
                         "type=patch", "options:peer=%s" % remote_name])
         return self.get_port_ofport(local_name)
 
     def db_get_map(self, table, record, column, check_error=False):
+        if self._native_table(table):
+            value = self._native_get(table, record, column, check_error)
+            if value is None:
+                return {}
+            return dict((k, str(v)) for k, v in
+                        ovsdb_jsonrpc.decode_value(value).iteritems())
         output = self.run_vsctl(["get", table, record, column], check_error)
         if output:
             output_str = output.rstrip("\n\r")
@@ -255,10 +424,33 @@ class OVSBridge(BaseOVS):
         return {}
 
     def db_get_val(self, table, record, column, check_error=False):
+        if self._native_table(table):
+            value = self._native_get(table, record, column, check_error)
+            if value is not None:
+                return ovsdb_jsonrpc.format_value(value)
+            return
         output = self.run_vsctl(["get", table, record, column], check_error)
         if output:
             return output.rstrip("\n\r")
 
+    def _native_get(self, table, record, column, check_error=False):
+        """Return the OVSDB JSON value of a column of a named record."""
+        table = self._native_table(table)
+        result = self.run_ovsdb([{'op': 'select', 'table': table,
+                                  'where': [['name', '==', record]],
+                                  'columns': [column]}], check_error)
+        if result is None:
+            return
+        rows = result[0]['rows']
+        if not rows:
+            msg = (_("no row %(record)s in table %(table)s") %
+                   {'record': record, 'table': table})
+            if check_error:
+                raise ovsdb_jsonrpc.OvsdbError(msg)
+            LOG.error(msg)
+            return
+        return rows[0][column]
+
     def db_str_to_map(self, full_str):
         list = full_str.strip("{}").split(", ")
         ret = {}
@@ -270,11 +462,29 @@ class OVSBridge(BaseOVS):
         return ret
 
     def get_port_name_list(self):
+        if self.ovsdb:
+            return self._native_get_port_name_list()
         res = self.run_vsctl(["list-ports", self.br_name], check_error=True)
         if res:
             return res.strip().split("\n")
         return []
 
+    def _native_get_port_name_list(self):
+        result = self.run_ovsdb(
+            [{'op': 'select', 'table': 'Bridge',
+              'where': [['name', '==', self.br_name]], 'columns': ['ports']},
+             {'op': 'select', 'table': 'Port', 'where': [],
+              'columns': ['_uuid', 'name']}], check_error=True)
+        if not result[0]['rows']:
+            raise ovsdb_jsonrpc.OvsdbError(_("no bridge named %s") %
+                                           self.br_name)
+        ports = ovsdb_jsonrpc.decode_value(result[0]['rows'][0]['ports'])
+        if not isinstance(ports, list):
+            ports = [ports]
+        names = dict((row['_uuid'][1], row['name'])
+                     for row in result[1]['rows'])
+        return [names[port] for port in ports if port in names]
+
     def get_port_stats(self, port_name):
         return self.db_get_map("Interface", port_name, "statistics")
 
@@ -0,0 +1,236 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Persistent JSON-RPC connection to ovsdb-server (RFC 7047).
+
+Talking to ovsdb-server directly avoids forking an ovs-vsctl process (and
+a rootwrap process) for every database operation, and allows several
+operations to be committed in a single transaction.
+"""
+
+import json
+import re
+import socket
+
+from eventlet import semaphore
+
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+DATABASE = 'Open_vSwitch'
+RECV_SIZE = 65536
+
+# Strings which ovs-vsctl prints without quotes.
+_BARE_STRING_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_.\-]*$')
+
+_connections = {}
+
+
+class OvsdbError(RuntimeError):
+    pass
+
+
+def get_connection(connection, timeout):
+    """Return the shared connection for a connection string."""
+    if connection not in _connections:
+        _connections[connection] = OvsdbConnection(connection, timeout)
+    return _connections[connection]
+
+
+def _parse_connection(connection):
+    kind, sep, address = connection.partition(':')
+    if kind == 'unix' and address:
+        return socket.AF_UNIX, address
+    if kind == 'tcp' and address:
+        host, sep, port = address.rpartition(':')
+        if host and port.isdigit():
+            return socket.AF_INET, (host, int(port))
+    raise OvsdbError(_('Invalid ovsdb connection: %s') % connection)
+
+
+class OvsdbConnection(object):
+    """A connection to ovsdb-server shared by all bridges of an agent.
+
+    The connection is opened lazily and reopened when ovsdb-server closes
+    it.  Calls are serialized, as replies are read from the same stream.
+    """
+
+    def __init__(self, connection, timeout):
+        self.family, self.address = _parse_connection(connection)
+        self.timeout = timeout
+        self._sock = None
+        self._buffer = ''
+        self._decoder = json.JSONDecoder()
+        self._next_id = 0
+        self._lock = semaphore.Semaphore()
+        self._schema = None
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except socket.error:
+            sock.close()
+            raise
+        self._sock = sock
+        self._buffer = ''
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+        self._sock = None
+
+    def _send(self, msg):
+        self._sock.sendall(jsonutils.dumps(msg))
+
+    def _recv(self):
+        while True:
+            data = self._buffer.lstrip()
+            if data:
+                try:
+                    msg, end = self._decoder.raw_decode(data)
+                except ValueError:
+                    # Incomplete message, wait for more data.
+                    pass
+                else:
+                    self._buffer = data[end:]
+                    return msg
+            chunk = self._sock.recv(RECV_SIZE)
+            if not chunk:
+                raise socket.error(_('Connection closed by ovsdb-server'))
+            self._buffer = data + chunk
+
+    def _wait_reply(self, msg_id):
+        while True:
+            msg = self._recv()
+            if msg.get('method') == 'echo':
+                # ovsdb-server inactivity probe
+                self._send({'id': msg.get('id'), 'result': msg.get('params'),
+                            'error': None})
+            elif msg.get('id') == msg_id:
+                if msg.get('error'):
+                    raise OvsdbError(_('ovsdb-server error: %s') %
+                                     msg['error'])
+                return msg.get('result')
+
+    def call(self, method, params):
+        with self._lock:
+            self._next_id += 1
+            msg_id = self._next_id
+            request = {'method': method, 'params': params, 'id': msg_id}
+            reused = self._sock is not None
+            try:
+                if not reused:
+                    self._connect()
+                try:
+                    self._send(request)
+                except socket.error:
+                    if not reused:
+                        raise
+                    # The server may have closed an idle connection.  As
+                    # nothing was sent, the request can safely be retried.
+                    self.close()
+                    self._connect()
+                    self._send(request)
+                return self._wait_reply(msg_id)
+            except socket.error as e:
+                self.close()
+                raise OvsdbError(_('Unable to talk to ovsdb-server at '
+                                   '%(address)s: %(error)s') %
+                                 {'address': self.address, 'error': e})
+
+    def transact(self, ops):
+        """Run ops in one transaction and return their results.
+
+        An OvsdbError is raised, and nothing is committed, if any of the
+        operations fails.
+        """
+        results = self.call('transact', [DATABASE] + list(ops))
+        for result in results:
+            if result and 'error' in result:
+                raise OvsdbError(_('OVSDB transaction failed: '
+                                   '%(error)s %(details)s') %
+                                 {'error': result['error'],
+                                  'details': result.get('details', '')})
+        return results
+
+    def get_column_type(self, table, column):
+        if self._schema is None:
+            self._schema = self.call('get_schema', [DATABASE])
+        return self._schema['tables'][table]['columns'][column]['type']
+
+
+def decode_value(value):
+    """Convert an OVSDB JSON value into a python value.
+
+    Sets become lists, maps become dicts and uuids become strings.  A set
+    with a single element is its bare element.
+    """
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'set':
+            return [decode_value(item) for item in data]
+        if kind == 'map':
+            return dict((decode_value(k), decode_value(v)) for k, v in data)
+        if kind in ('uuid', 'named-uuid'):
+            return data
+    return value
+
+
+def encode_atom(atom_type, value):
+    """Convert a value given as in ovs-vsctl arguments to an OVSDB atom."""
+    if isinstance(atom_type, dict):
+        atom_type = atom_type['type']
+    if atom_type == 'integer':
+        return int(value)
+    if atom_type == 'real':
+        return float(value)
+    if atom_type == 'boolean':
+        return str(value).lower() == 'true'
+    if atom_type == 'uuid':
+        return ['uuid', value]
+    value = str(value)
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    return value
+
+
+def _format_atom(atom):
+    if isinstance(atom, bool):
+        return 'true' if atom else 'false'
+    if isinstance(atom, basestring):
+        if (_BARE_STRING_RE.match(atom) and
+                atom not in ('true', 'false')):
+            return atom
+        return jsonutils.dumps(atom)
+    return str(atom)
+
+
+def format_value(value):
+    """Format an OVSDB JSON value the way 'ovs-vsctl get' prints it."""
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'set':
+            return '[%s]' % ', '.join(format_value(item) for item in data)
+        if kind == 'map':
+            return '{%s}' % ', '.join('%s=%s' % (format_value(k),
+                                                 format_value(v))
+                                      for k, v in data)
+        if kind == 'uuid':
+            return data
+    return _format_atom(value)
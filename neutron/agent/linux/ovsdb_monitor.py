@@ -15,6 +15,8 @@
 import eventlet
 
 from neutron.agent.linux import async_process
+from neutron.agent.linux import ovsdb_jsonrpc
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 
 
@@ -52,23 +54,28 @@ class OvsdbMonitor(async_process.AsyncProcess):
             # stop the monitor.
 
 
-class SimpleInterfaceMonitor(OvsdbMonitor):
-    """Monitors the Interface table of the local host's ovsdb for changes.
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
 
-    The has_updates() method indicates whether changes to the ovsdb
-    Interface table have been detected since the monitor started or
-    since the previous access.
+
+class OvsdbTableMonitor(OvsdbMonitor):
+    """Mirrors the rows of an ovsdb table.
+
+    The 'ovsdb-client monitor' output is applied to the rows dict, which
+    maps the uuid of each row to a dict of its monitored columns.
     """
 
-    def __init__(self, root_helper=None, respawn_interval=None):
-        super(SimpleInterfaceMonitor, self).__init__(
-            'Interface',
-            columns=['name', 'ofport'],
+    def __init__(self, table_name, columns, root_helper=None,
+                 respawn_interval=None):
+        super(OvsdbTableMonitor, self).__init__(
+            table_name,
+            columns=columns,
             format='json',
             root_helper=root_helper,
             respawn_interval=respawn_interval,
         )
         self.data_received = False
+        self.rows = {}
 
     @property
     def is_active(self):
@@ -76,19 +83,8 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
                 self._kill_event and
                 not self._kill_event.ready())
 
-    @property
-    def has_updates(self):
-        """Indicate whether the ovsdb Interface table has been updated.
-
-        True will be returned if the monitor process is not active.
-        This 'failing open' minimizes the risk of falsely indicating
-        the absence of updates at the expense of potential false
-        positives.
-        """
-        return bool(list(self.iter_stdout())) or not self.is_active
-
     def start(self, block=False, timeout=5):
-        super(SimpleInterfaceMonitor, self).start()
+        super(OvsdbTableMonitor, self).start()
         if block:
             eventlet.timeout.Timeout(timeout)
             while not self.is_active:
@@ -96,10 +92,146 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     def _kill(self, *args, **kwargs):
         self.data_received = False
-        super(SimpleInterfaceMonitor, self)._kill(*args, **kwargs)
+        # A respawned monitor starts over with the initial rows.
+        self.rows = {}
+        super(OvsdbTableMonitor, self)._kill(*args, **kwargs)
 
     def _read_stdout(self):
-        data = super(SimpleInterfaceMonitor, self)._read_stdout()
+        data = super(OvsdbTableMonitor, self)._read_stdout()
         if data and not self.data_received:
             self.data_received = True
         return data
+
+    def process_updates(self):
+        """Apply the monitor output received since the previous call.
+
+        Returns whether any row changed.  True is also returned if the
+        monitor process is not active, as the rows may then be stale.
+        """
+        updated = False
+        for line in self.iter_stdout():
+            updated = True
+            try:
+                self._apply_update(jsonutils.loads(line))
+            except (ValueError, KeyError, TypeError):
+                LOG.warn(_('Unable to parse ovsdb monitor output: %s'), line)
+        return updated or not self.is_active
+
+    def _apply_update(self, update):
+        headings = update['headings']
+        for data in update['data']:
+            row = dict(zip(headings, data))
+            uuid = ovsdb_jsonrpc.decode_value(row.pop('row'))
+            action = row.pop('action')
+            if action == 'delete':
+                self.rows.pop(uuid, None)
+            elif action in ('initial', 'insert', 'new'):
+                self.rows[uuid] = dict(
+                    (column, ovsdb_jsonrpc.decode_value(value))
+                    for column, value in row.iteritems())
+            # The 'old' row of a modification only carries the previous
+            # values of the modified columns, the 'new' row carries them all.
+
+
+class SimpleInterfaceMonitor(OvsdbTableMonitor):
+    """Monitors the Interface table of the local host's ovsdb for changes.
+
+    The has_updates() method indicates whether changes to the ovsdb
+    Interface table have been detected since the monitor started or
+    since the previous access.
+    """
+
+    def __init__(self, root_helper=None, respawn_interval=None):
+        super(SimpleInterfaceMonitor, self).__init__(
+            'Interface',
+            columns=['name', 'ofport'],
+            root_helper=root_helper,
+            respawn_interval=respawn_interval,
+        )
+
+    @property
+    def has_updates(self):
+        """Indicate whether the ovsdb Interface table has been updated.
+
+        True will be returned if the monitor process is not active.
+        This 'failing open' minimizes the risk of falsely indicating
+        the absence of updates at the expense of potential false
+        positives.
+        """
+        return bool(list(self.iter_stdout())) or not self.is_active
+
+
+class OvsdbPortMonitor(object):
+    """Mirrors the bridges, ports and interfaces of the local ovsdb.
+
+    This allows the vif ports of a bridge and their vlan tags to be
+    retrieved without running ovs-vsctl.
+    """
+
+    def __init__(self, root_helper=None, respawn_interval=None):
+        def monitor(table_name, columns):
+            return OvsdbTableMonitor(table_name, columns,
+                                     root_helper=root_helper,
+                                     respawn_interval=respawn_interval)
+        self.bridges = monitor('Bridge', ['name', 'ports'])
+        self.ports = monitor('Port', ['name', 'tag', 'interfaces'])
+        self.interfaces = monitor('Interface',
+                                  ['name', 'ofport', 'external_ids'])
+        self._monitors = (self.bridges, self.ports, self.interfaces)
+
+    @property
+    def is_active(self):
+        return all(monitor.is_active for monitor in self._monitors)
+
+    def start(self, block=False, timeout=5):
+        for monitor in self._monitors:
+            monitor.start(block=block, timeout=timeout)
+
+    def stop(self):
+        for monitor in self._monitors:
+            monitor.stop()
+
+    def process_updates(self):
+        """Apply pending updates and return whether anything changed."""
+        updated = False
+        for monitor in self._monitors:
+            updated = monitor.process_updates() or updated
+        return updated
+
+    def _iter_bridge_ports(self, bridge_name):
+        for bridge in self.bridges.rows.values():
+            if bridge['name'] == bridge_name:
+                for port_uuid in _as_list(bridge['ports']):
+                    port = self.ports.rows.get(port_uuid)
+                    if port:
+                        yield port
+                return
+
+    def _iter_bridge_vifs(self, bridge_name):
+        """Yield (name, ofport, external_ids) of the bridge's ready VIFs."""
+        for port in self._iter_bridge_ports(bridge_name):
+            for iface_uuid in _as_list(port['interfaces']):
+                iface = self.interfaces.rows.get(iface_uuid)
+                if not iface:
+                    continue
+                external_ids = iface['external_ids'] or {}
+                # Do not consider VIFs which aren't yet ready
+                ofport = iface['ofport']
+                if (isinstance(ofport, int) and ofport > 0 and
+                        'iface-id' in external_ids and
+                        'attached-mac' in external_ids):
+                    yield iface['name'], ofport, external_ids
+
+    def get_vif_port_set(self, bridge_name):
+        return set(external_ids['iface-id'] for name, ofport, external_ids
+                   in self._iter_bridge_vifs(bridge_name))
+
+    def get_port_tag_dict(self, bridge_name):
+        return dict((port['name'], port['tag'])
+                    for port in self._iter_bridge_ports(bridge_name))
+
+    def get_vif_port_attrs(self, bridge_name, port_id):
+        """Return the (name, ofport, mac) of a VIF, or None."""
+        for name, ofport, external_ids in self._iter_bridge_vifs(bridge_name):
+            if external_ids['iface-id'] == port_id:
+                return name, ofport, external_ids['attached-mac']
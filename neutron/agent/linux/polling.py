@@ -24,9 +24,14 @@ from neutron.plugins.openvswitch.common import constants
 def get_polling_manager(minimize_polling=False,
                         root_helper=None,
                         ovsdb_monitor_respawn_interval=(
-                            constants.DEFAULT_OVSDBMON_RESPAWN)):
+                            constants.DEFAULT_OVSDBMON_RESPAWN),
+                        ovsdb_port_cache=False):
     if minimize_polling:
-        pm = InterfacePollingMinimizer(
+        if ovsdb_port_cache:
+            pm_cls = PortCachePollingMinimizer
+        else:
+            pm_cls = InterfacePollingMinimizer
+        pm = pm_cls(
             root_helper=root_helper,
             ovsdb_monitor_respawn_interval=ovsdb_monitor_respawn_interval)
         pm.start()
@@ -41,6 +46,9 @@ def get_polling_manager(minimize_polling=False,
 
 class BasePollingManager(object):
 
+    # An ovsdb_monitor.OvsdbPortMonitor mirroring the local ports, if any
+    port_cache = None
+
     def __init__(self):
         self._force_polling = False
         self._polling_completed = True
@@ -110,3 +118,32 @@ class InterfacePollingMinimizer(BasePollingManager):
         # collect output.
         eventlet.sleep()
         return self._monitor.has_updates
+
+
+class PortCachePollingMinimizer(BasePollingManager):
+    """Mirrors the ports of the local ovsdb.
+
+    Polling is required when the mirrored bridges, ports or interfaces
+    change, and port_cache can then be queried instead of ovs-vsctl.
+    """
+
+    def __init__(self, root_helper=None,
+                 ovsdb_monitor_respawn_interval=(
+                     constants.DEFAULT_OVSDBMON_RESPAWN)):
+
+        super(PortCachePollingMinimizer, self).__init__()
+        self.port_cache = ovsdb_monitor.OvsdbPortMonitor(
+            root_helper=root_helper,
+            respawn_interval=ovsdb_monitor_respawn_interval)
+
+    def start(self):
+        self.port_cache.start()
+
+    def stop(self):
+        self.port_cache.stop()
+
+    def _is_polling_required(self):
+        # Maximize the chances of update detection having a chance to
+        # collect output.
+        eventlet.sleep()
+        return self.port_cache.process_updates()
@@ -15,6 +15,7 @@
 #
 # @author: Juliano Martinez, Locaweb.
 
+import collections
 import fcntl
 import os
 import shlex
@@ -22,10 +23,15 @@ import shutil
 import socket
 import struct
 import tempfile
+import threading
+import time
 
 from eventlet.green import subprocess
 from eventlet import greenthread
+from oslo.config import cfg
+from oslo.rootwrap import client
 
+from neutron.agent.common import config
 from neutron.common import constants
 from neutron.common import utils
 from neutron.openstack.common import excutils
@@ -34,6 +40,46 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+config.register_root_helper(cfg.CONF)
+
+# executable -> [number of calls, cumulated duration in seconds]
+_command_stats = collections.defaultdict(lambda: [0, 0.0])
+
+
+class RootwrapDaemonHelper(object):
+    __client = None
+    __lock = threading.Lock()
+
+    def __new__(cls):
+        """There is no reason to instantiate this class."""
+        raise NotImplementedError()
+
+    @classmethod
+    def get_client(cls):
+        with cls.__lock:
+            if cls.__client is None:
+                cls.__client = client.Client(
+                    shlex.split(cfg.CONF.AGENT.root_helper_daemon))
+            return cls.__client
+
+
+def get_command_stats():
+    """Return the number of calls and their duration, per executable.
+
+    :returns: dict of executable to (calls, total seconds, average seconds)
+    """
+    return dict((executable, (calls, total, total / calls))
+                for executable, (calls, total) in _command_stats.items())
+
+
+def _record_command_stats(executable, start):
+    duration = time.time() - start
+    stats = _command_stats[executable]
+    stats[0] += 1
+    stats[1] += duration
+    LOG.debug(_("Command %(executable)s took %(duration).3f seconds"),
+              {'executable': executable, 'duration': duration})
+
 
 def create_process(cmd, root_helper=None, addl_env=None):
     """Create a process object for the given command.
@@ -59,19 +105,45 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+def execute_rootwrap_daemon(cmd, process_input, addl_env):
+    """Run a command through the rootwrap daemon.
+
+    The daemon checks the command against the same filters as
+    root_helper would, but does not need to be forked for each command.
+    Each green thread gets its own connection, so commands from
+    concurrent green threads are run concurrently.
+    """
+    if addl_env:
+        cmd = ['env'] + ['%s=%s' % pair for pair in addl_env.items()] + cmd
+    cmd = map(str, cmd)
+    LOG.debug(_("Running command (rootwrap daemon): %s"), cmd)
+    rootwrap_client = RootwrapDaemonHelper.get_client()
+    returncode, _stdout, _stderr = rootwrap_client.execute(cmd,
+                                                           stdin=process_input)
+    return cmd, returncode, _stdout, _stderr
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
+    executable = str(cmd[0])
+    start = time.time()
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        if root_helper and cfg.CONF.AGENT.root_helper_daemon:
+            cmd, returncode, _stdout, _stderr = execute_rootwrap_daemon(
+                cmd, process_input, addl_env)
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
+        _record_command_stats(executable, start)
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
-        if obj.returncode:
+        if returncode:
             LOG.error(m)
             if check_exit_code:
                 raise RuntimeError(m)
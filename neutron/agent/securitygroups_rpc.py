@@ -15,13 +15,19 @@
 #
 
 from oslo.config import cfg
+from oslo import messaging
 
+from neutron.common import rpc as n_rpc
 from neutron.common import topics
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
+# history
+#   1.1 Support Security Group RPC
+#   1.2 Support security_group_info_for_devices
+SG_INFO_RPC_VERSION = "1.2"
 
 security_group_opts = [
     cfg.StrOpt(
@@ -33,7 +39,14 @@ security_group_opts = [
         help=_(
             'Controls whether the neutron security group API is enabled '
             'in the server. It should be false when using no security '
-            'groups or using the nova security group API.'))
+            'groups or using the nova security group API.')),
+    cfg.BoolOpt(
+        'enable_ipset',
+        default=False,
+        help=_('Use ipset to speed-up the iptables based security groups. '
+               'The members of a remote security group are kept in one '
+               'ipset per ethertype instead of one iptables rule per '
+               'member, so membership changes only update the ipset.'))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -82,6 +95,14 @@ class SecurityGroupServerRpcApiMixin(object):
                                        devices=devices),
                          version=SG_RPC_VERSION)
 
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_INFO_RPC_VERSION)
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -141,6 +162,10 @@ class SecurityGroupAgentRpcMixin(object):
         if not firewall_driver:
             firewall_driver = 'neutron.agent.firewall.NoopFirewallDriver'
         self.firewall = importutils.import_object(firewall_driver)
+        # When the firewall keeps remote group members in ipsets, the
+        # server sends them apart from the rules and membership changes
+        # are handled without refiltering the devices.
+        self.use_ipset = self.firewall.ipset_enabled
         # The following flag will be set to true if port filter must not be
         # applied as soon as a rule or membership notification is received
         self.defer_refresh_firewall = defer_refresh_firewall
@@ -149,14 +174,60 @@ class SecurityGroupAgentRpcMixin(object):
         self.devices_to_refilter = set()
         # Flag raised when a global refresh is needed
         self.global_refresh_firewall = False
+        # Stores security groups whose members should be refreshed when
+        # deferred refresh is enabled and ipset is used.
+        self.sg_members_to_refresh = set()
+
+    def _security_group_info_for_devices(self, device_ids):
+        """Fetch the security group info of the devices.
+
+        Returns None, and stops using the ipsets, when the server does
+        not support security_group_info_for_devices yet.
+        """
+        try:
+            return self.plugin_rpc.security_group_info_for_devices(
+                self.context, list(device_ids))
+        except (messaging.UnsupportedVersion, n_rpc.RemoteError) as e:
+            if (isinstance(e, n_rpc.RemoteError) and
+                    e.exc_type not in ('NoSuchMethod', 'UnsupportedVersion')):
+                raise
+            LOG.warn(_("security_group_info_for_devices is not supported "
+                       "by the server, falling back to "
+                       "security_group_rules_for_devices."))
+            self.use_ipset = False
+
+    def _get_devices_info(self, device_ids):
+        """Fetch the devices to filter, updating group members if needed.
+
+        Must be called within the firewall defer_apply context.
+        """
+        sg_info = None
+        if self.use_ipset:
+            sg_info = self._security_group_info_for_devices(device_ids)
+        if sg_info is None:
+            return self.plugin_rpc.security_group_rules_for_devices(
+                self.context, list(device_ids))
+        for sg_id, sg_members in sg_info['sg_member_ips'].items():
+            self.firewall.update_security_group_members(sg_id, sg_members)
+        devices = sg_info['devices']
+        security_groups = sg_info.get('security_groups')
+        if security_groups is not None:
+            # The rules of each security group are sent once, the devices
+            # only carry their provider rules.
+            for device in devices.values():
+                rules = []
+                for sg_id in device.get('security_groups', []):
+                    rules.extend(security_groups.get(sg_id, []))
+                device['security_group_rules'] = (
+                    rules + device.get('security_group_rules', []))
+        return devices
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
         with self.firewall.defer_apply():
+            devices = self._get_devices_info(device_ids)
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
 
@@ -170,9 +241,38 @@ class SecurityGroupAgentRpcMixin(object):
     def security_groups_member_updated(self, security_groups):
         LOG.info(_("Security group "
                    "member updated %r"), security_groups)
-        self._security_group_updated(
-            security_groups,
-            'security_group_source_groups')
+        if not self.use_ipset:
+            self._security_group_updated(
+                security_groups,
+                'security_group_source_groups')
+        elif self.defer_refresh_firewall:
+            self.sg_members_to_refresh |= set(security_groups)
+        else:
+            self.refresh_security_group_members(security_groups)
+
+    def refresh_security_group_members(self, security_groups):
+        """Update the ipsets of the security groups.
+
+        The iptables rules of the devices are left untouched, they match
+        the remote groups through their ipsets.
+        """
+        sec_grp_set = set(security_groups)
+        devices = [device['device']
+                   for device in self.firewall.ports.values()
+                   if sec_grp_set & set(device.get(
+                       'security_group_source_groups', []))]
+        if not devices:
+            return
+        LOG.info(_("Refresh members of security groups %r"),
+                 list(sec_grp_set))
+        sg_info = self._security_group_info_for_devices(devices)
+        if sg_info is None:
+            self.refresh_firewall(devices)
+            return
+        for sg_id, sg_members in sg_info['sg_member_ips'].items():
+            if sg_id in sec_grp_set:
+                self.firewall.update_security_group_members(sg_id,
+                                                            sg_members)
 
     def _security_group_updated(self, security_groups, attribute):
         devices = []
@@ -217,15 +317,15 @@ class SecurityGroupAgentRpcMixin(object):
             if not device_ids:
                 LOG.info(_("No ports here to refresh firewall"))
                 return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
         with self.firewall.defer_apply():
+            devices = self._get_devices_info(device_ids)
             for device in devices.values():
                 LOG.debug(_("Update port filter for %s"), device['device'])
                 self.firewall.update_port_filter(device)
 
     def firewall_refresh_needed(self):
-        return self.global_refresh_firewall or self.devices_to_refilter
+        return (self.global_refresh_firewall or self.devices_to_refilter or
+                self.sg_members_to_refresh)
 
     def setup_port_filters(self, new_devices, updated_devices):
         """Configure port filters for devices.
@@ -246,8 +346,14 @@ class SecurityGroupAgentRpcMixin(object):
         # losing updates occurring during firewall refresh
         devices_to_refilter = self.devices_to_refilter
         global_refresh_firewall = self.global_refresh_firewall
+        sg_members_to_refresh = self.sg_members_to_refresh
         self.devices_to_refilter = set()
         self.global_refresh_firewall = False
+        self.sg_members_to_refresh = set()
+        if sg_members_to_refresh:
+            LOG.debug(_("Refreshing members of %d security groups"),
+                      len(sg_members_to_refresh))
+            self.refresh_security_group_members(sg_members_to_refresh)
         # TODO(salv-orlando): Avoid if possible ever performing the global
         # refresh providing a precise list of devices for which firewall
         # should be refreshed
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import urllib
 
 from oslo.config import cfg
@@ -20,11 +21,15 @@ from webob import exc
 
 from neutron.common import constants
 from neutron.common import exceptions
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 
 
 LOG = logging.getLogger(__name__)
 
+# Prefix of the markers holding a cursor, which ids never start with.
+CURSOR_PREFIX = '~'
+
 
 def get_filters(request, attr_info, skips=[]):
     """Extracts the filters from the request string.
@@ -50,26 +55,59 @@ def get_filters(request, attr_info, skips=[]):
     return res
 
 
-def get_previous_link(request, items, id_key):
+def get_previous_link(request, items, id_key, marker_func=None):
     params = request.GET.copy()
     params.pop('marker', None)
     if items:
-        marker = items[0][id_key]
+        if marker_func:
+            marker = marker_func(items[0])
+        else:
+            marker = items[0][id_key]
         params['marker'] = marker
     params['page_reverse'] = True
     return "%s?%s" % (request.path_url, urllib.urlencode(params))
 
 
-def get_next_link(request, items, id_key):
+def get_next_link(request, items, id_key, marker_func=None):
     params = request.GET.copy()
     params.pop('marker', None)
     if items:
-        marker = items[-1][id_key]
+        if marker_func:
+            marker = marker_func(items[-1])
+        else:
+            marker = items[-1][id_key]
         params['marker'] = marker
     params.pop('page_reverse', None)
     return "%s?%s" % (request.path_url, urllib.urlencode(params))
 
 
+def encode_cursor(item, sorts):
+    """Return a marker holding the values of the sort keys of an item.
+
+    The page following the item is then found from these values, without
+    reading the item from the database.
+    """
+    values = dict((key, item[key]) for key, direction in sorts)
+    return CURSOR_PREFIX + base64.urlsafe_b64encode(
+        jsonutils.dumps(values)).rstrip('=')
+
+
+def decode_cursor(marker):
+    """Return the sort key values of a cursor, or None for an id marker."""
+    if not marker.startswith(CURSOR_PREFIX):
+        return None
+    data = str(marker[len(CURSOR_PREFIX):])
+    try:
+        values = jsonutils.loads(
+            base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+    except (TypeError, ValueError):
+        values = None
+    if not isinstance(values, dict):
+        msg = _("Invalid pagination marker '%s'") % marker
+        raise exceptions.BadRequest(resource='marker', msg=msg)
+    return values
+
+
 def get_limit_and_marker(request):
     """Return marker, limit tuple from request.
 
@@ -154,7 +192,7 @@ def get_page_reverse(request):
 
 
 def get_pagination_links(request, items, limit,
-                         marker, page_reverse, key="id"):
+                         marker, page_reverse, key="id", marker_func=None):
     key = key if key else 'id'
     links = []
     if not limit:
@@ -162,11 +200,11 @@ def get_pagination_links(request, items, limit,
     if not (len(items) < limit and not page_reverse):
         links.append({"rel": "next",
                       "href": get_next_link(request, items,
-                                            key)})
+                                            key, marker_func)})
     if not (len(items) < limit and page_reverse):
         links.append({"rel": "previous",
                       "href": get_previous_link(request, items,
-                                                key)})
+                                                key, marker_func)})
     return links
 
 
@@ -224,15 +262,42 @@ class PaginationEmulatedHelper(PaginationHelper):
 
 class PaginationNativeHelper(PaginationEmulatedHelper):
 
+    def __init__(self, request, primary_key='id'):
+        super(PaginationNativeHelper, self).__init__(request, primary_key)
+        self.sorts = []
+
     def update_args(self, args):
         if self.primary_key not in dict(args.get('sorts', [])).keys():
             args.setdefault('sorts', []).append((self.primary_key, True))
+        self.sorts = args['sorts']
         args.update({'limit': self.limit, 'marker': self.marker,
                      'page_reverse': self.page_reverse})
 
+    def update_fields(self, original_fields, fields_to_add):
+        super(PaginationNativeHelper, self).update_fields(original_fields,
+                                                          fields_to_add)
+        if not (original_fields and cfg.CONF.pagination_cursors):
+            return
+        # The cursors of the links hold the values of all the sort keys
+        for key, direction in self.sorts:
+            if key not in original_fields:
+                original_fields.append(key)
+                fields_to_add.append(key)
+
     def paginate(self, items):
         return items
 
+    def _get_cursor(self, item):
+        return encode_cursor(item, self.sorts)
+
+    def get_links(self, items):
+        marker_func = None
+        if cfg.CONF.pagination_cursors:
+            marker_func = self._get_cursor
+        return get_pagination_links(
+            self.request, items, self.limit, self.marker,
+            self.page_reverse, self.primary_key, marker_func)
+
 
 class NoPaginationHelper(PaginationHelper):
     pass
@@ -100,6 +100,13 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
 
     def _notify_agents(self, context, method, payload, network_id):
         """Notify all the agents that are hosting the network."""
+        self._notify_agents_bulk(context, method, [payload], network_id)
+
+    def _notify_agents_bulk(self, context, method, payloads, network_id):
+        """Send several payloads to the agents hosting the network.
+
+        The network and its agents are looked up once for all payloads.
+        """
         # fanout is required as we do not know who is "listening"
         no_agents = not utils.is_extension_supported(
             self.plugin, constants.DHCP_AGENT_SCHEDULER_EXT_ALIAS)
@@ -110,7 +117,8 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
         cast_required = method != 'network_create_end'
 
         if fanout_required:
-            self._fanout_message(context, method, payload)
+            for payload in payloads:
+                self._fanout_message(context, method, payload)
         elif cast_required:
             admin_ctx = (context if context.is_admin else context.elevated())
             network = self.plugin.get_network(admin_ctx, network_id)
@@ -120,15 +128,32 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
             # schedule the network first, if needed
             schedule_required = (
                 method == 'port_create_end' and
-                not self._is_reserved_dhcp_port(payload['port']))
+                not all(self._is_reserved_dhcp_port(payload['port'])
+                        for payload in payloads))
             if schedule_required:
                 agents = self._schedule_network(admin_ctx, network, agents)
 
             enabled_agents = self._get_enabled_agents(
-                context, network, agents, method, payload)
+                context, network, agents, method, payloads)
+            bulk_required = method == 'port_create_end' and len(payloads) > 1
             for agent in enabled_agents:
-                self._cast_message(
-                    context, method, payload, agent.host, agent.topic)
+                if bulk_required and self._supports_bulk_ports(agent):
+                    # a single cast and reload for all the ports
+                    ports = [payload['port'] for payload in payloads]
+                    self.cast(
+                        context, self.make_msg('port_create_end_bulk',
+                                               payload={'ports': ports}),
+                        topic='%s.%s' % (agent.topic, agent.host),
+                        version='1.1')
+                    continue
+                for payload in payloads:
+                    self._cast_message(
+                        context, method, payload, agent.host, agent.topic)
+
+    def _supports_bulk_ports(self, agent):
+        """Return whether the agent handles port_create_end_bulk."""
+        agent_conf = self.plugin.get_configuration_dict(agent)
+        return agent_conf.get('bulk_port_notifications', False)
 
     def _cast_message(self, context, method, payload, host,
                       topic=topics.DHCP_AGENT):
@@ -157,6 +182,21 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
         self._cast_message(context, 'agent_updated',
                            {'admin_state_up': admin_state_up}, host)
 
+    def _get_payload(self, obj_type, obj_value, method_name):
+        """Return the network and payload of a notification, if any."""
+        network_id = None
+        if obj_type == 'network' and 'id' in obj_value:
+            network_id = obj_value['id']
+        elif obj_type in ['port', 'subnet'] and 'network_id' in obj_value:
+            network_id = obj_value['network_id']
+        if not network_id:
+            return None, None
+        if method_name.endswith("_delete_end"):
+            if 'id' not in obj_value:
+                return None, None
+            return network_id, {obj_type + '_id': obj_value['id']}
+        return network_id, {obj_type: obj_value}
+
     def notify(self, context, data, method_name):
         # data is {'key' : 'value'} with only one key
         if method_name not in self.VALID_METHOD_NAMES:
@@ -164,19 +204,28 @@ class DhcpAgentNotifyAPI(n_rpc.RpcProxy):
         obj_type = data.keys()[0]
         if obj_type not in self.VALID_RESOURCES:
             return
-        obj_value = data[obj_type]
-        network_id = None
-        if obj_type == 'network' and 'id' in obj_value:
-            network_id = obj_value['id']
-        elif obj_type in ['port', 'subnet'] and 'network_id' in obj_value:
-            network_id = obj_value['network_id']
-        if not network_id:
+        method_name = method_name.replace(".", "_")
+        network_id, payload = self._get_payload(obj_type, data[obj_type],
+                                                method_name)
+        if network_id:
+            self._notify_agents(context, method_name, payload, network_id)
+
+    def notify_bulk(self, context, obj_type, obj_values, method_name):
+        """Notify the agents of an operation on several resources.
+
+        The resources of a network are notified together, so that the
+        network and its agents are only looked up once.
+        """
+        if (method_name not in self.VALID_METHOD_NAMES or
+                obj_type not in self.VALID_RESOURCES):
             return
         method_name = method_name.replace(".", "_")
-        if method_name.endswith("_delete_end"):
-            if 'id' in obj_value:
-                self._notify_agents(context, method_name,
-                                    {obj_type + '_id': obj_value['id']},
-                                    network_id)
-        else:
-            self._notify_agents(context, method_name, data, network_id)
+        payloads = {}
+        for obj_value in obj_values:
+            network_id, payload = self._get_payload(obj_type, obj_value,
+                                                    method_name)
+            if network_id:
+                payloads.setdefault(network_id, []).append(payload)
+        for network_id, network_payloads in payloads.iteritems():
+            self._notify_agents_bulk(context, method_name, network_payloads,
+                                     network_id)
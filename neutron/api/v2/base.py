@@ -26,9 +26,11 @@ from neutron.api.v2 import resource as wsgi_resource
 from neutron.common import constants as const
 from neutron.common import exceptions
 from neutron.common import rpc as n_rpc
+from neutron.openstack.common import excutils
 from neutron.openstack.common import log as logging
 from neutron import policy
 from neutron import quota
+from neutron import wsgi
 
 
 LOG = logging.getLogger(__name__)
@@ -238,19 +240,16 @@ class Controller(object):
         if parent_id:
             kwargs[self._parent_id_name] = parent_id
         obj_getter = getattr(self._plugin, self._plugin_handlers[self.LIST])
+        if self._is_streaming_possible(kwargs, sorting_helper,
+                                       pagination_helper):
+            return self._streamed_items(request, do_authz, obj_getter, kwargs,
+                                        original_fields, fields_to_add)
         obj_list = obj_getter(request.context, **kwargs)
         obj_list = sorting_helper.sort(obj_list)
         obj_list = pagination_helper.paginate(obj_list)
         # Check authz
         if do_authz:
-            # FIXME(salvatore-orlando): obj_getter might return references to
-            # other resources. Must check authZ on them too.
-            # Omit items from list that should not be visible
-            obj_list = [obj for obj in obj_list
-                        if policy.check(request.context,
-                                        self._plugin_handlers[self.SHOW],
-                                        obj,
-                                        plugin=self._plugin)]
+            obj_list = self._filter_authorized(request.context, obj_list)
         # Use the first element in the list for discriminating which attributes
         # should be filtered out because of authZ policies
         # fields_to_add contains a list of attributes added for request policy
@@ -270,6 +269,80 @@ class Controller(object):
             collection[self._collection + "_links"] = pagination_links
         return collection
 
+    def _filter_authorized(self, context, obj_list):
+        # FIXME(salvatore-orlando): obj_getter might return references to
+        # other resources. Must check authZ on them too.
+        # Omit items from list that should not be visible
+        allowed = policy.check_collection(
+            context, self._plugin_handlers[self.SHOW], obj_list)
+        return [obj for obj, is_allowed in zip(obj_list, allowed)
+                if is_allowed]
+
+    def _is_streaming_possible(self, kwargs, sorting_helper,
+                               pagination_helper):
+        # The collection is read with the native pagination of the plugin,
+        # unless the request asks for a single page, or the API sorts or
+        # paginates the whole collection itself
+        emulated = (
+            isinstance(sorting_helper, api_common.SortingEmulatedHelper) or
+            (isinstance(pagination_helper,
+                        api_common.PaginationEmulatedHelper) and
+             not isinstance(pagination_helper,
+                            api_common.PaginationNativeHelper)))
+        return (cfg.CONF.list_stream_page_size > 0 and
+                self._native_pagination and self._native_sorting and
+                not emulated and not kwargs.get('limit'))
+
+    def _streamed_items(self, request, do_authz, obj_getter, kwargs,
+                        original_fields, fields_to_add):
+        """Retrieves a collection while it is serialized.
+
+        The collection is read page by page with the native pagination of
+        the plugin, the marker of a page being a cursor on the last item of
+        the previous page, so that only one page is held in memory.
+        """
+        sorts = kwargs.setdefault('sorts', [])
+        if self._primary_key not in dict(sorts):
+            sorts.append((self._primary_key, True))
+        if original_fields:
+            # The cursors hold the values of all the sort keys
+            for key, direction in sorts:
+                if key not in original_fields:
+                    original_fields.append(key)
+                    fields_to_add.append(key)
+        limit = cfg.CONF.list_stream_page_size
+        kwargs.update({'limit': limit, 'marker': None, 'page_reverse': False})
+        context = request.context
+        # The first page is read before the response is started, so that
+        # the errors of the request are still reported with their status.
+        first_page = obj_getter(context, **kwargs)
+
+        def _pages():
+            page = first_page
+            while True:
+                yield page
+                if len(page) < limit:
+                    return
+                kwargs['marker'] = api_common.encode_cursor(page[-1], sorts)
+                page = obj_getter(context, **kwargs)
+
+        def _views():
+            fields_to_strip = None
+            for obj_list in _pages():
+                if do_authz:
+                    obj_list = self._filter_authorized(context, obj_list)
+                for obj in obj_list:
+                    # As for a list, the attributes excluded by policy are
+                    # those of the first item
+                    if fields_to_strip is None:
+                        fields_to_strip = (
+                            (fields_to_add or []) +
+                            self._exclude_attributes_by_policy(context, obj))
+                    yield self._filter_attributes(
+                        context, obj, fields_to_strip=fields_to_strip)
+
+        return {self._collection: wsgi.StreamedList(_views())}
+
     def _item(self, request, id, do_authz=False, field_list=None,
               parent_id=None):
         """Retrieves and formats a single element of the requested entity."""
@@ -289,6 +362,11 @@ class Controller(object):
     def _send_dhcp_notification(self, context, data, methodname):
         if cfg.CONF.dhcp_agent_notification:
             if self._collection in data:
+                if hasattr(self._dhcp_agent_notifier, 'notify_bulk'):
+                    self._dhcp_agent_notifier.notify_bulk(
+                        context, self._resource, data[self._collection],
+                        methodname)
+                    return
                 for body in data[self._collection]:
                     item = {self._resource: body}
                     self._dhcp_agent_notifier.notify(context, item, methodname)
@@ -388,12 +466,20 @@ class Controller(object):
             bulk = False
         # Ensure policy engine is initialized
         policy.init()
+        # Number of resources to reserve by tenant, when the quota driver
+        # tracks their usage
+        amounts = {}
+        tracked = quota.QUOTAS.is_tracked(self._resource)
         for item in items:
             self._validate_network_tenant_ownership(request,
                                                     item[self._resource])
             policy.enforce(request.context,
                            action,
                            item[self._resource])
+            if tracked:
+                tenant_id = item[self._resource]['tenant_id']
+                amounts[tenant_id] = amounts.get(tenant_id, 0) + 1
+                continue
             try:
                 tenant_id = item[self._resource]['tenant_id']
                 count = quota.QUOTAS.count(request.context, self._resource,
@@ -423,32 +509,57 @@ class Controller(object):
                                          notifier_method)
             return create_result
 
-        kwargs = {self._parent_id_name: parent_id} if parent_id else {}
-        if self._collection in body and self._native_bulk:
-            # plugin does atomic bulk create operations
-            obj_creator = getattr(self._plugin, "%s_bulk" % action)
-            objs = obj_creator(request.context, body, **kwargs)
-            # Use first element of list to discriminate attributes which
-            # should be removed because of authZ policies
-            fields_to_strip = self._exclude_attributes_by_policy(
-                request.context, objs[0])
-            return notify({self._collection: [self._filter_attributes(
-                request.context, obj, fields_to_strip=fields_to_strip)
-                for obj in objs]})
-        else:
-            obj_creator = getattr(self._plugin, action)
-            if self._collection in body:
-                # Emulate atomic bulk behavior
-                objs = self._emulate_bulk_create(obj_creator, request,
-                                                 body, parent_id)
-                return notify({self._collection: objs})
+        reservations = self._make_reservations(request.context, amounts)
+        try:
+            kwargs = {self._parent_id_name: parent_id} if parent_id else {}
+            if self._collection in body and self._native_bulk:
+                # plugin does atomic bulk create operations
+                obj_creator = getattr(self._plugin, "%s_bulk" % action)
+                objs = obj_creator(request.context, body, **kwargs)
+                # Use first element of list to discriminate attributes which
+                # should be removed because of authZ policies
+                fields_to_strip = self._exclude_attributes_by_policy(
+                    request.context, objs[0])
+                return notify({self._collection: [self._filter_attributes(
+                    request.context, obj, fields_to_strip=fields_to_strip)
+                    for obj in objs]})
             else:
-                kwargs.update({self._resource: body})
-                obj = obj_creator(request.context, **kwargs)
-                self._send_nova_notification(action, {},
-                                             {self._resource: obj})
-                return notify({self._resource: self._view(request.context,
-                                                          obj)})
+                obj_creator = getattr(self._plugin, action)
+                if self._collection in body:
+                    # Emulate atomic bulk behavior
+                    objs = self._emulate_bulk_create(obj_creator, request,
+                                                     body, parent_id)
+                    return notify({self._collection: objs})
+                else:
+                    kwargs.update({self._resource: body})
+                    obj = obj_creator(request.context, **kwargs)
+                    self._send_nova_notification(action, {},
+                                                 {self._resource: obj})
+                    return notify({self._resource: self._view(
+                        request.context, obj)})
+        finally:
+            # The created resources are now in the usage
+            self._release_reservations(request.context, reservations)
+
+    def _make_reservations(self, context, amounts):
+        reservations = []
+        try:
+            for tenant_id, amount in amounts.iteritems():
+                reservations.append(quota.QUOTAS.make_reservation(
+                    context, tenant_id, self._resource, amount))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._release_reservations(context, reservations)
+        return reservations
+
+    def _release_reservations(self, context, reservations):
+        for reservation_id in reservations:
+            try:
+                quota.QUOTAS.release_reservation(context, reservation_id)
+            except Exception:
+                # It expires anyway
+                LOG.exception(_("Failed to release quota reservation %s"),
+                              reservation_id)
 
     def delete(self, request, id, **kwargs):
         """Deletes the specified entity."""
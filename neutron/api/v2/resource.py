@@ -136,6 +136,11 @@ def Resource(controller, faults=None, deserializers=None, serializers=None):
             raise webob.exc.HTTPInternalServerError(**kwargs)
 
         status = action_status.get(action, 200)
+        if wsgi.is_streamed(result):
+            # Without a length, the body is sent with chunked encoding
+            return webob.Response(request=request, status=status,
+                                  content_type=content_type,
+                                  app_iter=serializer.serialize_iter(result))
         body = serializer.serialize(result)
         # NOTE(jkoelker) Comply with RFC2616 section 9.7
         if status == 204:
@@ -53,6 +53,21 @@ core_opts = [
                help=_("The base MAC address Neutron will use for VIFs")),
     cfg.IntOpt('mac_generation_retries', default=16,
                help=_("How many times Neutron will retry MAC generation")),
+    cfg.StrOpt('ip_allocation_strategy', default='availability_ranges',
+               choices=['availability_ranges', 'random', 'striped'],
+               help=_("How IP addresses are allocated to ports. "
+                      "'availability_ranges' hands out the lowest free "
+                      "address, locking the availability ranges of the "
+                      "subnet. 'random' and 'striped' reserve an address "
+                      "without locks and try another one when it was taken "
+                      "concurrently: 'random' picks any free address, "
+                      "'striped' the lowest free address of a random part "
+                      "of the allocation pools.")),
+    cfg.BoolOpt('network_cache', default=False,
+                help=_("Cache the subnets and segments of networks in each "
+                       "server process. Cached values are checked against "
+                       "the revision of their network in the database, so "
+                       "that changes made by any process are seen.")),
     cfg.BoolOpt('allow_bulk', default=True,
                 help=_("Allow the usage of the bulk API")),
     cfg.BoolOpt('allow_pagination', default=False,
@@ -63,6 +78,18 @@ core_opts = [
                help=_("The maximum number of items returned in a single "
                       "response, value was 'infinite' or negative integer "
                       "means no limit")),
+    cfg.BoolOpt('pagination_cursors', default=False,
+                help=_("Use cursors holding the sort key values of the last "
+                       "item of a page as markers of the pagination links "
+                       "of plugins supporting native pagination, so that "
+                       "the next page is found without reading the marker "
+                       "item from the database.")),
+    cfg.IntOpt('list_stream_page_size', default=0,
+               help=_("Number of items read at once when listing a "
+                      "collection of a plugin supporting native pagination "
+                      "without a limit: the collection is then read page "
+                      "by page while the response is sent. 0 reads the "
+                      "whole collection before sending the response.")),
     cfg.IntOpt('max_dns_nameservers', default=5,
                help=_("Maximum number of DNS nameservers")),
     cfg.IntOpt('max_subnet_host_routes', default=20,
@@ -115,6 +142,18 @@ core_opts = [
     cfg.IntOpt('send_events_interval', default=2,
                help=_('Number of seconds between sending events to nova if '
                       'there are any events to send.')),
+    cfg.IntOpt('nova_events_queue_size', default=10000,
+               help=_('Maximum number of events waiting to be sent to nova. '
+                      'When it is reached, the oldest events are dropped.')),
+    cfg.IntOpt('nova_events_batch_size', default=100,
+               help=_('Maximum number of events sent to nova in one '
+                      'request.')),
+    cfg.IntOpt('nova_events_concurrency', default=4,
+               help=_('Number of requests sending events to nova run '
+                      'concurrently.')),
+    cfg.IntOpt('nova_events_retries', default=2,
+               help=_('Number of times a request sending events to nova is '
+                      'retried when it fails.')),
 ]
 
 core_cli_opts = [
@@ -15,8 +15,10 @@
 
 import weakref
 
+from sqlalchemy import orm
 from sqlalchemy import sql
 
+from neutron.api import api_common
 from neutron.common import exceptions as n_exc
 from neutron.db import sqlalchemyutils
 
@@ -153,9 +155,40 @@ class CommonDbMixin(object):
             if func:
                 func(*args)
 
+    @staticmethod
+    def _get_column_fields(model, fields):
+        """Return the requested fields if they all are columns of model.
+
+        Duplicates are removed.  None is returned when no fields were
+        requested, or when some of them are not plain columns of the
+        model, i.e. relationships or attributes of extensions.
+        """
+        if not fields:
+            return None
+        columns = orm.class_mapper(model).column_attrs.keys()
+        column_fields = []
+        for field in fields:
+            if field not in columns:
+                return None
+            if field not in column_fields:
+                column_fields.append(field)
+        return column_fields
+
+    @staticmethod
+    def _select_column_fields(query, model, column_fields):
+        """Only load the given columns of model from query.
+
+        The query then returns tuples instead of objects: neither the
+        objects nor their eagerly loaded relationships are built.
+        """
+        if column_fields:
+            query = query.with_entities(
+                *[getattr(model, field) for field in column_fields])
+        return query
+
     def _get_collection_query(self, context, model, filters=None,
                               sorts=None, limit=None, marker_obj=None,
-                              page_reverse=False):
+                              page_reverse=False, column_fields=None):
         collection = self._model_query(context, model)
         collection = self._apply_filters_to_query(collection, model, filters)
         if limit and page_reverse and sorts:
@@ -163,17 +196,31 @@ class CommonDbMixin(object):
         collection = sqlalchemyutils.paginate_query(collection, model, limit,
                                                     sorts,
                                                     marker_obj=marker_obj)
-        return collection
+        return self._select_column_fields(collection, model, column_fields)
 
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
-                        page_reverse=False):
+                        page_reverse=False, project_columns=False):
+        """Return the dicts of a collection.
+
+        With project_columns, a request for columns of the model only is
+        answered from a query on these columns, without calling dict_func:
+        it must be set only when dict_func copies these columns as they
+        are, and its extend functions do not change them.
+        """
+        column_fields = None
+        if project_columns:
+            column_fields = self._get_column_fields(model, fields)
         query = self._get_collection_query(context, model, filters=filters,
                                            sorts=sorts,
                                            limit=limit,
                                            marker_obj=marker_obj,
-                                           page_reverse=page_reverse)
-        items = [dict_func(c, fields) for c in query]
+                                           page_reverse=page_reverse,
+                                           column_fields=column_fields)
+        if column_fields:
+            items = [dict(zip(column_fields, row)) for row in query]
+        else:
+            items = [dict_func(c, fields) for c in query]
         if limit and page_reverse:
             items.reverse()
         return items
@@ -183,6 +230,10 @@ class CommonDbMixin(object):
 
     def _get_marker_obj(self, context, resource, limit, marker):
         if limit and marker:
+            # A cursor holds the sort key values of the marker already
+            cursor = api_common.decode_cursor(marker)
+            if cursor is not None:
+                return cursor
             return getattr(self, '_get_%s' % resource)(context, marker)
         return None
 
@@ -13,10 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import random
 
 import netaddr
 from oslo.config import cfg
+from oslo.db import exception as db_exc
 from sqlalchemy import and_
 from sqlalchemy import event
 from sqlalchemy import orm
@@ -29,7 +31,9 @@ from neutron.common import ipv6_utils
 from neutron import context as ctx
 from neutron.db import api as db
 from neutron.db import common_db_mixin
+from neutron.db import ip_allocator
 from neutron.db import models_v2
+from neutron.db import network_cache
 from neutron.db import sqlalchemyutils
 from neutron.extensions import l3
 from neutron import manager
@@ -51,6 +55,14 @@ LOG = logging.getLogger(__name__)
 # IP allocations being cleaned up by cascade.
 AUTO_DELETE_PORT_OWNERS = [constants.DEVICE_OWNER_DHCP]
 
+# Subnet attributes get_subnets can filter cached subnets on
+CACHED_SUBNET_FILTERS = ('id', 'name', 'tenant_id', 'network_id',
+                         'ip_version', 'cidr', 'gateway_ip', 'enable_dhcp',
+                         'ipv6_ra_mode', 'ipv6_address_mode', 'shared')
+
+# MAC addresses generated for ports, and how many of them were in use
+_mac_generation_stats = {'attempts': 0, 'collisions': 0}
+
 
 class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                         common_db_mixin.CommonDbMixin):
@@ -129,40 +141,81 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
 
     @staticmethod
     def _generate_mac(context, network_id):
+        """Return a random MAC address of the base MAC range.
+
+        Whether it is free on the network is only known when the port is
+        inserted, see _create_port_with_mac.
+        """
         base_mac = cfg.CONF.base_mac.split(':')
+        mac = [int(base_mac[0], 16), int(base_mac[1], 16),
+               int(base_mac[2], 16), random.randint(0x00, 0xff),
+               random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
+        if base_mac[3] != '00':
+            mac[3] = int(base_mac[3], 16)
+        return ':'.join(map(lambda x: "%02x" % x, mac))
+
+    @staticmethod
+    def _insert_port(context, port_args, mac_address):
+        """Insert a port, raising MacAddressInUse if its MAC is taken.
+
+        The ports are unique by network and MAC address: the insertion
+        itself checks the MAC address, in a savepoint so that a conflict
+        does not abort the transaction of the caller.
+        """
+        port = models_v2.Port(mac_address=mac_address, **port_args)
+        try:
+            with context.session.begin_nested():
+                context.session.add(port)
+        except db_exc.DBDuplicateEntry as e:
+            if 'mac_address' not in e.columns:
+                raise
+            raise n_exc.MacAddressInUse(net_id=port_args['network_id'],
+                                        mac=mac_address)
+        return port
+
+    @staticmethod
+    def _create_port_with_mac(context, port_args, mac_address):
+        """Insert a port with the given or a generated MAC address.
+
+        A generated MAC address that is already used on the network is
+        replaced by another one, up to mac_generation_retries times.
+        """
+        if mac_address is not attributes.ATTR_NOT_SPECIFIED:
+            return NeutronDbPluginV2._insert_port(context, port_args,
+                                                  mac_address)
+        network_id = port_args['network_id']
         max_retries = cfg.CONF.mac_generation_retries
         for i in range(max_retries):
-            mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-                   int(base_mac[2], 16), random.randint(0x00, 0xff),
-                   random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-            if base_mac[3] != '00':
-                mac[3] = int(base_mac[3], 16)
-            mac_address = ':'.join(map(lambda x: "%02x" % x, mac))
-            if NeutronDbPluginV2._check_unique_mac(context, network_id,
-                                                   mac_address):
-                LOG.debug(_("Generated mac for network %(network_id)s "
-                            "is %(mac_address)s"),
-                          {'network_id': network_id,
-                           'mac_address': mac_address})
-                return mac_address
-            else:
+            mac_address = NeutronDbPluginV2._generate_mac(context,
+                                                          network_id)
+            _mac_generation_stats['attempts'] += 1
+            try:
+                port = NeutronDbPluginV2._insert_port(context, port_args,
+                                                      mac_address)
+            except n_exc.MacAddressInUse:
+                _mac_generation_stats['collisions'] += 1
                 LOG.debug(_("Generated mac %(mac_address)s exists. Remaining "
                             "attempts %(max_retries)s."),
                           {'mac_address': mac_address,
                            'max_retries': max_retries - (i + 1)})
+                continue
+            LOG.debug(_("Generated mac for network %(network_id)s "
+                        "is %(mac_address)s"),
+                      {'network_id': network_id,
+                       'mac_address': mac_address})
+            return port
         LOG.error(_("Unable to generate mac address after %s attempts"),
                   max_retries)
         raise n_exc.MacAddressGenerationFailure(net_id=network_id)
 
     @staticmethod
-    def _check_unique_mac(context, network_id, mac_address):
-        mac_qry = context.session.query(models_v2.Port)
-        try:
-            mac_qry.filter_by(network_id=network_id,
-                              mac_address=mac_address).one()
-        except exc.NoResultFound:
-            return True
-        return False
+    def get_mac_generation_stats():
+        """Return the MAC generation attempts and collisions so far.
+
+        The collision rate, collisions / attempts, tells how crowded the
+        base MAC range of the networks is.
+        """
+        return dict(_mac_generation_stats)
 
     @staticmethod
     def _delete_ip_allocation(context, network_id, subnet_id, ip_address):
@@ -177,6 +230,26 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             network_id=network_id,
             ip_address=ip_address,
             subnet_id=subnet_id).delete()
+        if ip_allocator.is_enabled():
+            ip_allocator.release(subnet_id, ip_address)
+
+    @staticmethod
+    def _store_ip_allocation(context, ip_address, network_id, subnet_id,
+                             port_id):
+        if ip_allocator.is_enabled():
+            # The allocator reserved the address by inserting its row
+            allocated = context.session.query(models_v2.IPAllocation).get(
+                (ip_address, subnet_id, network_id))
+            if allocated is not None and allocated.port_id is None:
+                allocated.port_id = port_id
+                return
+        allocated = models_v2.IPAllocation(
+            network_id=network_id,
+            port_id=port_id,
+            ip_address=ip_address,
+            subnet_id=subnet_id,
+        )
+        context.session.add(allocated)
 
     @staticmethod
     def _check_if_subnet_uses_eui64(subnet):
@@ -186,6 +259,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
 
     @staticmethod
     def _generate_ip(context, subnets):
+        if ip_allocator.is_enabled():
+            return ip_allocator.allocate(context, subnets)
         try:
             return NeutronDbPluginV2._try_generate_ip(context, subnets)
         except n_exc.IpAddressGenerationFailure:
@@ -433,9 +508,14 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         ips = []
         for fixed in fixed_ips:
             if 'ip_address' in fixed:
-                # Remove the IP address from the allocation pool
-                NeutronDbPluginV2._allocate_specific_ip(
-                    context, fixed['subnet_id'], fixed['ip_address'])
+                if ip_allocator.is_enabled():
+                    ip_allocator.allocate_specific(
+                        context, network['id'], fixed['subnet_id'],
+                        fixed['ip_address'])
+                else:
+                    # Remove the IP address from the allocation pool
+                    NeutronDbPluginV2._allocate_specific_ip(
+                        context, fixed['subnet_id'], fixed['ip_address'])
                 ips.append({'ip_address': fixed['ip_address'],
                             'subnet_id': fixed['subnet_id']})
             # Only subnet ID is specified => need to generate IP
@@ -843,6 +923,7 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                     'status': n.get('status', constants.NET_STATUS_ACTIVE)}
             network = models_v2.Network(**args)
             context.session.add(network)
+            network_cache.add(context, network)
         return self._make_network_dict(network, process_extensions=False)
 
     def update_network(self, context, id, network):
@@ -857,6 +938,7 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             subnets = self._get_subnets_by_network(context, id)
             for subnet in subnets:
                 subnet['shared'] = network['shared']
+            network_cache.bump(context, id)
         return self._make_network_dict(network)
 
     def delete_network(self, context, id):
@@ -884,6 +966,7 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             # clean up subnets
             subnets_qry = context.session.query(models_v2.Subnet)
             subnets_qry.filter_by(network_id=id).delete()
+            network_cache.bump(context, id)
             context.session.delete(network)
 
     def get_network(self, context, id, fields=None):
@@ -900,7 +983,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    project_columns=True)
 
     def get_networks_count(self, context, filters=None):
         return self._get_collection_count(context, models_v2.Network,
@@ -1070,6 +1154,7 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                     first_ip=pool['start'],
                     last_ip=pool['end'])
                 context.session.add(ip_range)
+            network_cache.bump(context, s['network_id'])
 
         return self._make_subnet_dict(subnet)
 
@@ -1181,6 +1266,7 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                                                  id, s)
             subnet = self._get_subnet(context, id)
             subnet.update(s)
+            network_cache.bump(context, subnet.network_id)
         result = self._make_subnet_dict(subnet)
         # Keep up with fields that changed
         if changed_dns:
@@ -1209,15 +1295,64 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                 else:
                     raise n_exc.SubnetInUse(subnet_id=id)
 
+            network_cache.bump(context, subnet.network_id)
             context.session.delete(subnet)
+        ip_allocator.forget(id)
 
     def get_subnet(self, context, id, fields=None):
         subnet = self._get_subnet(context, id)
         return self._make_subnet_dict(subnet, fields)
 
+    def _load_subnets_by_network(self, context, network_ids):
+        subnets = dict((network_id, []) for network_id in network_ids)
+        for subnet in self._get_collection(
+                context, models_v2.Subnet, self._make_subnet_dict,
+                filters={'network_id': network_ids}):
+            subnets[subnet['network_id']].append(subnet)
+        return subnets
+
+    def _get_cached_subnets(self, context, filters, fields):
+        """Return the subnets filtered on, from the cache.
+
+        Return None if the request is not answered from the cache: only
+        admin requests filtering on networks or subnet ids, and on
+        attributes of CACHED_SUBNET_FILTERS, are.
+        """
+        if (not network_cache.is_enabled() or not context.is_admin or
+                not filters or
+                self._model_query_hooks.get(models_v2.Subnet)):
+            return None
+        if any(key not in CACHED_SUBNET_FILTERS for key in filters):
+            return None
+        if filters.get('network_id'):
+            network_ids = list(set(filters['network_id']))
+            revisions = None
+        elif filters.get('id'):
+            # The networks of the subnets are read with their revisions
+            revisions = network_cache.get_subnet_revisions(context,
+                                                           filters['id'])
+            network_ids = list(revisions)
+        else:
+            return None
+        subnets_by_network = network_cache.SUBNETS.get(
+            context, network_ids, self._load_subnets_by_network, revisions)
+        subnets = []
+        for network_id in network_ids:
+            for subnet in subnets_by_network[network_id] or []:
+                if all(subnet[key] in values
+                       for key, values in filters.iteritems()):
+                    # The cached subnets are shared
+                    subnets.append(copy.deepcopy(self._fields(subnet,
+                                                              fields)))
+        return subnets
+
     def get_subnets(self, context, filters=None, fields=None,
                     sorts=None, limit=None, marker=None,
                     page_reverse=False):
+        if not (sorts or limit or marker):
+            subnets = self._get_cached_subnets(context, filters, fields)
+            if subnets is not None:
+                return subnets
         marker_obj = self._get_marker_obj(context, 'subnet', limit, marker)
         return self._get_collection(context, models_v2.Subnet,
                                     self._make_subnet_dict,
@@ -1225,7 +1360,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    project_columns=True)
 
     def get_subnets_count(self, context, filters=None):
         return self._get_collection_count(context, models_v2.Subnet,
@@ -1248,40 +1384,31 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         with context.session.begin(subtransactions=True):
             network = self._get_network(context, network_id)
 
-            # Ensure that a MAC address is defined and it is unique on the
-            # network
-            if p['mac_address'] is attributes.ATTR_NOT_SPECIFIED:
-                #Note(scollins) Add the generated mac_address to the port,
-                #since _allocate_ips_for_port will need the mac when
-                #calculating an EUI-64 address for a v6 subnet
-                p['mac_address'] = NeutronDbPluginV2._generate_mac(context,
-                                                                   network_id)
-            else:
-                # Ensure that the mac on the network is unique
-                if not NeutronDbPluginV2._check_unique_mac(context,
-                                                           network_id,
-                                                           p['mac_address']):
-                    raise n_exc.MacAddressInUse(net_id=network_id,
-                                                mac=p['mac_address'])
-
-            # Returns the IP's for the port
-            ips = self._allocate_ips_for_port(context, network, port)
-
             if 'status' not in p:
                 status = constants.PORT_STATUS_ACTIVE
             else:
                 status = p['status']
 
-            port = models_v2.Port(tenant_id=tenant_id,
-                                  name=p['name'],
-                                  id=port_id,
-                                  network_id=network_id,
-                                  mac_address=p['mac_address'],
-                                  admin_state_up=p['admin_state_up'],
-                                  status=status,
-                                  device_id=p['device_id'],
-                                  device_owner=p['device_owner'])
-            context.session.add(port)
+            # Ensure that a MAC address is defined and it is unique on the
+            # network
+            db_port = NeutronDbPluginV2._create_port_with_mac(
+                context,
+                dict(tenant_id=tenant_id,
+                     name=p['name'],
+                     id=port_id,
+                     network_id=network_id,
+                     admin_state_up=p['admin_state_up'],
+                     status=status,
+                     device_id=p['device_id'],
+                     device_owner=p['device_owner']),
+                p['mac_address'])
+            #Note(scollins) Add the generated mac_address to the port,
+            #since _allocate_ips_for_port will need the mac when
+            #calculating an EUI-64 address for a v6 subnet
+            p['mac_address'] = db_port['mac_address']
+
+            # Returns the IP's for the port
+            ips = self._allocate_ips_for_port(context, network, port)
 
             # Update the allocated IP's
             if ips:
@@ -1294,15 +1421,10 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                'network_id': network_id,
                                'subnet_id': subnet_id,
                                'port_id': port_id})
-                    allocated = models_v2.IPAllocation(
-                        network_id=network_id,
-                        port_id=port_id,
-                        ip_address=ip_address,
-                        subnet_id=subnet_id,
-                    )
-                    context.session.add(allocated)
+                    NeutronDbPluginV2._store_ip_allocation(
+                        context, ip_address, network_id, subnet_id, port_id)
 
-        return self._make_port_dict(port, process_extensions=False)
+        return self._make_port_dict(db_port, process_extensions=False)
 
     def update_port(self, context, id, port):
         p = port['port']
@@ -1338,10 +1460,9 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
 
                 # Update ips if necessary
                 for ip in added_ips:
-                    allocated = models_v2.IPAllocation(
-                        network_id=port['network_id'], port_id=port.id,
-                        ip_address=ip['ip_address'], subnet_id=ip['subnet_id'])
-                    context.session.add(allocated)
+                    NeutronDbPluginV2._store_ip_allocation(
+                        context, ip['ip_address'], port['network_id'],
+                        ip['subnet_id'], port.id)
             # Remove all attributes in p which are not in the port DB model
             # and then update the port
             port.update(self._filter_non_model_columns(p, models_v2.Port))
@@ -1384,7 +1505,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
         return self._make_port_dict(port, fields)
 
     def _get_ports_query(self, context, filters=None, sorts=None, limit=None,
-                         marker_obj=None, page_reverse=False):
+                         marker_obj=None, page_reverse=False,
+                         column_fields=None):
         Port = models_v2.Port
         IPAllocation = models_v2.IPAllocation
 
@@ -1408,17 +1530,27 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             sorts = [(s[0], not s[1]) for s in sorts]
         query = sqlalchemyutils.paginate_query(query, Port, limit,
                                                sorts, marker_obj)
-        return query
+        return self._select_column_fields(query, Port, column_fields)
 
     def get_ports(self, context, filters=None, fields=None,
                   sorts=None, limit=None, marker=None,
                   page_reverse=False):
         marker_obj = self._get_marker_obj(context, 'port', limit, marker)
+        column_fields = self._get_column_fields(models_v2.Port, fields)
+        if filters and filters.get('fixed_ips'):
+            # Ports are joined with their IP allocations: only the entity
+            # query removes the duplicates.
+            column_fields = None
         query = self._get_ports_query(context, filters=filters,
                                       sorts=sorts, limit=limit,
                                       marker_obj=marker_obj,
-                                      page_reverse=page_reverse)
-        items = [self._make_port_dict(c, fields) for c in query]
+                                      page_reverse=page_reverse,
+                                      column_fields=column_fields)
+        if column_fields:
+            # Neither the fixed IPs nor the extensions were requested
+            items = [dict(zip(column_fields, row)) for row in query]
+        else:
+            items = [self._make_port_dict(c, fields) for c in query]
         if limit and page_reverse:
             items.reverse()
         return items
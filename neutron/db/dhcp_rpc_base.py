@@ -206,6 +206,94 @@ class DhcpRpcCallbackMixin(object):
 
         return retval
 
+    def get_dhcp_ports(self, context, **kwargs):
+        """Allocate the DHCP ports of a host on many networks at once.
+
+        For every network the host's DHCP port is reused, a reserved DHCP
+        port is claimed or a new port is created, and the port is given an
+        address on every DHCP enabled subnet, as get_dhcp_port does for a
+        single network.  The networks, subnets and existing ports are
+        looked up with one query each.
+
+        @param kwargs: host, network_ids
+        @return: a dict mapping network ids to DHCP ports.  Networks whose
+                 port could not be allocated are left out.
+        """
+        host = kwargs.get('host')
+        network_ids = kwargs.get('network_ids') or []
+        LOG.debug(_('DHCP ports for %(count)d networks requested from '
+                    '%(host)s'), {'count': len(network_ids), 'host': host})
+        if not network_ids:
+            return {}
+        plugin = manager.NeutronManager.get_plugin()
+        networks = plugin.get_networks(context,
+                                       filters=dict(id=network_ids),
+                                       fields=['id', 'tenant_id'])
+        subnet_ids = dict((network['id'], []) for network in networks)
+        for subnet in plugin.get_subnets(
+                context, filters=dict(network_id=network_ids,
+                                      enable_dhcp=[True]),
+                fields=['id', 'network_id']):
+            subnet_ids[subnet['network_id']].append(subnet['id'])
+
+        device_ids = dict((network_id,
+                           utils.get_dhcp_agent_device_id(network_id, host))
+                          for network_id in subnet_ids)
+        own_ports = {}
+        reserved_ports = {}
+        for port in plugin.get_ports(
+                context, filters=dict(
+                    network_id=network_ids,
+                    device_id=(device_ids.values() +
+                               [constants.DEVICE_ID_RESERVED_DHCP_PORT]))):
+            if port['device_id'] == constants.DEVICE_ID_RESERVED_DHCP_PORT:
+                reserved_ports.setdefault(port['network_id'], port)
+            else:
+                own_ports[port['network_id']] = port
+
+        tenant_ids = dict((network['id'], network['tenant_id'])
+                          for network in networks)
+        ports = {}
+        for network_id, dhcp_subnet_ids in subnet_ids.iteritems():
+            port = own_ports.get(network_id)
+            if port:
+                fixed_ips = [dict(subnet_id=fixed_ip['subnet_id'],
+                                  ip_address=fixed_ip['ip_address'])
+                             for fixed_ip in port['fixed_ips']]
+                missing = (set(dhcp_subnet_ids) -
+                           set(ip['subnet_id'] for ip in fixed_ips))
+                if missing:
+                    fixed_ips.extend(dict(subnet_id=s) for s in missing)
+                    port = self._port_action(
+                        plugin, context,
+                        {'id': port['id'],
+                         'port': {'port': {'network_id': network_id,
+                                           'fixed_ips': fixed_ips}}},
+                        'update_port')
+            elif network_id in reserved_ports:
+                port = self._port_action(
+                    plugin, context,
+                    {'id': reserved_ports[network_id]['id'],
+                     'port': {'port': {'network_id': network_id,
+                                       'device_id': device_ids[network_id]}}},
+                    'update_port')
+            else:
+                port_dict = dict(
+                    admin_state_up=True,
+                    device_id=device_ids[network_id],
+                    network_id=network_id,
+                    tenant_id=tenant_ids[network_id],
+                    mac_address=attributes.ATTR_NOT_SPECIFIED,
+                    name='',
+                    device_owner=constants.DEVICE_OWNER_DHCP,
+                    fixed_ips=[dict(subnet_id=s) for s in dhcp_subnet_ids])
+                port_dict[portbindings.HOST_ID] = host
+                port = self._port_action(plugin, context,
+                                         {'port': port_dict}, 'create_port')
+            if port:
+                ports[network_id] = port
+        return ports
+
     def release_dhcp_port(self, context, **kwargs):
         """Release the port currently being used by a DHCP agent."""
         host = kwargs.get('host')
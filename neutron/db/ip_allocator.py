@@ -0,0 +1,249 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Lock-free IP address allocation.
+
+The default allocator hands out the first address of the availability
+ranges of a subnet, which are read with SELECT ... FOR UPDATE: every port
+creation on a subnet is serialized on the same row, across all servers.
+
+The allocators of this module keep the free addresses of each subnet in
+memory, pick a candidate from them and reserve it by inserting its
+IPAllocation row in a savepoint.  The primary key of the ipallocations
+table guarantees that an address is only handed out once: an address
+taken by another server shows up as a duplicate entry, and another
+candidate is tried.
+"""
+
+import bisect
+import random
+
+import netaddr
+from oslo.config import cfg
+from oslo.db import exception as db_exc
+
+from neutron.common import exceptions as n_exc
+from neutron.db import models_v2
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+AVAILABILITY_RANGES = 'availability_ranges'
+RANDOM = 'random'
+STRIPED = 'striped'
+
+# Number of stripes the allocation pools are split into by the striped
+# strategy.
+STRIPES = 16
+
+# Free space of the subnets, by subnet id.
+_free_space = {}
+
+
+def is_enabled():
+    return cfg.CONF.ip_allocation_strategy != AVAILABILITY_RANGES
+
+
+class FreeSpace(object):
+    """The free addresses of the allocation pools of a subnet.
+
+    Addresses are integers, kept as sorted lists of the first and last
+    addresses of disjoint intervals, so that the space only grows with
+    the fragmentation of the pools.
+    """
+
+    def __init__(self, pools, allocated=()):
+        self.pools = sorted(pools)
+        self._firsts = [first for first, last in self.pools]
+        self._lasts = [last for first, last in self.pools]
+        for ip in allocated:
+            self.take(ip)
+
+    def size(self):
+        return sum(last - first + 1
+                   for first, last in zip(self._firsts, self._lasts))
+
+    def __contains__(self, ip):
+        i = bisect.bisect_right(self._firsts, ip) - 1
+        return i >= 0 and ip <= self._lasts[i]
+
+    def take(self, ip):
+        """Remove an address from the free space."""
+        i = bisect.bisect_right(self._firsts, ip) - 1
+        if i < 0 or ip > self._lasts[i]:
+            return
+        first, last = self._firsts[i], self._lasts[i]
+        if first == last:
+            del self._firsts[i]
+            del self._lasts[i]
+        elif ip == first:
+            self._firsts[i] = ip + 1
+        elif ip == last:
+            self._lasts[i] = ip - 1
+        else:
+            self._lasts[i] = ip - 1
+            self._firsts.insert(i + 1, ip + 1)
+            self._lasts.insert(i + 1, last)
+
+    def release(self, ip):
+        """Give an address of the allocation pools back."""
+        if ip in self or not any(first <= ip <= last
+                                 for first, last in self.pools):
+            return
+        i = bisect.bisect_right(self._firsts, ip)
+        joins_prev = i > 0 and self._lasts[i - 1] == ip - 1
+        joins_next = i < len(self._firsts) and self._firsts[i] == ip + 1
+        if joins_prev and joins_next:
+            self._lasts[i - 1] = self._lasts[i]
+            del self._firsts[i]
+            del self._lasts[i]
+        elif joins_prev:
+            self._lasts[i - 1] = ip
+        elif joins_next:
+            self._firsts[i] = ip
+        else:
+            self._firsts.insert(i, ip)
+            self._lasts.insert(i, ip)
+
+    def pick(self, strategy):
+        """Return a free address, or None if there is none left."""
+        if not self._firsts:
+            return None
+        if strategy == RANDOM:
+            offset = random.randrange(self.size())
+            for first, last in zip(self._firsts, self._lasts):
+                if offset <= last - first:
+                    return first + offset
+                offset -= last - first + 1
+        # Take the lowest free address from a random stripe, so that
+        # concurrent allocations rarely pick the same candidate while the
+        # allocated addresses stay packed.
+        pools_first = self.pools[0][0]
+        stripe = max((self.pools[-1][1] - pools_first + 1) // STRIPES, 1)
+        start = pools_first + random.randrange(STRIPES) * stripe
+        i = bisect.bisect_left(self._lasts, start)
+        if i == len(self._lasts):
+            return self._firsts[0]
+        return max(self._firsts[i], start)
+
+
+def _get_pools(context, subnet_id):
+    query = context.session.query(models_v2.IPAllocationPool.first_ip,
+                                  models_v2.IPAllocationPool.last_ip)
+    return sorted((int(netaddr.IPAddress(first)), int(netaddr.IPAddress(last)))
+                  for first, last in query.filter_by(subnet_id=subnet_id))
+
+
+def _load_free_space(context, subnet_id, pools):
+    LOG.debug("Loading free addresses of subnet %s", subnet_id)
+    query = context.session.query(models_v2.IPAllocation.ip_address)
+    allocated = [int(netaddr.IPAddress(ip))
+                 for ip, in query.filter_by(subnet_id=subnet_id)]
+    # The availability ranges are not maintained by this allocator: drop
+    # them, so that the default allocator rebuilds them from the
+    # allocations if it is used again.
+    pool_ids = context.session.query(models_v2.IPAllocationPool.id).filter_by(
+        subnet_id=subnet_id).subquery()
+    context.session.query(models_v2.IPAvailabilityRange).filter(
+        models_v2.IPAvailabilityRange.allocation_pool_id.in_(pool_ids)
+    ).delete(synchronize_session=False)
+    space = FreeSpace(pools, allocated)
+    _free_space[subnet_id] = space
+    return space
+
+
+def _get_free_space(context, subnet_id):
+    """Return the free space of a subnet and whether it was just loaded.
+
+    The allocation pools are read on each allocation, which is cheap, so
+    that a change of pools by another server is noticed.
+    """
+    pools = _get_pools(context, subnet_id)
+    space = _free_space.get(subnet_id)
+    if space is not None and space.pools == pools:
+        return space, False
+    return _load_free_space(context, subnet_id, pools), True
+
+
+def _reserve(context, network_id, subnet_id, ip_address):
+    try:
+        with context.session.begin_nested():
+            context.session.add(models_v2.IPAllocation(
+                network_id=network_id, subnet_id=subnet_id,
+                ip_address=ip_address))
+    except db_exc.DBDuplicateEntry:
+        return False
+    return True
+
+
+def allocate(context, subnets):
+    """Reserve an address from one of the subnets.
+
+    The IPAllocation row of the address is inserted without a port, the
+    caller is expected to set it.
+    """
+    strategy = cfg.CONF.ip_allocation_strategy
+    with context.session.begin(subtransactions=True):
+        for subnet in subnets:
+            space, loaded = _get_free_space(context, subnet['id'])
+            while True:
+                candidate = space.pick(strategy)
+                if candidate is None:
+                    if loaded:
+                        break
+                    # Addresses released by other servers are only seen
+                    # when the free space is loaded again.
+                    space = _load_free_space(context, subnet['id'],
+                                             space.pools)
+                    loaded = True
+                    continue
+                space.take(candidate)
+                ip_address = str(netaddr.IPAddress(candidate))
+                if _reserve(context, subnet['network_id'], subnet['id'],
+                            ip_address):
+                    LOG.debug("Allocated IP %(ip_address)s on subnet "
+                              "%(subnet_id)s",
+                              {'ip_address': ip_address,
+                               'subnet_id': subnet['id']})
+                    return {'ip_address': ip_address,
+                            'subnet_id': subnet['id']}
+                LOG.debug("IP %(ip_address)s of subnet %(subnet_id)s was "
+                          "allocated concurrently, trying another one",
+                          {'ip_address': ip_address,
+                           'subnet_id': subnet['id']})
+            LOG.debug("All IPs from subnet %(subnet_id)s (%(cidr)s) "
+                      "allocated",
+                      {'subnet_id': subnet['id'], 'cidr': subnet['cidr']})
+    raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+
+def allocate_specific(context, network_id, subnet_id, ip_address):
+    """Reserve a given address of a subnet."""
+    with context.session.begin(subtransactions=True):
+        space, loaded = _get_free_space(context, subnet_id)
+        space.take(int(netaddr.IPAddress(ip_address)))
+        if not _reserve(context, network_id, subnet_id, ip_address):
+            raise n_exc.IpAddressInUse(net_id=network_id,
+                                       ip_address=ip_address)
+
+
+def release(subnet_id, ip_address):
+    space = _free_space.get(subnet_id)
+    if space is not None:
+        space.release(int(netaddr.IPAddress(ip_address)))
+
+
+def forget(subnet_id):
+    _free_space.pop(subnet_id, None)
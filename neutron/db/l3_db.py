@@ -64,6 +64,11 @@ class FloatingIP(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     may not be associated with an internal port/ip address/router.
     """
 
+    __table_args__ = (
+        # Pagination of the floating IPs of a tenant by id
+        sa.Index('ix_floatingips_tenant_id_id', 'tenant_id', 'id'),
+    )
+
     floating_ip_address = sa.Column(sa.String(64), nullable=False)
     floating_network_id = sa.Column(sa.String(36), nullable=False)
     floating_port_id = sa.Column(sa.String(36), sa.ForeignKey('ports.id'),
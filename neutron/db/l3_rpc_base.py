@@ -65,6 +65,33 @@ class L3RpcCallbackMixin(object):
                   jsonutils.dumps(routers, indent=5))
         return routers
 
+    def get_router_ids(self, context, **kwargs):
+        """Return the ids of the routers to be synced to a specific agent.
+
+        This is the lightweight first step of a full resync: the agent
+        then fetches the routers in batches with sync_routers.
+
+        @param context: contain user information
+        @param kwargs: host
+        @return: a list of router ids
+        """
+        host = kwargs.get('host')
+        context = neutron_context.get_admin_context()
+        l3plugin = manager.NeutronManager.get_service_plugins()[
+            plugin_constants.L3_ROUTER_NAT]
+        if not l3plugin:
+            LOG.error(_('No plugin for L3 routing registered! Will reply '
+                        'to l3 agent with empty router list.'))
+            return []
+        if utils.is_extension_supported(
+                l3plugin, constants.L3_AGENT_SCHEDULER_EXT_ALIAS):
+            if cfg.CONF.router_auto_schedule:
+                l3plugin.auto_schedule_routers(context, host, None)
+            return l3plugin.list_router_ids_on_active_l3_agent(context,
+                                                               host)
+        return [router['id'] for router in
+                l3plugin.get_routers(context, fields=['id'])]
+
     def _ensure_host_set_on_ports(self, context, plugin, host, routers):
         for router in routers:
             LOG.debug(_("Checking router: %(id)s for host: %(host)s"),
@@ -0,0 +1,81 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Add indexes for the pagination of ports and floating IPs
+
+Revision ID: 1b5a2cc1e2f4
+Revises: 3f6c720f56d0
+Create Date: 2014-08-18 10:41:27.903316
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b5a2cc1e2f4'
+down_revision = '3f6c720f56d0'
+
+migration_for_plugins = [
+    '*'
+]
+
+# The floating IP index is only created for the L3 capable plugins
+L3_CAPABLE = [
+    'neutron.plugins.bigswitch.plugin.NeutronRestProxyV2',
+    'neutron.plugins.brocade.NeutronPlugin.BrocadePluginV2',
+    'neutron.plugins.cisco.network_plugin.PluginV2',
+    'neutron.plugins.cisco.n1kv.n1kv_neutron_plugin.N1kvNeutronPluginV2',
+    'neutron.plugins.embrane.plugins.embrane_ovs_plugin.EmbraneOvsPlugin',
+    'neutron.plugins.hyperv.hyperv_neutron_plugin.HyperVNeutronPlugin',
+    'neutron.plugins.ibm.sdnve_neutron_plugin.SdnvePluginV2',
+    'neutron.plugins.linuxbridge.lb_neutron_plugin.LinuxBridgePluginV2',
+    'neutron.plugins.metaplugin.meta_neutron_plugin.MetaPluginV2',
+    'neutron.plugins.mlnx.mlnx_plugin.MellanoxEswitchPlugin',
+    'neutron.plugins.midonet.plugin.MidonetPluginV2',
+    'neutron.plugins.ml2.plugin.Ml2Plugin',
+    'neutron.plugins.nec.nec_plugin.NECPluginV2',
+    'neutron.plugins.nicira.NeutronPlugin.NvpPluginV2',
+    'neutron.plugins.nicira.NeutronServicePlugin.NvpAdvancedPlugin',
+    'neutron.plugins.nuage.plugin.NuagePlugin',
+    'neutron.plugins.oneconvergence.plugin.OneConvergencePluginV2',
+    'neutron.plugins.openvswitch.ovs_neutron_plugin.OVSNeutronPluginV2',
+    'neutron.plugins.plumgrid.plumgrid_plugin.plumgrid_plugin.'
+    'NeutronPluginPLUMgridV2',
+    'neutron.plugins.ryu.ryu_neutron_plugin.RyuNeutronPluginV2',
+    'neutron.plugins.vmware.plugin.NsxPlugin',
+    'neutron.plugins.vmware.plugin.NsxServicePlugin',
+]
+
+from alembic import op
+
+from neutron.db import migration
+
+
+def upgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.create_index('ix_ports_tenant_id_id', 'ports', ['tenant_id', 'id'])
+    op.create_index('ix_ports_network_id_id', 'ports', ['network_id', 'id'])
+    if migration.should_run(active_plugins, L3_CAPABLE):
+        op.create_index('ix_floatingips_tenant_id_id', 'floatingips',
+                        ['tenant_id', 'id'])
+
+
+def downgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    if migration.should_run(active_plugins, L3_CAPABLE):
+        op.drop_index('ix_floatingips_tenant_id_id', 'floatingips')
+    op.drop_index('ix_ports_network_id_id', 'ports')
+    op.drop_index('ix_ports_tenant_id_id', 'ports')
@@ -0,0 +1,60 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""Add unique constraint on network and MAC address of ports
+
+Revision ID: 2a1ee2fb59e0
+Revises: 5589aa32bf80
+Create Date: 2014-08-12 11:24:39.181542
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2a1ee2fb59e0'
+down_revision = '5589aa32bf80'
+
+migration_for_plugins = [
+    '*'
+]
+
+from alembic import op
+
+from neutron.db import migration
+
+
+CONSTRAINT_NAME = 'uniq_ports0network_id0mac_address'
+TABLE_NAME = 'ports'
+
+
+def upgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.create_unique_constraint(
+        name=CONSTRAINT_NAME,
+        source=TABLE_NAME,
+        local_cols=['network_id', 'mac_address']
+    )
+
+
+def downgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.drop_constraint(
+        CONSTRAINT_NAME,
+        TABLE_NAME,
+        type_='unique'
+    )
@@ -0,0 +1,59 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""Add network revisions for the network cache
+
+Revision ID: 3f6c720f56d0
+Revises: 2a1ee2fb59e0
+Create Date: 2014-08-14 16:02:11.513624
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f6c720f56d0'
+down_revision = '2a1ee2fb59e0'
+
+migration_for_plugins = [
+    '*'
+]
+
+from alembic import op
+import sqlalchemy as sa
+
+from neutron.db import migration
+
+
+def upgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.create_table('networkrevisions',
+                    sa.Column('network_id', sa.String(length=36),
+                              nullable=False),
+                    sa.Column('revision', sa.BigInteger(), nullable=False),
+                    sa.ForeignKeyConstraint(['network_id'], ['networks.id'],
+                                            ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('network_id'))
+
+    # Networks without a revision are never cached
+    op.execute("INSERT INTO networkrevisions SELECT id as network_id, "
+               "0 as revision from networks")
+
+
+def downgrade(active_plugins=None, options=None):
+    if not migration.should_run(active_plugins, migration_for_plugins):
+        return
+
+    op.drop_table('networkrevisions')
@@ -119,6 +119,14 @@ class SubnetRoute(model_base.BASEV2, Route):
 class Port(model_base.BASEV2, HasId, HasTenant):
     """Represents a port on a Neutron v2 network."""
 
+    __table_args__ = (
+        sa.UniqueConstraint('network_id', 'mac_address',
+                            name='uniq_ports0network_id0mac_address'),
+        # Pagination of the ports of a tenant or a network by id
+        sa.Index('ix_ports_tenant_id_id', 'tenant_id', 'id'),
+        sa.Index('ix_ports_network_id_id', 'network_id', 'id'),
+    )
+
     name = sa.Column(sa.String(255))
     network_id = sa.Column(sa.String(36), sa.ForeignKey("networks.id"),
                            nullable=False)
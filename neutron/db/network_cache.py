@@ -0,0 +1,148 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per process cache of data read by network.
+
+The agents read the subnets of their networks over and over, while they
+rarely change.  Each network has a revision, bumped in the transaction
+changing the network or its subnets.  The values cached for a network are
+only used while its revision is unchanged: all the networks of a read are
+validated with a single query on their revisions, whichever server
+process made the change.
+"""
+
+from oslo.config import cfg
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from neutron.db import model_base
+from neutron.db import models_v2
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class NetworkRevision(model_base.BASEV2):
+    """Revision of a network, bumped when it or its subnets change."""
+
+    network_id = sa.Column(sa.String(36),
+                           sa.ForeignKey('networks.id', ondelete="CASCADE"),
+                           primary_key=True)
+    revision = sa.Column(sa.BigInteger, nullable=False, default=0)
+    # Makes the network inserted first
+    network = orm.relationship(models_v2.Network)
+
+
+def is_enabled():
+    return cfg.CONF.network_cache
+
+
+def add(context, network):
+    """Record the revision of a new network.
+
+    Revisions are maintained whether the cache is enabled or not, so that
+    the processes using it see the changes made by the others.
+    """
+    context.session.add(NetworkRevision(network=network, revision=0))
+
+
+def bump(context, network_id):
+    """Invalidate the values cached for a network, in all processes."""
+    with context.session.begin(subtransactions=True):
+        query = context.session.query(NetworkRevision).filter_by(
+            network_id=network_id)
+        if not query.update({'revision': NetworkRevision.revision + 1},
+                            synchronize_session=False):
+            # The network was created by a plugin not recording it
+            context.session.add(NetworkRevision(network_id=network_id,
+                                                revision=1))
+
+
+def get_revisions(context, network_ids):
+    query = context.session.query(NetworkRevision.network_id,
+                                  NetworkRevision.revision)
+    return dict(query.filter(NetworkRevision.network_id.in_(network_ids)))
+
+
+def get_subnet_revisions(context, subnet_ids):
+    """Return the revisions of the networks of subnets, by network id.
+
+    The networks of the subnets and their revisions are read in a single
+    query; the networks without a revision get None.
+    """
+    query = context.session.query(models_v2.Subnet.network_id,
+                                  NetworkRevision.revision)
+    query = query.outerjoin(
+        NetworkRevision,
+        NetworkRevision.network_id == models_v2.Subnet.network_id)
+    return dict(query.filter(models_v2.Subnet.id.in_(subnet_ids)))
+
+
+class NetworkCache(object):
+    """Values computed by network, valid while its revision is unchanged.
+
+    The cached values are shared: callers must not modify them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, context, network_ids, loader, revisions=None):
+        """Return the values of the networks, by network id.
+
+        loader(context, network_ids) returns the values of networks that
+        are not cached, by network id; the networks it omits get None.
+        revisions are those of the networks, when already read.
+        """
+        if not network_ids:
+            return {}
+        # The revisions are read before the values, so that a value is
+        # never cached with a revision more recent than its own.
+        if revisions is None:
+            revisions = get_revisions(context, network_ids)
+        values = {}
+        missing = []
+        for network_id in network_ids:
+            entry = self._entries.get(network_id)
+            if (entry is not None and network_id in revisions and
+                    entry[0] == revisions[network_id]):
+                values[network_id] = entry[1]
+            else:
+                missing.append(network_id)
+        self.hits += len(values)
+        self.misses += len(missing)
+        if missing:
+            LOG.debug("Loading %(name)s of networks %(network_ids)s",
+                      {'name': self.name, 'network_ids': missing})
+            loaded = loader(context, missing)
+            for network_id in missing:
+                value = loaded.get(network_id)
+                values[network_id] = value
+                if revisions.get(network_id) is not None:
+                    self._entries[network_id] = (revisions[network_id], value)
+                else:
+                    # Deleted, or not cacheable without a revision
+                    self._entries.pop(network_id, None)
+        return values
+
+    def clear(self):
+        self._entries.clear()
+
+
+SUBNETS = NetworkCache('subnets')
+SEGMENTS = NetworkCache('segments')
@@ -13,11 +13,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
+from oslo.config import cfg
+from oslo.db import exception as db_exc
 import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import orm
 
 from neutron.common import exceptions
 from neutron.db import model_base
 from neutron.db import models_v2
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import timeutils
+from neutron.openstack.common import uuidutils
+from neutron import quota
+
+LOG = logging.getLogger(__name__)
+
+# Models of the resources whose usage is tracked, by resource name
+TRACKED_MODELS = {
+    'network': models_v2.Network,
+    'subnet': models_v2.Subnet,
+    'port': models_v2.Port,
+}
 
 
 class Quota(model_base.BASEV2, models_v2.HasId):
@@ -31,6 +50,58 @@ class Quota(model_base.BASEV2, models_v2.HasId):
     limit = sa.Column(sa.Integer)
 
 
+class QuotaUsage(model_base.BASEV2):
+    """Number of resources of a tenant, as they are created and deleted.
+
+    The resources are counted again when the usage is older than
+    quota_usage_resync_interval, so that the drift due to resources
+    changed without the ORM is fixed.
+    """
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    in_use = sa.Column(sa.Integer, nullable=False, default=0)
+    synced_at = sa.Column(sa.DateTime, nullable=False)
+
+
+class Reservation(model_base.BASEV2, models_v2.HasId):
+    """Resources being created by a request, counted until it is done."""
+    tenant_id = sa.Column(sa.String(255), index=True)
+    resource = sa.Column(sa.String(255))
+    amount = sa.Column(sa.Integer, nullable=False)
+    expiration = sa.Column(sa.DateTime, nullable=False)
+
+
+def _is_tracking_enabled():
+    return cfg.CONF.QUOTAS.quota_driver == quota.QUOTA_TRACKED_DRIVER
+
+
+@event.listens_for(orm.Session, 'after_flush')
+def _update_usages(session, flush_context):
+    """Count the tracked resources inserted and deleted by a flush.
+
+    The usages are updated in the transaction changing the resources: they
+    are rolled back with them.  A usage which is not recorded yet is left
+    alone, it will be counted when it is first checked.
+    """
+    if not _is_tracking_enabled():
+        return
+    deltas = {}
+    for objs, delta in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            for resource, model in TRACKED_MODELS.iteritems():
+                if isinstance(obj, model) and obj.tenant_id is not None:
+                    key = (obj.tenant_id, resource)
+                    deltas[key] = deltas.get(key, 0) + delta
+    table = QuotaUsage.__table__
+    for (tenant_id, resource), delta in deltas.iteritems():
+        if delta:
+            session.execute(
+                table.update().
+                where(table.c.tenant_id == tenant_id).
+                where(table.c.resource == resource).
+                values(in_use=table.c.in_use + delta))
+
+
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain quota
     information.
@@ -177,3 +248,108 @@ class DbQuotaDriver(object):
                  if quotas[key] >= 0 and quotas[key] < val]
         if overs:
             raise exceptions.OverQuota(overs=sorted(overs))
+
+
+class TrackedQuotaDriver(DbQuotaDriver):
+    """Driver checking quotas against the usages it keeps up to date.
+
+    Checking the quota of a tracked resource reads the usage of the tenant
+    instead of counting its resources.  The resources being created are
+    reserved while the usage is locked, so that concurrent requests cannot
+    exceed the quota together.
+    """
+
+    @staticmethod
+    def is_tracked(resource):
+        return resource in TRACKED_MODELS
+
+    @staticmethod
+    def _count(context, tenant_id, resource):
+        query = context.session.query(TRACKED_MODELS[resource])
+        return query.filter_by(tenant_id=tenant_id).count()
+
+    def _get_usage(self, context, tenant_id, resource):
+        """Return the locked usage of a resource, counted again if stale."""
+        query = context.session.query(QuotaUsage).filter_by(
+            tenant_id=tenant_id, resource=resource).with_lockmode('update')
+        usage = query.first()
+        if usage and not timeutils.is_older_than(
+                usage.synced_at, cfg.CONF.QUOTAS.quota_usage_resync_interval):
+            return usage
+        in_use = self._count(context, tenant_id, resource)
+        if usage:
+            if usage.in_use != in_use:
+                LOG.debug("Fixed usage of %(resource)s by tenant "
+                          "%(tenant_id)s from %(old)s to %(new)s",
+                          {'resource': resource, 'tenant_id': tenant_id,
+                           'old': usage.in_use, 'new': in_use})
+            usage.update({'in_use': in_use, 'synced_at': timeutils.utcnow()})
+            return usage
+        try:
+            with context.session.begin_nested():
+                usage = QuotaUsage(tenant_id=tenant_id, resource=resource,
+                                   in_use=in_use,
+                                   synced_at=timeutils.utcnow())
+                context.session.add(usage)
+        except db_exc.DBDuplicateEntry:
+            # Recorded concurrently, with the same count
+            usage = query.one()
+        return usage
+
+    @staticmethod
+    def _get_reserved(context, tenant_id, resource):
+        query = context.session.query(sa.func.sum(Reservation.amount))
+        query = query.filter(Reservation.tenant_id == tenant_id,
+                             Reservation.resource == resource)
+        return query.scalar() or 0
+
+    def make_reservation(self, context, tenant_id, resources, resource,
+                         amount):
+        """Reserve resources a request is about to create.
+
+        The reservation is counted in the usage until it is released, or
+        until it expires if the server is stopped in between.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param resources: A dictionary of the registered resources.
+        :param resource: The name of the resource to reserve.
+        :param amount: The number of resources to reserve.
+        :return: The id of the reservation, None if the quota is unlimited.
+        """
+        if amount < 0:
+            raise exceptions.InvalidQuotaValue(unders=[resource])
+        limit = self._get_quotas(context, tenant_id, resources,
+                                 [resource])[resource]
+        if limit < 0:
+            return None
+        with context.session.begin(subtransactions=True):
+            usage = self._get_usage(context, tenant_id, resource)
+            now = timeutils.utcnow()
+            # Expired reservations are purged while the usage is locked
+            context.session.query(Reservation).filter_by(
+                tenant_id=tenant_id, resource=resource).filter(
+                    Reservation.expiration <= now).delete(
+                        synchronize_session=False)
+            reserved = self._get_reserved(context, tenant_id, resource)
+            if usage.in_use + reserved + amount > limit:
+                raise exceptions.OverQuota(overs=[resource])
+            expiration = now + datetime.timedelta(
+                seconds=cfg.CONF.QUOTAS.quota_reservation_expiration)
+            reservation = Reservation(id=uuidutils.generate_uuid(),
+                                      tenant_id=tenant_id, resource=resource,
+                                      amount=amount, expiration=expiration)
+            context.session.add(reservation)
+        return reservation.id
+
+    @staticmethod
+    def release_reservation(context, reservation_id):
+        """Release a reservation once its request is done.
+
+        The resources created by the request are then in the usage.
+        """
+        if reservation_id is None:
+            return
+        with context.session.begin(subtransactions=True):
+            context.session.query(Reservation).filter_by(
+                id=reservation_id).delete(synchronize_session=False)
@@ -14,6 +14,7 @@
 #    under the License.
 
 import netaddr
+from oslo.config import cfg
 from sqlalchemy.orm import exc
 
 from neutron.common import constants as q_const
@@ -26,6 +27,16 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+security_group_rpc_opts = [
+    cfg.BoolOpt('rules_cache',
+                default=False,
+                help=_('Cache the rules of each security group sent to the '
+                       'agents. The cached rules of a group are only used '
+                       'while the ids of its rules in the database are '
+                       'unchanged.')),
+]
+cfg.CONF.register_opts(security_group_rpc_opts, 'SECURITYGROUP')
+
 
 IP_MASK = {q_const.IPv4: 32,
            q_const.IPv6: 128}
@@ -35,6 +46,50 @@ DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
 
+class SecurityGroupRulesCache(object):
+    """Rules of security groups, in the format sent to the agents.
+
+    Security group rules are only ever created or deleted, so the ids of
+    the rules of a group identify them.  The cached rules of a group are
+    only used while the ids of its rules in the database are those they
+    were cached with, whichever server process changed them.
+    """
+
+    def __init__(self):
+        self._rules = {}
+
+    @property
+    def enabled(self):
+        return cfg.CONF.SECURITYGROUP.rules_cache
+
+    def get(self, rule_ids_by_sg):
+        """Return the cached rules of the groups, by security group.
+
+        :param rule_ids_by_sg: ids of the rules of each group in the
+            database; the groups cached with other ids are omitted.
+        """
+        if not self.enabled:
+            return {}
+        rules_by_sg = {}
+        for sg_id, rule_ids in rule_ids_by_sg.items():
+            entry = self._rules.get(sg_id)
+            if entry is not None and entry[0] == rule_ids:
+                rules_by_sg[sg_id] = entry[1]
+        return rules_by_sg
+
+    def update(self, rules_by_sg, rule_ids_by_sg):
+        if self.enabled:
+            for sg_id, rules in rules_by_sg.items():
+                self._rules[sg_id] = (rule_ids_by_sg[sg_id], rules)
+
+    def invalidate(self, sg_ids):
+        for sg_id in sg_ids:
+            self._rules.pop(sg_id, None)
+
+
+SG_RULES_CACHE = SecurityGroupRulesCache()
+
+
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
 
     def create_security_group_rule(self, context, security_group_rule):
@@ -42,6 +97,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.create_security_group_rule_bulk_native(context,
                                                            bulk_rule)[0]
         sgids = [rule['security_group_id']]
+        SG_RULES_CACHE.invalidate(sgids)
         self.notifier.security_groups_rule_updated(context, sgids)
         return rule
 
@@ -51,6 +107,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                       self).create_security_group_rule_bulk_native(
                           context, security_group_rule)
         sgids = set([r['security_group_id'] for r in rules])
+        SG_RULES_CACHE.invalidate(sgids)
         self.notifier.security_groups_rule_updated(context, list(sgids))
         return rules
 
@@ -58,9 +115,15 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.get_security_group_rule(context, sgrid)
         super(SecurityGroupServerRpcMixin,
               self).delete_security_group_rule(context, sgrid)
+        SG_RULES_CACHE.invalidate([rule['security_group_id']])
         self.notifier.security_groups_rule_updated(context,
                                                    [rule['security_group_id']])
 
+    def delete_security_group(self, context, id):
+        super(SecurityGroupServerRpcMixin,
+              self).delete_security_group(context, id)
+        SG_RULES_CACHE.invalidate([id])
+
     def update_security_group_on_port(self, context, id, port,
                                       original_port, updated_port):
         """Update security groups on port.
@@ -116,18 +179,43 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         occurs and the plugin agent fetches the update provider
         rule in the other RPC call (security_group_rules_for_devices).
         """
-        if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
-            self.notifier.security_groups_provider_updated(context)
-        # For IPv6, provider rule need to be updated in case router
-        # interface is created or updated after VM port is created.
-        elif port['device_owner'] == q_const.DEVICE_OWNER_ROUTER_INTF:
-            if any(netaddr.IPAddress(fixed_ip['ip_address']).version == 6
-                   for fixed_ip in port['fixed_ips']):
+        if port['device_owner'] in (q_const.DEVICE_OWNER_DHCP,
+                                    q_const.DEVICE_OWNER_ROUTER_INTF):
+            if self._port_updates_provider_rules(port):
                 self.notifier.security_groups_provider_updated(context)
         else:
             self.notifier.security_groups_member_updated(
                 context, port.get(ext_sg.SECURITYGROUPS))
 
+    def notify_security_groups_member_updated_bulk(self, context, ports):
+        """Notify update event of security group members for many ports.
+
+        The agents are notified once for the provider rules, and once for
+        the security groups of all the ports.
+        """
+        provider_updated = False
+        sec_groups = set()
+        for port in ports:
+            if port['device_owner'] in (q_const.DEVICE_OWNER_DHCP,
+                                        q_const.DEVICE_OWNER_ROUTER_INTF):
+                provider_updated |= self._port_updates_provider_rules(port)
+            else:
+                sec_groups.update(port.get(ext_sg.SECURITYGROUPS) or [])
+        if provider_updated:
+            self.notifier.security_groups_provider_updated(context)
+        if sec_groups:
+            self.notifier.security_groups_member_updated(
+                context, list(sec_groups))
+
+    @staticmethod
+    def _port_updates_provider_rules(port):
+        if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
+            return True
+        # For IPv6, provider rule need to be updated in case router
+        # interface is created or updated after VM port is created.
+        return any(netaddr.IPAddress(fixed_ip['ip_address']).version == 6
+                   for fixed_ip in port['fixed_ips'])
+
 
 class SecurityGroupServerRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent support in plugin
@@ -144,7 +232,49 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
+
+    def security_group_info_for_devices(self, context, **kwargs):
+        """Return security group rules and remote group members for ports.
+
+        Unlike security_group_rules_for_devices, the rules of each
+        security group are returned once rather than copied into every
+        port, and remote_group_id rules are not converted into one rule
+        per member. The IP addresses of each remote group are returned
+        once instead, so that the agent can keep them in an ipset.
+
+        :params devices: list of devices
+        :returns:
+          {'devices': port correspond to the devices with their
+                      security_groups and provider rules,
+           'security_groups': {sg_id: [rule, ...]},
+           'sg_member_ips': {sg_id: {'IPv4': [ip, ...],
+                                     'IPv6': [ip, ...]}}}
+        """
+        devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        sg_ids = self._select_sg_ids_for_ports(context, ports)
+        rules_by_sg = self._select_rules_for_security_groups(context,
+                                                             sg_ids)
+        remote_group_ids = set()
+        for port in ports.values():
+            port['security_groups'] = sg_ids.get(port['id'], [])
+            for sg_id in port['security_groups']:
+                for rule in rules_by_sg[sg_id]:
+                    remote_group_id = rule.get('remote_group_id')
+                    if (remote_group_id and remote_group_id not in
+                            port['security_group_source_groups']):
+                        port['security_group_source_groups'].append(
+                            remote_group_id)
+                        remote_group_ids.add(remote_group_id)
+        self._apply_provider_rule(context, ports)
+        return {'devices': ports,
+                'security_groups': rules_by_sg,
+                'sg_member_ips': self._get_remote_group_member_ips(
+                    context, remote_group_ids)}
 
+    def _get_ports_for_devices(self, devices):
         ports = {}
         for device in devices:
             port = self.get_port_from_device(device)
@@ -153,22 +283,57 @@ class SecurityGroupServerRpcCallbackMixin(object):
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
 
-    def _select_rules_for_ports(self, context, ports):
+    def _select_sg_ids_for_ports(self, context, ports):
+        """Return the security group ids of each port, by port id."""
+        sg_ids = {}
         if not ports:
-            return []
-        sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
-        sg_binding_sgid = sg_db.SecurityGroupPortBinding.security_group_id
-
-        sgr_sgid = sg_db.SecurityGroupRule.security_group_id
-
-        query = context.session.query(sg_db.SecurityGroupPortBinding,
-                                      sg_db.SecurityGroupRule)
-        query = query.join(sg_db.SecurityGroupRule,
-                           sgr_sgid == sg_binding_sgid)
-        query = query.filter(sg_binding_port.in_(ports.keys()))
-        return query.all()
+            return sg_ids
+        binding = sg_db.SecurityGroupPortBinding
+        query = context.session.query(binding.port_id,
+                                      binding.security_group_id)
+        query = query.filter(binding.port_id.in_(ports.keys()))
+        for port_id, sg_id in query:
+            sg_ids.setdefault(port_id, []).append(sg_id)
+        return sg_ids
+
+    def _select_rules_for_security_groups(self, context, sg_ids):
+        """Return the rules of the security groups, by security group id.
+
+        :param sg_ids: security group ids of each port, by port id
+        """
+        all_sg_ids = set()
+        for port_sg_ids in sg_ids.values():
+            all_sg_ids.update(port_sg_ids)
+        rules_by_sg = {}
+        if all_sg_ids and SG_RULES_CACHE.enabled:
+            rule_ids = dict((sg_id, set()) for sg_id in all_sg_ids)
+            query = context.session.query(
+                sg_db.SecurityGroupRule.security_group_id,
+                sg_db.SecurityGroupRule.id)
+            query = query.filter(
+                sg_db.SecurityGroupRule.security_group_id.in_(all_sg_ids))
+            for sg_id, rule_id in query:
+                rule_ids[sg_id].add(rule_id)
+            rules_by_sg = SG_RULES_CACHE.get(rule_ids)
+        missing = all_sg_ids - set(rules_by_sg)
+        if missing:
+            fetched = dict((sg_id, []) for sg_id in missing)
+            fetched_ids = dict((sg_id, set()) for sg_id in missing)
+            query = context.session.query(sg_db.SecurityGroupRule)
+            query = query.filter(
+                sg_db.SecurityGroupRule.security_group_id.in_(missing))
+            for rule_in_db in query:
+                fetched[rule_in_db['security_group_id']].append(
+                    self._make_rule_dict_for_agent(rule_in_db))
+                fetched_ids[rule_in_db['security_group_id']].add(
+                    rule_in_db['id'])
+            # Cached with the ids of the rules actually fetched, which may
+            # have changed since the ids above were read.
+            SG_RULES_CACHE.update(fetched, fetched_ids)
+            rules_by_sg.update(fetched)
+        return rules_by_sg
 
     def _select_ips_for_remote_group(self, context, remote_group_ids):
         ips_by_group = {}
@@ -316,6 +481,19 @@ class SecurityGroupServerRpcCallbackMixin(object):
             port['security_group_rules'] = updated_rule
         return ports
 
+    def _get_remote_group_member_ips(self, context, remote_group_ids):
+        ips = self._select_ips_for_remote_group(context, remote_group_ids)
+        sg_member_ips = {}
+        for remote_group_id, group_ips in ips.items():
+            members = {q_const.IPv4: set(), q_const.IPv6: set()}
+            for ip in group_ips:
+                cidr = netaddr.IPNetwork(ip).cidr
+                members['IPv%s' % cidr.version].add(str(cidr))
+            sg_member_ips[remote_group_id] = dict(
+                (ethertype, sorted(member_ips))
+                for ethertype, member_ips in members.items())
+        return sg_member_ips
+
     def _add_ingress_dhcp_rule(self, port, ips):
         dhcp_ips = ips.get(port['network_id'])
         for dhcp_ip in dhcp_ips:
@@ -355,24 +533,33 @@ class SecurityGroupServerRpcCallbackMixin(object):
             self._add_ingress_dhcp_rule(port, ips_dhcp)
 
     def _security_group_rules_for_ports(self, context, ports):
-        rules_in_db = self._select_rules_for_ports(context, ports)
-        for (binding, rule_in_db) in rules_in_db:
-            port_id = binding['port_id']
+        self._select_sg_rules_for_ports(context, ports)
+        return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _make_rule_dict_for_agent(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'remote_ip_prefix', 'remote_group_id'):
+            if rule_in_db.get(key):
+                if key == 'remote_ip_prefix':
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
+                    rule_dict[direction_ip_prefix] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
+
+    def _select_sg_rules_for_ports(self, context, ports):
+        sg_ids = self._select_sg_ids_for_ports(context, ports)
+        rules_by_sg = self._select_rules_for_security_groups(context, sg_ids)
+        for port_id, port_sg_ids in sg_ids.items():
             port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'remote_ip_prefix', 'remote_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'remote_ip_prefix':
-                        direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
-                        rule_dict[direction_ip_prefix] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
-            port['security_group_rules'].append(rule_dict)
+            for sg_id in port_sg_ids:
+                port['security_group_rules'].extend(
+                    rule.copy() for rule in rules_by_sg[sg_id])
         self._apply_provider_rule(context, ports)
-        return self._convert_remote_group_id_to_ip_prefix(context, ports)
+        return ports
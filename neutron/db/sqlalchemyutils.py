@@ -42,15 +42,21 @@ def paginate_query(query, model, limit, sorts, marker_obj=None):
 
     Typically, the id of the last row is used as the client-facing pagination
     marker, then the actual marker object must be fetched from the db and
-    passed in to us as marker.
+    passed in to us as marker. A dict of the sort key values of the last row,
+    decoded from a pagination cursor, can be passed instead.
+
+    The first sort key is also bounded by its marker value: the database can
+    then seek in an index starting with this key, instead of evaluating the
+    OR-chain on every row.
 
     :param query: the query object to which we should add paging/sorting
     :param model: the ORM model class
     :param limit: maximum number of items to return
     :param sorts: array of attributes and direction by which results should
                  be sorted
-    :param marker: the last item of the previous page; we returns the next
-                    results after this value.
+    :param marker_obj: the last item of the previous page, or the dict of its
+                       sort key values; we returns the next results after
+                       this value.
     :rtype: sqlalchemy.orm.query.Query
     :return: The query with sorting/pagination added.
     """
@@ -82,7 +88,19 @@ def paginate_query(query, model, limit, sorts, marker_obj=None):
 
     # Add pagination
     if marker_obj:
-        marker_values = [getattr(marker_obj, sort[0]) for sort in sorts]
+        if isinstance(marker_obj, dict):
+            missing = [sort[0] for sort in sorts if sort[0] not in marker_obj]
+            if missing:
+                msg = _("The pagination marker has no value for the sort "
+                        "keys %s") % missing
+                raise n_exc.BadRequest(resource=model.__tablename__, msg=msg)
+            marker_values = [marker_obj[sort[0]] for sort in sorts]
+        else:
+            marker_values = [getattr(marker_obj, sort[0]) for sort in sorts]
+        # Booleans can only be compared for ordering as bound parameters
+        marker_values = [sqlalchemy.literal(value)
+                         if isinstance(value, bool) else value
+                         for value in marker_values]
 
         # Build up an array of sort criteria as in the docstring
         criteria_list = []
@@ -100,6 +118,13 @@ def paginate_query(query, model, limit, sorts, marker_obj=None):
 
         f = sqlalchemy.sql.or_(*criteria_list)
         query = query.filter(f)
+        if len(sorts) > 1 and marker_values[0] is not None:
+            # Redundant with the OR-chain, but usable as an index range
+            first_attr = getattr(model, sorts[0][0])
+            if sorts[0][1]:
+                query = query.filter(first_attr >= marker_values[0])
+            else:
+                query = query.filter(first_attr <= marker_values[0])
 
     if limit:
         query = query.limit(limit)
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 import eventlet
 from novaclient import exceptions as nova_exceptions
 import novaclient.v1_1.client as nclient
@@ -56,6 +58,14 @@ class Notifier(object):
             extensions=[server_external_events])
         self.pending_events = []
         self._waiting_to_send = False
+        self._pool = eventlet.GreenPool(cfg.CONF.nova_events_concurrency)
+        self.stats = {'queued': 0, 'coalesced': 0, 'dropped': 0,
+                      'sent': 0, 'failed': 0, 'retried': 0,
+                      'requests': 0, 'send_time': 0.0, 'max_send_time': 0.0}
+
+    @property
+    def queue_depth(self):
+        return len(self.pending_events)
 
     def queue_event(self, event):
         """Called to queue sending an event with the next batch of events.
@@ -80,7 +90,10 @@ class Notifier(object):
         if not event:
             return
 
+        if len(self.pending_events) >= cfg.CONF.nova_events_queue_size:
+            self._shrink_pending_events()
         self.pending_events.append(event)
+        self.stats['queued'] += 1
 
         if self._waiting_to_send:
             return
@@ -94,6 +107,44 @@ class Notifier(object):
 
         eventlet.spawn_n(last_out_sends)
 
+    def _shrink_pending_events(self):
+        """Make room in the queue of pending events.
+
+        The repeated events are merged first, the oldest events are dropped
+        when the queue is still full.
+        """
+        self.pending_events = self._coalesce_events(self.pending_events)
+        excess = (len(self.pending_events) -
+                  cfg.CONF.nova_events_queue_size + 1)
+        if excess > 0:
+            LOG.warning(_("Too many events waiting to be sent to nova, "
+                          "dropping %d of them"), excess)
+            del self.pending_events[:excess]
+            self.stats['dropped'] += excess
+
+    @staticmethod
+    def _event_key(event):
+        return (event.get('server_uuid'), event.get('name'),
+                event.get('tag'))
+
+    def _coalesce_events(self, events):
+        """Merge the events of an instance with the same name and tag.
+
+        The last of the repeated events is kept, at its own position, so that
+        nova sees the latest status and the order of the distinct events is
+        preserved.
+        """
+        seen = set()
+        coalesced = []
+        for event in reversed(events):
+            key = self._event_key(event)
+            if key not in seen:
+                seen.add(key)
+                coalesced.append(event)
+        coalesced.reverse()
+        self.stats['coalesced'] += len(events) - len(coalesced)
+        return coalesced
+
     def _is_compute_port(self, port):
         try:
             if (port['device_id'] and uuidutils.is_uuid_like(port['device_id'])
@@ -214,36 +265,64 @@ class Notifier(object):
         if not self.pending_events:
             return
 
-        batched_events = self.pending_events
+        batched_events = self._coalesce_events(self.pending_events)
         self.pending_events = []
 
+        batch_size = cfg.CONF.nova_events_batch_size
+        for i in range(0, len(batched_events), batch_size):
+            self._pool.spawn_n(self._send_batch,
+                               batched_events[i:i + batch_size])
+        self._pool.waitall()
+
+    def _send_batch(self, batched_events):
         LOG.debug(_("Sending events: %s"), batched_events)
-        try:
-            response = self.nclient.server_external_events.create(
-                batched_events)
-        except nova_exceptions.NotFound:
-            LOG.warning(_("Nova returned NotFound for event: %s"),
-                        batched_events)
-        except Exception:
-            LOG.exception(_("Failed to notify nova on events: %s"),
-                          batched_events)
-        else:
-            if not isinstance(response, list):
-                LOG.error(_("Error response returned from nova: %s"),
-                          response)
+        for attempt in range(cfg.CONF.nova_events_retries + 1):
+            if attempt:
+                eventlet.sleep(cfg.CONF.send_events_interval * attempt)
+                self.stats['retried'] += 1
+            start = time.time()
+            try:
+                response = self.nclient.server_external_events.create(
+                    batched_events)
+            except nova_exceptions.NotFound:
+                LOG.warning(_("Nova returned NotFound for event: %s"),
+                            batched_events)
+                self.stats['failed'] += len(batched_events)
                 return
-            response_error = False
-            for event in response:
-                try:
-                    code = event['code']
-                except KeyError:
-                    response_error = True
-                    continue
-                if code != 200:
-                    LOG.warning(_("Nova event: %s returned with failed "
-                                  "status"), event)
-                else:
-                    LOG.info(_("Nova event response: %s"), event)
-            if response_error:
-                LOG.error(_("Error response returned from nova: %s"),
-                          response)
+            except Exception:
+                LOG.exception(_("Failed to notify nova on events: %s"),
+                              batched_events)
+            else:
+                break
+            finally:
+                self._record_send_time(time.time() - start)
+        else:
+            self.stats['failed'] += len(batched_events)
+            return
+
+        self.stats['sent'] += len(batched_events)
+        if not isinstance(response, list):
+            LOG.error(_("Error response returned from nova: %s"),
+                      response)
+            return
+        response_error = False
+        for event in response:
+            try:
+                code = event['code']
+            except KeyError:
+                response_error = True
+                continue
+            if code != 200:
+                LOG.warning(_("Nova event: %s returned with failed "
+                              "status"), event)
+            else:
+                LOG.info(_("Nova event response: %s"), event)
+        if response_error:
+            LOG.error(_("Error response returned from nova: %s"),
+                      response)
+
+    def _record_send_time(self, duration):
+        self.stats['requests'] += 1
+        self.stats['send_time'] += duration
+        self.stats['max_send_time'] = max(self.stats['max_send_time'],
+                                          duration)
@@ -20,6 +20,7 @@
 # Neutron OpenVSwitch Plugin.
 # @author: Sumit Naiksatam, Cisco Systems, Inc.
 
+import contextlib
 import os
 import sys
 import time
@@ -31,6 +32,7 @@ from oslo.config import cfg
 
 from neutron.agent import l2population_rpc as l2pop_rpc
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink
 from neutron.agent.linux import utils
 from neutron.agent import rpc as agent_rpc
 from neutron.agent import securitygroups_rpc as sg_rpc
@@ -84,8 +86,22 @@ class LinuxBridgeManager:
                               'must be provided'))
         # Store network mapping to segments
         self.network_map = {}
+        # A netlink.LinkMonitor mirroring the links, if any
+        self.link_monitor = None
+        # The fdb and neighbour entries programmed on the vxlan interfaces,
+        # by interface, when they are batched
+        self.fdb_mirror = {} if cfg.CONF.VXLAN.fdb_batch else None
+        self._fdb_batch = None
+
+    def _get_link_monitor(self):
+        """Return the link monitor if the links can be looked up in it."""
+        if self.link_monitor and self.link_monitor.is_active:
+            return self.link_monitor
 
     def interface_exists_on_bridge(self, bridge, interface):
+        link_monitor = self._get_link_monitor()
+        if link_monitor:
+            return interface in link_monitor.get_slaves(bridge)
         directory = '/sys/class/net/%s/brif' % bridge
         for filename in os.listdir(directory):
             if filename == interface:
@@ -122,13 +138,20 @@ class LinuxBridgeManager:
 
     def get_all_neutron_bridges(self):
         neutron_bridge_list = []
-        bridge_list = os.listdir(BRIDGE_FS)
+        link_monitor = self._get_link_monitor()
+        if link_monitor:
+            bridge_list = link_monitor.links.keys()
+        else:
+            bridge_list = os.listdir(BRIDGE_FS)
         for bridge in bridge_list:
             if bridge.startswith(BRIDGE_NAME_PREFIX):
                 neutron_bridge_list.append(bridge)
         return neutron_bridge_list
 
     def get_interfaces_on_bridge(self, bridge_name):
+        link_monitor = self._get_link_monitor()
+        if link_monitor:
+            return link_monitor.get_slaves(bridge_name)
         if ip_lib.device_exists(bridge_name):
             bridge_interface_path = BRIDGE_INTERFACES_FS.replace(
                 BRIDGE_NAME_PLACEHOLDER, bridge_name)
@@ -137,6 +160,11 @@ class LinuxBridgeManager:
             return []
 
     def get_tap_devices_count(self, bridge_name):
+            link_monitor = self._get_link_monitor()
+            if link_monitor:
+                return len([interface for interface in
+                            link_monitor.get_slaves(bridge_name) if
+                            interface.startswith(TAP_INTERFACE_PREFIX)])
             bridge_interface_path = BRIDGE_INTERFACES_FS.replace(
                 BRIDGE_NAME_PLACEHOLDER, bridge_name)
             try:
@@ -152,6 +180,12 @@ class LinuxBridgeManager:
                 return device.name
 
     def get_bridge_for_tap_device(self, tap_device_name):
+        link_monitor = self._get_link_monitor()
+        if link_monitor:
+            bridge = link_monitor.get_master(tap_device_name)
+            if bridge and bridge['name'].startswith(BRIDGE_NAME_PREFIX):
+                return bridge['name']
+            return None
         bridges = self.get_all_neutron_bridges()
         for bridge in bridges:
             interfaces = self.get_interfaces_on_bridge(bridge)
@@ -163,6 +197,10 @@ class LinuxBridgeManager:
     def is_device_on_bridge(self, device_name):
         if not device_name:
             return False
+        link_monitor = self._get_link_monitor()
+        if link_monitor:
+            bridge = link_monitor.get_master(device_name)
+            return bool(bridge and bridge['kind'] == 'bridge')
         else:
             bridge_port_path = BRIDGE_PORT_FS_FOR_DEVICE.replace(
                 DEVICE_NAME_PLACEHOLDER, device_name)
@@ -247,6 +285,7 @@ class LinuxBridgeManager:
                 args['proxy'] = True
             int_vxlan = self.ip.add_vxlan(interface, segmentation_id, **args)
             int_vxlan.link.set_up()
+            self._forget_fdb_entries(interface)
             LOG.debug(_("Done creating vxlan interface %s"), interface)
         return interface
 
@@ -504,11 +543,17 @@ class LinuxBridgeManager:
             int_vxlan = self.ip.device(interface)
             int_vxlan.link.set_down()
             int_vxlan.link.delete()
+            self._forget_fdb_entries(interface)
             LOG.debug(_("Done deleting vxlan interface %s"), interface)
 
     def get_tap_devices(self):
         devices = set()
-        for device in os.listdir(BRIDGE_FS):
+        link_monitor = self._get_link_monitor()
+        if link_monitor:
+            device_list = link_monitor.links.keys()
+        else:
+            device_list = os.listdir(BRIDGE_FS)
+        for device in device_list:
             if device.startswith(TAP_INTERFACE_PREFIX):
                 devices.add(device)
         return devices
@@ -583,13 +628,89 @@ class LinuxBridgeManager:
             raise exceptions.VxlanNetworkUnsupported()
         LOG.debug(_('Using %s VXLAN mode'), self.vxlan_mode)
 
+    def _forget_fdb_entries(self, interface):
+        if self.fdb_mirror is not None:
+            self.fdb_mirror.pop(interface, None)
+
+    def _get_fdb_entries(self, interface):
+        """Return the mirrored entries of an interface.
+
+        They are read from the interface the first time it is used.
+        """
+        if interface not in self.fdb_mirror:
+            entries = {'neigh': {}, 'fdb': {}}
+            output = utils.execute(['ip', 'neigh', 'show', 'dev', interface],
+                                   root_helper=self.root_helper)
+            for line in output.splitlines():
+                fields = line.split()
+                if 'lladdr' in fields[:-1]:
+                    mac = fields[fields.index('lladdr') + 1]
+                    entries['neigh'][fields[0]] = mac
+            output = utils.execute(['bridge', 'fdb', 'show',
+                                    'dev', interface],
+                                   root_helper=self.root_helper)
+            for line in output.splitlines():
+                fields = line.split()
+                if 'dst' in fields[:-1]:
+                    dst = fields[fields.index('dst') + 1]
+                    entries['fdb'].setdefault(fields[0], set()).add(dst)
+            self.fdb_mirror[interface] = entries
+        return self.fdb_mirror[interface]
+
+    @contextlib.contextmanager
+    def fdb_batch(self):
+        """Program the entries changed in the block with a single command.
+
+        Only when fdb_batch is enabled: the neighbour entries are then
+        programmed with one ip command and the fdb entries with one bridge
+        command.
+        """
+        if self.fdb_mirror is None or self._fdb_batch is not None:
+            yield
+            return
+        self._fdb_batch = {'bridge': [], 'ip': []}
+        try:
+            yield
+        finally:
+            batch, self._fdb_batch = self._fdb_batch, None
+            for command in ('ip', 'bridge'):
+                if batch[command]:
+                    self._execute_batch(command, batch[command])
+
+    def _execute_batch(self, command, lines):
+        LOG.debug(_("Running %(count)d %(command)s commands in a batch"),
+                  {'count': len(lines), 'command': command})
+        # -force runs all the commands, their failures are ignored as they
+        # are when run one by one.
+        utils.execute([command, '-force', '-batch', '-'],
+                      root_helper=self.root_helper,
+                      process_input='\n'.join(' '.join(line)
+                                              for line in lines) + '\n',
+                      check_exit_code=False)
+
+    def _execute_fdb(self, cmd):
+        if self._fdb_batch is not None:
+            self._fdb_batch[cmd[0]].append(cmd[1:])
+        elif self.fdb_mirror is not None:
+            self._execute_batch(cmd[0], [cmd[1:]])
+        else:
+            utils.execute(cmd, root_helper=self.root_helper,
+                          check_exit_code=False)
+
     def fdb_ip_entry_exists(self, mac, ip, interface):
+        if self.fdb_mirror is not None:
+            return self._get_fdb_entries(interface)['neigh'].get(ip) == mac
         entries = utils.execute(['ip', 'neigh', 'show', 'to', ip,
                                  'dev', interface],
                                 root_helper=self.root_helper)
         return mac in entries
 
     def fdb_bridge_entry_exists(self, mac, interface, agent_ip=None):
+        if self.fdb_mirror is not None:
+            dsts = self._get_fdb_entries(interface)['fdb'].get(mac, set())
+            if not agent_ip:
+                return bool(dsts)
+            return agent_ip in dsts
         entries = utils.execute(['bridge', 'fdb', 'show', 'dev', interface],
                                 root_helper=self.root_helper)
         if not agent_ip:
@@ -598,28 +719,43 @@ class LinuxBridgeManager:
         return (agent_ip in entries and mac in entries)
 
     def add_fdb_ip_entry(self, mac, ip, interface):
-        utils.execute(['ip', 'neigh', 'replace', ip, 'lladdr', mac,
-                       'dev', interface, 'nud', 'permanent'],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
+        if self.fdb_mirror is not None:
+            if self.fdb_ip_entry_exists(mac, ip, interface):
+                return
+            self._get_fdb_entries(interface)['neigh'][ip] = mac
+        self._execute_fdb(['ip', 'neigh', 'replace', ip, 'lladdr', mac,
+                           'dev', interface, 'nud', 'permanent'])
 
     def remove_fdb_ip_entry(self, mac, ip, interface):
-        utils.execute(['ip', 'neigh', 'del', ip, 'lladdr', mac,
-                       'dev', interface],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
+        if self.fdb_mirror is not None:
+            self._get_fdb_entries(interface)['neigh'].pop(ip, None)
+        self._execute_fdb(['ip', 'neigh', 'del', ip, 'lladdr', mac,
+                           'dev', interface])
 
     def add_fdb_bridge_entry(self, mac, agent_ip, interface, operation="add"):
-        utils.execute(['bridge', 'fdb', operation, mac, 'dev', interface,
-                       'dst', agent_ip],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
+        if self.fdb_mirror is not None:
+            if self.fdb_bridge_entry_exists(mac, interface, agent_ip):
+                return
+            dsts = self._get_fdb_entries(interface)['fdb'].setdefault(
+                mac, set())
+            # An added entry does not replace an existing one
+            if operation == "replace" or not dsts:
+                dsts.clear()
+                dsts.add(agent_ip)
+            elif operation == "append":
+                dsts.add(agent_ip)
+        self._execute_fdb(['bridge', 'fdb', operation, mac, 'dev', interface,
+                           'dst', agent_ip])
 
     def remove_fdb_bridge_entry(self, mac, agent_ip, interface):
-        utils.execute(['bridge', 'fdb', 'del', mac, 'dev', interface,
-                       'dst', agent_ip],
-                      root_helper=self.root_helper,
-                      check_exit_code=False)
+        if self.fdb_mirror is not None:
+            entries = self._get_fdb_entries(interface)['fdb']
+            dsts = entries.get(mac, set())
+            dsts.discard(agent_ip)
+            if not dsts:
+                entries.pop(mac, None)
+        self._execute_fdb(['bridge', 'fdb', 'del', mac, 'dev', interface,
+                           'dst', agent_ip])
 
     def add_fdb_entries(self, agent_ip, ports, interface):
         for mac, ip in ports:
@@ -676,72 +812,77 @@ class LinuxBridgeRpcCallbacks(n_rpc.RpcCallback,
 
     def fdb_add(self, context, fdb_entries):
         LOG.debug(_("fdb_add received"))
-        for network_id, values in fdb_entries.items():
-            segment = self.agent.br_mgr.network_map.get(network_id)
-            if not segment:
-                return
+        with self.agent.br_mgr.fdb_batch():
+            for network_id, values in fdb_entries.items():
+                segment = self.agent.br_mgr.network_map.get(network_id)
+                if not segment:
+                    return
 
-            if segment.network_type != p_const.TYPE_VXLAN:
-                return
+                if segment.network_type != p_const.TYPE_VXLAN:
+                    return
 
-            interface = self.agent.br_mgr.get_vxlan_device_name(
-                segment.segmentation_id)
+                interface = self.agent.br_mgr.get_vxlan_device_name(
+                    segment.segmentation_id)
 
-            agent_ports = values.get('ports')
-            for agent_ip, ports in agent_ports.items():
-                if agent_ip == self.agent.br_mgr.local_ip:
-                    continue
+                agent_ports = values.get('ports')
+                for agent_ip, ports in agent_ports.items():
+                    if agent_ip == self.agent.br_mgr.local_ip:
+                        continue
 
-                self.agent.br_mgr.add_fdb_entries(agent_ip,
-                                                  ports,
-                                                  interface)
+                    self.agent.br_mgr.add_fdb_entries(agent_ip,
+                                                      ports,
+                                                      interface)
 
     def fdb_remove(self, context, fdb_entries):
         LOG.debug(_("fdb_remove received"))
-        for network_id, values in fdb_entries.items():
-            segment = self.agent.br_mgr.network_map.get(network_id)
-            if not segment:
-                return
+        with self.agent.br_mgr.fdb_batch():
+            for network_id, values in fdb_entries.items():
+                segment = self.agent.br_mgr.network_map.get(network_id)
+                if not segment:
+                    return
 
-            if segment.network_type != p_const.TYPE_VXLAN:
-                return
+                if segment.network_type != p_const.TYPE_VXLAN:
+                    return
 
-            interface = self.agent.br_mgr.get_vxlan_device_name(
-                segment.segmentation_id)
+                interface = self.agent.br_mgr.get_vxlan_device_name(
+                    segment.segmentation_id)
 
-            agent_ports = values.get('ports')
-            for agent_ip, ports in agent_ports.items():
-                if agent_ip == self.agent.br_mgr.local_ip:
-                    continue
+                agent_ports = values.get('ports')
+                for agent_ip, ports in agent_ports.items():
+                    if agent_ip == self.agent.br_mgr.local_ip:
+                        continue
 
-                self.agent.br_mgr.remove_fdb_entries(agent_ip,
-                                                     ports,
-                                                     interface)
+                    self.agent.br_mgr.remove_fdb_entries(agent_ip,
+                                                         ports,
+                                                         interface)
 
     def _fdb_chg_ip(self, context, fdb_entries):
         LOG.debug(_("update chg_ip received"))
-        for network_id, agent_ports in fdb_entries.items():
-            segment = self.agent.br_mgr.network_map.get(network_id)
-            if not segment:
-                return
+        with self.agent.br_mgr.fdb_batch():
+            for network_id, agent_ports in fdb_entries.items():
+                segment = self.agent.br_mgr.network_map.get(network_id)
+                if not segment:
+                    return
 
-            if segment.network_type != p_const.TYPE_VXLAN:
-                return
+                if segment.network_type != p_const.TYPE_VXLAN:
+                    return
 
-            interface = self.agent.br_mgr.get_vxlan_device_name(
-                segment.segmentation_id)
+                interface = self.agent.br_mgr.get_vxlan_device_name(
+                    segment.segmentation_id)
 
-            for agent_ip, state in agent_ports.items():
-                if agent_ip == self.agent.br_mgr.local_ip:
-                    continue
+                for agent_ip, state in agent_ports.items():
+                    if agent_ip == self.agent.br_mgr.local_ip:
+                        continue
 
-                after = state.get('after')
-                for mac, ip in after:
-                    self.agent.br_mgr.add_fdb_ip_entry(mac, ip, interface)
+                    after = state.get('after')
+                    for mac, ip in after:
+                        self.agent.br_mgr.add_fdb_ip_entry(mac, ip,
+                                                           interface)
 
-                before = state.get('before')
-                for mac, ip in before:
-                    self.agent.br_mgr.remove_fdb_ip_entry(mac, ip, interface)
+                    before = state.get('before')
+                    for mac, ip in before:
+                        self.agent.br_mgr.remove_fdb_ip_entry(mac, ip,
+                                                              interface)
 
     def fdb_update(self, context, fdb_entries):
         LOG.debug(_("fdb_update received"))
@@ -832,6 +973,18 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
 
     def setup_linux_bridge(self, interface_mappings):
         self.br_mgr = LinuxBridgeManager(interface_mappings, self.root_helper)
+        self.link_monitor = None
+        if cfg.CONF.AGENT.netlink_link_monitor:
+            self.link_monitor = netlink.LinkMonitor()
+            self.link_monitor.start()
+            self.br_mgr.link_monitor = self.link_monitor
+
+    def _wait(self, timeout):
+        if self.link_monitor and self.link_monitor.is_active:
+            # Handle the link changes as soon as they are notified
+            self.link_monitor.wait(timeout)
+        else:
+            time.sleep(timeout)
 
     def remove_port_binding(self, network_id, interface_id):
         bridge_name = self.br_mgr.get_bridge_name(network_id)
@@ -1006,7 +1159,7 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
             # sleep till end of polling interval
             elapsed = (time.time() - start)
             if (elapsed < self.polling_interval):
-                time.sleep(self.polling_interval - elapsed)
+                self._wait(self.polling_interval - elapsed)
             else:
                 LOG.debug(_("Loop iteration exceeded interval "
                             "(%(polling_interval)s vs. %(elapsed)s)!"),
@@ -1015,6 +1168,7 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
 
 
 def main():
+    cfg.CONF.register_opts(ip_lib.OPTS)
     common_config.init(sys.argv[1:])
 
     common_config.setup_logging(cfg.CONF)
@@ -51,6 +51,11 @@ vxlan_opts = [
                 help=_("Extension to use alongside ml2 plugin's l2population "
                        "mechanism driver. It enables the plugin to populate "
                        "VXLAN forwarding table.")),
+    cfg.BoolOpt('fdb_batch', default=False,
+                help=_("Program the forwarding and neighbour entries of an "
+                       "l2_population update with one bridge and one ip "
+                       "command, and mirror them in memory instead of "
+                       "reading them back before each change.")),
 ]
 
 bridge_opts = [
@@ -65,6 +70,12 @@ agent_opts = [
                       "polling for local device changes.")),
     cfg.BoolOpt('rpc_support_old_agents', default=False,
                 help=_("Enable server RPC compatibility with old agents")),
+    cfg.BoolOpt('netlink_link_monitor', default=False,
+                help=_("Minimize polling by monitoring the links with "
+                       "netlink: the tap devices and the ports of the "
+                       "bridges are then looked up in memory instead of "
+                       "sysfs, and the changes are handled without waiting "
+                       "for the end of the polling interval.")),
 ]
 
 
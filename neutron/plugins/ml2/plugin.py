@@ -37,6 +37,7 @@ from neutron.db import dvr_mac_db
 from neutron.db import external_net_db
 from neutron.db import extradhcpopt_db
 from neutron.db import models_v2
+from neutron.db import network_cache
 from neutron.db import quota_db  # noqa
 from neutron.db import securitygroups_rpc_base as sg_db_rpc
 from neutron.extensions import allowedaddresspairs as addr_pair
@@ -191,9 +192,20 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             value = None
         return value
 
-    def _extend_network_dict_provider(self, context, network):
+    def _load_networks_segments(self, context, network_ids):
+        return db.get_networks_segments(context.session, network_ids)
+
+    def _get_networks_segments(self, context, network_ids):
+        if network_cache.is_enabled():
+            return network_cache.SEGMENTS.get(context, network_ids,
+                                              self._load_networks_segments)
+        return self._load_networks_segments(context, network_ids)
+
+    def _extend_network_dict_provider(self, context, network,
+                                      segments=None):
         id = network['id']
-        segments = db.get_network_segments(context.session, id)
+        if segments is None:
+            segments = db.get_network_segments(context.session, id)
         if not segments:
             LOG.error(_("Network %s has no segments"), id)
             network[provider.NETWORK_TYPE] = None
@@ -582,8 +594,11 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             nets = super(Ml2Plugin,
                          self).get_networks(context, filters, None, sorts,
                                             limit, marker, page_reverse)
+            segments = self._get_networks_segments(
+                context, [net['id'] for net in nets])
             for net in nets:
-                self._extend_network_dict_provider(context, net)
+                self._extend_network_dict_provider(
+                    context, net, segments[net['id']] or [])
 
             nets = self._filter_nets_provider(context, nets, filters)
             nets = self._filter_nets_l3(context, nets, filters)
@@ -645,6 +660,7 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
 
                         record = self._get_network(context, id)
                         LOG.debug(_("Deleting network record %s"), record)
+                        network_cache.bump(context, id)
                         session.delete(record)
 
                         for segment in mech_context.network_segments:
@@ -761,6 +777,7 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
 
                     LOG.debug(_("Deleting subnet record"))
                     record = self._get_subnet(context, id)
+                    network_cache.bump(context, record.network_id)
                     session.delete(record)
 
                     LOG.debug(_("Committing transaction"))
@@ -791,7 +808,7 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             # the fact that an error occurred.
             LOG.error(_("mechanism_manager.delete_subnet_postcommit failed"))
 
-    def create_port(self, context, port):
+    def _create_port_db(self, context, port, network=None):
         attrs = port['port']
         attrs['status'] = const.PORT_STATUS_DOWN
 
@@ -802,7 +819,8 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             dhcp_opts = port['port'].get(edo_ext.EXTRADHCPOPTS, [])
             result = super(Ml2Plugin, self).create_port(context, port)
             self._process_port_create_security_group(context, result, sgids)
-            network = self.get_network(context, result['network_id'])
+            if network is None:
+                network = self.get_network(context, result['network_id'])
             binding = db.add_port_binding(session, result['id'])
             mech_context = driver_context.PortContext(self, context, result,
                                                       network, binding)
@@ -815,7 +833,10 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             self._process_port_create_extra_dhcp_opts(context, result,
                                                       dhcp_opts)
             self.mechanism_manager.create_port_precommit(mech_context)
+        return result, mech_context
 
+    def create_port(self, context, port):
+        result, mech_context = self._create_port_db(context, port)
         try:
             self.mechanism_manager.create_port_postcommit(mech_context)
         except ml2_exc.MechanismDriverError:
@@ -837,6 +858,61 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
                 self.delete_port(context, result['id'])
         return bound_context._port
 
+    def _delete_created_ports(self, context, port_ids):
+        for port_id in port_ids:
+            try:
+                self.delete_port(context, port_id)
+            except Exception:
+                LOG.exception(_("Failed to delete port '%s'"), port_id)
+
+    def create_port_bulk(self, context, ports):
+        """Create several ports in a single transaction.
+
+        The networks are looked up once, the ports are committed together
+        and the agents are notified once of the security group members.
+        The MAC and IP addresses are still allocated port by port, by
+        _create_port_db, and the postcommit and binding of the mechanism
+        drivers also run once per port.
+        """
+        items = ports['ports']
+        network_ids = list(set(item['port']['network_id'] for item in items))
+        networks = dict((net['id'], net) for net in self.get_networks(
+            context, filters={'id': network_ids}))
+        created = []
+        try:
+            with context.session.begin(subtransactions=True):
+                for item in items:
+                    created.append(self._create_port_db(
+                        context, item,
+                        networks.get(item['port']['network_id'])))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_("An exception occurred while creating %(total)d "
+                            "ports, after %(done)d of them were processed"),
+                          {'total': len(items), 'done': len(created)})
+        port_ids = [result['id'] for result, mech_context in created]
+
+        try:
+            for result, mech_context in created:
+                self.mechanism_manager.create_port_postcommit(mech_context)
+        except ml2_exc.MechanismDriverError:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_("mechanism_manager.create_port_postcommit "
+                            "failed, deleting ports %s"), port_ids)
+                self._delete_created_ports(context, port_ids)
+
+        self.notify_security_groups_member_updated_bulk(
+            context, [result for result, mech_context in created])
+
+        try:
+            return [self._bind_port_if_needed(mech_context)._port
+                    for result, mech_context in created]
+        except ml2_exc.MechanismDriverError:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_("_bind_port_if_needed failed, deleting ports "
+                            "%s"), port_ids)
+                self._delete_created_ports(context, port_ids)
+
     def update_port(self, context, id, port):
         attrs = port['port']
         need_port_update_notify = False
@@ -44,12 +44,13 @@ class RpcCallbacks(n_rpc.RpcCallback,
                    sg_db_rpc.SecurityGroupServerRpcCallbackMixin,
                    type_tunnel.TunnelRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.3'
+    RPC_API_VERSION = '1.4'
     # history
     #   1.0 Initial version (from openvswitch/linuxbridge)
     #   1.1 Support Security Group RPC
     #   1.2 Support get_devices_details_list
     #   1.3 Support Distributed Virtual Router (DVR)
+    #   1.4 Support get_dhcp_ports
 
     def __init__(self, notifier, type_manager):
         self.setup_tunnel_callback_mixin(notifier, type_manager)
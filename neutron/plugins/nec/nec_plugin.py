@@ -696,7 +696,7 @@ class SecurityGroupServerRpcCallback(
     n_rpc.RpcCallback,
     sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
 
-    RPC_API_VERSION = sg_rpc.SG_RPC_VERSION
+    RPC_API_VERSION = sg_rpc.SG_INFO_RPC_VERSION
 
     @staticmethod
     def get_port_from_device(device):
@@ -56,7 +56,10 @@ class NVSDPluginRpcCallbacks(n_rpc.RpcCallback,
                              l3_rpc_base.L3RpcCallbackMixin,
                              sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
+    # history
+    #   1.1 Support Security Group RPC
+    #   1.2 Support security_group_info_for_devices
 
     @staticmethod
     def get_port_from_device(device):
@@ -15,6 +15,7 @@
 #    under the License.
 
 import hashlib
+import re
 import signal
 import sys
 import time
@@ -74,6 +75,10 @@ class LocalVLANMapping:
         self.vif_ports = vif_ports
         # set of tunnel ports on which packets should be flooded
         self.tun_ofports = set()
+        # remote unicast flows {mac: ofport} and ARP responder entries
+        # {ip: mac} installed for this local VLAN, when they are cached
+        self.ucast_ofports = {}
+        self.arp_entries = {}
 
     def __str__(self):
         return ("lv-id = %s type = %s phys-net = %s phys-id = %s" %
@@ -140,7 +145,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                  ovsdb_monitor_respawn_interval=(
                      constants.DEFAULT_OVSDBMON_RESPAWN),
                  arp_responder=False,
-                 use_veth_interconnection=False):
+                 use_veth_interconnection=False,
+                 ovsdb_port_cache=False,
+                 l2pop_flow_cache=False):
         '''Constructor.
 
         :param integ_br: name of the integration bridge.
@@ -163,6 +170,12 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                supported.
         :param use_veth_interconnection: use veths instead of patch ports to
                interconnect the integration bridge to physical bridges.
+        :param ovsdb_port_cache: Optional, when using polling minimization,
+               whether to mirror the ovsdb ports and query them instead of
+               running ovs-vsctl.
+        :param l2pop_flow_cache: Optional, with l2_population, whether to
+               keep the flows installed for each local VLAN in memory and
+               only send the flows which change.
         '''
         super(OVSNeutronAgent, self).__init__()
         self.use_veth_interconnection = use_veth_interconnection
@@ -176,6 +189,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         #                 ML2 l2 population mechanism driver.
         self.enable_distributed_routing = enable_distributed_routing
         self.arp_responder_enabled = arp_responder and self.l2_pop
+        self.l2pop_flow_cache = l2pop_flow_cache and self.l2_pop
         self.agent_state = {
             'binary': 'neutron-openvswitch-agent',
             'host': cfg.CONF.host,
@@ -202,12 +216,17 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.bridge_mappings = bridge_mappings
         self.setup_physical_bridges(self.bridge_mappings)
         self.local_vlan_map = {}
+        # The same LocalVLANMappings, indexed by their local VLAN
+        self.lvm_by_vlan = {}
         self.tun_br_ofports = {p_const.TYPE_GRE: {},
                                p_const.TYPE_VXLAN: {}}
 
         self.polling_interval = polling_interval
         self.minimize_polling = minimize_polling
         self.ovsdb_monitor_respawn_interval = ovsdb_monitor_respawn_interval
+        self.ovsdb_port_cache = ovsdb_port_cache
+        # Set by daemon_loop to the port cache of the polling manager
+        self.port_cache = None
 
         if tunnel_types:
             self.enable_tunneling = True
@@ -363,40 +382,55 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                     self.fdb_remove_tun(context, self.tun_br, lvm,
                                         agent_ports, self.tun_br_ofports)
 
-    def add_fdb_flow(self, br, port_info, remote_ip, lvm, ofport):
-        if port_info == q_const.FLOODING_ENTRY:
-            lvm.tun_ofports.add(ofport)
+    def _set_flood_flow(self, br, lvm):
+        if lvm.tun_ofports:
             ofports = ','.join(lvm.tun_ofports)
             br.mod_flow(table=constants.FLOOD_TO_TUN,
                         dl_vlan=lvm.vlan,
                         actions="strip_vlan,set_tunnel:%s,output:%s" %
                         (lvm.segmentation_id, ofports))
+        else:
+            # This local vlan doesn't require any more tunnelling
+            br.delete_flows(table=constants.FLOOD_TO_TUN, dl_vlan=lvm.vlan)
+
+    def _add_ucast_flow(self, br, lvm, mac, ofport):
+        br.add_flow(table=constants.UCAST_TO_TUN,
+                    priority=2,
+                    dl_vlan=lvm.vlan,
+                    dl_dst=mac,
+                    actions="strip_vlan,set_tunnel:%s,output:%s" %
+                    (lvm.segmentation_id, ofport))
+
+    def add_fdb_flow(self, br, port_info, remote_ip, lvm, ofport):
+        if port_info == q_const.FLOODING_ENTRY:
+            if self.l2pop_flow_cache and ofport in lvm.tun_ofports:
+                return
+            lvm.tun_ofports.add(ofport)
+            self._set_flood_flow(br, lvm)
         else:
             self.setup_entry_for_arp_reply(br, 'add', lvm.vlan, port_info[0],
                                            port_info[1])
             if not self.dvr_agent.is_dvr_router_interface(port_info[1]):
-                br.add_flow(table=constants.UCAST_TO_TUN,
-                            priority=2,
-                            dl_vlan=lvm.vlan,
-                            dl_dst=port_info[0],
-                            actions="strip_vlan,set_tunnel:%s,output:%s" %
-                            (lvm.segmentation_id, ofport))
+                if self.l2pop_flow_cache:
+                    if lvm.ucast_ofports.get(port_info[0]) == ofport:
+                        return
+                    lvm.ucast_ofports[port_info[0]] = ofport
+                self._add_ucast_flow(br, lvm, port_info[0], ofport)
 
     def del_fdb_flow(self, br, port_info, remote_ip, lvm, ofport):
         if port_info == q_const.FLOODING_ENTRY:
+            if self.l2pop_flow_cache and ofport not in lvm.tun_ofports:
+                return
             lvm.tun_ofports.remove(ofport)
-            if len(lvm.tun_ofports) > 0:
-                ofports = ','.join(lvm.tun_ofports)
-                br.mod_flow(table=constants.FLOOD_TO_TUN,
-                            dl_vlan=lvm.vlan,
-                            actions="strip_vlan,set_tunnel:%s,output:%s" %
-                            (lvm.segmentation_id, ofports))
-            else:
-                # This local vlan doesn't require any more tunnelling
-                br.delete_flows(table=constants.FLOOD_TO_TUN, dl_vlan=lvm.vlan)
+            self._set_flood_flow(br, lvm)
         else:
             self.setup_entry_for_arp_reply(br, 'remove', lvm.vlan,
                                            port_info[0], port_info[1])
+            if self.l2pop_flow_cache:
+                # The mac may have moved to another tunnel meanwhile
+                if lvm.ucast_ofports.get(port_info[0]) != ofport:
+                    return
+                del lvm.ucast_ofports[port_info[0]]
             br.delete_flows(table=constants.UCAST_TO_TUN,
                             dl_vlan=lvm.vlan,
                             dl_dst=port_info[0])
@@ -421,6 +455,20 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         mac = netaddr.EUI(mac_address, dialect=netaddr.mac_unix)
         ip = netaddr.IPAddress(ip_address)
 
+        lvm = self.l2pop_flow_cache and self.lvm_by_vlan.get(local_vid)
+        if lvm:
+            if action == 'add':
+                if lvm.arp_entries.get(str(ip)) == mac:
+                    return
+                lvm.arp_entries[str(ip)] = mac
+            elif action == 'remove':
+                if lvm.arp_entries.get(str(ip)) != mac:
+                    return
+                del lvm.arp_entries[str(ip)]
+
+        self._set_arp_reply_flow(br, action, local_vid, mac, ip)
+
+    def _set_arp_reply_flow(self, br, action, local_vid, mac, ip):
         if action == 'add':
             actions = constants.ARP_RESPONDER_ACTIONS % {'mac': mac, 'ip': ip}
             br.add_flow(table=constants.ARP_RESPONDER,
@@ -437,6 +485,92 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         else:
             LOG.warning(_('Action %s not supported'), action)
 
+    def _dump_tun_flows(self, table):
+        """Return the match fields and actions of the flows of a table."""
+        flows = []
+        for flow in (self.tun_br.dump_flows_for_table(table) or
+                     '').splitlines():
+            match, _sep, actions = flow.partition(' actions=')
+            if not actions:
+                continue
+            fields = {}
+            for field in match.replace(' ', ',').split(','):
+                key, _sep, value = field.partition('=')
+                if key:
+                    fields[key] = value
+            flows.append((fields, actions.strip()))
+        return flows
+
+    def reconcile_fdb_flows(self):
+        '''Reconcile the l2 population flows of the tunnel bridge.
+
+        The flooding, unicast and ARP responder tables are dumped once each
+        and compared with the flows cached for the local VLANs: the missing
+        or different flows are installed, replacing the installed ones, and
+        the stale ones are deleted.
+        '''
+        lvms = dict((lvm.vlan, lvm) for lvm in self.local_vlan_map.values()
+                    if lvm.network_type in constants.TUNNEL_NETWORK_TYPES)
+        with self.tun_br.deferred() as br:
+            flooded = set()
+            for fields, actions in self._dump_tun_flows(
+                    constants.FLOOD_TO_TUN):
+                if 'dl_vlan' not in fields:
+                    continue
+                lvm = lvms.get(int(fields['dl_vlan']))
+                ofports = set(re.findall(r'output:(\d+)', actions))
+                if lvm is None or not lvm.tun_ofports:
+                    br.delete_flows(table=constants.FLOOD_TO_TUN,
+                                    dl_vlan=fields['dl_vlan'])
+                elif ofports == set(str(ofport)
+                                    for ofport in lvm.tun_ofports):
+                    flooded.add(lvm.vlan)
+            for lvm in lvms.values():
+                if lvm.tun_ofports and lvm.vlan not in flooded:
+                    self._set_flood_flow(br, lvm)
+
+            installed = set()
+            for fields, actions in self._dump_tun_flows(
+                    constants.UCAST_TO_TUN):
+                # Leave the flows learnt from the tunnels alone
+                if fields.get('priority') != '2' or 'dl_vlan' not in fields:
+                    continue
+                lvm = lvms.get(int(fields['dl_vlan']))
+                mac = fields.get('dl_dst')
+                if lvm is None or mac not in lvm.ucast_ofports:
+                    br.delete_flows(table=constants.UCAST_TO_TUN,
+                                    dl_vlan=fields['dl_vlan'], dl_dst=mac)
+                elif ([str(lvm.ucast_ofports[mac])] ==
+                      re.findall(r'output:(\d+)', actions)):
+                    installed.add((lvm.vlan, mac))
+            for lvm in lvms.values():
+                for mac, ofport in lvm.ucast_ofports.items():
+                    if (lvm.vlan, mac) not in installed:
+                        self._add_ucast_flow(br, lvm, mac, ofport)
+
+            if not self.arp_responder_enabled:
+                return
+            installed = set()
+            for fields, actions in self._dump_tun_flows(
+                    constants.ARP_RESPONDER):
+                if 'dl_vlan' not in fields:
+                    continue
+                lvm = lvms.get(int(fields['dl_vlan']))
+                ip = fields.get('arp_tpa', fields.get('nw_dst'))
+                if lvm is None or ip not in lvm.arp_entries:
+                    br.delete_flows(table=constants.ARP_RESPONDER,
+                                    proto='arp', dl_vlan=fields['dl_vlan'],
+                                    nw_dst=ip)
+                elif [lvm.arp_entries[ip]] == [
+                        netaddr.EUI(mac) for mac in
+                        re.findall(r'mod_dl_src:([0-9a-f:]+)', actions)]:
+                    installed.add((lvm.vlan, ip))
+            for lvm in lvms.values():
+                for ip, mac in lvm.arp_entries.items():
+                    if (lvm.vlan, ip) not in installed:
+                        self._set_arp_reply_flow(br, 'add', lvm.vlan, mac,
+                                                 netaddr.IPAddress(ip))
+
     def provision_local_vlan(self, net_uuid, network_type, physical_network,
                              segmentation_id):
         '''Provisions a local VLAN.
@@ -459,10 +593,10 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 LOG.error(_("No local VLAN available for net-id=%s"), net_uuid)
                 return
             lvid = self.available_local_vlans.pop()
-            self.local_vlan_map[net_uuid] = LocalVLANMapping(lvid,
-                                                             network_type,
-                                                             physical_network,
-                                                             segmentation_id)
+            lvm = LocalVLANMapping(lvid, network_type, physical_network,
+                                   segmentation_id)
+            self.local_vlan_map[net_uuid] = lvm
+            self.lvm_by_vlan[lvid] = lvm
 
         LOG.info(_("Assigning %(vlan_id)s as local vlan for "
                    "net-id=%(net_uuid)s"),
@@ -472,6 +606,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
             if self.enable_tunneling:
                 # outbound broadcast/multicast
                 ofports = ','.join(self.tun_br_ofports[network_type].values())
+                if self.l2pop_flow_cache and lvm and lvm.tun_ofports:
+                    # Keep flooding to the tunnels cached for the vlan
+                    ofports = ','.join(lvm.tun_ofports)
                 if ofports:
                     self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
                                          dl_vlan=lvid,
@@ -557,6 +694,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         if lvm is None:
             LOG.debug(_("Network %s not used on agent."), net_uuid)
             return
+        self.lvm_by_vlan.pop(lvm.vlan, None)
 
         LOG.info(_("Reclaiming vlan = %(vlan_id)s from net-id = %(net_uuid)s"),
                  {'vlan_id': lvm.vlan,
@@ -929,8 +1067,29 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 br.set_db_attribute('Interface', phys_if_name,
                                     'options:peer', int_if_name)
 
+    def _get_port_cache(self):
+        """Return the ovsdb port cache, if it is in sync with ovsdb."""
+        if self.port_cache and self.port_cache.is_active:
+            return self.port_cache
+
+    def _get_vif_port_set(self, bridge):
+        port_cache = self._get_port_cache()
+        if port_cache:
+            return port_cache.get_vif_port_set(bridge.br_name)
+        return bridge.get_vif_port_set()
+
+    def _get_vif_port_by_id(self, port_id):
+        port_cache = self._get_port_cache()
+        if not port_cache:
+            return self.int_br.get_vif_port_by_id(port_id)
+        attrs = port_cache.get_vif_port_attrs(self.int_br.br_name, port_id)
+        if attrs:
+            port_name, ofport, mac = attrs
+            return ovs_lib.VifPort(port_name, ofport, port_id, mac,
+                                   self.int_br)
+
     def scan_ports(self, registered_ports, updated_ports=None):
-        cur_ports = self.int_br.get_vif_port_set()
+        cur_ports = self._get_vif_port_set(self.int_br)
         self.int_br_device_count = len(cur_ports)
         port_info = {'current': cur_ports}
         if updated_ports is None:
@@ -962,7 +1121,11 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         The returned value is a set of port ids of the ports concerned by a
         vlan tag loss.
         """
-        port_tags = self.int_br.get_port_tag_dict()
+        port_cache = self._get_port_cache()
+        if port_cache:
+            port_tags = port_cache.get_port_tag_dict(self.int_br.br_name)
+        else:
+            port_tags = self.int_br.get_port_tag_dict()
         changed_ports = set()
         for lvm in self.local_vlan_map.values():
             for port in registered_ports:
@@ -983,7 +1146,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
     def update_ancillary_ports(self, registered_ports):
         ports = set()
         for bridge in self.ancillary_brs:
-            ports |= bridge.get_vif_port_set()
+            ports |= self._get_vif_port_set(bridge)
 
         if ports == registered_ports:
             return
@@ -1089,7 +1252,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         for details in devices_details_list:
             device = details['device']
             LOG.debug("Processing port: %s", device)
-            port = self.int_br.get_vif_port_by_id(device)
+            port = self._get_vif_port_by_id(device)
             if not port:
                 # The port disappeared and cannot be processed
                 LOG.info(_("Port %s was not found on the integration bridge "
@@ -1370,6 +1533,8 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 LOG.info(_("Agent tunnel out of sync with plugin!"))
                 try:
                     tunnel_sync = self.tunnel_sync()
+                    if not tunnel_sync and self.l2pop_flow_cache:
+                        self.reconcile_fdb_flows()
                 except Exception:
                     LOG.exception(_("Error while synchronizing tunnels"))
                     tunnel_sync = True
@@ -1466,8 +1631,10 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         with polling.get_polling_manager(
             self.minimize_polling,
             self.root_helper,
-            self.ovsdb_monitor_respawn_interval) as pm:
+            self.ovsdb_monitor_respawn_interval,
+            self.ovsdb_port_cache) as pm:
 
+            self.port_cache = pm.port_cache
             self.rpc_loop(polling_manager=pm)
 
     def _handle_sigterm(self, signum, frame):
@@ -1500,6 +1667,8 @@ def create_agent_config_map(config):
         l2_population=config.AGENT.l2_population,
         arp_responder=config.AGENT.arp_responder,
         use_veth_interconnection=config.OVS.use_veth_interconnection,
+        ovsdb_port_cache=config.AGENT.ovsdb_port_cache,
+        l2pop_flow_cache=config.AGENT.l2pop_flow_cache,
     )
 
     # If enable_tunneling is TRUE, set tunnel_type to default to GRE
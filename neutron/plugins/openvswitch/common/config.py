@@ -71,6 +71,11 @@ agent_opts = [
                default=constants.DEFAULT_OVSDBMON_RESPAWN,
                help=_("The number of seconds to wait before respawning the "
                       "ovsdb monitor after losing communication with it")),
+    cfg.BoolOpt('ovsdb_port_cache', default=False,
+                help=_("When minimizing polling, mirror the bridges, ports "
+                       "and interfaces of ovsdb and use them to find the "
+                       "ports of the bridges, instead of running "
+                       "ovs-vsctl.")),
     cfg.ListOpt('tunnel_types', default=DEFAULT_TUNNEL_TYPES,
                 help=_("Network types supported by the agent "
                        "(gre and/or vxlan)")),
@@ -83,6 +88,11 @@ agent_opts = [
                        "remote mac and IPs and improve tunnel scalability")),
     cfg.BoolOpt('arp_responder', default=False,
                 help=_("Enable local ARP responder if it is supported")),
+    cfg.BoolOpt('l2pop_flow_cache', default=False,
+                help=_("Keep the l2population flows of each local VLAN in "
+                       "memory, only send the flows which change and "
+                       "reconcile the tunnel bridge with them after a "
+                       "tunnel sync")),
     cfg.BoolOpt('dont_fragment', default=True,
                 help=_("Set or un-set the don't fragment (DF) bit on "
                        "outgoing IP packet carrying GRE/VXLAN tunnel")),
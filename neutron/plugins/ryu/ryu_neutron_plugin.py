@@ -50,7 +50,10 @@ class RyuRpcCallbacks(n_rpc.RpcCallback,
                       l3_rpc_base.L3RpcCallbackMixin,
                       sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
+    # history
+    #   1.1 Support Security Group RPC
+    #   1.2 Support security_group_info_for_devices
 
     def __init__(self, ofp_rest_api_addr):
         super(RyuRpcCallbacks, self).__init__()
@@ -28,6 +28,10 @@ class DhcpAgentNotifyAPI(dhcp_rpc_agent_api.DhcpAgentNotifyAPI):
         super(DhcpAgentNotifyAPI, self).__init__(topic=topics.DHCP_AGENT)
         self.agentless_notifier = nsx_svc.DhcpAgentNotifyAPI(plugin, manager)
 
+    def notify_bulk(self, context, obj_type, obj_values, methodname):
+        for obj_value in obj_values:
+            self.notify(context, {obj_type: obj_value}, methodname)
+
     def notify(self, context, data, methodname):
         [resource, action, _e] = methodname.split('.')
         lsn_manager = self.agentless_notifier.plugin.lsn_manager
@@ -34,6 +34,15 @@ from neutron.openstack.common import policy
 LOG = logging.getLogger(__name__)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+# Read rules compiled for the rules currently loaded in the policy engine,
+# and the decisions of those which do not depend on the target. They are
+# dropped whenever the rules are loaded or reset; _COMPILED_FOR keeps a
+# reference to the rules they were compiled for, so that rules set
+# directly in the policy engine are detected as well.
+_COMPILED_FOR = None
+_COMPILED_CHECKS = {}
+_DECISION_CACHE = {}
+MAX_CACHED_DECISIONS = 10000
 ADMIN_CTX_POLICY = 'context_is_admin'
 # Maps deprecated 'extension' policies to new-style policies
 DEPRECATED_POLICY_MAP = {
@@ -60,9 +69,19 @@ def reset():
     global _POLICY_CACHE
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _reset_compiled_checks()
     policy.reset()
 
 
+def _reset_compiled_checks(rules=None):
+    global _COMPILED_FOR
+    global _COMPILED_CHECKS
+    global _DECISION_CACHE
+    _COMPILED_FOR = rules
+    _COMPILED_CHECKS = {}
+    _DECISION_CACHE = {}
+
+
 def init():
     global _POLICY_PATH
     global _POLICY_CACHE
@@ -116,6 +135,7 @@ def _set_rules(data):
                               "deprecated policy %s. The policy will "
                               "not be enforced"), pol)
     policy.set_rules(policies)
+    _reset_compiled_checks(policies)
 
 
 def _is_attribute_explicitly_set(attribute_name, resource, target):
@@ -317,6 +337,125 @@ class FieldCheck(policy.Check):
         return target_value == self.value
 
 
+class _CompiledCheck(object):
+    """A policy rule flattened into a single callable.
+
+    Rule references are resolved once, so evaluating the rule no longer
+    goes through the rules dictionary. A rule which only looks at the
+    credentials is marked as target independent, along with the keys of
+    the credentials it reads.
+    """
+
+    def __init__(self, func, target_dependent, cred_keys=()):
+        self.func = func
+        self.target_dependent = target_dependent
+        self.cred_keys = frozenset(cred_keys)
+
+    def __call__(self, target, creds):
+        return self.func(target, creds)
+
+
+def _compile_and(checks):
+    funcs = [check.func for check in checks]
+
+    def func(target, creds):
+        for f in funcs:
+            if not f(target, creds):
+                return False
+        return True
+    return func
+
+
+def _compile_or(checks):
+    funcs = [check.func for check in checks]
+
+    def func(target, creds):
+        for f in funcs:
+            if f(target, creds):
+                return True
+        return False
+    return func
+
+
+def _compile(rule, resolving=()):
+    """Compile a policy check tree into a _CompiledCheck."""
+    if isinstance(rule, policy.RuleCheck):
+        if rule.match in resolving:
+            # Circular reference, let the policy engine deal with it
+            return _CompiledCheck(rule, True)
+        try:
+            referenced = policy._rules[rule.match]
+        except KeyError:
+            # We don't have any matching rule; fail closed
+            return _CompiledCheck(lambda target, creds: False, False)
+        return _compile(referenced, resolving + (rule.match,))
+    if isinstance(rule, policy.TrueCheck):
+        return _CompiledCheck(lambda target, creds: True, False)
+    if isinstance(rule, policy.FalseCheck):
+        return _CompiledCheck(lambda target, creds: False, False)
+    if isinstance(rule, policy.RoleCheck):
+        role = rule.match.lower()
+        return _CompiledCheck(
+            lambda target, creds: role in [x.lower() for x in creds['roles']],
+            False, ['roles'])
+    if isinstance(rule, (policy.AndCheck, policy.OrCheck)):
+        checks = [_compile(sub_rule, resolving) for sub_rule in rule.rules]
+        if isinstance(rule, policy.AndCheck):
+            func = _compile_and(checks)
+        else:
+            func = _compile_or(checks)
+        return _CompiledCheck(
+            func, any(check.target_dependent for check in checks),
+            itertools.chain(*[check.cred_keys for check in checks]))
+    if isinstance(rule, policy.NotCheck):
+        check = _compile(rule.rule, resolving)
+        return _CompiledCheck(lambda target, creds: not check(target, creds),
+                              check.target_dependent, check.cred_keys)
+    if (type(rule) is policy.GenericCheck and '%(' not in rule.match):
+        return _CompiledCheck(rule, False, [rule.kind])
+    # Any other check, e.g. tenant_id or field, looks at the target
+    return _CompiledCheck(rule, True)
+
+
+def _get_compiled_check(action):
+    rules = policy._rules
+    if _COMPILED_FOR is not rules:
+        _reset_compiled_checks(rules)
+    if action not in _COMPILED_CHECKS:
+        _COMPILED_CHECKS[action] = _compile(policy.RuleCheck('rule', action))
+    return _COMPILED_CHECKS[action]
+
+
+def _get_decision_key(action, compiled, credentials):
+    key = [action]
+    for cred_key in sorted(compiled.cred_keys):
+        value = credentials.get(cred_key)
+        if cred_key == 'roles':
+            value = tuple(sorted(x.lower() for x in value or []))
+        key.append(value)
+    return tuple(key)
+
+
+def _check_read_collection(context, action, targets):
+    """Evaluate a read rule on each target, compiling it once."""
+    compiled = _get_compiled_check(action)
+    credentials = context.to_dict()
+    if compiled.target_dependent:
+        return [compiled(target, credentials) for target in targets]
+    key = _get_decision_key(action, compiled, credentials)
+    try:
+        result = _DECISION_CACHE[key]
+    except KeyError:
+        result = compiled({}, credentials)
+        if len(_DECISION_CACHE) >= MAX_CACHED_DECISIONS:
+            _DECISION_CACHE.clear()
+        _DECISION_CACHE[key] = result
+    except TypeError:
+        # Unhashable credentials, do not cache the decision
+        result = compiled({}, credentials)
+    return [result] * len(targets)
+
+
 def _prepare_check(context, action, target):
     """Prepare rule, target, and credentials for the policy engine."""
     # Compare with None to distinguish case in which target is {}
@@ -346,6 +485,35 @@ def check(context, action, target, plugin=None, might_not_exist=False):
     """
     if might_not_exist and not (policy._rules and action in policy._rules):
         return True
+    return _check(context, action, target)
+
+
+def check_collection(context, action, targets, might_not_exist=False):
+    """Verifies that the action is valid on each target of a collection.
+
+    This is equivalent to calling check on each target, but the rule is
+    built and the credentials are extracted only once, and the decision
+    of a rule which does not depend on the target is shared by all the
+    targets.
+
+    :return: a list of booleans, one for each target.
+    """
+    if might_not_exist and not (policy._rules and action in policy._rules):
+        return [True] * len(targets)
+    resource, is_write = get_resource_and_action(action)
+    if is_write or not policy._rules:
+        return [check(context, action, target) for target in targets]
+    return _check_read_collection(context, action, targets)
+
+
+def _check(context, action, target):
+    resource, is_write = get_resource_and_action(action)
+    # Attribute-based checks are not enforced on reads, so the rule to
+    # match only depends on the action and can be compiled.
+    if not is_write and policy._rules:
+        if target is None:
+            target = {}
+        return _check_read_collection(context, action, [target])[0]
     return policy.check(*(_prepare_check(context, action, target)))
 
 
@@ -364,8 +532,7 @@ def enforce(context, action, target, plugin=None):
     :raises neutron.exceptions.PolicyNotAuthorized: if verification fails.
     """
 
-    rule, target, credentials = _prepare_check(context, action, target)
-    result = policy.check(rule, target, credentials, action=action)
+    result = _check(context, action, target)
     if not result:
         LOG.debug(_("Failed policy check for '%s'"), action)
         raise exceptions.PolicyNotAuthorized(action=action)
@@ -27,6 +27,7 @@ LOG = logging.getLogger(__name__)
 QUOTA_DB_MODULE = 'neutron.db.quota_db'
 QUOTA_DB_DRIVER = 'neutron.db.quota_db.DbQuotaDriver'
 QUOTA_CONF_DRIVER = 'neutron.quota.ConfDriver'
+QUOTA_TRACKED_DRIVER = 'neutron.db.quota_db.TrackedQuotaDriver'
 
 quota_opts = [
     cfg.ListOpt('quota_items',
@@ -52,6 +53,16 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default=QUOTA_DB_DRIVER,
                help=_('Default driver to use for quota checks')),
+    cfg.IntOpt('quota_usage_resync_interval',
+               default=600,
+               help=_('Number of seconds after which the resources of a '
+                      'tenant are counted again, to fix the usage tracked '
+                      'by %s.') % QUOTA_TRACKED_DRIVER),
+    cfg.IntOpt('quota_reservation_expiration',
+               default=120,
+               help=_('Number of seconds after which the resources reserved '
+                      'by a request that did not release them are no longer '
+                      'counted in the usage.')),
 ]
 # Register the configuration options
 cfg.CONF.register_opts(quota_opts, 'QUOTAS')
@@ -297,6 +308,36 @@ class QuotaEngine(object):
         return self.get_driver().limit_check(context, tenant_id,
                                              self._resources, values)
 
+    def is_tracked(self, resource):
+        """Whether the driver tracks the usage of a resource.
+
+        The quota of a tracked resource is checked by reserving the
+        resources to create, instead of counting them and checking limits.
+        """
+        driver = self.get_driver()
+        return (resource in self._resources and
+                hasattr(driver, 'make_reservation') and
+                driver.is_tracked(resource))
+
+    def make_reservation(self, context, tenant_id, resource, amount):
+        """Reserve resources of a tenant, if they are within the quota.
+
+        This method will raise an OverQuota exception if the usage of the
+        tenant, including its reservations, would go over the quota.
+        Otherwise it returns a reservation to release once the resources
+        are created, or could not be.
+
+        :param context: The request context, for access checks.
+        """
+
+        return self.get_driver().make_reservation(
+            context, tenant_id, self._resources, resource, amount)
+
+    def release_reservation(self, context, reservation_id):
+        """Release a reservation returned by make_reservation."""
+
+        self.get_driver().release_reservation(context, reservation_id)
+
     @property
     def resources(self):
         return self._resources
@@ -36,10 +36,11 @@ from neutron.plugins.common import constants
 class L3RouterPluginRpcCallbacks(n_rpc.RpcCallback,
                                  l3_rpc_base.L3RpcCallbackMixin):
 
-    RPC_API_VERSION = '1.3'
+    RPC_API_VERSION = '1.4'
     # history
     #   1.2 Added methods for DVR support
     #   1.3 Added a method that returns the list of activated services
+    #   1.4 Added get_router_ids for chunked router sync
 
 
 class L3RouterPlugin(common_db_mixin.CommonDbMixin,
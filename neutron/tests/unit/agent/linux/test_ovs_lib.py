@@ -864,6 +864,143 @@ class OVS_Lib_Test(base.BaseTestCase):
                                                         "br-ext"))
 
 
+class TestNativeOVSBridge(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestNativeOVSBridge, self).setUp()
+        cfg.CONF.set_override('ovsdb_interface', 'native')
+        self.ovsdb = mock.Mock()
+        mock.patch.object(ovs_lib.ovsdb_jsonrpc, 'get_connection',
+                          return_value=self.ovsdb).start()
+        self.execute = mock.patch.object(utils, "execute").start()
+        self.br = ovs_lib.OVSBridge('br-int', 'sudo')
+
+    def test_db_get_val(self):
+        self.ovsdb.transact.return_value = [{'rows': [{'tag': 5}]}]
+        self.assertEqual('5', self.br.db_get_val('Port', 'tap0', 'tag'))
+        self.ovsdb.transact.assert_called_once_with(
+            [{'op': 'select', 'table': 'Port',
+              'where': [['name', '==', 'tap0']], 'columns': ['tag']}])
+        self.assertFalse(self.execute.called)
+
+    def test_db_get_val_unknown_record(self):
+        self.ovsdb.transact.return_value = [{'rows': []}]
+        self.assertIsNone(self.br.db_get_val('Port', 'tap0', 'tag'))
+        with testtools.ExpectedException(ovs_lib.ovsdb_jsonrpc.OvsdbError):
+            self.br.db_get_val('Port', 'tap0', 'tag', check_error=True)
+
+    def test_db_get_map(self):
+        self.ovsdb.transact.return_value = [{'rows': [
+            {'external_ids': ['map', [['iface-id', 'foo']]]}]}]
+        self.assertEqual({'iface-id': 'foo'},
+                         self.br.db_get_map('Interface', 'tap0',
+                                            'external_ids'))
+
+    def test_db_get_val_other_table_uses_vsctl(self):
+        self.execute.return_value = 'tcp:127.0.0.1:6633\n'
+        self.br.db_get_val('Controller', 'br-int', 'target')
+        self.assertFalse(self.ovsdb.transact.called)
+        self.assertTrue(self.execute.called)
+
+    def test_set_db_attribute(self):
+        self.ovsdb.get_column_type.return_value = {'key': 'integer',
+                                                   'min': 0, 'max': 1}
+        self.br.set_db_attribute('Port', 'tap0', 'tag', '5')
+        self.ovsdb.transact.assert_called_once_with(
+            [{'op': 'update', 'table': 'Port',
+              'where': [['name', '==', 'tap0']], 'row': {'tag': 5}}])
+
+    def test_set_db_attribute_map_key(self):
+        self.ovsdb.get_column_type.return_value = {'key': 'string',
+                                                   'value': 'string'}
+        self.br.set_db_attribute('Interface', 'int-br', 'options:peer',
+                                 'phy-br')
+        self.ovsdb.transact.assert_called_once_with(
+            [{'op': 'mutate', 'table': 'Interface',
+              'where': [['name', '==', 'int-br']],
+              'mutations': [['options', 'delete', ['set', ['peer']]],
+                            ['options', 'insert',
+                             ['map', [['peer', 'phy-br']]]]]}])
+
+    def test_clear_db_attribute(self):
+        self.br.clear_db_attribute('Port', 'tap0', 'tag')
+        self.ovsdb.transact.assert_called_once_with(
+            [{'op': 'update', 'table': 'Port',
+              'where': [['name', '==', 'tap0']],
+              'row': {'tag': ['set', []]}}])
+
+    def test_add_tunnel_port(self):
+        self.ovsdb.transact.side_effect = [
+            [{'rows': []}],
+            [{}, {'uuid': ['uuid', 'i']}, {'uuid': ['uuid', 'p']},
+             {'count': 1}],
+            [{'rows': [{'ofport': ['set', []]}]}],
+            [{'rows': [{'ofport': 6}]}]]
+        with mock.patch.object(ovs_lib.eventlet, 'sleep') as sleep:
+            ofport = self.br.add_tunnel_port('gre-1', '10.0.0.2',
+                                             '10.0.0.1')
+        self.assertEqual('6', ofport)
+        self.assertEqual(1, sleep.call_count)
+        self.assertFalse(self.execute.called)
+        ops = self.ovsdb.transact.call_args_list[1][0][0]
+        self.assertEqual(['wait', 'insert', 'insert', 'mutate'],
+                         [op['op'] for op in ops])
+        self.assertEqual(
+            {'name': 'gre-1', 'type': 'gre',
+             'options': ['map', [['df_default', 'true'],
+                                 ['in_key', 'flow'],
+                                 ['local_ip', '10.0.0.1'],
+                                 ['out_key', 'flow'],
+                                 ['remote_ip', '10.0.0.2']]]},
+            ops[1]['row'])
+
+    def test_add_existing_port_updates_interface(self):
+        self.ovsdb.transact.side_effect = [
+            [{'rows': [{'_uuid': ['uuid', 'p']}]}],
+            [{'count': 1}],
+            [{'rows': [{'ofport': 3}]}]]
+        self.assertEqual('3', self.br.add_patch_port('patch-tun',
+                                                     'patch-int'))
+        self.assertEqual(
+            [{'op': 'update', 'table': 'Interface',
+              'where': [['name', '==', 'patch-tun']],
+              'row': {'type': 'patch',
+                      'options': ['map', [['peer', 'patch-int']]]}}],
+            self.ovsdb.transact.call_args_list[1][0][0])
+
+    def test_add_port_missing_bridge(self):
+        self.ovsdb.transact.side_effect = [
+            [{'rows': []}], [{}, {}, {}, {'count': 0}]]
+        self.assertEqual(const.INVALID_OFPORT, self.br.add_port('tap0'))
+
+    def test_delete_port(self):
+        self.ovsdb.transact.side_effect = [
+            [{'rows': [{'_uuid': ['uuid', 'p']}]}], [{'count': 1}]]
+        self.br.delete_port('tap0')
+        self.ovsdb.transact.assert_called_with(
+            [{'op': 'mutate', 'table': 'Bridge',
+              'where': [['name', '==', 'br-int']],
+              'mutations': [['ports', 'delete',
+                             ['set', [['uuid', 'p']]]]]}])
+
+    def test_delete_missing_port(self):
+        self.ovsdb.transact.return_value = [{'rows': []}]
+        self.br.delete_port('tap0')
+        self.assertEqual(1, self.ovsdb.transact.call_count)
+
+    def test_get_port_name_list(self):
+        self.ovsdb.transact.return_value = [
+            {'rows': [{'ports': ['set', [['uuid', 'a'], ['uuid', 'b']]]}]},
+            {'rows': [{'_uuid': ['uuid', 'a'], 'name': 'tap0'},
+                      {'_uuid': ['uuid', 'b'], 'name': 'tap1'},
+                      {'_uuid': ['uuid', 'c'], 'name': 'other'}]}]
+        self.assertEqual(['tap0', 'tap1'], self.br.get_port_name_list())
+
+    def test_flows_still_use_ofctl(self):
+        self.br.add_flow(priority=1, actions='normal')
+        self.assertEqual('add-flows', self.execute.call_args[0][0][1])
+
+
 class TestDeferredOVSBridge(base.BaseTestCase):
 
     def setUp(self):
@@ -0,0 +1,138 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import mock
+import testtools
+
+from neutron.agent.linux import ovsdb_jsonrpc
+from neutron.openstack.common import jsonutils
+from neutron.tests import base
+
+
+class TestOvsdbConnection(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOvsdbConnection, self).setUp()
+        self.sock = mock.Mock()
+        mock.patch('socket.socket', return_value=self.sock).start()
+        self.conn = ovsdb_jsonrpc.OvsdbConnection('unix:/tmp/db.sock', 10)
+
+    def _set_replies(self, *chunks):
+        self.sock.recv.side_effect = list(chunks)
+
+    def _sent(self):
+        return [jsonutils.loads(call[0][0])
+                for call in self.sock.sendall.call_args_list]
+
+    def test_parse_connection(self):
+        conn = ovsdb_jsonrpc.OvsdbConnection('tcp:127.0.0.1:6640', 10)
+        self.assertEqual(socket.AF_INET, conn.family)
+        self.assertEqual(('127.0.0.1', 6640), conn.address)
+        self.assertEqual(socket.AF_UNIX, self.conn.family)
+        self.assertEqual('/tmp/db.sock', self.conn.address)
+
+    def test_parse_invalid_connection(self):
+        with testtools.ExpectedException(ovsdb_jsonrpc.OvsdbError):
+            ovsdb_jsonrpc.OvsdbConnection('ssl:foo', 10)
+
+    def test_transact(self):
+        self._set_replies('{"id": 1, "result": [{"rows": []}], '
+                          '"error": null}')
+        ops = [{'op': 'select', 'table': 'Port', 'where': []}]
+        self.assertEqual([{'rows': []}], self.conn.transact(ops))
+        self.sock.connect.assert_called_once_with('/tmp/db.sock')
+        self.assertEqual([{'method': 'transact', 'id': 1,
+                           'params': ['Open_vSwitch'] + ops}], self._sent())
+
+    def test_connection_is_reused(self):
+        self._set_replies('{"id": 1, "result": [], "error": null}',
+                          '{"id": 2, "result": [], "error": null}')
+        self.conn.transact([])
+        self.conn.transact([])
+        self.assertEqual(1, self.sock.connect.call_count)
+
+    def test_split_and_pipelined_replies(self):
+        self._set_replies('{"id": 1, "result"',
+                          ': [], "error": null}{"id": 2, ',
+                          '"result": [{}], "error": null}')
+        self.assertEqual([], self.conn.transact([]))
+        self.assertEqual([{}], self.conn.transact([]))
+
+    def test_echo_is_answered(self):
+        self._set_replies('{"id": "echo", "method": "echo", "params": []}',
+                          '{"id": 1, "result": [], "error": null}')
+        self.conn.transact([])
+        self.assertEqual({'id': 'echo', 'result': [], 'error': None},
+                         self._sent()[1])
+
+    def test_transact_operation_error(self):
+        self._set_replies('{"id": 1, "result": [{"error": "timed out", '
+                          '"details": "wait"}], "error": null}')
+        with testtools.ExpectedException(ovsdb_jsonrpc.OvsdbError):
+            self.conn.transact([{'op': 'wait'}])
+
+    def test_reconnect_on_stale_connection(self):
+        self._set_replies('{"id": 1, "result": [], "error": null}',
+                          '{"id": 2, "result": [], "error": null}')
+        self.conn.transact([])
+        self.sock.sendall.side_effect = [socket.error(), None]
+        self.conn.transact([])
+        self.assertEqual(2, self.sock.connect.call_count)
+
+    def test_closed_connection_raises(self):
+        self._set_replies('')
+        with testtools.ExpectedException(ovsdb_jsonrpc.OvsdbError):
+            self.conn.transact([])
+        self.assertIsNone(self.conn._sock)
+
+    def test_get_column_type_caches_schema(self):
+        schema = {'tables': {'Port': {'columns': {'tag': {'type': {
+            'key': 'integer', 'min': 0, 'max': 1}}}}}}
+        self._set_replies(jsonutils.dumps({'id': 1, 'result': schema,
+                                           'error': None}))
+        for i in range(2):
+            self.assertEqual({'key': 'integer', 'min': 0, 'max': 1},
+                             self.conn.get_column_type('Port', 'tag'))
+        self.assertEqual(1, self.sock.sendall.call_count)
+
+
+class TestOvsdbValues(base.BaseTestCase):
+
+    def test_decode_value(self):
+        self.assertEqual(
+            {'iface-id': 'foo'},
+            ovsdb_jsonrpc.decode_value(['map', [['iface-id', 'foo']]]))
+        self.assertEqual([], ovsdb_jsonrpc.decode_value(['set', []]))
+        self.assertEqual('abc', ovsdb_jsonrpc.decode_value(['uuid', 'abc']))
+        self.assertEqual(5, ovsdb_jsonrpc.decode_value(5))
+
+    def test_encode_atom(self):
+        self.assertEqual(5, ovsdb_jsonrpc.encode_atom('integer', '5'))
+        self.assertEqual(True, ovsdb_jsonrpc.encode_atom('boolean', 'True'))
+        self.assertEqual('br-int',
+                         ovsdb_jsonrpc.encode_atom({'type': 'string'},
+                                                   '"br-int"'))
+
+    def test_format_value(self):
+        self.assertEqual('5', ovsdb_jsonrpc.format_value(5))
+        self.assertEqual('[]', ovsdb_jsonrpc.format_value(['set', []]))
+        self.assertEqual('tap1', ovsdb_jsonrpc.format_value('tap1'))
+        self.assertEqual('"0000abcd"',
+                         ovsdb_jsonrpc.format_value('0000abcd'))
+        self.assertEqual('{peer=patch-tun}',
+                         ovsdb_jsonrpc.format_value(
+                             ['map', [['peer', 'patch-tun']]]))
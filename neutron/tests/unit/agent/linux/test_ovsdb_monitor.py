@@ -16,6 +16,7 @@ import eventlet.event
 import mock
 
 from neutron.agent.linux import ovsdb_monitor
+from neutron.openstack.common import jsonutils
 from neutron.tests import base
 
 
@@ -101,3 +102,107 @@ class TestSimpleInterfaceMonitor(base.BaseTestCase):
                 return_value=output):
             self.monitor._read_stdout()
         self.assertFalse(self.monitor.data_received)
+
+
+def _monitor_output(headings, *rows):
+    return jsonutils.dumps({'headings': ['row', 'action'] + headings,
+                            'data': list(rows)})
+
+
+class TestOvsdbTableMonitor(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOvsdbTableMonitor, self).setUp()
+        self.monitor = ovsdb_monitor.OvsdbTableMonitor(
+            'Port', ['name', 'tag'], root_helper='sudo')
+        self.monitor.data_received = True
+        self.monitor._kill_event = eventlet.event.Event()
+
+    def _receive(self, *lines):
+        for line in lines:
+            self.monitor._stdout_lines.put(line)
+        return self.monitor.process_updates()
+
+    def test_process_updates_applies_rows(self):
+        headings = ['name', 'tag']
+        self.assertTrue(self._receive(
+            _monitor_output(headings,
+                            ['u1', 'initial', 'tap1', 1],
+                            ['u2', 'initial', 'tap2', ['set', []]])))
+        self.assertEqual({'u1': {'name': 'tap1', 'tag': 1},
+                          'u2': {'name': 'tap2', 'tag': []}},
+                         self.monitor.rows)
+        self._receive(
+            _monitor_output(headings,
+                            ['u1', 'old', '', 1],
+                            ['u1', 'new', 'tap1', 2]),
+            _monitor_output(headings, ['u2', 'delete', 'tap2', []]))
+        self.assertEqual({'u1': {'name': 'tap1', 'tag': 2}},
+                         self.monitor.rows)
+
+    def test_process_updates_no_output(self):
+        self.assertFalse(self._receive())
+
+    def test_process_updates_inactive(self):
+        self.monitor.data_received = False
+        self.assertTrue(self._receive())
+
+    def test_process_updates_ignores_bad_output(self):
+        self.assertTrue(self._receive('not json'))
+        self.assertEqual({}, self.monitor.rows)
+
+    def test_kill_clears_rows(self):
+        self.monitor.rows = {'u1': {}}
+        with mock.patch.object(ovsdb_monitor.OvsdbMonitor, '_kill'):
+            self.monitor._kill()
+        self.assertEqual({}, self.monitor.rows)
+        self.assertFalse(self.monitor.data_received)
+
+
+class TestOvsdbPortMonitor(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOvsdbPortMonitor, self).setUp()
+        self.monitor = ovsdb_monitor.OvsdbPortMonitor(root_helper='sudo')
+        self.monitor.bridges.rows = {
+            'b1': {'name': 'br-int', 'ports': ['p1', 'p2', 'p3']},
+            'b2': {'name': 'br-ex', 'ports': 'p4'}}
+        self.monitor.ports.rows = {
+            'p1': {'name': 'tap1', 'tag': 1, 'interfaces': 'i1'},
+            'p2': {'name': 'tap2', 'tag': [], 'interfaces': 'i2'},
+            'p3': {'name': 'patch-tun', 'tag': [], 'interfaces': 'i3'},
+            'p4': {'name': 'qg-1', 'tag': [], 'interfaces': 'i4'}}
+        vif_ids = {'iface-id': 'port1', 'attached-mac': 'mac1'}
+        self.monitor.interfaces.rows = {
+            'i1': {'name': 'tap1', 'ofport': 1, 'external_ids': vif_ids},
+            'i2': {'name': 'tap2', 'ofport': [],
+                   'external_ids': {'iface-id': 'port2',
+                                    'attached-mac': 'mac2'}},
+            'i3': {'name': 'patch-tun', 'ofport': 2, 'external_ids': {}},
+            'i4': {'name': 'qg-1', 'ofport': 1,
+                   'external_ids': {'iface-id': 'port4',
+                                    'attached-mac': 'mac4'}}}
+
+    def test_get_vif_port_set(self):
+        self.assertEqual(set(['port1']),
+                         self.monitor.get_vif_port_set('br-int'))
+        self.assertEqual(set(['port4']),
+                         self.monitor.get_vif_port_set('br-ex'))
+        self.assertEqual(set(), self.monitor.get_vif_port_set('br-foo'))
+
+    def test_get_port_tag_dict(self):
+        self.assertEqual({'tap1': 1, 'tap2': [], 'patch-tun': []},
+                         self.monitor.get_port_tag_dict('br-int'))
+
+    def test_get_vif_port_attrs(self):
+        self.assertEqual(('tap1', 1, 'mac1'),
+                         self.monitor.get_vif_port_attrs('br-int', 'port1'))
+        self.assertIsNone(self.monitor.get_vif_port_attrs('br-int', 'port4'))
+
+    def test_process_updates(self):
+        for monitor in self.monitor._monitors:
+            monitor.process_updates = mock.Mock(return_value=False)
+        self.assertFalse(self.monitor.process_updates())
+        self.monitor.ports.process_updates.return_value = True
+        self.assertTrue(self.monitor.process_updates())
+        self.assertTrue(self.monitor.interfaces.process_updates.called)
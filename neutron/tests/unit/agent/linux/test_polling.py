@@ -36,6 +36,19 @@ class TestGetPollingManager(base.BaseTestCase):
                 mock_stop.assert_has_calls(mock.call())
             mock_start.assert_has_calls(mock.call())
 
+    def test_manage_port_cache_polling_minimizer(self):
+        mock_target = 'neutron.agent.linux.polling.PortCachePollingMinimizer'
+        with mock.patch('%s.start' % mock_target) as mock_start:
+            with mock.patch('%s.stop' % mock_target) as mock_stop:
+                with polling.get_polling_manager(minimize_polling=True,
+                                                 root_helper='test',
+                                                 ovsdb_port_cache=True) as pm:
+                    self.assertEqual(pm.__class__,
+                                     polling.PortCachePollingMinimizer)
+                    self.assertIsNotNone(pm.port_cache)
+                mock_stop.assert_called_once_with()
+            mock_start.assert_called_once_with()
+
 
 class TestBasePollingManager(base.BaseTestCase):
 
@@ -112,3 +125,16 @@ class TestInterfacePollingMinimizer(base.BaseTestCase):
     def test__is_polling_required_returns_when_updates_are_present(self):
         with self.mock_has_updates(True):
             self.assertTrue(self.pm._is_polling_required())
+
+
+class TestPortCachePollingMinimizer(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPortCachePollingMinimizer, self).setUp()
+        self.pm = polling.PortCachePollingMinimizer()
+
+    def test__is_polling_required_processes_updates(self):
+        with mock.patch.object(self.pm.port_cache, 'process_updates',
+                               return_value=False) as process_updates:
+            self.assertFalse(self.pm._is_polling_required())
+        process_updates.assert_called_once_with()
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import datetime
 import mock
 
@@ -146,6 +147,72 @@ class TestDhcpAgentNotifyAPI(base.BaseTestCase):
         self._test__notify_agents('network_create_end',
                                   expected_scheduling=0, expected_casts=0)
 
+    def _test__notify_agents_bulk(self, agent_conf):
+        self.notifier.plugin.get_configuration_dict.return_value = agent_conf
+        payloads = [{'port': {'id': 'p1'}}, {'port': {'id': 'p2'}}]
+        with contextlib.nested(
+            mock.patch.object(self.notifier, '_schedule_network'),
+            mock.patch.object(self.notifier, '_get_enabled_agents'),
+            mock.patch.object(self.notifier, 'cast')
+        ) as (f, g, cast):
+            agent = agents_db.Agent()
+            agent.admin_state_up = True
+            agent.heartbeat_timestamp = timeutils.utcnow()
+            agent.host = 'foo_host'
+            agent.topic = 'dhcp_agent'
+            g.return_value = [agent]
+            self.notifier._notify_agents_bulk(
+                mock.Mock(), 'port_create_end', payloads, 'foo_network_id')
+            self.assertEqual(1, f.call_count)
+            g.assert_called_once_with(mock.ANY, mock.ANY, mock.ANY,
+                                      'port_create_end', payloads)
+        self.assertEqual(1, self.notifier.plugin.get_network.call_count)
+        return cast
+
+    def test__notify_agents_bulk(self):
+        cast = self._test__notify_agents_bulk({})
+        self.assertEqual(2, self.mock_cast.call_count)
+        self.assertFalse(cast.called)
+
+    def test__notify_agents_bulk_supported_by_agent(self):
+        cast = self._test__notify_agents_bulk(
+            {'bulk_port_notifications': True})
+        self.assertFalse(self.mock_cast.called)
+        cast.assert_called_once_with(
+            mock.ANY,
+            self.notifier.make_msg(
+                'port_create_end_bulk',
+                payload={'ports': [{'id': 'p1'}, {'id': 'p2'}]}),
+            topic='dhcp_agent.foo_host', version='1.1')
+
+    def test__notify_agents_single_port_not_bulk(self):
+        self.notifier.plugin.get_configuration_dict.return_value = {
+            'bulk_port_notifications': True}
+        self._test__notify_agents('port_create_end',
+                                  expected_scheduling=1, expected_casts=1)
+
+    def test_notify_bulk_groups_by_network(self):
+        with mock.patch.object(self.notifier, '_notify_agents_bulk') as f:
+            ports = [{'id': 'p1', 'network_id': 'n1'},
+                     {'id': 'p2', 'network_id': 'n2'},
+                     {'id': 'p3', 'network_id': 'n1'}]
+            self.notifier.notify_bulk(mock.ANY, 'port', ports,
+                                      'port.create.end')
+            self.assertEqual(2, f.call_count)
+            f.assert_any_call(mock.ANY, 'port_create_end',
+                              [{'port': ports[0]}, {'port': ports[2]}],
+                              'n1')
+            f.assert_any_call(mock.ANY, 'port_create_end',
+                              [{'port': ports[1]}], 'n2')
+
+    def test_notify_bulk_delete(self):
+        with mock.patch.object(self.notifier, '_notify_agents_bulk') as f:
+            self.notifier.notify_bulk(mock.ANY, 'port',
+                                      [{'id': 'p1', 'network_id': 'n1'}],
+                                      'port.delete.end')
+            f.assert_called_once_with(mock.ANY, 'port_delete_end',
+                                      [{'port_id': 'p1'}], 'n1')
+
     def test__fanout_message(self):
         self.notifier._fanout_message(mock.ANY, mock.ANY, mock.ANY)
         self.assertEqual(1, self.mock_fanout.call_count)
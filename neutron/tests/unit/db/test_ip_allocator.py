@@ -0,0 +1,81 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.db import ip_allocator
+from neutron.tests import base
+
+
+class FreeSpaceTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(FreeSpaceTestCase, self).setUp()
+        self.space = ip_allocator.FreeSpace([(20, 29), (2, 9)], [5])
+
+    def _intervals(self):
+        return zip(self.space._firsts, self.space._lasts)
+
+    def test_init(self):
+        self.assertEqual([(2, 9), (20, 29)], self.space.pools)
+        self.assertEqual([(2, 4), (6, 9), (20, 29)], self._intervals())
+        self.assertEqual(17, self.space.size())
+
+    def test_take(self):
+        for ip in (2, 9, 7, 40):
+            self.space.take(ip)
+        self.assertEqual([(3, 4), (6, 6), (8, 8), (20, 29)],
+                         self._intervals())
+        self.assertNotIn(7, self.space)
+        self.assertIn(8, self.space)
+
+    def test_release(self):
+        self.space.release(5)
+        self.assertEqual([(2, 9), (20, 29)], self._intervals())
+
+    def test_release_outside_pools(self):
+        self.space.release(15)
+        self.assertEqual([(2, 4), (6, 9), (20, 29)], self._intervals())
+
+    def test_release_joins_intervals(self):
+        for ip in (20, 21, 22):
+            self.space.take(ip)
+        self.space.release(21)
+        self.assertEqual([(2, 4), (6, 9), (21, 21), (23, 29)],
+                         self._intervals())
+        self.space.release(22)
+        self.assertEqual([(2, 4), (6, 9), (21, 29)], self._intervals())
+
+    def test_pick_random(self):
+        with mock.patch('random.randrange', return_value=3):
+            self.assertEqual(6, self.space.pick(ip_allocator.RANDOM))
+        with mock.patch('random.randrange', return_value=16):
+            self.assertEqual(29, self.space.pick(ip_allocator.RANDOM))
+
+    def test_pick_striped(self):
+        # The pools span 28 addresses: each stripe holds one address
+        with mock.patch('random.randrange', return_value=3):
+            self.assertEqual(6, self.space.pick(ip_allocator.STRIPED))
+        with mock.patch('random.randrange', return_value=12):
+            self.assertEqual(20, self.space.pick(ip_allocator.STRIPED))
+
+    def test_pick_striped_wraps_around(self):
+        space = ip_allocator.FreeSpace([(0, 31)], range(16, 32))
+        with mock.patch('random.randrange', return_value=15):
+            self.assertEqual(0, space.pick(ip_allocator.STRIPED))
+
+    def test_pick_exhausted(self):
+        space = ip_allocator.FreeSpace([(2, 2)], [2])
+        self.assertIsNone(space.pick(ip_allocator.STRIPED))
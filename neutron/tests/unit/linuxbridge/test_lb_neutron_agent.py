@@ -19,6 +19,7 @@ import mock
 from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink
 from neutron.agent.linux import utils
 from neutron.common import constants
 from neutron.common import exceptions
@@ -111,6 +112,21 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                                                                           0,
                                                                           None)
 
+    def test_netlink_link_monitor(self):
+        cfg.CONF.set_override('netlink_link_monitor', True, 'AGENT')
+        with mock.patch.object(netlink, 'LinkMonitor') as monitor_cls:
+            agent = linuxbridge_neutron_agent.LinuxBridgeNeutronAgentRPC(
+                {}, 0, None)
+            monitor = monitor_cls.return_value
+            monitor.start.assert_called_once_with()
+            self.assertEqual(monitor, agent.br_mgr.link_monitor)
+            with mock.patch('time.sleep') as sleep:
+                agent._wait(1.5)
+                monitor.is_active = False
+                agent._wait(0.5)
+            monitor.wait.assert_called_once_with(1.5)
+            sleep.assert_called_once_with(0.5)
+
     def test_treat_devices_removed_with_existed_device(self):
         agent = linuxbridge_neutron_agent.LinuxBridgeNeutronAgentRPC({},
                                                                      0,
@@ -451,6 +467,51 @@ class TestLinuxBridgeManager(base.BaseTestCase):
                 "/sys/devices/virtual/net/tap1/brport"
             )
 
+    def _set_link_monitor(self):
+        monitor = netlink.LinkMonitor()
+        monitor._thread = mock.Mock()
+        for index, name, master, kind in ((2, 'brq1', None, 'bridge'),
+                                          (3, 'tap1', 2, None),
+                                          (4, 'eth1.100', 2, 'vlan'),
+                                          (5, 'tap2', None, None),
+                                          (6, 'bond0', None, 'bond'),
+                                          (7, 'eth2', 6, None)):
+            link = {'index': index, 'name': name, 'master': master,
+                    'kind': kind}
+            monitor.links[name] = link
+            monitor._indexes[index] = link
+        self.lbm.link_monitor = monitor
+        self.listdir = mock.patch.object(os, 'listdir').start()
+        self.exists = mock.patch.object(os.path, 'exists').start()
+
+    def test_link_monitor_devices(self):
+        self._set_link_monitor()
+        self.assertEqual(set(['tap1', 'tap2']), self.lbm.get_tap_devices())
+        self.assertEqual(['brq1'], self.lbm.get_all_neutron_bridges())
+        self.assertEqual(['eth1.100', 'tap1'],
+                         sorted(self.lbm.get_interfaces_on_bridge('brq1')))
+        self.assertEqual([], self.lbm.get_interfaces_on_bridge('brq2'))
+        self.assertEqual(1, self.lbm.get_tap_devices_count('brq1'))
+        self.assertTrue(self.lbm.interface_exists_on_bridge('brq1', 'tap1'))
+        self.assertFalse(self.lbm.interface_exists_on_bridge('brq1',
+                                                             'tap2'))
+        self.assertFalse(self.listdir.called)
+
+    def test_link_monitor_bridge_ports(self):
+        self._set_link_monitor()
+        self.assertEqual('brq1', self.lbm.get_bridge_for_tap_device('tap1'))
+        self.assertIsNone(self.lbm.get_bridge_for_tap_device('tap2'))
+        self.assertTrue(self.lbm.is_device_on_bridge('tap1'))
+        self.assertFalse(self.lbm.is_device_on_bridge('tap2'))
+        self.assertFalse(self.lbm.is_device_on_bridge('eth2'))
+        self.assertFalse(self.exists.called)
+
+    def test_link_monitor_inactive(self):
+        self._set_link_monitor()
+        self.lbm.link_monitor._thread = None
+        self.listdir.return_value = ['tap3']
+        self.assertEqual(set(['tap3']), self.lbm.get_tap_devices())
+
     def test_get_interface_details(self):
         with contextlib.nested(
             mock.patch.object(ip_lib.IpAddrCommand, 'list'),
@@ -1003,6 +1064,86 @@ class TestLinuxBridgeRpcCallbacks(base.BaseTestCase):
             ]
             execute_fn.assert_has_calls(expected)
 
+    def _batch_call(self, command, *lines):
+        return mock.call([command, '-force', '-batch', '-'],
+                         root_helper=self.root_helper,
+                         process_input=''.join(line + '\n'
+                                               for line in lines),
+                         check_exit_code=False)
+
+    def test_fdb_add_batch(self):
+        self.lb_rpc.agent.br_mgr.fdb_mirror = {}
+        fdb_entries = {'net_id':
+                       {'ports':
+                        {'agent_ip': [constants.FLOODING_ENTRY,
+                                      ['port_mac', 'port_ip']]},
+                        'network_type': 'vxlan',
+                        'segment_id': 1}}
+        fdb = ('%s dst agent_ip2 self permanent' %
+               constants.FLOODING_ENTRY[0])
+
+        with mock.patch.object(utils, 'execute',
+                               side_effect=['', fdb, '', '']) as execute_fn:
+            self.lb_rpc.fdb_add(None, fdb_entries)
+
+            expected = [
+                mock.call(['ip', 'neigh', 'show', 'dev', 'vxlan-1'],
+                          root_helper=self.root_helper),
+                mock.call(['bridge', 'fdb', 'show', 'dev', 'vxlan-1'],
+                          root_helper=self.root_helper),
+                self._batch_call('ip', 'neigh replace port_ip lladdr '
+                                 'port_mac dev vxlan-1 nud permanent'),
+                # The flooding entry is appended to the existing one
+                self._batch_call('bridge',
+                                 'fdb append %s dev vxlan-1 dst agent_ip' %
+                                 constants.FLOODING_ENTRY[0],
+                                 'fdb add port_mac dev vxlan-1 dst agent_ip')
+            ]
+            self.assertEqual(expected, execute_fn.call_args_list)
+
+            # The entries programmed are not programmed again
+            execute_fn.reset_mock()
+            self.lb_rpc.fdb_add(None, fdb_entries)
+            self.assertFalse(execute_fn.called)
+
+    def test_fdb_remove_batch(self):
+        br_mgr = self.lb_rpc.agent.br_mgr
+        br_mgr.fdb_mirror = {}
+        fdb_entries = {'net_id':
+                       {'ports':
+                        {'agent_ip': [constants.FLOODING_ENTRY,
+                                      ['port_mac', 'port_ip']]},
+                        'network_type': 'vxlan',
+                        'segment_id': 1}}
+        neigh = 'port_ip lladdr port_mac PERMANENT'
+        fdb = ('%s dst agent_ip self permanent\n'
+               '%s dst agent_ip2 self permanent\n'
+               'port_mac dst agent_ip self permanent' %
+               (constants.FLOODING_ENTRY[0], constants.FLOODING_ENTRY[0]))
+
+        with mock.patch.object(utils, 'execute',
+                               side_effect=[neigh, fdb, '', '']) as execute:
+            self.lb_rpc.fdb_remove(None, fdb_entries)
+
+            execute.assert_has_calls([
+                self._batch_call('ip', 'neigh del port_ip lladdr port_mac '
+                                 'dev vxlan-1'),
+                self._batch_call('bridge',
+                                 'fdb del %s dev vxlan-1 dst agent_ip' %
+                                 constants.FLOODING_ENTRY[0],
+                                 'fdb del port_mac dev vxlan-1 dst agent_ip')
+            ])
+        self.assertTrue(br_mgr.fdb_bridge_entry_exists(
+            constants.FLOODING_ENTRY[0], 'vxlan-1', 'agent_ip2'))
+        self.assertFalse(br_mgr.fdb_bridge_entry_exists('port_mac',
+                                                        'vxlan-1'))
+        self.assertFalse(br_mgr.fdb_ip_entry_exists('port_mac', 'port_ip',
+                                                    'vxlan-1'))
+
+        with mock.patch.object(ip_lib, 'device_exists', return_value=True):
+            br_mgr.delete_vxlan('vxlan-1')
+        self.assertEqual({}, br_mgr.fdb_mirror)
+
     def test_fdb_ignore(self):
         fdb_entries = {'net_id':
                        {'ports':
@@ -298,9 +298,9 @@ class TestCiscoPortsV2(CiscoML2MechanismTestCase,
         with mock.patch('__builtin__.hasattr',
                         new=fakehasattr):
             plugin_obj = manager.NeutronManager.get_plugin()
-            orig = plugin_obj.create_port
+            orig = plugin_obj._create_port_db
             with mock.patch.object(plugin_obj,
-                                   'create_port') as patched_plugin:
+                                   '_create_port_db') as patched_plugin:
 
                 def side_effect(*args, **kwargs):
                     return self._do_side_effect(patched_plugin, orig,
@@ -332,9 +332,9 @@ class TestCiscoPortsV2(CiscoML2MechanismTestCase,
         ctx = context.get_admin_context()
         with self.network() as net:
             plugin_obj = manager.NeutronManager.get_plugin()
-            orig = plugin_obj.create_port
+            orig = plugin_obj._create_port_db
             with mock.patch.object(plugin_obj,
-                                   'create_port') as patched_plugin:
+                                   '_create_port_db') as patched_plugin:
 
                 def side_effect(*args, **kwargs):
                     return self._do_side_effect(patched_plugin, orig,
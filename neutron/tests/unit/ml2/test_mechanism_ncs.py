@@ -47,4 +47,4 @@ class NCSMechanismTestNetworksV2(test_plugin.TestNetworksV2, NCSTestCase):
 
 
 class NCSMechanismTestPortsV2(test_plugin.TestPortsV2, NCSTestCase):
-    pass
+    _create_port_method = '_create_port_db'
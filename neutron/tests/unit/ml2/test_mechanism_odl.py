@@ -114,4 +114,4 @@ class OpenDaylightMechanismTestSubnetsV2(test_plugin.TestSubnetsV2,
 
 class OpenDaylightMechanismTestPortsV2(test_plugin.TestPortsV2,
                                        OpenDaylightTestCase):
-    pass
+    _create_port_method = '_create_port_db'
@@ -15,12 +15,15 @@
 
 import contextlib
 import mock
+from oslo.config import cfg
 import testtools
 import uuid
 import webob
 
 from neutron.common import exceptions as exc
 from neutron import context
+from neutron.db import network_cache
+from neutron.db import quota_db
 from neutron.extensions import multiprovidernet as mpnet
 from neutron.extensions import portbindings
 from neutron.extensions import providernet as pnet
@@ -32,6 +35,7 @@ from neutron.plugins.ml2 import db as ml2_db
 from neutron.plugins.ml2 import driver_api
 from neutron.plugins.ml2 import driver_context
 from neutron.plugins.ml2 import plugin as ml2_plugin
+from neutron import quota
 from neutron.tests.unit import _test_extension_portbindings as test_bindings
 from neutron.tests.unit.ml2.drivers import mechanism_logger as mech_logger
 from neutron.tests.unit.ml2.drivers import mechanism_test as mech_test
@@ -105,7 +109,25 @@ class TestMl2V2HTTPResponse(test_plugin.TestV2HTTPResponse,
 
 class TestMl2NetworksV2(test_plugin.TestNetworksV2,
                         Ml2PluginV2TestCase):
-    pass
+
+    def test_get_networks_segments_from_network_cache(self):
+        config.cfg.CONF.set_override('network_cache', True)
+        self.addCleanup(network_cache.SEGMENTS.clear)
+        plugin = manager.NeutronManager.get_plugin()
+        with contextlib.nested(self.network(), self.network()):
+            with contextlib.nested(
+                mock.patch.object(ml2_db, 'get_networks_segments',
+                                  wraps=ml2_db.get_networks_segments),
+                mock.patch.object(ml2_db, 'get_network_segments')
+            ) as (get_networks_segments, get_network_segments):
+                for i in range(2):
+                    networks = plugin.get_networks(self.context)
+                    self.assertEqual(2, len(networks))
+                    for network in networks:
+                        self.assertEqual('local',
+                                         network[pnet.NETWORK_TYPE])
+                self.assertEqual(1, get_networks_segments.call_count)
+                self.assertFalse(get_network_segments.called)
 
 
 class TestMl2SubnetsV2(test_plugin.TestSubnetsV2,
@@ -114,6 +136,8 @@ class TestMl2SubnetsV2(test_plugin.TestSubnetsV2,
 
 
 class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
+    # Bulk creations do not go through create_port
+    _create_port_method = '_create_port_db'
 
     def test_update_port_status_build(self):
         with self.port() as port:
@@ -162,6 +186,45 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
                 mock.call(ctx, disassociate_floatingips.return_value)
             ])
 
+    def test_create_port_bulk_single_transaction(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.network() as net:
+            with contextlib.nested(
+                mock.patch.object(plugin, 'get_network',
+                                  wraps=plugin.get_network),
+                mock.patch.object(
+                    plugin, 'notify_security_groups_member_updated_bulk'),
+                mock.patch.object(plugin.mechanism_manager,
+                                  'create_port_postcommit')
+            ) as (get_network, notify, postcommit):
+                res = self._create_port_bulk(self.fmt, 3,
+                                             net['network']['id'],
+                                             'test', True)
+                ports = self.deserialize(self.fmt, res)['ports']
+                self.assertEqual(3, len(ports))
+                # Only looked up by the DHCP agent notification
+                self.assertEqual(1, get_network.call_count)
+                self.assertEqual(1, notify.call_count)
+                self.assertEqual(3, len(notify.call_args[0][1]))
+                self.assertEqual(3, postcommit.call_count)
+            for port in ports:
+                self._delete('ports', port['id'])
+
+    def test_create_port_bulk_db_failure(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.network() as net:
+            with contextlib.nested(
+                mock.patch.object(plugin, '_create_port_db',
+                                  side_effect=ValueError),
+                mock.patch.object(ml2_plugin.LOG, 'error')
+            ) as (create_port_db, log_error):
+                res = self._create_port_bulk(self.fmt, 2,
+                                             net['network']['id'],
+                                             'test', True)
+                self.assertEqual(500, res.status_int)
+                log_error.assert_called_once_with(
+                    mock.ANY, {'total': 2, 'done': 0})
+
     def test_disassociate_floatingips_do_notify_returns_nothing(self):
         ctx = context.get_admin_context()
         l3plugin = manager.NeutronManager.get_service_plugins().get(
@@ -174,6 +237,38 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
             self.assertIsNone(l3plugin.disassociate_floatingips(ctx, port_id))
 
 
+class TestMl2TrackedQuotas(Ml2PluginV2TestCase):
+
+    def setUp(self):
+        cfg.CONF.set_override('quota_driver', quota.QUOTA_TRACKED_DRIVER,
+                              group='QUOTAS')
+        cfg.CONF.set_override('quota_network', 2, group='QUOTAS')
+        super(TestMl2TrackedQuotas, self).setUp()
+        quota.QUOTAS._driver = None
+        self.addCleanup(setattr, quota.QUOTAS, '_driver', None)
+
+    def _assert_no_reservation(self):
+        session = context.get_admin_context().session
+        self.assertEqual(0, session.query(quota_db.Reservation).count())
+
+    def test_create_networks_over_quota(self):
+        nets = [self.deserialize(self.fmt, self._create_network(
+            self.fmt, 'net%d' % i, True)) for i in range(2)]
+        res = self._create_network(self.fmt, 'net2', True)
+        self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+        self._delete('networks', nets[0]['network']['id'])
+        res = self._create_network(self.fmt, 'net2', True)
+        self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+        self._assert_no_reservation()
+
+    def test_create_networks_bulk_over_quota(self):
+        res = self._create_network_bulk(self.fmt, 3, 'net', True)
+        self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+        res = self._create_network_bulk(self.fmt, 2, 'net', True)
+        self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+        self._assert_no_reservation()
+
+
 class TestMl2PortBinding(Ml2PluginV2TestCase,
                          test_bindings.PortBindingsTestCase):
     # Test case does not set binding:host_id, so ml2 does not attempt
@@ -653,6 +748,21 @@ class TestFaultyMechansimDriver(Ml2PluginV2FaultyDriverTestCase):
                 ports = self._list('ports', query_params=query_params)
                 self.assertFalse(ports['ports'])
 
+    def test_create_port_bulk_faulty(self):
+
+        with mock.patch.object(mech_test.TestMechanismDriver,
+                               'create_port_postcommit',
+                               side_effect=ml2_exc.MechanismDriverError):
+
+            with self.network() as network:
+                net_id = network['network']['id']
+                res = self._create_port_bulk(self.fmt, 2, net_id, 'test',
+                                             True)
+                self.assertEqual(500, res.status_int)
+                query_params = "network_id=%s" % net_id
+                ports = self._list('ports', query_params=query_params)
+                self.assertFalse(ports['ports'])
+
     def test_update_port_faulty(self):
 
         with mock.patch.object(mech_test.TestMechanismDriver,
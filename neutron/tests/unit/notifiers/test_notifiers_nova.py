@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 
 import mock
 from novaclient import exceptions as nova_exceptions
@@ -228,11 +229,34 @@ class TestNovaNotify(base.BaseTestCase):
             self.nova_notifier.send_events()
 
     def test_nova_send_events_raises(self):
-        with mock.patch.object(
-            self.nova_notifier.nclient.server_external_events,
-                'create') as nclient_create:
+        with contextlib.nested(
+            mock.patch.object(
+                self.nova_notifier.nclient.server_external_events, 'create'),
+            mock.patch('eventlet.sleep')
+        ) as (nclient_create, sleep):
             nclient_create.side_effect = Exception
+            self.nova_notifier.pending_events.append(
+                {'name': 'network-changed', 'server_uuid': 'fake'})
+            self.nova_notifier.send_events()
+            self.assertEqual(3, nclient_create.call_count)
+            self.assertEqual(2, sleep.call_count)
+            self.assertEqual(1, self.nova_notifier.stats['failed'])
+            self.assertEqual(3, self.nova_notifier.stats['requests'])
+
+    def test_nova_send_events_retried(self):
+        with contextlib.nested(
+            mock.patch.object(
+                self.nova_notifier.nclient.server_external_events, 'create'),
+            mock.patch('eventlet.sleep')
+        ) as (nclient_create, sleep):
+            nclient_create.side_effect = [Exception, []]
+            self.nova_notifier.pending_events.append(
+                {'name': 'network-changed', 'server_uuid': 'fake'})
             self.nova_notifier.send_events()
+            self.assertEqual(2, nclient_create.call_count)
+            self.assertEqual(1, self.nova_notifier.stats['retried'])
+            self.assertEqual(1, self.nova_notifier.stats['sent'])
+            self.assertEqual(0, self.nova_notifier.stats['failed'])
 
     def test_nova_send_events_returns_non_200(self):
         device_id = '32102d7b-1cf4-404d-b50a-97aae1f55f87'
@@ -303,3 +327,61 @@ class TestNovaNotify(base.BaseTestCase):
                 self.nova_notifier.queue_event(mock.Mock())
                 self.assertFalse(self.nova_notifier._waiting_to_send)
                 send_events.assert_called_once_with()
+
+    def _fake_nova(self):
+        """Record the batches of events nova receives."""
+        batches = []
+
+        def create(events):
+            batches.append(events)
+            return [dict(event, code=200) for event in events]
+
+        self.nova_notifier.nclient.server_external_events.create = create
+        return batches
+
+    def test_send_events_coalesced(self):
+        batches = self._fake_nova()
+        device_id = '32102d7b-1cf4-404d-b50a-97aae1f55f87'
+        plugged = {'server_uuid': device_id, 'name': nova.VIF_PLUGGED,
+                   'status': 'completed', 'tag': 'port'}
+        changed = {'server_uuid': device_id, 'name': 'network-changed'}
+        for i in range(50):
+            self.nova_notifier.pending_events.append(dict(changed))
+        self.nova_notifier.pending_events.append(plugged)
+        self.nova_notifier.pending_events.append(
+            dict(plugged, status='failed'))
+        self.nova_notifier.send_events()
+        self.assertEqual([[changed, dict(plugged, status='failed')]],
+                         batches)
+        self.assertEqual(50, self.nova_notifier.stats['coalesced'])
+        self.assertEqual(2, self.nova_notifier.stats['sent'])
+
+    def test_send_events_batch_size(self):
+        cfg.CONF.set_override('nova_events_batch_size', 3)
+        batches = self._fake_nova()
+        events = [{'server_uuid': str(i), 'name': 'network-changed'}
+                  for i in range(8)]
+        self.nova_notifier.pending_events.extend(events)
+        self.nova_notifier.send_events()
+        self.assertEqual([3, 3, 2], sorted((len(b) for b in batches),
+                                           reverse=True))
+        self.assertEqual(events, sorted(sum(batches, []),
+                                        key=lambda e: int(e['server_uuid'])))
+        self.assertEqual(3, self.nova_notifier.stats['requests'])
+        self.assertEqual(0, self.nova_notifier.queue_depth)
+
+    def test_queue_event_queue_size(self):
+        cfg.CONF.set_override('nova_events_queue_size', 4)
+        with mock.patch('eventlet.spawn_n'):
+            for i in range(3):
+                self.nova_notifier.queue_event(
+                    {'server_uuid': 'dup', 'name': 'network-changed'})
+            for i in range(5):
+                self.nova_notifier.queue_event(
+                    {'server_uuid': str(i), 'name': 'network-changed'})
+        self.assertEqual(['1', '2', '3', '4'],
+                         [e['server_uuid']
+                          for e in self.nova_notifier.pending_events])
+        self.assertEqual(2, self.nova_notifier.stats['coalesced'])
+        self.assertEqual(2, self.nova_notifier.stats['dropped'])
+        self.assertEqual(8, self.nova_notifier.stats['queued'])
@@ -644,6 +644,18 @@ class OvsAgentSchedulerTestCase(OvsAgentSchedulerTestCaseBase):
         self.assertEqual(1, len(l3_agents['agents']))
         self.assertEqual(L3_HOSTA, l3_agents['agents'][0]['host'])
 
+    def test_get_router_ids_with_hosted(self):
+        with self.router() as router:
+            l3_rpc = l3_rpc_base.L3RpcCallbackMixin()
+            self._register_agent_states()
+            ret_a = l3_rpc.get_router_ids(self.adminContext, host=L3_HOSTA)
+            ret_b = l3_rpc.get_router_ids(self.adminContext, host=L3_HOSTB)
+            self.assertEqual([router['router']['id']], ret_a)
+            self.assertEqual([], ret_b)
+            routers = l3_rpc.sync_routers(self.adminContext, host=L3_HOSTA,
+                                          router_ids=ret_a)
+            self.assertEqual(ret_a, [r['id'] for r in routers])
+
     def test_router_auto_schedule_restart_l3_agent(self):
         with self.router():
             l3_rpc = l3_rpc_base.L3RpcCallbackMixin()
@@ -1146,6 +1146,134 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.assertEqual(len(expected_calls),
                              len(do_action_flows_fn.mock_calls))
 
+    def _prepare_l2_pop_flow_cache(self):
+        lvm = ovs_neutron_agent.LocalVLANMapping(1, 'gre', None, 100)
+        lvm.tun_ofports = set(['1', '2'])
+        lvm.ucast_ofports = {FAKE_MAC: '2'}
+        lvm.arp_entries = {FAKE_IP1: netaddr.EUI(FAKE_MAC,
+                                                 dialect=netaddr.mac_unix)}
+        self.agent.local_vlan_map = {'net1': lvm}
+        self.agent.lvm_by_vlan = {1: lvm}
+        self.agent.tun_br_ofports = {'gre':
+                                     {'1.1.1.1': '1', '2.2.2.2': '2',
+                                      '3.3.3.3': '3'}}
+        self.agent.arp_responder_enabled = True
+        self.agent.l2pop_flow_cache = True
+        return lvm
+
+    def test_fdb_add_flows_cached(self):
+        lvm = self._prepare_l2_pop_flow_cache()
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 100,
+                      'ports':
+                      {'2.2.2.2':
+                       [[FAKE_MAC, FAKE_IP1],
+                        n_const.FLOODING_ENTRY]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'deferred'),
+            mock.patch.object(self.agent.tun_br, 'do_action_flows'),
+        ) as (deferred_fn, do_action_flows_fn):
+            deferred_fn.side_effect = (
+                lambda: ovs_lib.DeferredOVSBridge(self.agent.tun_br))
+            # Everything is already installed
+            self.agent.fdb_add(None, fdb_entry)
+            self.assertFalse(do_action_flows_fn.called)
+
+            # The port moved behind another tunnel
+            fdb_entry['net1']['ports'] = {'3.3.3.3': [[FAKE_MAC, FAKE_IP1]]}
+            self.agent.fdb_add(None, fdb_entry)
+            do_action_flows_fn.assert_called_once_with(
+                'add', [dict(table=constants.UCAST_TO_TUN,
+                             priority=2,
+                             dl_vlan=1,
+                             dl_dst=FAKE_MAC,
+                             actions='strip_vlan,set_tunnel:100,output:3')])
+            self.assertEqual({FAKE_MAC: '3'}, lvm.ucast_ofports)
+
+            # The late removal from the previous tunnel leaves it alone
+            do_action_flows_fn.reset_mock()
+            fdb_entry['net1']['ports'] = {'2.2.2.2': [[FAKE_MAC, FAKE_IP2]]}
+            self.agent.fdb_remove(None, fdb_entry)
+            self.assertFalse(do_action_flows_fn.called)
+            self.assertEqual({FAKE_MAC: '3'}, lvm.ucast_ofports)
+            self.assertEqual([FAKE_IP1], lvm.arp_entries.keys())
+
+    def test_reconcile_fdb_flows(self):
+        self._prepare_l2_pop_flow_cache()
+        flows = {
+            constants.FLOOD_TO_TUN:
+            ' cookie=0x0, duration=4.2s, table=22, n_packets=0, '
+            'n_bytes=0, idle_age=4, priority=1,dl_vlan=1 '
+            'actions=strip_vlan,set_tunnel:0x64,output:1\n'
+            ' cookie=0x0, duration=4.2s, table=22, n_packets=0, '
+            'n_bytes=0, idle_age=4, priority=1,dl_vlan=9 '
+            'actions=strip_vlan,set_tunnel:0x65,output:2\n'
+            ' cookie=0x0, duration=9.1s, table=22, n_packets=0, '
+            'n_bytes=0, idle_age=9, priority=0 actions=drop',
+            constants.UCAST_TO_TUN:
+            ' cookie=0x0, duration=4.2s, table=20, n_packets=0, '
+            'n_bytes=0, idle_age=4, priority=2,dl_vlan=1,'
+            'dl_dst=00:11:22:33:44:55 '
+            'actions=strip_vlan,set_tunnel:0x64,output:2\n'
+            ' cookie=0x0, duration=4.2s, table=20, n_packets=0, '
+            'n_bytes=0, idle_age=4, priority=2,dl_vlan=1,'
+            'dl_dst=00:11:22:33:44:66 '
+            'actions=strip_vlan,set_tunnel:0x64,output:1\n'
+            ' cookie=0x0, duration=4.2s, table=20, n_packets=0, '
+            'n_bytes=0, hard_timeout=300, idle_age=4, '
+            'priority=1,vlan_tci=0x0001/0x0fff,dl_dst=00:11:22:33:44:77 '
+            'actions=load:0->NXM_OF_VLAN_TCI[],output:1',
+            constants.ARP_RESPONDER:
+            ' cookie=0x0, duration=4.2s, table=21, n_packets=0, '
+            'n_bytes=0, idle_age=4, priority=1,arp,dl_vlan=1,'
+            'arp_tpa=10.0.0.2 actions=move:NXM_OF_ETH_SRC[]->'
+            'NXM_OF_ETH_DST[],mod_dl_src:00:11:22:33:44:66,in_port\n'
+            ' cookie=0x0, duration=4.2s, table=21, n_packets=0, '
+            'n_bytes=0, idle_age=4, priority=1,arp,dl_vlan=1,'
+            'arp_tpa=10.0.0.1 actions=move:NXM_OF_ETH_SRC[]->'
+            'NXM_OF_ETH_DST[],mod_dl_src:00:11:22:33:44:66,in_port'}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'deferred'),
+            mock.patch.object(self.agent.tun_br, 'dump_flows_for_table',
+                              side_effect=flows.get),
+            mock.patch.object(self.agent.tun_br, 'do_action_flows'),
+        ) as (deferred_fn, dump_fn, do_action_flows_fn):
+            deferred_fn.return_value = ovs_lib.DeferredOVSBridge(
+                self.agent.tun_br)
+            self.agent.reconcile_fdb_flows()
+
+            self.assertEqual(3, dump_fn.call_count)
+            actions = (constants.ARP_RESPONDER_ACTIONS %
+                       {'mac': netaddr.EUI(FAKE_MAC, dialect=netaddr.mac_unix),
+                        'ip': netaddr.IPAddress(FAKE_IP1)})
+            flood_actions = do_action_flows_fn.call_args_list[1][0][1][0][
+                'actions']
+            self.assertIn(flood_actions,
+                          ('strip_vlan,set_tunnel:100,output:1,2',
+                           'strip_vlan,set_tunnel:100,output:2,1'))
+            expected_calls = [
+                mock.call('add', [dict(table=constants.ARP_RESPONDER,
+                                       priority=1,
+                                       proto='arp',
+                                       dl_vlan=1,
+                                       nw_dst=FAKE_IP1,
+                                       actions=actions)]),
+                mock.call('mod', [dict(table=constants.FLOOD_TO_TUN,
+                                       dl_vlan=1,
+                                       actions=flood_actions)]),
+                mock.call('del', [dict(table=constants.FLOOD_TO_TUN,
+                                       dl_vlan='9'),
+                                  dict(table=constants.UCAST_TO_TUN,
+                                       dl_vlan='1',
+                                       dl_dst='00:11:22:33:44:66'),
+                                  dict(table=constants.ARP_RESPONDER,
+                                       proto='arp',
+                                       dl_vlan='1',
+                                       nw_dst='10.0.0.2')])]
+            self.assertEqual(expected_calls,
+                             do_action_flows_fn.call_args_list)
+
     def test_recl_lv_port_to_preserve(self):
         self._prepare_l2_pop_ofports()
         self.agent.l2_pop = True
@@ -1202,9 +1330,58 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             with mock.patch.object(self.agent, 'rpc_loop') as mock_loop:
                 self.agent.daemon_loop()
         mock_get_pm.assert_called_with(True, 'sudo',
-                                       constants.DEFAULT_OVSDBMON_RESPAWN)
+                                       constants.DEFAULT_OVSDBMON_RESPAWN,
+                                       False)
         mock_loop.assert_called_once_with(polling_manager=mock.ANY)
 
+    def _mock_port_cache(self):
+        port_cache = mock.Mock()
+        port_cache.is_active = True
+        self.agent.port_cache = port_cache
+        return port_cache
+
+    def test_scan_ports_uses_port_cache(self):
+        port_cache = self._mock_port_cache()
+        port_cache.get_vif_port_set.return_value = set([1, 3])
+        port_cache.get_port_tag_dict.return_value = {}
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'get_vif_port_set'),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict')
+        ) as (get_vif_port_set, get_port_tag_dict):
+            actual = self.agent.scan_ports(set([1, 2]))
+        self.assertEqual(dict(current=set([1, 3]), added=set([3]),
+                              removed=set([2])), actual)
+        port_cache.get_vif_port_set.assert_called_once_with(
+            self.agent.int_br.br_name)
+        self.assertFalse(get_vif_port_set.called)
+        self.assertFalse(get_port_tag_dict.called)
+
+    def test_scan_ports_inactive_port_cache_uses_vsctl(self):
+        port_cache = self._mock_port_cache()
+        port_cache.is_active = False
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'get_vif_port_set',
+                              return_value=set([1])),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={})
+        ) as (get_vif_port_set, get_port_tag_dict):
+            self.agent.scan_ports(set([1]))
+        self.assertTrue(get_vif_port_set.called)
+        self.assertFalse(port_cache.get_vif_port_set.called)
+
+    def test_get_vif_port_by_id_uses_port_cache(self):
+        port_cache = self._mock_port_cache()
+        port_cache.get_vif_port_attrs.return_value = ('tap1', 5, 'mac')
+        with mock.patch.object(self.agent.int_br,
+                               'get_vif_port_by_id') as get_vif_port_by_id:
+            port = self.agent._get_vif_port_by_id('port1')
+        self.assertFalse(get_vif_port_by_id.called)
+        self.assertEqual(('tap1', 5, 'port1', 'mac', self.agent.int_br),
+                         (port.port_name, port.ofport, port.vif_id,
+                          port.vif_mac, port.switch))
+        port_cache.get_vif_port_attrs.return_value = None
+        self.assertIsNone(self.agent._get_vif_port_by_id('port1'))
+
     def test__setup_tunnel_port_error_negative(self):
         with contextlib.nested(
             mock.patch.object(self.agent.tun_br, 'add_tunnel_port',
@@ -335,6 +335,7 @@ class TunnelTest(base.BaseTestCase):
         a.available_local_vlans = set([LV_ID])
         a.tun_br_ofports = TUN_OFPORTS
         a.provision_local_vlan(NET_UUID, p_const.TYPE_GRE, None, LS_ID)
+        self.assertIs(a.local_vlan_map[NET_UUID], a.lvm_by_vlan[LV_ID])
         self._verify_mock_calls()
 
     def test_provision_local_vlan_flat(self):
@@ -395,8 +396,10 @@ class TunnelTest(base.BaseTestCase):
         a = self._build_agent()
         a.available_local_vlans = set()
         a.local_vlan_map[NET_UUID] = LVM
+        a.lvm_by_vlan[LVM.vlan] = LVM
         a.reclaim_local_vlan(NET_UUID)
         self.assertIn(LVM.vlan, a.available_local_vlans)
+        self.assertNotIn(LVM.vlan, a.lvm_by_vlan)
         self._verify_mock_calls()
 
     def test_reclaim_local_vlan_flat(self):
@@ -14,6 +14,7 @@
 
 import fixtures
 import mock
+from oslo.config import cfg
 import testtools
 
 from neutron.agent.linux import utils
@@ -110,6 +111,51 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
                 utils.execute(['ls'])
                 self.assertTrue(log.debug.called)
 
+    def test_command_stats(self):
+        self.mock_popen.return_value = ["", ""]
+        calls = utils.get_command_stats().get('ls', (0,))[0]
+        utils.execute(["ls", self.test_file])
+        stats = utils.get_command_stats()['ls']
+        self.assertEqual(calls + 1, stats[0])
+
+
+class AgentUtilsExecuteRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsExecuteRootwrapDaemonTest, self).setUp()
+        cfg.CONF.set_override('root_helper_daemon',
+                              'sudo neutron-rootwrap-daemon rootwrap.conf',
+                              'AGENT')
+        self.client = mock.Mock()
+        self.client.execute.return_value = (0, 'out', '')
+        mock.patch.object(utils.RootwrapDaemonHelper, 'get_client',
+                          return_value=self.client).start()
+        self.create_process = mock.patch.object(utils,
+                                                'create_process').start()
+
+    def test_execute_with_root_helper(self):
+        result = utils.execute(['ip', 'link'], root_helper='sudo',
+                               process_input='input')
+        self.assertEqual('out', result)
+        self.client.execute.assert_called_once_with(['ip', 'link'],
+                                                    stdin='input')
+        self.assertFalse(self.create_process.called)
+
+    def test_execute_with_addl_env(self):
+        utils.execute(['dnsmasq'], root_helper='sudo',
+                      addl_env={'NEUTRON_NETWORK_ID': 'net'})
+        self.client.execute.assert_called_once_with(
+            ['env', 'NEUTRON_NETWORK_ID=net', 'dnsmasq'], stdin=None)
+
+    def test_execute_without_root_helper(self):
+        self.create_process.return_value = FakeCreateProcess(0), 'ls'
+        utils.execute(['ls'])
+        self.assertFalse(self.client.execute.called)
+
+    def test_execute_raises_on_exit_code(self):
+        self.client.execute.return_value = (1, '', 'error')
+        self.assertRaises(RuntimeError, utils.execute, ['ip', 'link'],
+                          root_helper='sudo')
+
 
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
@@ -17,6 +17,7 @@ import contextlib
 import copy
 
 import mock
+import netaddr
 from oslo.config import cfg
 from testtools import matchers
 import webob.exc
@@ -34,7 +35,9 @@ from neutron.common import utils
 from neutron import context
 from neutron.db import api as db
 from neutron.db import db_base_plugin_v2
+from neutron.db import ip_allocator
 from neutron.db import models_v2
+from neutron.db import network_cache
 from neutron import manager
 from neutron.openstack.common import importutils
 from neutron.tests import base
@@ -774,6 +777,9 @@ class TestV2HTTPResponse(NeutronDbPluginV2TestCase):
 
 
 class TestPortsV2(NeutronDbPluginV2TestCase):
+    # The plugin method the bulk failure tests inject a fault into
+    _create_port_method = 'create_port'
+
     def test_create_port_json(self):
         keys = [('admin_state_up', True), ('status', self.port_create_status)]
         with self.port(name='myname') as port:
@@ -891,9 +897,10 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
 
         with mock.patch('__builtin__.hasattr',
                         new=fakehasattr):
-            orig = manager.NeutronManager.get_plugin().create_port
-            with mock.patch.object(manager.NeutronManager.get_plugin(),
-                                   'create_port') as patched_plugin:
+            plugin = manager.NeutronManager.get_plugin()
+            orig = getattr(plugin, self._create_port_method)
+            with mock.patch.object(plugin,
+                                   self._create_port_method) as patched_plugin:
 
                 def side_effect(*args, **kwargs):
                     return self._fail_second_call(patched_plugin, orig,
@@ -916,8 +923,9 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
         ctx = context.get_admin_context()
         with self.network() as net:
             plugin = manager.NeutronManager.get_plugin()
-            orig = plugin.create_port
-            with mock.patch.object(plugin, 'create_port') as patched_plugin:
+            orig = getattr(plugin, self._create_port_method)
+            with mock.patch.object(plugin,
+                                   self._create_port_method) as patched_plugin:
 
                 def side_effect(*args, **kwargs):
                     return self._fail_second_call(patched_plugin, orig,
@@ -938,6 +946,27 @@ class TestPortsV2(NeutronDbPluginV2TestCase):
                                self.port()) as ports:
             self._test_list_resources('port', ports)
 
+    def test_list_ports_streamed(self):
+        if self._skip_native_pagination:
+            self.skipTest("Skip test for not implemented pagination feature")
+        cfg.CONF.set_override('list_stream_page_size', 2)
+        cfg.CONF.set_default('allow_overlapping_ips', True)
+        plugin = manager.NeutronManager.get_plugin()
+        with contextlib.nested(self.port(),
+                               self.port(),
+                               self.port()) as ports:
+            with mock.patch.object(plugin, 'get_ports',
+                                   side_effect=plugin.get_ports) as get_ports:
+                req = self.new_list_request('ports', params='fields=name')
+                res = self.deserialize(self.fmt, req.get_response(self.api))
+            self.assertEqual([{'name': port['port']['name']}
+                              for port in ports], res['ports'])
+            # The ports are read two at a time, with cursor markers
+            self.assertEqual(2, get_ports.call_count)
+            markers = [call[1]['marker'] for call in get_ports.call_args_list]
+            self.assertIsNone(markers[0])
+            self.assertTrue(markers[1].startswith(api_common.CURSOR_PREFIX))
+
     def test_list_ports_filtered_by_fixed_ip(self):
         # for this test we need to enable overlapping ips
         cfg.CONF.set_default('allow_overlapping_ips', True)
@@ -951,6 +980,27 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
             self._test_list_resources('port', [port1],
                                       query_params=query_params)
 
+    def test_list_ports_with_column_fields(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.port() as port:
+            with mock.patch.object(plugin, '_make_port_dict') as make_dict:
+                req = self.new_list_request(
+                    'ports', params='fields=id&fields=device_id&fields=id')
+                res = self.deserialize(self.fmt, req.get_response(self.api))
+                self.assertFalse(make_dict.called)
+            self.assertEqual([{'id': port['port']['id'],
+                               'device_id': port['port']['device_id']}],
+                             res['ports'])
+
+    def test_list_ports_with_fixed_ips_field(self):
+        with self.port() as port:
+            req = self.new_list_request(
+                'ports', params='fields=id&fields=fixed_ips')
+            res = self.deserialize(self.fmt, req.get_response(self.api))
+            self.assertEqual([{'id': port['port']['id'],
+                               'fixed_ips': port['port']['fixed_ips']}],
+                             res['ports'])
+
     def test_list_ports_public_network(self):
         with self.network(shared=True) as network:
             with self.subnet(network) as subnet:
@@ -1012,6 +1062,37 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                                             (port1, port2, port3),
                                             ('mac_address', 'asc'), 2, 2)
 
+    def test_list_ports_with_pagination_cursors(self):
+        if self._skip_native_pagination:
+            self.skipTest("Skip test for not implemented pagination feature")
+        cfg.CONF.set_override('pagination_cursors', True)
+        cfg.CONF.set_default('allow_overlapping_ips', True)
+        plugin = manager.NeutronManager.get_plugin()
+        with contextlib.nested(self.port(mac_address='00:00:00:00:00:01'),
+                               self.port(mac_address='00:00:00:00:00:02'),
+                               self.port(mac_address='00:00:00:00:00:03')
+                               ) as (port1, port2, port3):
+            # The markers are not read from the database
+            with mock.patch.object(plugin, '_get_port') as get_port:
+                self._test_list_with_pagination('port',
+                                                (port1, port2, port3),
+                                                ('mac_address', 'asc'), 2, 2,
+                                                query_params='fields=id')
+                self.assertFalse(get_port.called)
+
+    def test_list_ports_with_invalid_cursor(self):
+        if self._skip_native_pagination:
+            self.skipTest("Skip test for not implemented pagination feature")
+        with self.port() as port:
+            cursor = api_common.encode_cursor(port['port'], [('id', True)])
+            for marker in (cursor, api_common.CURSOR_PREFIX + 'foo'):
+                req = self.new_list_request(
+                    'ports', params='limit=1&sort_key=name&sort_dir=asc&'
+                    'marker=%s' % marker)
+                res = req.get_response(self.api)
+                self.assertEqual(webob.exc.HTTPBadRequest.code,
+                                 res.status_int)
+
     def test_list_ports_with_pagination_emulated(self):
         helper_patcher = mock.patch(
             'neutron.api.v2.base.Controller._get_pagination_helper',
@@ -1290,6 +1371,49 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
             self.assertEqual(res.status_int,
                              webob.exc.HTTPServiceUnavailable.code)
 
+    def test_mac_generation_collision(self):
+        plugin = neutron.db.db_base_plugin_v2.NeutronDbPluginV2
+        with self.port() as port:
+            mac = port['port']['mac_address']
+            stats = plugin.get_mac_generation_stats()
+            with mock.patch.object(plugin, '_generate_mac',
+                                   side_effect=[mac, '12:34:56:78:9a:bc']):
+                res = self._create_port(self.fmt,
+                                        net_id=port['port']['network_id'])
+            self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+            port2 = self.deserialize(self.fmt, res)
+            self.assertEqual('12:34:56:78:9a:bc',
+                             port2['port']['mac_address'])
+            new_stats = plugin.get_mac_generation_stats()
+            self.assertEqual(stats['attempts'] + 2, new_stats['attempts'])
+            self.assertEqual(stats['collisions'] + 1,
+                             new_stats['collisions'])
+            self._delete('ports', port2['port']['id'])
+
+    def test_mac_generation_collisions_exhaust_retries(self):
+        cfg.CONF.set_override('mac_generation_retries', 3)
+        plugin = neutron.db.db_base_plugin_v2.NeutronDbPluginV2
+        with self.port() as port:
+            mac = port['port']['mac_address']
+            with mock.patch.object(plugin, '_generate_mac',
+                                   return_value=mac) as generate_mac:
+                res = self._create_port(self.fmt,
+                                        net_id=port['port']['network_id'])
+                self.assertEqual(3, generate_mac.call_count)
+            self.assertEqual(webob.exc.HTTPServiceUnavailable.code,
+                             res.status_int)
+
+    def test_same_mac_on_other_network(self):
+        with contextlib.nested(self.port(),
+                               self.network()) as (port, network):
+            kwargs = {"mac_address": port['port']['mac_address']}
+            res = self._create_port(self.fmt,
+                                    net_id=network['network']['id'],
+                                    **kwargs)
+            self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+            port2 = self.deserialize(self.fmt, res)
+            self._delete('ports', port2['port']['id'])
+
     def test_requested_duplicate_ip(self):
         with self.subnet() as subnet:
             with self.port(subnet=subnet) as port:
@@ -1692,7 +1816,7 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
         with self.subnet() as subnet:
             with contextlib.nested(
                 self.port(subnet=subnet, device_id='owner1', do_delete=False),
-                self.port(subnet=subnet, device_id='owner1'),
+                self.port(subnet=subnet, device_id='owner1', do_delete=False),
                 self.port(subnet=subnet, device_id='owner2'),
             ) as (p1, p2, p3):
                 orig = plugin.delete_port
@@ -1707,10 +1831,14 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                     self.assertRaises(n_exc.NeutronException,
                                       plugin.delete_ports_by_device_id,
                                       ctx, 'owner1', network_id)
-                self._show('ports', p1['port']['id'],
-                           expected_code=webob.exc.HTTPNotFound.code)
-                self._show('ports', p2['port']['id'],
-                           expected_code=webob.exc.HTTPOk.code)
+                # The ports of owner1 are not deleted in a given order
+                remaining = [p['port']['id'] for p in (p1, p2)
+                             if self.new_show_request(
+                                 'ports', p['port']['id']).get_response(
+                                     self.api).status_int ==
+                             webob.exc.HTTPOk.code]
+                self.assertEqual(1, len(remaining))
+                self._delete('ports', remaining[0])
                 self._show('ports', p3['port']['id'],
                            expected_code=webob.exc.HTTPOk.code)
 
@@ -2198,6 +2326,21 @@ class TestNetworksV2(NeutronDbPluginV2TestCase):
                              net1['network']['name'])
             self.assertIsNone(res['networks'][0].get('id'))
 
+    def test_get_networks_with_column_fields(self):
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        # Plugins may extend the networks after the base query
+        get_networks = db_base_plugin_v2.NeutronDbPluginV2.get_networks
+        with self.network(name='net1') as net1:
+            with mock.patch.object(plugin, '_make_network_dict') as make_dict:
+                nets = get_networks(plugin, ctx, fields=['id', 'name'])
+                self.assertFalse(make_dict.called)
+            self.assertEqual([{'id': net1['network']['id'], 'name': 'net1'}],
+                             nets)
+            nets = get_networks(plugin, ctx, fields=['id', 'subnets'])
+            self.assertEqual([{'id': net1['network']['id'], 'subnets': []}],
+                             nets)
+
     def test_list_networks_with_parameters_invalid_values(self):
         with contextlib.nested(self.network(name='net1',
                                             admin_state_up=False),
@@ -3438,6 +3581,90 @@ class TestSubnetsV2(NeutronDbPluginV2TestCase):
                                                cidr='10.0.2.0/24')) as subnets:
                 self._test_list_resources('subnet', subnets)
 
+    def test_get_subnets_from_network_cache(self):
+        cfg.CONF.set_override('network_cache', True)
+        self.addCleanup(network_cache.SUBNETS.clear)
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        with self.subnet(enable_dhcp=False) as subnet:
+            net_id = subnet['subnet']['network_id']
+            filters = {'network_id': [net_id]}
+            with mock.patch.object(plugin, '_load_subnets_by_network',
+                                   wraps=plugin._load_subnets_by_network
+                                   ) as load:
+                subnets = plugin.get_subnets(ctx, filters=filters)
+                subnets[0]['dns_nameservers'].append('1.2.3.4')
+                subnets = plugin.get_subnets(ctx, filters=filters,
+                                             fields=['id', 'name'])
+                self.assertEqual(1, load.call_count)
+                self.assertEqual([{'id': subnet['subnet']['id'],
+                                   'name': subnet['subnet']['name']}],
+                                 subnets)
+                self.assertEqual([], plugin.get_subnets(
+                    ctx, filters=dict(filters, enable_dhcp=[True])))
+                self.assertEqual([], plugin.get_subnets(
+                    ctx, filters=filters)[0]['dns_nameservers'])
+                self.assertEqual(1, load.call_count)
+
+                data = {'subnet': {'name': 'updated'}}
+                self._update('subnets', subnet['subnet']['id'], data)
+                subnets = plugin.get_subnets(ctx, filters=filters)
+                self.assertEqual(2, load.call_count)
+                self.assertEqual('updated', subnets[0]['name'])
+
+                # Unknown networks are loaded every time
+                plugin.get_subnets(ctx, filters={'network_id': [net_id,
+                                                                'other']})
+                load.assert_called_with(mock.ANY, ['other'])
+
+    def test_get_subnets_by_id_from_network_cache(self):
+        cfg.CONF.set_override('network_cache', True)
+        self.addCleanup(network_cache.SUBNETS.clear)
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        with self.network() as network:
+            with contextlib.nested(
+                self.subnet(network=network, cidr='10.0.0.0/24'),
+                self.subnet(network=network, cidr='10.0.1.0/24')
+            ) as (subnet1, subnet2):
+                subnet_id = subnet1['subnet']['id']
+                filters = {'id': [subnet_id, 'unknown']}
+                with contextlib.nested(
+                    mock.patch.object(plugin, '_load_subnets_by_network',
+                                      wraps=plugin._load_subnets_by_network),
+                    mock.patch.object(network_cache, 'get_revisions')
+                ) as (load, get_revisions):
+                    for i in range(2):
+                        subnets = plugin.get_subnets(ctx, filters=filters,
+                                                     fields=['id'])
+                        self.assertEqual([{'id': subnet_id}], subnets)
+                    self.assertEqual(1, load.call_count)
+                    # The revisions are read with the subnet networks
+                    self.assertFalse(get_revisions.called)
+
+                    data = {'subnet': {'name': 'updated'}}
+                    self._update('subnets', subnet_id, data)
+                    subnets = plugin.get_subnets(ctx, filters=filters)
+                    self.assertEqual(2, load.call_count)
+                    self.assertEqual('updated', subnets[0]['name'])
+                    self.assertEqual([], plugin.get_subnets(
+                        ctx, filters={'id': ['unknown']}))
+
+    def test_get_subnets_network_cache_not_used(self):
+        cfg.CONF.set_override('network_cache', True)
+        plugin = manager.NeutronManager.get_plugin()
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            with mock.patch.object(plugin,
+                                   '_load_subnets_by_network') as load:
+                plugin.get_subnets(context.get_admin_context())
+                plugin.get_subnets(context.Context('', 'some_tenant'),
+                                   filters={'network_id': [net_id]})
+                plugin.get_subnets(context.get_admin_context(),
+                                   filters={'network_id': [net_id],
+                                            'unknown': ['value']})
+                self.assertFalse(load.called)
+
     def test_list_subnets_shared(self):
         with self.network(shared=True) as network:
             with self.subnet(network=network, cidr='10.0.0.0/24') as subnet:
@@ -3839,6 +4066,91 @@ class TestSubnetsV2(NeutronDbPluginV2TestCase):
             n_exc.HostRoutesExhausted)
 
 
+class TestIpAllocatorV2(NeutronDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestIpAllocatorV2, self).setUp()
+        cfg.CONF.set_override('ip_allocation_strategy', 'striped')
+        mock.patch.dict(ip_allocator._free_space, clear=True).start()
+
+    def _fixed_ips(self, port):
+        return [ip['ip_address'] for ip in port['port']['fixed_ips']]
+
+    def test_allocate_until_exhausted(self):
+        with self.subnet(cidr='10.0.0.0/29') as subnet:
+            subnet_id = subnet['subnet']['id']
+            kwargs = {'fixed_ips': [{'subnet_id': subnet_id}] * 5}
+            net_id = subnet['subnet']['network_id']
+            res = self._create_port(self.fmt, net_id=net_id, **kwargs)
+            port = self.deserialize(self.fmt, res)
+            self.assertEqual(['10.0.0.2', '10.0.0.3', '10.0.0.4',
+                              '10.0.0.5', '10.0.0.6'],
+                             sorted(self._fixed_ips(port)))
+            res = self._create_port(self.fmt, net_id=net_id)
+            self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+            self._delete('ports', port['port']['id'])
+
+    def test_allocations_belong_to_port(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet) as port:
+                ip_address = self._fixed_ips(port)[0]
+                query = context.get_admin_context().session.query(
+                    models_v2.IPAllocation).filter_by(ip_address=ip_address)
+                self.assertEqual([port['port']['id']],
+                                 [a.port_id for a in query])
+
+    def test_availability_ranges_are_dropped(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet):
+                session = context.get_admin_context().session
+                self.assertEqual(
+                    0, session.query(models_v2.IPAvailabilityRange).count())
+
+    def test_requested_duplicate_ip(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet) as port:
+                kwargs = {'fixed_ips': [{'subnet_id': subnet['subnet']['id'],
+                                         'ip_address':
+                                         self._fixed_ips(port)[0]}]}
+                net_id = port['port']['network_id']
+                res = self._create_port(self.fmt, net_id=net_id, **kwargs)
+                self.assertEqual(webob.exc.HTTPConflict.code, res.status_int)
+
+    def test_concurrently_allocated_ip_is_skipped(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet) as port:
+                ip_address = self._fixed_ips(port)[0]
+                # Another server allocating the same address would leave
+                # it in the free space of this one.
+                ip_allocator.release(subnet['subnet']['id'], ip_address)
+                with mock.patch('random.randrange', return_value=0):
+                    with self.port(subnet=subnet) as port2:
+                        self.assertNotEqual([ip_address],
+                                            self._fixed_ips(port2))
+
+    def test_update_port_releases_ip(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet) as port:
+                ip_address = self._fixed_ips(port)[0]
+                data = {'port': {'fixed_ips': [{'subnet_id':
+                                                subnet['subnet']['id'],
+                                                'ip_address': '10.0.0.10'}]}}
+                req = self.new_update_request('ports', data,
+                                              port['port']['id'])
+                res = self.deserialize(self.fmt, req.get_response(self.api))
+                self.assertEqual(['10.0.0.10'], self._fixed_ips(res))
+                space = ip_allocator._free_space[subnet['subnet']['id']]
+                self.assertIn(int(netaddr.IPAddress(ip_address)), space)
+
+    def test_released_ips_are_found_when_exhausted(self):
+        with self.subnet(cidr='10.0.0.0/30') as subnet:
+            with self.port(subnet=subnet) as port:
+                self.assertEqual(['10.0.0.2'], self._fixed_ips(port))
+            # The port was deleted behind the back of the allocator
+            with self.port(subnet=subnet) as port:
+                self.assertEqual(['10.0.0.2'], self._fixed_ips(port))
+
+
 class DbModelTestCase(base.BaseTestCase):
     """DB model tests."""
     def test_repr(self):
@@ -18,7 +18,9 @@ from oslo.db import exception as db_exc
 
 from neutron.common import constants
 from neutron.common import exceptions as n_exc
+from neutron.common import utils
 from neutron.db import dhcp_rpc_base
+from neutron.extensions import portbindings
 from neutron.tests import base
 
 
@@ -208,6 +210,66 @@ class TestDhcpRpcCallbackMixin(base.BaseTestCase):
         self._test_get_dhcp_port_create_new(
             update_port=n_exc.PortNotFound(port_id='foo'))
 
+    def _test_get_dhcp_ports(self, ports):
+        self.plugin.get_networks.return_value = [
+            dict(id='net1', tenant_id='tenantid'),
+            dict(id='net2', tenant_id='tenantid')]
+        self.plugin.get_subnets.return_value = [
+            dict(id='a', network_id='net1'),
+            dict(id='b', network_id='net2')]
+        self.plugin.get_ports.return_value = ports
+        self.plugin.update_port.side_effect = (
+            lambda context, id, port: dict(port['port'], id=id))
+        self.plugin.create_port.side_effect = (
+            lambda context, port: dict(port['port'], id='new_port'))
+        return self.callbacks.get_dhcp_ports(mock.Mock(), host='host',
+                                             network_ids=['net1', 'net2',
+                                                          'deleted'])
+
+    def test_get_dhcp_ports(self):
+        device_id = utils.get_dhcp_agent_device_id('net1', 'host')
+        own_port = dict(id='own_port', network_id='net1',
+                        device_id=device_id,
+                        fixed_ips=[dict(subnet_id='a',
+                                        ip_address='10.0.0.2')])
+        ports = self._test_get_dhcp_ports([own_port])
+        self.assertEqual(own_port, ports['net1'])
+        self.assertEqual('new_port', ports['net2']['id'])
+        self.assertEqual([dict(subnet_id='b')], ports['net2']['fixed_ips'])
+        self.assertEqual('host', ports['net2'][portbindings.HOST_ID])
+        self.assertNotIn('deleted', ports)
+        self.assertFalse(self.plugin.update_port.called)
+        self.assertEqual(1, self.plugin.get_ports.call_count)
+
+    def test_get_dhcp_ports_adds_missing_subnet(self):
+        device_id = utils.get_dhcp_agent_device_id('net1', 'host')
+        own_port = dict(id='own_port', network_id='net1',
+                        device_id=device_id, fixed_ips=[])
+        ports = self._test_get_dhcp_ports([own_port])
+        self.plugin.update_port.assert_called_once_with(
+            mock.ANY, 'own_port',
+            {'port': {'network_id': 'net1',
+                      'fixed_ips': [dict(subnet_id='a')]}})
+        self.assertEqual('own_port', ports['net1']['id'])
+
+    def test_get_dhcp_ports_claims_reserved_port(self):
+        reserved_port = dict(id='reserved', network_id='net2',
+                             device_id=constants.DEVICE_ID_RESERVED_DHCP_PORT,
+                             fixed_ips=[dict(subnet_id='b',
+                                             ip_address='10.0.1.2')])
+        ports = self._test_get_dhcp_ports([reserved_port])
+        self.plugin.update_port.assert_called_once_with(
+            mock.ANY, 'reserved',
+            {'port': {'network_id': 'net2',
+                      'device_id': utils.get_dhcp_agent_device_id('net2',
+                                                                  'host')}})
+        self.assertEqual('reserved', ports['net2']['id'])
+
+    def test_get_dhcp_ports_no_networks(self):
+        self.assertEqual({}, self.callbacks.get_dhcp_ports(
+            mock.Mock(), host='host', network_ids=[]))
+        self.assertFalse(self.plugin.get_networks.called)
+
     def test_release_dhcp_port(self):
         port_retval = dict(id='port_id', fixed_ips=[dict(subnet_id='a')])
         self.plugin.get_ports.return_value = [port_retval]
@@ -30,6 +30,7 @@ from neutron.common import config as common_config
 from neutron.common import constants as const
 from neutron.common import exceptions
 from neutron.common import rpc as n_rpc
+from neutron.common import utils
 from neutron.tests import base
 
 
@@ -291,6 +292,66 @@ class TestDhcpAgent(base.BaseTestCase):
             self._test_sync_state_helper(known_networks, active_networks)
             w.assert_called_once_with()
 
+    def _network_without_dhcp_port(self, network_id):
+        return dhcp.NetModel(True, dict(id=network_id,
+                                        tenant_id=fake_tenant_id,
+                                        admin_state_up=True,
+                                        subnets=[fake_subnet1],
+                                        ports=[fake_port2]))
+
+    def test_sync_state_allocates_dhcp_ports_in_batches(self):
+        cfg.CONF.set_override('dhcp_ports_batch_size', 2)
+        networks = [self._network_without_dhcp_port(id)
+                    for id in ('net1', 'net2', 'net3')]
+        networks.append(fake_down_network)
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.return_value = networks
+            mock_plugin.get_dhcp_ports.side_effect = lambda ids: dict(
+                (id, dhcp.DictModel(id='port-' + id)) for id in ids)
+            plug.return_value = mock_plugin
+            dhcp_agent_inst = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp_agent_inst,
+                                   'safe_configure_dhcp_for_network'):
+                dhcp_agent_inst.sync_state()
+        self.assertEqual(2, mock_plugin.get_dhcp_ports.call_count)
+        self.assertEqual(['net1', 'net2', 'net3'], sorted(
+            id for call in mock_plugin.get_dhcp_ports.call_args_list
+            for id in call[0][0]))
+        self.assertEqual([fake_port2.id, 'port-net1'],
+                         [port.id for port in networks[0].ports])
+
+    def test_sync_state_dhcp_port_exists(self):
+        network = self._network_without_dhcp_port('net1')
+        network.ports.append(dhcp.DictModel(dict(
+            id='port1', fixed_ips=[fake_fixed_ip1],
+            device_id=utils.get_dhcp_agent_device_id('net1', cfg.CONF.host))))
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.return_value = [network]
+            plug.return_value = mock_plugin
+            dhcp_agent_inst = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp_agent_inst,
+                                   'safe_configure_dhcp_for_network'):
+                dhcp_agent_inst.sync_state()
+        self.assertFalse(mock_plugin.get_dhcp_ports.called)
+
+    def test_sync_state_bulk_dhcp_ports_unsupported(self):
+        network = self._network_without_dhcp_port('net1')
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.return_value = [network]
+            mock_plugin.get_dhcp_ports.side_effect = n_rpc.RemoteError(
+                'UnsupportedVersion')
+            plug.return_value = mock_plugin
+            dhcp_agent_inst = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp_agent_inst,
+                                   'safe_configure_dhcp_for_network') as c:
+                dhcp_agent_inst.sync_state()
+        c.assert_called_once_with(network)
+        self.assertEqual([fake_port2], network.ports)
+        self.assertFalse(dhcp_agent_inst.needs_resync_reasons)
+
     def test_sync_state_plugin_error(self):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
@@ -791,6 +852,47 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.call_driver.assert_called_once_with('reload_allocations',
                                                  fake_network)
 
+    def test_port_create_end_bulk(self):
+        payload = dict(ports=[fake_port1, fake_port2])
+        self.cache.get_network_by_id.return_value = fake_network
+        self.dhcp.port_create_end_bulk(None, payload)
+        self.cache.assert_has_calls(
+            [mock.call.get_network_by_id(fake_port1.network_id),
+             mock.call.put_port(mock.ANY),
+             mock.call.get_network_by_id(fake_port2.network_id),
+             mock.call.put_port(mock.ANY)])
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+
+    def test_port_create_end_bulk_unknown_network(self):
+        payload = dict(ports=[fake_port1])
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp.port_create_end_bulk(None, payload)
+        self.assertFalse(self.cache.put_port.called)
+        self.assertFalse(self.call_driver.called)
+
+    def test_port_update_end_delayed_reloads_coalesced(self):
+        cfg.CONF.set_override('reload_allocations_delay', 0.5)
+        self.cache.get_network_by_id.return_value = fake_network
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, dict(port=fake_port1))
+            self.dhcp.port_update_end(None, dict(port=fake_port2))
+        spawn_after.assert_called_once_with(
+            0.5, self.dhcp._delayed_reload_allocations, fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.dhcp._delayed_reload_allocations(fake_network.id)
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+        self.assertEqual(set(), self.dhcp.pending_reloads)
+
+    def test_delayed_reload_allocations_network_gone(self):
+        self.dhcp.pending_reloads.add(fake_network.id)
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp._delayed_reload_allocations(fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.assertEqual(set(), self.dhcp.pending_reloads)
+
     def test_port_update_change_ip_on_port(self):
         payload = dict(port=fake_port1)
         self.cache.get_network_by_id.return_value = fake_network
@@ -857,6 +959,14 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
                                               device_id='devid',
                                               host='foo')
 
+    def test_get_dhcp_ports(self):
+        self.call.return_value = {'netid': dict(a=1)}
+        retval = self.proxy.get_dhcp_ports(['netid'])
+        self.assertEqual(1, retval['netid'].a)
+        self.make_msg.assert_called_once_with('get_dhcp_ports',
+                                              network_ids=['netid'],
+                                              host='foo')
+
     def test_get_dhcp_port_none(self):
         self.call.return_value = None
         self.assertIsNone(self.proxy.get_dhcp_port('netid', 'devid'))
@@ -0,0 +1,108 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ipset_manager
+from neutron.tests import base
+
+FAKE_SG_ID = 'fake_sgid'
+FAKE_SET_NAME = 'IPv4fake_sgid'
+
+
+class IpsetManagerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.execute = mock.Mock()
+        self.ipset = ipset_manager.IpsetManager(execute=self.execute,
+                                                root_helper='sudo')
+
+    def _expect_restore(self, lines):
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input='\n'.join(lines) + '\n',
+            root_helper='sudo')
+
+    def test_get_name(self):
+        self.assertEqual(FAKE_SET_NAME,
+                         self.ipset.get_name(FAKE_SG_ID, 'IPv4'))
+
+    def test_get_name_truncated(self):
+        name = self.ipset.get_name('x' * 40, 'IPv6')
+        self.assertEqual(ipset_manager.IPSET_NAME_MAX_LENGTH, len(name))
+
+    def test_set_members_new_set(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4',
+                               ['10.0.0.2/32', '10.0.0.1/32'])
+        self._expect_restore(
+            ['create IPv4fake_sgid hash:net family inet',
+             'flush IPv4fake_sgid',
+             'add IPv4fake_sgid 10.0.0.1/32',
+             'add IPv4fake_sgid 10.0.0.2/32'])
+        self.assertTrue(self.ipset.set_exists(FAKE_SG_ID, 'IPv4'))
+
+    def test_set_members_new_ipv6_set(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv6', [])
+        self._expect_restore(
+            ['create IPv6fake_sgid hash:net family inet6',
+             'flush IPv6fake_sgid'])
+
+    def test_set_members_sends_diff(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4',
+                               ['10.0.0.1/32', '10.0.0.2/32'])
+        self.execute.reset_mock()
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4',
+                               ['10.0.0.2/32', '10.0.0.3/32'])
+        self._expect_restore(['add IPv4fake_sgid 10.0.0.3/32',
+                              'del IPv4fake_sgid 10.0.0.1/32'])
+
+    def test_set_members_unchanged(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4', ['10.0.0.1/32'])
+        self.execute.reset_mock()
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4', ['10.0.0.1/32'])
+        self.assertFalse(self.execute.called)
+
+    def test_ensure_set_keeps_members(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4', ['10.0.0.1/32'])
+        self.execute.reset_mock()
+        self.ipset.ensure_set(FAKE_SG_ID, 'IPv4')
+        self.assertFalse(self.execute.called)
+
+    def test_destroy(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4', [])
+        self.execute.reset_mock()
+        self.ipset.destroy(FAKE_SG_ID, 'IPv4')
+        self.execute.assert_called_once_with(
+            ['ipset', 'destroy', FAKE_SET_NAME],
+            process_input=None, root_helper='sudo')
+        self.assertFalse(self.ipset.set_exists(FAKE_SG_ID, 'IPv4'))
+
+    def test_destroy_unknown_set(self):
+        self.ipset.destroy(FAKE_SG_ID, 'IPv4')
+        self.assertFalse(self.execute.called)
+
+    def test_destroy_failure_keeps_set(self):
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4', [])
+        self.execute.side_effect = RuntimeError()
+        self.ipset.destroy(FAKE_SG_ID, 'IPv4')
+        self.assertTrue(self.ipset.set_exists(FAKE_SG_ID, 'IPv4'))
+
+    def test_namespace(self):
+        self.ipset.namespace = 'qrouter-foo'
+        self.ipset.set_members(FAKE_SG_ID, 'IPv4', [])
+        args = self.execute.call_args[0][0]
+        self.assertEqual(['ip', 'netns', 'exec', 'qrouter-foo', 'ipset'],
+                         args[:5])
@@ -19,6 +19,7 @@ import mock
 from oslo.config import cfg
 
 from neutron.agent.common import config as a_cfg
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_firewall
 from neutron.common import constants
 from neutron.tests import base
@@ -1221,3 +1222,91 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  mock.call.add_rule('ofake_dev', '-j $sg-fallback'),
                  mock.call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
+
+
+class IptablesFirewallEnhancedIpsetTestCase(IptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, group='SECURITYGROUP')
+        super(IptablesFirewallEnhancedIpsetTestCase, self).setUp()
+        self.firewall.ipset = mock.Mock()
+        self.firewall.ipset.get_name.side_effect = (
+            ipset_manager.IpsetManager.get_name)
+        self.firewall.ipset.set_exists.return_value = False
+        self.firewall.ipset.get_set_names.return_value = set()
+
+    def _fake_port_with_remote_group(self, direction='ingress'):
+        port = self._fake_port()
+        port['security_group_rules'] = [
+            {'ethertype': 'IPv4',
+             'direction': direction,
+             'protocol': 'tcp',
+             'port_range_min': 22,
+             'port_range_max': 22,
+             'remote_group_id': 'fake_sgid'}]
+        return port
+
+    def test_prepare_port_filter_with_remote_group(self):
+        self.firewall.update_security_group_members(
+            'fake_sgid', {'IPv4': ['10.0.0.2/32'], 'IPv6': []})
+        self.firewall.prepare_port_filter(
+            self._fake_port_with_remote_group())
+        self.firewall.ipset.set_members.assert_called_once_with(
+            'fake_sgid', 'IPv4', ['10.0.0.2/32'])
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ifake_dev',
+            '-p tcp -m tcp --dport 22 -m set --match-set IPv4fake_sgid src '
+            '-j RETURN')
+
+    def test_prepare_port_filter_with_remote_group_egress(self):
+        self.firewall.prepare_port_filter(
+            self._fake_port_with_remote_group(direction='egress'))
+        self.firewall.ipset.set_members.assert_called_once_with(
+            'fake_sgid', 'IPv4', [])
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ofake_dev',
+            '-p tcp -m tcp --dport 22 -m set --match-set IPv4fake_sgid dst '
+            '-j RETURN')
+
+    def test_prepare_port_filter_with_expanded_rule(self):
+        port = self._fake_port_with_remote_group()
+        port['security_group_rules'][0]['source_ip_prefix'] = '10.0.0.2/32'
+        self.firewall.prepare_port_filter(port)
+        self.assertFalse(self.firewall.ipset.set_members.called)
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ifake_dev', '-s 10.0.0.2/32 -p tcp -m tcp --dport 22 -j RETURN')
+
+    def test_update_security_group_members_existing_set(self):
+        self.firewall.ipset.set_exists.side_effect = (
+            lambda sg_id, ethertype: ethertype == 'IPv4')
+        self.firewall.update_security_group_members(
+            'fake_sgid', {'IPv4': ['10.0.0.2/32'], 'IPv6': ['fe80::2/128']})
+        self.firewall.ipset.set_members.assert_called_once_with(
+            'fake_sgid', 'IPv4', ['10.0.0.2/32'])
+        self.assertFalse(self.iptables_inst.apply.called)
+
+    def test_remove_port_filter_destroys_unused_ipset(self):
+        port = self._fake_port_with_remote_group()
+        self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.get_set_names.return_value = set(
+            ['IPv4fake_sgid'])
+        self.firewall.remove_port_filter(port)
+        self.firewall.ipset.destroy_by_name.assert_called_once_with(
+            'IPv4fake_sgid')
+
+    def test_ipset_kept_while_referenced(self):
+        port = self._fake_port_with_remote_group()
+        self.firewall.ipset.get_set_names.return_value = set(
+            ['IPv4fake_sgid'])
+        self.firewall.prepare_port_filter(port)
+        self.assertFalse(self.firewall.ipset.destroy_by_name.called)
+
+    def test_ipset_not_removed_while_deferred(self):
+        port = self._fake_port_with_remote_group()
+        self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.get_set_names.return_value = set(
+            ['IPv4fake_sgid'])
+        with self.firewall.defer_apply():
+            self.firewall.remove_port_filter(port)
+            self.assertFalse(self.firewall.ipset.destroy_by_name.called)
+        self.firewall.ipset.destroy_by_name.assert_called_once_with(
+            'IPv4fake_sgid')
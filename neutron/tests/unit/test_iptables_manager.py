@@ -19,6 +19,7 @@ import inspect
 import os
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import iptables_manager
 from neutron.tests import base
@@ -693,6 +694,95 @@ class IptablesManagerStateFulTestCase(base.BaseTestCase):
         self.assertIsNone(ret_str)
 
 
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        self.root_helper = 'sudo'
+        cfg.CONF.set_override('iptables_incremental_apply', True, 'AGENT')
+        self.iptables = (iptables_manager.
+                         IptablesManager(root_helper=self.root_helper))
+        self.execute = mock.patch.object(self.iptables, "execute").start()
+        self.execute.return_value = ''
+        self.filter = self.iptables.ipv4['filter']
+        self.filter.add_chain('filter')
+        self.filter.add_rule('FORWARD', '-j $filter')
+        self.filter.add_rule('filter', '-s 1.1.1.1 -j DROP')
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+    def _expect_noflush_restore(self, lines):
+        self.execute.assert_called_once_with(
+            ['iptables-restore', '--noflush'],
+            process_input='\n'.join(['*filter'] + lines + ['COMMIT']),
+            root_helper=self.root_helper)
+
+    def test_apply_without_changes(self):
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_apply_new_chain(self):
+        self.filter.add_chain('new')
+        self.filter.add_rule('new', '-j ACCEPT')
+        self.filter.add_rule('FORWARD', '-j $new')
+        self.iptables.apply()
+        self._expect_noflush_restore(
+            [':%(bn)s-new - [0:0]' % IPTABLES_ARG,
+             '-I %(bn)s-FORWARD 2 -j %(bn)s-new' % IPTABLES_ARG,
+             '-A %(bn)s-new -j ACCEPT' % IPTABLES_ARG])
+
+    def test_apply_added_rules(self):
+        self.filter.add_rule('filter', '-s 2.2.2.2 -j DROP')
+        self.filter.add_rule('filter', '-s 0.0.0.0 -j DROP', top=True)
+        self.iptables.apply()
+        self._expect_noflush_restore(
+            ['-I %(bn)s-filter 2 -s 2.2.2.2 -j DROP' % IPTABLES_ARG,
+             '-I %(bn)s-filter 1 -s 0.0.0.0 -j DROP' % IPTABLES_ARG])
+
+    def test_apply_removed_rule(self):
+        self.filter.add_rule('filter', '-s 2.2.2.2 -j DROP')
+        self.iptables.apply()
+        self.execute.reset_mock()
+        self.filter.remove_rule('filter', '-s 1.1.1.1 -j DROP')
+        self.iptables.apply()
+        self._expect_noflush_restore(['-D %(bn)s-filter 1' % IPTABLES_ARG])
+
+    def test_apply_rebuilt_chain_unchanged(self):
+        self.filter.remove_chain('filter')
+        self.filter.add_chain('filter')
+        self.filter.add_rule('FORWARD', '-j $filter')
+        self.filter.add_rule('filter', '-s 1.1.1.1 -j DROP')
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_apply_removed_chain(self):
+        self.filter.remove_chain('filter')
+        self.iptables.apply()
+        self._expect_noflush_restore(
+            ['-D %(bn)s-FORWARD 1' % IPTABLES_ARG,
+             '-F %(bn)s-filter' % IPTABLES_ARG,
+             '-X %(bn)s-filter' % IPTABLES_ARG])
+
+    def test_apply_unwrapped_change_is_full(self):
+        self.filter.add_rule('FORWARD', '-j ACCEPT', wrap=False)
+        self.iptables.apply()
+        self.execute.assert_any_call(['iptables-save', '-c'],
+                                     root_helper=self.root_helper)
+
+    def test_apply_after_failure_is_full(self):
+        self.filter.add_rule('filter', '-s 2.2.2.2 -j DROP')
+        self.execute.side_effect = RuntimeError()
+        self.assertRaises(RuntimeError, self.iptables.apply)
+        self.execute.side_effect = None
+        self.execute.reset_mock()
+        self.iptables.apply()
+        self.execute.assert_any_call(['iptables-save', '-c'],
+                                     root_helper=self.root_helper)
+        self.execute.reset_mock()
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+
 class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def setUp(self):
@@ -25,6 +25,7 @@ from testtools import matchers
 from neutron.agent.common import config as agent_config
 from neutron.agent import l3_agent
 from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
 from neutron.common import config as base_config
 from neutron.common import constants as l3_constants
 from neutron.common import exceptions as n_exc
@@ -249,6 +250,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         l3pluginApi_cls = self.l3pluginApi_cls_p.start()
         self.plugin_api = mock.MagicMock()
         l3pluginApi_cls.return_value = self.plugin_api
+        self.plugin_api.get_router_ids.return_value = [FAKE_ID]
 
         self.looping_call_p = mock.patch(
             'neutron.openstack.common.loopingcall.FixedIntervalLoopingCall')
@@ -268,6 +270,55 @@ class TestBasicRouterOperations(base.BaseTestCase):
             agent._sync_routers_task(agent.context)
         self.assertTrue(f.called)
 
+    def test__sync_routers_task_fetches_routers_in_chunks(self):
+        self.conf.set_override('sync_routers_chunk_size', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_ids = [_uuid() for i in range(5)]
+        self.plugin_api.get_router_ids.return_value = router_ids
+        self.plugin_api.get_routers.side_effect = (
+            lambda context, ids: [{'id': id} for id in ids])
+        with mock.patch.object(agent, '_cleanup_namespaces'):
+            agent._sync_routers_task(agent.context)
+        self.assertEqual(
+            [mock.call(agent.context, router_ids[0:2]),
+             mock.call(agent.context, router_ids[2:4]),
+             mock.call(agent.context, router_ids[4:])],
+            self.plugin_api.get_routers.call_args_list)
+        self.assertEqual(5, agent._queue.qsize())
+        self.assertFalse(agent.fullsync)
+
+    def test__sync_routers_task_chunk_failure_keeps_fullsync(self):
+        self.conf.set_override('sync_routers_chunk_size', 1)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.return_value = [FAKE_ID, FAKE_ID_2]
+        self.plugin_api.get_routers.side_effect = [[{'id': FAKE_ID}],
+                                                   Exception()]
+        with mock.patch.object(agent, '_cleanup_namespaces') as f:
+            agent._sync_routers_task(agent.context)
+        self.assertFalse(f.called)
+        self.assertTrue(agent.fullsync)
+        self.assertEqual(1, agent._queue.qsize())
+
+    def test__sync_routers_task_old_server(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.side_effect = (
+            l3_agent.n_rpc.RemoteError('UnsupportedVersion'))
+        self.plugin_api.get_routers.return_value = []
+        with mock.patch.object(agent, '_cleanup_namespaces'):
+            agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context)
+        self.assertFalse(agent.fullsync)
+
+    def test__sync_routers_task_chunking_disabled(self):
+        self.conf.set_override('sync_routers_chunk_size', 0)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_routers.return_value = []
+        with mock.patch.object(agent, '_cleanup_namespaces'):
+            agent._sync_routers_task(agent.context)
+        self.assertFalse(self.plugin_api.get_router_ids.called)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context,
+                                                            None)
+
     def test_router_info_create(self):
         id = _uuid()
         ri = l3_agent.RouterInfo(id, self.conf.root_helper,
@@ -377,6 +428,44 @@ class TestBasicRouterOperations(base.BaseTestCase):
     def test_agent_add_external_gateway(self):
         self._test_external_gateway_action('add')
 
+    def _test_gratuitous_arp_flushes_ip_batch(self, add_port):
+        self.send_arp_p.stop()
+        router = prepare_router_data(num_internal_ports=2)
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.device_exists.return_value = False
+        port = {'fixed_ips': [{'ip_address': '20.0.0.30',
+                               'subnet_id': _uuid()}],
+                'subnet': {'gateway_ip': '20.0.0.1'},
+                'extra_subnets': [],
+                'id': _uuid(),
+                'network_id': _uuid(),
+                'mac_address': 'ca:fe:de:ad:be:ef',
+                'ip_cidr': '20.0.0.30/24'}
+        with contextlib.nested(
+            mock.patch.object(ip_lib.IpBatch, 'flush'),
+            mock.patch.object(l3_agent.eventlet, 'spawn_n')
+        ) as (flush, spawn_n):
+            manager = mock.Mock()
+            manager.attach_mock(flush, 'flush')
+            manager.attach_mock(spawn_n, 'spawn_n')
+            with ip_lib.IpBatch(self.conf.root_helper, ri.ns_name):
+                add_port(agent, ri, port)
+                # The arping thread does not see the batch, the address
+                # is configured before it is spawned
+                self.assertEqual(['flush', 'spawn_n'],
+                                 [call[0] for call in manager.mock_calls])
+
+    def test_external_gateway_added_flushes_ip_batch(self):
+        self._test_gratuitous_arp_flushes_ip_batch(
+            lambda agent, ri, port: agent.external_gateway_added(
+                ri, port, agent.get_external_device_name(port['id'])))
+
+    def test_internal_network_added_flushes_ip_batch(self):
+        self._test_gratuitous_arp_flushes_ip_batch(
+            lambda agent, ri, port: agent.internal_network_added(ri, port))
+
     def _test_arping(self, namespace):
         if not namespace:
             self.conf.set_override('use_namespaces', False)
@@ -658,6 +747,17 @@ class TestBasicRouterOperations(base.BaseTestCase):
                                  self.conf.use_namespaces, router=router)
         self._test_process_router(ri)
 
+    def test_process_cent_router_ip_batch(self):
+        self.conf.set_override('router_ip_batch', True)
+        router = prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        with mock.patch.object(ip_lib, 'IpBatch') as batch_cls:
+            self._test_process_router(ri)
+        batch_cls.assert_called_with(self.conf.root_helper, ri.ns_name)
+        self.assertEqual(4, batch_cls.return_value.__exit__.call_count)
+        self.assertFalse(ri.iptables_manager.iptables_apply_deferred)
+
     def test_process_dist_router(self):
         router = prepare_router_data()
         ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
@@ -738,6 +838,34 @@ class TestBasicRouterOperations(base.BaseTestCase):
                          fip_statuses)
         device.addr.add.assert_called_once_with(4, '15.1.2.3/32', '15.1.2.3')
 
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_addresses_batched(self, IPDevice):
+        router = prepare_router_data(enable_snat=True)
+        router[l3_constants.FLOATINGIP_KEY] = [
+            {'id': _uuid(),
+             'floating_ip_address': '15.1.2.%d' % i,
+             'fixed_ip_address': '192.168.0.%d' % i,
+             'port_id': _uuid()} for i in range(1, 4)]
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        IPDevice.return_value = device = mock.Mock()
+        device.addr.list.return_value = []
+        self.send_arp_p.stop()
+        batch = mock.Mock()
+        manager = mock.Mock()
+        manager.attach_mock(device.addr.add, 'add')
+        manager.attach_mock(batch.flush, 'flush')
+        with contextlib.nested(
+            mock.patch.object(ip_lib.IpBatch, 'get', return_value=batch),
+            mock.patch.object(l3_agent.eventlet, 'spawn_n')
+        ) as (get, spawn_n):
+            manager.attach_mock(spawn_n, 'spawn_n')
+            agent.process_router_floating_ip_addresses(ri, {'id': _uuid()})
+        # The addresses are announced once configured
+        self.assertEqual(['add', 'add', 'add'] + ['flush', 'spawn_n'] * 3,
+                         [call[0] for call in manager.mock_calls])
+
     def test_process_router_floating_ip_nat_rules_add(self):
         fip = {
             'id': _uuid(), 'port_id': _uuid(),
@@ -1374,6 +1502,43 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.router_added_to_agent(None, [FAKE_ID])
         agent._queue.add.assert_called_once()
 
+    def test_rpc_update_processed_before_sync_update(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue.add(l3_agent.RouterUpdate(
+            FAKE_ID, l3_agent.PRIORITY_SYNC_ROUTERS_TASK))
+        agent.routers_updated(None, [FAKE_ID_2])
+        self.assertEqual(2, agent._queue.qsize())
+        updates = [update for rp, update in
+                   agent._queue.each_update_to_next_router()]
+        self.assertEqual([FAKE_ID_2], [update.id for update in updates])
+        self.assertEqual(1, agent._queue.qsize())
+
+    def test_process_router_update_records_processing_time(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = prepare_router_data()
+        agent._queue.add(l3_agent.RouterUpdate(router['id'],
+                                               l3_agent.PRIORITY_RPC,
+                                               router=router))
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update()
+        process.assert_called_once_with([router])
+        self.assertIn(router['id'], agent.router_processing_times)
+        stats = agent.get_router_processing_stats()
+        self.assertEqual(0, stats['queue_depth'])
+        self.assertEqual(agent.router_processing_times[router['id']],
+                         stats['router_processing_time_max'])
+
+    def test_process_router_update_deleted_router_drops_time(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.router_processing_times[FAKE_ID] = 1.0
+        agent.router_deleted(None, FAKE_ID)
+        with mock.patch.object(agent, '_router_removed') as removed:
+            agent._process_router_update()
+        removed.assert_called_once_with(FAKE_ID)
+        self.assertEqual({}, agent.router_processing_times)
+        self.assertEqual(0.0, agent.get_router_processing_stats()[
+            'router_processing_time_avg'])
+
     def test_process_router_delete(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         ex_gw_port = {'id': _uuid(),
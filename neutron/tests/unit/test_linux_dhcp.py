@@ -442,6 +442,8 @@ class TestBase(base.BaseTestCase):
         self.execute_p = mock.patch('neutron.agent.linux.utils.execute')
         self.safe = self.replace_p.start()
         self.execute = self.execute_p.start()
+        mock.patch.dict(dhcp.Dnsmasq._conf_file_contents,
+                        clear=True).start()
 
 
 class TestDhcpBase(TestBase):
@@ -1179,6 +1181,43 @@ tag:tag0,option:router""".lstrip()
         self.execute.assert_called_once_with(exp_args, 'sudo')
         device_manager.update.assert_called_with(fake_net, 'tap12345678-12')
 
+    def test_reload_allocations_unchanged(self):
+        fake_net = FakeDualNetwork()
+        dm = dhcp.Dnsmasq(self.conf, fake_net,
+                          version=dhcp.Dnsmasq.MINIMUM_VERSION)
+
+        with contextlib.nested(
+            mock.patch('os.path.isdir', return_value=True),
+            mock.patch.object(dhcp.Dnsmasq, 'active'),
+            mock.patch.object(dhcp.Dnsmasq, 'pid'),
+            mock.patch.object(dhcp.Dnsmasq, 'interface_name'),
+            mock.patch.object(dhcp.Dnsmasq, '_make_subnet_interface_ip_map'),
+            mock.patch.object(dhcp.Dnsmasq, '_release_unused_leases'),
+            mock.patch.object(dm, 'device_manager')
+        ) as (isdir, active, pid, interface_name, ip_map, release,
+              device_manager):
+            active.__get__ = mock.Mock(return_value=True)
+            pid.__get__ = mock.Mock(return_value=5)
+            interface_name.__get__ = mock.Mock(return_value='tap12345678-12')
+            ip_map.return_value = {}
+            dm.reload_allocations()
+            self.assertEqual(3, self.safe.call_count)
+            self.assertEqual(1, self.execute.call_count)
+
+            self.safe.reset_mock()
+            self.execute.reset_mock()
+            dm.reload_allocations()
+
+            self.assertFalse(self.safe.called)
+            self.assertFalse(self.execute.called)
+            self.assertEqual(2, device_manager.update.call_count)
+
+            # The files are written again once they are removed
+            dm._remove_config_files()
+            dm.reload_allocations()
+            self.assertEqual(3, self.safe.call_count)
+            self.execute.assert_called_once_with(['kill', '-HUP', 5], 'sudo')
+
     def test_reload_allocations_stale_pid(self):
         (exp_host_name, exp_host_data,
          exp_addn_name, exp_addn_data,
@@ -14,8 +14,11 @@
 #    under the License.
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink
+from neutron.agent.linux import utils
 from neutron.common import exceptions
 from neutron.tests import base
 
@@ -502,6 +505,7 @@ class TestIPCmdBase(base.BaseTestCase):
         self.parent = mock.Mock()
         self.parent.name = 'eth0'
         self.parent.root_helper = 'sudo'
+        self.parent.use_netlink = False
 
     def _assert_call(self, options, args):
         self.parent.assert_has_calls([
@@ -862,3 +866,219 @@ class TestIpNeighCommand(TestIPCmdBase):
         self.neigh_cmd.delete(4, '192.168.45.100', 'cc:dd:ee:ff:ab:cd')
         self._assert_sudo([4], ('del', '192.168.45.100', 'lladdr',
                                 'cc:dd:ee:ff:ab:cd', 'dev', 'tap0'))
+
+
+class TestIpLibNetlink(base.BaseTestCase):
+    def setUp(self):
+        super(TestIpLibNetlink, self).setUp()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        cfg.CONF.set_override('ip_lib_use_netlink', True)
+        iproute_cls = mock.patch.object(netlink, 'IPRoute').start()
+        self.iproute = iproute_cls.return_value.__enter__.return_value
+        self.iproute_cls = iproute_cls
+        self.execute = mock.patch.object(ip_lib.SubProcessBase,
+                                         '_execute').start()
+        self.device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+
+    def test_get_devices(self):
+        self.iproute.get_links.return_value = [{'name': 'lo'},
+                                               {'name': 'tap0'}]
+        devices = ip_lib.IPWrapper('sudo', 'ns').get_devices(
+            exclude_loopback=True)
+        self.assertEqual([ip_lib.IPDevice('tap0', 'sudo', 'ns')], devices)
+        self.iproute_cls.assert_called_once_with('ns')
+        self.assertFalse(self.execute.called)
+
+    def test_link_set(self):
+        self.device.link.set_up()
+        self.device.link.set_mtu(1450)
+        self.iproute.assert_has_calls([
+            mock.call.link_set('tap0', up=True),
+            mock.call.link_set('tap0', mtu=1450)])
+        self.assertFalse(self.execute.called)
+
+    def test_link_attributes(self):
+        self.iproute.get_link.return_value = {
+            'index': 3, 'name': 'tap0', 'type': netlink.ARPHRD_ETHER,
+            'flags': 0, 'address': 'cc:dd:ee:ff:ab:cd', 'mtu': 1500,
+            'qdisc': 'mq', 'qlen': 1000, 'state': 'UP', 'alias': None}
+        self.assertEqual({'mtu': 1500, 'qlen': 1000, 'state': 'UP',
+                          'qdisc': 'mq', 'link/ether': 'cc:dd:ee:ff:ab:cd'},
+                         self.device.link.attributes)
+        self.assertEqual('cc:dd:ee:ff:ab:cd', self.device.link.address)
+
+    def test_device_does_not_exist(self):
+        self.iproute.get_link.side_effect = netlink.NetlinkError(19)
+        self.assertFalse(ip_lib.device_exists('tap0', 'sudo', 'ns'))
+
+    def test_addr_add_delete(self):
+        self.device.addr.add(4, '10.0.0.2/24', '10.0.0.255')
+        self.device.addr.delete(4, '10.0.0.2/24')
+        self.iproute.assert_has_calls([
+            mock.call.addr_add('tap0', '10.0.0.2/24', '10.0.0.255',
+                               'global'),
+            mock.call.addr_del('tap0', '10.0.0.2/24')])
+
+    def test_addr_list(self):
+        self.iproute.get_addrs.return_value = [
+            {'cidr': '10.0.0.2/24', 'broadcast': None, 'scope': 'global',
+             'ip_version': 4, 'dynamic': False},
+            {'cidr': '172.16.0.2/16', 'broadcast': '172.16.255.255',
+             'scope': 'global', 'ip_version': 4, 'dynamic': False},
+            {'cidr': 'fe80::1/64', 'broadcast': None, 'scope': 'link',
+             'ip_version': 6, 'dynamic': True}]
+        self.assertEqual(
+            [dict(cidr='10.0.0.2/24', broadcast='10.0.0.255',
+                  scope='global', ip_version=4, dynamic=False),
+             dict(cidr='172.16.0.2/16', broadcast='172.16.255.255',
+                  scope='global', ip_version=4, dynamic=False)],
+            self.device.addr.list(scope='global'))
+        self.assertEqual(['fe80::1/64'],
+                         [a['cidr'] for a in
+                          self.device.addr.list(to='fe80::/64')])
+        self.iproute.get_addrs.assert_called_with('tap0')
+
+    def test_addr_list_filters(self):
+        self.execute.return_value = ''
+        self.device.addr.list(filters=['permanent'])
+        self.assertFalse(self.iproute.get_addrs.called)
+        self.assertTrue(self.execute.called)
+
+    def test_routes(self):
+        self.device.route.add_gateway('10.0.0.1', metric=5, table=16)
+        self.device.route.delete_gateway('10.0.0.1')
+        self.device.route.add_route('10.1.0.0/16', '10.0.0.2')
+        self.device.route.add_onlink_route('10.2.0.0/16')
+        self.iproute.assert_has_calls([
+            mock.call.route_replace('tap0', gateway='10.0.0.1', metric=5,
+                                    table=16),
+            mock.call.route_del('tap0', gateway='10.0.0.1', table=None),
+            mock.call.route_replace('tap0', cidr='10.1.0.0/16',
+                                    gateway='10.0.0.2', table=None),
+            mock.call.route_replace('tap0', cidr='10.2.0.0/16',
+                                    scope='link')])
+
+    def test_get_gateway(self):
+        self.iproute.get_routes.return_value = [
+            {'cidr': '10.0.0.0/24', 'gateway': None, 'metric': None,
+             'scope': 'link'},
+            {'cidr': 'default', 'gateway': '10.0.0.1', 'metric': 5,
+             'scope': 'global'}]
+        self.assertEqual({'gateway': '10.0.0.1', 'metric': 5},
+                         self.device.route.get_gateway())
+        self.assertIsNone(self.device.route.get_gateway(scope='link'))
+
+    def test_neigh(self):
+        self.device.neigh.add(4, '10.0.0.3', 'cc:dd:ee:ff:ab:cd')
+        self.device.neigh.delete(4, '10.0.0.3', 'cc:dd:ee:ff:ab:cd')
+        self.iproute.assert_has_calls([
+            mock.call.neigh_replace('tap0', '10.0.0.3', 'cc:dd:ee:ff:ab:cd'),
+            mock.call.neigh_del('tap0', '10.0.0.3', 'cc:dd:ee:ff:ab:cd')])
+        self.assertFalse(self.execute.called)
+
+
+class TestIpBatch(base.BaseTestCase):
+    def setUp(self):
+        super(TestIpBatch, self).setUp()
+        self.execute = mock.patch.object(utils, 'execute').start()
+        self.execute.return_value = ''
+
+    def _batch_call(self, *lines):
+        return mock.call(['ip', 'netns', 'exec', 'ns', 'ip', '-force',
+                          '-batch', '-'], root_helper='sudo',
+                         process_input=''.join('%s\n' % l for l in lines))
+
+    def test_changes_batched(self):
+        device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+        with ip_lib.IpBatch('sudo', 'ns'):
+            device.link.set_up()
+            device.addr.add(4, '10.0.0.2/24', '10.0.0.255')
+            device.neigh.add(4, '10.0.0.3', 'cc:dd:ee:ff:ab:cd')
+            device.route.add_gateway('10.0.0.1')
+            self.assertFalse(self.execute.called)
+        self.assertEqual(
+            [self._batch_call(
+                'link set tap0 up',
+                'addr add 10.0.0.2/24 brd 10.0.0.255 scope global dev tap0',
+                'neigh replace 10.0.0.3 lladdr cc:dd:ee:ff:ab:cd '
+                'nud permanent dev tap0',
+                'route replace default via 10.0.0.1 dev tap0')],
+            self.execute.call_args_list)
+
+    def test_flushed_before_other_commands(self):
+        device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+        with ip_lib.IpBatch('sudo', 'ns'):
+            device.link.set_up()
+            device.addr.list()
+            device.link.set_down()
+        self.assertEqual(
+            [self._batch_call('link set tap0 up'),
+             mock.call(['ip', 'netns', 'exec', 'ns', 'ip', 'addr', 'show',
+                        'tap0'], root_helper='sudo'),
+             self._batch_call('link set tap0 down')],
+            self.execute.call_args_list)
+
+    def test_other_namespace_not_batched(self):
+        with ip_lib.IpBatch('sudo', 'ns'):
+            ip_lib.IPDevice('tap0', 'sudo', 'ns2').link.set_up()
+            ip_lib.IPDevice('tap0', 'sudo').link.set_up()
+            self.assertEqual(2, self.execute.call_count)
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_no_namespace_not_batched(self):
+        with ip_lib.IpBatch('sudo', None):
+            ip_lib.IPDevice('tap0', 'sudo').link.set_up()
+            self.assertEqual(1, self.execute.call_count)
+
+    def test_netns_execute(self):
+        ip = ip_lib.IPWrapper('sudo', 'ns')
+        with ip_lib.IpBatch('sudo', 'ns'):
+            ip.netns.execute(['ip', 'route', 'replace', 'to', '10.1.0.0/16',
+                              'via', '10.0.0.1'], check_exit_code=False)
+            ip.netns.execute(['sysctl', '-w', 'net.ipv4.ip_forward=1'])
+        self.assertEqual(
+            [self._batch_call('route replace to 10.1.0.0/16 via 10.0.0.1'),
+             mock.call(['ip', 'netns', 'exec', 'ns', 'sysctl', '-w',
+                        'net.ipv4.ip_forward=1'], root_helper='sudo',
+                       check_exit_code=True)],
+            self.execute.call_args_list)
+
+    def test_unsafe_args_not_batched(self):
+        device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+        with ip_lib.IpBatch('sudo', 'ns'):
+            device.link.set_alias('my alias')
+            self.assertEqual(1, self.execute.call_count)
+
+    def test_failure_raised(self):
+        self.execute.side_effect = RuntimeError('Command failed -:2')
+        ip = ip_lib.IPWrapper('sudo', 'ns')
+
+        def batch():
+            with ip_lib.IpBatch('sudo', 'ns'):
+                ip.netns.execute(['ip', 'route', 'del', '10.1.0.0/16'],
+                                 check_exit_code=False)
+                ip.device('tap0').link.set_up()
+
+        self.assertRaises(RuntimeError, batch)
+
+    def test_unchecked_failure_ignored(self):
+        self.execute.side_effect = RuntimeError('Command failed -:1')
+        ip = ip_lib.IPWrapper('sudo', 'ns')
+        with ip_lib.IpBatch('sudo', 'ns'):
+            ip.netns.execute(['ip', 'route', 'del', '10.1.0.0/16'],
+                             check_exit_code=False)
+            ip.device('tap0').link.set_up()
+        self.assertEqual(1, self.execute.call_count)
+
+    def test_flushed_on_exception(self):
+        device = ip_lib.IPDevice('tap0', 'sudo', 'ns')
+
+        def batch():
+            with ip_lib.IpBatch('sudo', 'ns'):
+                device.link.set_up()
+                raise ValueError()
+
+        self.assertRaises(ValueError, batch)
+        self.assertEqual([self._batch_call('link set tap0 up')],
+                         self.execute.call_args_list)
+        self.assertIsNone(ip_lib.IpBatch.get('ns'))
@@ -0,0 +1,269 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import socket
+
+import mock
+
+from neutron.agent.linux import netlink
+from neutron.tests import base
+
+
+def _message(msg_type, seq, payload, flags=0):
+    return netlink._NLMSGHDR.pack(netlink._NLMSGHDR.size + len(payload),
+                                  msg_type, flags, seq, 0) + payload
+
+
+def _ack(seq, code=0):
+    return _message(netlink.NLMSG_ERROR, seq,
+                    netlink._NLMSGERR.pack(-code) + '\0' * 16)
+
+
+def _link(index, name, address, master=None, kind=None,
+          family=socket.AF_UNSPEC):
+    link = (netlink._IFINFOMSG.pack(family, netlink.ARPHRD_ETHER,
+                                    index, netlink.IFF_UP, 0) +
+            netlink._attr(netlink.IFLA_IFNAME, name + '\0') +
+            netlink._attr(netlink.IFLA_ADDRESS,
+                          netlink._pack_mac(address)) +
+            netlink._attr(netlink.IFLA_MTU, netlink._U32.pack(1500)) +
+            netlink._attr(netlink.IFLA_OPERSTATE, chr(6)))
+    if master:
+        link += netlink._attr(netlink.IFLA_MASTER, netlink._U32.pack(master))
+    if kind:
+        link += netlink._attr(netlink.IFLA_LINKINFO,
+                              netlink._attr(netlink.IFLA_INFO_KIND,
+                                            kind + '\0'))
+    return link
+
+
+def _parse_requests(data):
+    requests = []
+    offset = 0
+    while offset < len(data):
+        length, msg_type, flags, seq, pid = (
+            netlink._NLMSGHDR.unpack_from(data, offset))
+        requests.append((msg_type, flags, seq,
+                         data[offset + netlink._NLMSGHDR.size:
+                              offset + length]))
+        offset += netlink._align(length)
+    return requests
+
+
+class FakeSocket(object):
+    """Reply to the requests with the messages built by a handler."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sent = []
+        self.replies = []
+
+    def sendall(self, data):
+        self.sent.append(data)
+        for request in _parse_requests(data):
+            self.replies.append(''.join(self.handler(*request)))
+
+    def recv(self, size):
+        return self.replies.pop(0)
+
+    def close(self):
+        pass
+
+
+class TestIPRoute(base.BaseTestCase):
+    def setUp(self):
+        super(TestIPRoute, self).setUp()
+        self.open_socket = mock.patch.object(netlink, 'open_socket').start()
+        self.errors = {}
+        self.sock = FakeSocket(self._handle)
+        self.open_socket.return_value = self.sock
+
+    def _handle(self, msg_type, flags, seq, payload):
+        if msg_type == netlink.RTM_GETLINK:
+            if flags & netlink.NLM_F_DUMP == netlink.NLM_F_DUMP:
+                return [_message(netlink.RTM_NEWLINK, seq,
+                                 _link(1, 'lo', '00:00:00:00:00:00'),
+                                 netlink.NLM_F_MULTI),
+                        _message(netlink.RTM_NEWLINK, seq,
+                                 _link(3, 'tap0', 'fa:16:3e:00:00:01'),
+                                 netlink.NLM_F_MULTI),
+                        _message(netlink.NLMSG_DONE, seq, '\0' * 4)]
+            if 'tap0\0' in payload:
+                return [_message(netlink.RTM_NEWLINK, seq,
+                                 _link(3, 'tap0', 'fa:16:3e:00:00:01'))]
+            return [_ack(seq, errno.ENODEV)]
+        return [_ack(seq, self.errors.get(seq, 0))]
+
+    def test_namespace(self):
+        netlink.IPRoute('ns').get_links()
+        self.open_socket.assert_called_once_with('ns')
+
+    def test_get_links(self):
+        links = netlink.IPRoute().get_links()
+        self.assertEqual(['lo', 'tap0'], [link['name'] for link in links])
+        self.assertEqual({'index': 3, 'name': 'tap0',
+                          'type': netlink.ARPHRD_ETHER,
+                          'flags': netlink.IFF_UP,
+                          'address': 'fa:16:3e:00:00:01', 'mtu': 1500,
+                          'qdisc': None, 'qlen': None, 'state': 'UP',
+                          'alias': None, 'master': None, 'kind': None},
+                         links[1])
+
+    def test_get_link_missing(self):
+        e = self.assertRaises(netlink.NetlinkError,
+                              netlink.IPRoute().get_link, 'tap1')
+        self.assertEqual(errno.ENODEV, e.code)
+        self.assertIsInstance(e, RuntimeError)
+
+    def test_change(self):
+        ipr = netlink.IPRoute()
+        ipr.link_set('tap0', up=True)
+        ipr.neigh_replace('tap0', '10.0.0.3', 'fa:16:3e:00:00:03')
+        self.assertEqual(3, len(self.sock.sent))
+        requests = [_parse_requests(data)[0] for data in self.sock.sent]
+        self.assertEqual([netlink.RTM_SETLINK, netlink.RTM_GETLINK,
+                          netlink.RTM_NEWNEIGH],
+                         [request[0] for request in requests])
+        ndmsg = netlink._NDMSG.unpack_from(requests[2][3])
+        self.assertEqual((socket.AF_INET, 3, netlink.NUD_PERMANENT, 0, 0),
+                         ndmsg)
+
+    def test_change_failed(self):
+        self.errors[1] = errno.EEXIST
+        ipr = netlink.IPRoute()
+        e = self.assertRaises(netlink.NetlinkError, ipr.link_set, 'tap0',
+                              mtu=1450)
+        self.assertEqual(errno.EEXIST, e.code)
+
+    def test_batch(self):
+        with netlink.IPRoute() as ipr:
+            ipr.addr_add('tap0', '10.0.0.2/24', '10.0.0.255')
+            ipr.route_replace('tap0', gateway='10.0.0.1')
+            ipr.link_set('tap0', up=True)
+            # Only the lookup of the index is sent so far
+            self.assertEqual(1, len(self.sock.sent))
+        self.assertEqual(2, len(self.sock.sent))
+        self.assertEqual([netlink.RTM_NEWADDR, netlink.RTM_NEWROUTE,
+                          netlink.RTM_SETLINK],
+                         [request[0] for request in
+                          _parse_requests(self.sock.sent[1])])
+
+    def test_batch_failed(self):
+        self.errors[2] = errno.EEXIST
+        self.errors[3] = errno.ENETUNREACH
+        ipr = netlink.IPRoute()
+
+        def batch():
+            with ipr:
+                ipr.addr_add('tap0', '10.0.0.2/24', '10.0.0.255')
+                ipr.route_replace('tap0', gateway='10.0.0.1')
+                ipr.link_set('tap0', up=True)
+
+        e = self.assertRaises(netlink.NetlinkError, batch)
+        self.assertEqual(errno.EEXIST, e.code)
+        # All the acknowledgements were read
+        self.assertEqual([], self.sock.replies)
+
+    def test_batch_split(self):
+        with netlink.IPRoute() as ipr:
+            for i in range(1000):
+                ipr.link_set('tap0', mtu=1500)
+        self.assertTrue(len(self.sock.sent) > 2)
+        self.assertTrue(all(len(data) <= netlink.SEND_SIZE
+                            for data in self.sock.sent))
+        self.assertEqual(1000, sum(len(_parse_requests(data))
+                                   for data in self.sock.sent))
+
+
+class TestLinkMonitor(base.BaseTestCase):
+    def setUp(self):
+        super(TestLinkMonitor, self).setUp()
+        self.open_socket = mock.patch.object(netlink, 'open_socket').start()
+        self.get_links = mock.patch.object(netlink.IPRoute,
+                                           'get_links').start()
+        self.get_links.return_value = [
+            netlink.IPRoute._parse_link(
+                _link(2, 'brq1', 'fa:16:3e:00:00:02', kind='bridge')),
+            netlink.IPRoute._parse_link(
+                _link(3, 'tap1', 'fa:16:3e:00:00:03', master=2))]
+        self.spawn = mock.patch.object(netlink.eventlet, 'spawn').start()
+        self.monitor = netlink.LinkMonitor()
+        self.monitor.start()
+
+    def _events(self, *events):
+        self.monitor.process_events(''.join(
+            _message(msg_type, 0, payload) for msg_type, payload in events))
+
+    def test_start(self):
+        self.open_socket.assert_called_once_with(None, netlink.RTMGRP_LINK)
+        self.assertTrue(self.monitor.is_active)
+        self.assertEqual(['tap1'], self.monitor.get_slaves('brq1'))
+        self.assertEqual('bridge',
+                         self.monitor.get_master('tap1')['kind'])
+        self.assertTrue(self.monitor.process_updates())
+        self.assertFalse(self.monitor.process_updates())
+
+    def test_stop(self):
+        self.monitor.stop()
+        self.assertFalse(self.monitor.is_active)
+        self.spawn.return_value.kill.assert_called_once_with()
+        self.open_socket.return_value.close.assert_called_once_with()
+
+    def test_process_events(self):
+        self.monitor.process_updates()
+        self._events(
+            (netlink.RTM_NEWLINK, _link(4, 'tap2', 'fa:16:3e:00:00:04')),
+            (netlink.RTM_NEWLINK, _link(4, 'tap2', 'fa:16:3e:00:00:04',
+                                        master=2)),
+            (netlink.RTM_DELLINK, _link(3, 'tap1', 'fa:16:3e:00:00:03',
+                                        master=2)))
+        self.assertTrue(self.monitor.process_updates())
+        self.assertEqual(['brq1', 'tap2'], sorted(self.monitor.links))
+        self.assertEqual(['tap2'], self.monitor.get_slaves('brq1'))
+        self.assertIsNone(self.monitor.get_master('tap1'))
+
+    def test_process_events_rename(self):
+        self._events(
+            (netlink.RTM_NEWLINK, _link(3, 'tap9', 'fa:16:3e:00:00:03',
+                                        master=2)))
+        self.assertEqual(['brq1', 'tap9'], sorted(self.monitor.links))
+        self.assertEqual(['tap9'], self.monitor.get_slaves('brq1'))
+
+    def test_process_events_ignores_bridge_family(self):
+        self.monitor.process_updates()
+        self._events(
+            (netlink.RTM_DELLINK, _link(3, 'tap1', 'fa:16:3e:00:00:03',
+                                        master=2,
+                                        family=netlink.AF_BRIDGE)))
+        self.assertFalse(self.monitor.process_updates())
+        self.assertIn('tap1', self.monitor.links)
+
+    def test_run_reloads_lost_events(self):
+        self.open_socket.return_value.recv.side_effect = [
+            socket.error(errno.ENOBUFS, 'No buffer space'),
+            socket.error(errno.EBADF, 'Bad file descriptor')]
+        with mock.patch.object(netlink.LOG, 'exception'):
+            self.monitor._run()
+        self.assertEqual(2, self.get_links.call_count)
+        self.assertFalse(self.monitor.is_active)
+
+    def test_wait(self):
+        self.monitor.wait(0.01)
+        # Nothing changed since the start
+        with mock.patch.object(self.monitor._waiter, 'get',
+                               side_effect=netlink.queue.Empty) as get:
+            self.monitor.wait(0.5)
+            get.assert_called_once_with(timeout=0.5)
@@ -551,3 +551,63 @@ class NeutronPolicyTestCase(base.BaseTestCase):
             {'extension:provider_network:set': 'rule:admin_only'},
             dict((policy, 'rule:admin_only') for policy in
                  expected_policies))
+
+    def test_check_collection(self):
+        policy.init()
+        targets = [{'tenant_id': 'fake', 'shared': False},
+                   {'tenant_id': 'another', 'shared': False},
+                   {'tenant_id': 'another', 'shared': True}]
+        self.assertEqual([True, False, True],
+                         policy.check_collection(self.context,
+                                                 'get_network', targets))
+
+    def test_check_collection_might_not_exist(self):
+        policy.init()
+        self.assertEqual([True, True],
+                         policy.check_collection(self.context,
+                                                 'get_network:idonotexist',
+                                                 [{}, {}],
+                                                 might_not_exist=True))
+
+    def test_check_caches_target_independent_decision(self):
+        self.rules['get_something'] = common_policy.parse_rule(
+            'rule:regular_user')
+        admin_context = context.get_admin_context()
+        policy.init()
+        with mock.patch.object(common_policy.RoleCheck, '__call__',
+                               return_value=True) as role_check:
+            compiled = policy._get_compiled_check('get_something')
+            self.assertFalse(compiled.target_dependent)
+            self.assertTrue(policy.check(self.context, 'get_something',
+                                         {'tenant_id': 'a'}))
+            self.assertTrue(policy.check(self.context, 'get_something',
+                                         {'tenant_id': 'b'}))
+        # The role check is compiled, the decision is computed once
+        self.assertFalse(role_check.called)
+        self.assertEqual(1, len(policy._DECISION_CACHE))
+        self.assertFalse(policy.check(admin_context, 'get_something', {}))
+        self.assertEqual(2, len(policy._DECISION_CACHE))
+
+    def test_check_target_dependent_rule_not_cached(self):
+        policy.init()
+        compiled = policy._get_compiled_check('get_network')
+        self.assertTrue(compiled.target_dependent)
+        policy.check(self.context, 'get_network', {'tenant_id': 'fake'})
+        self.assertFalse(policy._DECISION_CACHE)
+
+    def test_compiled_checks_reset_on_rules_reload(self):
+        self.rules['get_something'] = common_policy.parse_rule('@')
+        policy.init()
+        self.assertTrue(policy.check(self.context, 'get_something', {}))
+        self.rules['get_something'] = common_policy.parse_rule('!')
+        policy.init()
+        self.assertFalse(policy.check(self.context, 'get_something', {}))
+
+    def test_compiled_checks_reset_on_rules_replaced(self):
+        self.rules['get_something'] = common_policy.parse_rule('@')
+        policy.init()
+        self.assertTrue(policy.check(self.context, 'get_something', {}))
+        rules = common_policy.Rules(dict(common_policy._rules))
+        rules['get_something'] = common_policy.parse_rule('!')
+        common_policy.set_rules(rules)
+        self.assertFalse(policy.check(self.context, 'get_something', {}))
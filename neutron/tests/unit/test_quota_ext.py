@@ -26,6 +26,7 @@ from neutron.common import config
 from neutron.common import exceptions
 from neutron import context
 from neutron.db import api as db
+from neutron.db import models_v2
 from neutron.db import quota_db
 from neutron import quota
 from neutron.tests import base
@@ -401,6 +402,82 @@ class TestDbQuotaDriver(base.BaseTestCase):
                                                       target_tenant)
 
 
+class TestTrackedQuotaDriver(base.BaseTestCase):
+    """Test for neutron.db.quota_db.TrackedQuotaDriver."""
+
+    def setUp(self):
+        super(TestTrackedQuotaDriver, self).setUp()
+        cfg.CONF.set_override('quota_driver', quota.QUOTA_TRACKED_DRIVER,
+                              group='QUOTAS')
+        cfg.CONF.set_override('quota_network', 2, group='QUOTAS')
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.driver = quota_db.TrackedQuotaDriver()
+        self.context = context.get_admin_context()
+        self.resources = {'network': quota.CountableResource(
+            'network', None, 'quota_network')}
+
+    def _add_network(self, tenant_id='foo'):
+        with self.context.session.begin():
+            network = models_v2.Network(tenant_id=tenant_id, name='net')
+            self.context.session.add(network)
+        return network
+
+    def _reserve(self, amount=1):
+        return self.driver.make_reservation(self.context, 'foo',
+                                            self.resources, 'network', amount)
+
+    def _get_usage(self):
+        return self.context.session.query(quota_db.QuotaUsage).filter_by(
+            tenant_id='foo', resource='network').one()
+
+    def test_make_reservation(self):
+        self._add_network()
+        self._add_network(tenant_id='bar')
+        self.assertIsNotNone(self._reserve())
+        self.assertRaises(exceptions.OverQuota, self._reserve)
+
+    def test_make_reservation_over_quota(self):
+        self.assertRaises(exceptions.OverQuota, self._reserve, 3)
+        self.assertEqual(
+            0, self.context.session.query(quota_db.Reservation).count())
+
+    def test_release_reservation(self):
+        self.driver.release_reservation(self.context, self._reserve(2))
+        self.assertIsNotNone(self._reserve(2))
+
+    def test_expired_reservation(self):
+        cfg.CONF.set_override('quota_reservation_expiration', -1,
+                              group='QUOTAS')
+        self._reserve(2)
+        self.assertIsNotNone(self._reserve(2))
+
+    def test_usage_tracked(self):
+        self._reserve()
+        network = self._add_network()
+        self._add_network(tenant_id='bar')
+        self.assertEqual(1, self._get_usage().in_use)
+        with self.context.session.begin():
+            self.context.session.delete(network)
+        self.context.session.expire_all()
+        self.assertEqual(0, self._get_usage().in_use)
+
+    def test_usage_resynced(self):
+        self._add_network()
+        self.driver.release_reservation(self.context, self._reserve())
+        self.context.session.query(quota_db.QuotaUsage).update(
+            {'in_use': 2})
+        self.assertRaises(exceptions.OverQuota, self._reserve)
+        cfg.CONF.set_override('quota_usage_resync_interval', -1,
+                              group='QUOTAS')
+        self.assertIsNotNone(self._reserve())
+        self.assertEqual(1, self._get_usage().in_use)
+
+    def test_unlimited_quota(self):
+        cfg.CONF.set_override('quota_network', -1, group='QUOTAS')
+        self.assertIsNone(self._reserve(100))
+
+
 class TestQuotaDriverLoad(base.BaseTestCase):
     def setUp(self):
         super(TestQuotaDriverLoad, self).setUp()
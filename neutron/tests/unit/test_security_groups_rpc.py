@@ -17,6 +17,7 @@ import contextlib
 
 import mock
 from oslo.config import cfg
+from oslo import messaging
 from testtools import matchers
 import webob.exc
 
@@ -365,23 +366,125 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                              'security_group_id': sg1_id},
                             {'direction': 'egress', 'ethertype': const.IPv6,
                              'security_group_id': sg1_id},
+                            {'direction': u'ingress',
+                             'source_ip_prefix': u'10.0.0.3/32',
+                             'protocol': const.PROTO_NAME_TCP,
+                             'ethertype': const.IPv4,
+                             'port_range_max': 25, 'port_range_min': 24,
+                             'remote_group_id': sg2_id,
+                             'security_group_id': sg1_id},
                             {'direction': 'egress', 'ethertype': const.IPv4,
                              'security_group_id': sg2_id},
                             {'direction': 'egress', 'ethertype': const.IPv6,
                              'security_group_id': sg2_id},
+                            ]
+                # Rules of different security groups come in no
+                # particular order.
+                self.assertEqual(sorted(port_rpc['security_group_rules']),
+                                 sorted(expected))
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with contextlib.nested(self.subnet(n),
+                                   self.security_group(),
+                                   self.security_group()) as (subnet_v4,
+                                                              sg1,
+                                                              sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', const.PROTO_NAME_TCP, '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, webob.exc.HTTPCreated.code)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                ctx = context.get_admin_context()
+                sg_info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                port_rpc = sg_info['devices'][port_id1]
+                expected = [{'direction': 'egress', 'ethertype': const.IPv4,
+                             'security_group_id': sg1_id},
+                            {'direction': 'egress', 'ethertype': const.IPv6,
+                             'security_group_id': sg1_id},
                             {'direction': u'ingress',
-                             'source_ip_prefix': u'10.0.0.3/32',
                              'protocol': const.PROTO_NAME_TCP,
                              'ethertype': const.IPv4,
                              'port_range_max': 25, 'port_range_min': 24,
                              'remote_group_id': sg2_id,
                              'security_group_id': sg1_id},
                             ]
-                self.assertEqual(port_rpc['security_group_rules'],
-                                 expected)
+                self.assertEqual(expected, sg_info['security_groups'][sg1_id])
+                self.assertEqual([sg1_id], port_rpc['security_groups'])
+                self.assertEqual([], port_rpc['security_group_rules'])
+                self.assertEqual([sg2_id],
+                                 port_rpc['security_group_source_groups'])
+                self.assertEqual({sg2_id: {const.IPv4: [u'10.0.0.3/32'],
+                                           const.IPv6: []}},
+                                 sg_info['sg_member_ips'])
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_rules_cache(self):
+        if getattr(self, "notifier", None) is None:
+            self.skipTest("Notifier mock is not set so the plugin does not "
+                          "invalidate the security group rules cache")
+        cfg.CONF.set_override('rules_cache', True, 'SECURITYGROUP')
+        rules_cache = sg_db_rpc.SecurityGroupRulesCache()
+        mock.patch.object(sg_db_rpc, 'SG_RULES_CACHE', rules_cache).start()
+        with self.network() as n:
+            with contextlib.nested(self.subnet(n),
+                                   self.security_group()) as (subnet_v4,
+                                                              sg1):
+                sg1_id = sg1['security_group']['id']
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                ctx = context.get_admin_context()
+                self.rpc.devices = {port_id1: dict(ports_rest1['port'])}
+                sg_info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=[port_id1])
+                self.assertEqual(2, len(sg_info['security_groups'][sg1_id]))
+                rule_ids = set(
+                    rule['id'] for rule in
+                    sg1['security_group']['security_group_rules'])
+                self.assertEqual(sg_info['security_groups'],
+                                 rules_cache.get({sg1_id: rule_ids}))
+
+                # The rule is created as by another server, which does
+                # not invalidate the rules cached here
+                rule1 = self._build_security_group_rule(
+                    sg1_id, 'ingress', const.PROTO_NAME_TCP, '22', '22')
+                with mock.patch.object(rules_cache, 'invalidate'):
+                    res = self._create_security_group_rule(self.fmt, rule1)
+                self.assertEqual(res.status_int, webob.exc.HTTPCreated.code)
+                self.rpc.devices = {port_id1: dict(ports_rest1['port'])}
+                sg_info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=[port_id1])
+                self.assertEqual(3, len(sg_info['security_groups'][sg1_id]))
+                self._delete('ports', port_id1)
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = FAKE_PREFIX[const.IPv6]
         fake_gateway = FAKE_IP[const.IPv6]
@@ -806,10 +909,6 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                              'security_group_id': sg1_id},
                             {'direction': 'egress', 'ethertype': const.IPv6,
                              'security_group_id': sg1_id},
-                            {'direction': 'egress', 'ethertype': const.IPv4,
-                             'security_group_id': sg2_id},
-                            {'direction': 'egress', 'ethertype': const.IPv6,
-                             'security_group_id': sg2_id},
                             {'direction': 'ingress',
                              'source_ip_prefix': '2001:db8::2/128',
                              'protocol': const.PROTO_NAME_TCP,
@@ -817,14 +916,20 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                              'port_range_max': 25, 'port_range_min': 24,
                              'remote_group_id': sg2_id,
                              'security_group_id': sg1_id},
+                            {'direction': 'egress', 'ethertype': const.IPv4,
+                             'security_group_id': sg2_id},
+                            {'direction': 'egress', 'ethertype': const.IPv6,
+                             'security_group_id': sg2_id},
                             {'direction': 'ingress',
                              'protocol': const.PROTO_NAME_ICMP_V6,
                              'ethertype': const.IPv6,
                              'source_ip_prefix': fake_gateway,
                              'source_port_range_min': const.ICMPV6_TYPE_RA},
                             ]
-                self.assertEqual(port_rpc['security_group_rules'],
-                                 expected)
+                # Rules of different security groups come in no
+                # particular order.
+                self.assertEqual(sorted(port_rpc['security_group_rules']),
+                                 sorted(expected))
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
@@ -833,6 +938,76 @@ class SGServerRpcCallBackMixinTestCaseXML(SGServerRpcCallBackMixinTestCase):
     fmt = 'xml'
 
 
+class SecurityGroupRulesCacheTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(SecurityGroupRulesCacheTestCase, self).setUp()
+        cfg.CONF.set_override('rules_cache', True, 'SECURITYGROUP')
+        self.cache = sg_db_rpc.SecurityGroupRulesCache()
+
+    def test_get_update_invalidate(self):
+        self.cache.update({'sg1': [], 'sg2': [{'direction': 'ingress'}]},
+                          {'sg1': set(), 'sg2': set(['r1'])})
+        self.assertEqual({'sg2': [{'direction': 'ingress'}]},
+                         self.cache.get({'sg2': set(['r1']),
+                                         'sg3': set()}))
+        self.cache.invalidate(['sg2'])
+        self.assertEqual({'sg1': []},
+                         self.cache.get({'sg1': set(),
+                                         'sg2': set(['r1'])}))
+
+    def test_get_changed_rules(self):
+        self.cache.update({'sg1': [{'direction': 'ingress'}]},
+                          {'sg1': set(['r1'])})
+        self.assertEqual({}, self.cache.get({'sg1': set(['r1', 'r2'])}))
+        self.assertEqual({}, self.cache.get({'sg1': set()}))
+
+    def test_disabled(self):
+        cfg.CONF.set_override('rules_cache', False, 'SECURITYGROUP')
+        self.cache.update({'sg1': []}, {'sg1': set()})
+        self.assertEqual({}, self.cache.get({'sg1': set()}))
+
+
+class SGServerRpcMixinNotifyTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(SGServerRpcMixinNotifyTestCase, self).setUp()
+        self.mixin = sg_db_rpc.SecurityGroupServerRpcMixin()
+        self.mixin.notifier = mock.Mock()
+
+    def _port(self, device_owner='compute:nova', security_groups=None,
+              ip_address='10.0.0.2'):
+        return {'device_owner': device_owner,
+                'fixed_ips': [{'ip_address': ip_address}],
+                ext_sg.SECURITYGROUPS: security_groups or []}
+
+    def test_notify_member_updated_bulk(self):
+        ports = [self._port(security_groups=['sg1']),
+                 self._port(security_groups=['sg1', 'sg2']),
+                 self._port(const.DEVICE_OWNER_DHCP),
+                 self._port(const.DEVICE_OWNER_DHCP)]
+        self.mixin.notify_security_groups_member_updated_bulk(None, ports)
+        notifier = self.mixin.notifier
+        notifier.security_groups_provider_updated.assert_called_once_with(
+            None)
+        sg_ids = notifier.security_groups_member_updated.call_args[0][1]
+        self.assertEqual(['sg1', 'sg2'], sorted(sg_ids))
+
+    def test_notify_member_updated_bulk_ipv4_router_port(self):
+        ports = [self._port(const.DEVICE_OWNER_ROUTER_INTF)]
+        self.mixin.notify_security_groups_member_updated_bulk(None, ports)
+        self.assertFalse(self.mixin.notifier.method_calls)
+
+    def test_notify_member_updated_bulk_ipv6_router_port(self):
+        ports = [self._port(const.DEVICE_OWNER_ROUTER_INTF,
+                            ip_address='2001:db8::1')]
+        self.mixin.notify_security_groups_member_updated_bulk(None, ports)
+        notifier = self.mixin.notifier
+        notifier.security_groups_provider_updated.assert_called_once_with(
+            None)
+        self.assertFalse(notifier.security_groups_member_updated.called)
+
+
 class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
     def setUp(self):
         super(SGAgentRpcCallBackMixinTestCase, self).setUp()
@@ -963,6 +1138,153 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.firewall.assert_has_calls([])
 
 
+class SecurityGroupAgentEnhancedIpsetRpcTestCase(base.BaseTestCase):
+    def setUp(self, defer_refresh_firewall=False):
+        super(SecurityGroupAgentEnhancedIpsetRpcTestCase, self).setUp()
+        cfg.CONF.set_default('firewall_driver',
+                             'neutron.agent.firewall.NoopFirewallDriver',
+                             group='SECURITYGROUP')
+        self.agent = sg_rpc.SecurityGroupAgentRpcMixin()
+        self.agent.context = None
+        self.agent.init_firewall(defer_refresh_firewall=defer_refresh_firewall)
+        self.agent.use_ipset = True
+        self.firewall = mock.Mock()
+        firewall_object = firewall_base.FirewallDriver()
+        self.firewall.defer_apply.side_effect = firewall_object.defer_apply
+        self.agent.firewall = self.firewall
+        rpc = mock.Mock()
+        self.agent.plugin_rpc = rpc
+        self.fake_device = {'device': 'fake_device',
+                            'security_groups': ['fake_sgid1'],
+                            'security_group_source_groups': ['fake_sgid2'],
+                            'security_group_rules': [{'security_group_id':
+                                                      'fake_sgid1',
+                                                      'remote_group_id':
+                                                      'fake_sgid2'}]}
+        self.sg_members = {'fake_sgid2': {'IPv4': ['10.0.0.2/32'],
+                                          'IPv6': []}}
+        fake_devices = {'fake_device': self.fake_device}
+        self.firewall.ports = fake_devices
+        rpc.security_group_info_for_devices.return_value = {
+            'devices': fake_devices,
+            'sg_member_ips': self.sg_members}
+
+    def test_prepare_devices_filter(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.assert_has_calls(
+            [mock.call.defer_apply(),
+             mock.call.update_security_group_members(
+                 'fake_sgid2', self.sg_members['fake_sgid2']),
+             mock.call.prepare_port_filter(self.fake_device)])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_rules_for_devices.called)
+
+    def test_refresh_firewall(self):
+        self.agent.refresh_firewall()
+        self.firewall.assert_has_calls(
+            [mock.call.defer_apply(),
+             mock.call.update_security_group_members(
+                 'fake_sgid2', self.sg_members['fake_sgid2']),
+             mock.call.update_port_filter(self.fake_device)])
+
+    def test_prepare_devices_filter_with_rules_by_security_group(self):
+        sg_rule = {'security_group_id': 'fake_sgid1',
+                   'remote_group_id': 'fake_sgid2'}
+        provider_rule = {'direction': 'ingress', 'ethertype': 'IPv4'}
+        device = {'device': 'fake_device',
+                  'security_groups': ['fake_sgid1'],
+                  'security_group_source_groups': ['fake_sgid2'],
+                  'security_group_rules': [provider_rule]}
+        self.agent.plugin_rpc.security_group_info_for_devices.return_value = {
+            'devices': {'fake_device': device},
+            'security_groups': {'fake_sgid1': [sg_rule]},
+            'sg_member_ips': self.sg_members}
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.prepare_port_filter.assert_called_once_with(device)
+        self.assertEqual([sg_rule, provider_rule],
+                         device['security_group_rules'])
+
+    def test_security_groups_member_updated(self):
+        self.agent.security_groups_member_updated(['fake_sgid2',
+                                                   'fake_sgid3'])
+        self.agent.plugin_rpc.security_group_info_for_devices.\
+            assert_called_once_with(None, ['fake_device'])
+        self.firewall.update_security_group_members.assert_called_once_with(
+            'fake_sgid2', self.sg_members['fake_sgid2'])
+        self.assertFalse(self.firewall.update_port_filter.called)
+
+    def test_security_groups_member_not_updated(self):
+        self.agent.security_groups_member_updated(['fake_sgid3'])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_info_for_devices.called)
+        self.assertFalse(self.firewall.update_security_group_members.called)
+
+    def _test_prepare_devices_filter_fallback(self, error):
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = error
+        rpc.security_group_rules_for_devices.return_value = {
+            'fake_device': self.fake_device}
+        self.agent.prepare_devices_filter(['fake_device'])
+        rpc.security_group_rules_for_devices.assert_called_once_with(
+            None, ['fake_device'])
+        self.firewall.prepare_port_filter.assert_called_once_with(
+            self.fake_device)
+        self.assertFalse(self.firewall.update_security_group_members.called)
+        self.assertFalse(self.agent.use_ipset)
+
+    def test_prepare_devices_filter_no_such_method(self):
+        self._test_prepare_devices_filter_fallback(
+            n_rpc.RemoteError('NoSuchMethod'))
+
+    def test_prepare_devices_filter_unsupported_version(self):
+        self._test_prepare_devices_filter_fallback(
+            messaging.UnsupportedVersion(sg_rpc.SG_INFO_RPC_VERSION))
+
+    def test_prepare_devices_filter_remote_error(self):
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = (
+            n_rpc.RemoteError('DBError'))
+        self.assertRaises(n_rpc.RemoteError,
+                          self.agent.prepare_devices_filter, ['fake_device'])
+        self.assertFalse(rpc.security_group_rules_for_devices.called)
+        self.assertTrue(self.agent.use_ipset)
+
+    def test_refresh_security_group_members_fallback(self):
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = (
+            n_rpc.RemoteError('NoSuchMethod'))
+        rpc.security_group_rules_for_devices.return_value = {
+            'fake_device': self.fake_device}
+        self.agent.refresh_security_group_members(['fake_sgid2'])
+        self.firewall.update_port_filter.assert_called_once_with(
+            self.fake_device)
+        self.assertFalse(self.agent.use_ipset)
+
+
+class SecurityGroupAgentEnhancedIpsetWithDeferredRefreshTestCase(
+    SecurityGroupAgentEnhancedIpsetRpcTestCase):
+
+    def setUp(self):
+        super(SecurityGroupAgentEnhancedIpsetWithDeferredRefreshTestCase,
+              self).setUp(defer_refresh_firewall=True)
+
+    def test_security_groups_member_updated(self):
+        self.agent.security_groups_member_updated(['fake_sgid2'])
+        self.assertIn('fake_sgid2', self.agent.sg_members_to_refresh)
+        self.assertFalse(self.agent.devices_to_refilter)
+        self.assertTrue(self.agent.firewall_refresh_needed())
+        self.assertFalse(self.firewall.update_security_group_members.called)
+
+    def test_setup_port_filters_sg_members_updates_only(self):
+        self.agent.security_groups_member_updated(['fake_sgid2'])
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.setup_port_filters(set(), set())
+        self.assertFalse(self.agent.sg_members_to_refresh)
+        self.firewall.update_security_group_members.assert_called_once_with(
+            'fake_sgid2', self.sg_members['fake_sgid2'])
+        self.assertFalse(self.agent.refresh_firewall.called)
+
+
 class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
     SecurityGroupAgentRpcTestCase):
 
@@ -1186,6 +1508,16 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
               'namespace': None},
              version=sg_rpc.SG_RPC_VERSION)])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [mock.call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+              'method': 'security_group_info_for_devices',
+              'namespace': None},
+             version=sg_rpc.SG_INFO_RPC_VERSION)])
+
 
 class FakeSGNotifierAPI(n_rpc.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):
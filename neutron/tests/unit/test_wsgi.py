@@ -602,6 +602,27 @@ class JSONDictSerializerTest(base.BaseTestCase):
 
         self.assertEqual(result, expected_json)
 
+    def test_json_streamed(self):
+        serializer = wsgi.JSONDictSerializer()
+        serializer.chunk_size = 10
+        items = [{'id': 'a' * 8}, {'id': 'b' * 8}, {'id': 'c' * 8}]
+        input_dict = {'servers': wsgi.StreamedList(iter(items)),
+                      'servers_links': []}
+        chunks = list(serializer.serialize_iter(input_dict))
+
+        # A chunk by item, larger than the chunk size, and the remainder
+        self.assertEqual(4, len(chunks))
+        self.assertEqual(
+            serializer.serialize({'servers': items, 'servers_links': []}),
+            ''.join(chunks))
+
+    def test_json_streamed_empty(self):
+        serializer = wsgi.JSONDictSerializer()
+        input_dict = {'servers': wsgi.StreamedList([])}
+        result = ''.join(serializer.serialize_iter(input_dict))
+
+        self.assertEqual('{"servers": []}', result)
+
 
 class TextDeserializerTest(base.BaseTestCase):
 
@@ -377,12 +377,37 @@ class ActionDispatcher(object):
         raise NotImplementedError()
 
 
+class StreamedList(object):
+    """A list of a response, produced while the response is serialized."""
+
+    def __init__(self, iterable):
+        self._iterable = iterable
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+
+def is_streamed(data):
+    return (isinstance(data, dict) and
+            any(isinstance(value, StreamedList) for value in data.values()))
+
+
 class DictSerializer(ActionDispatcher):
     """Default request body serialization."""
 
     def serialize(self, data, action='default'):
         return self.dispatch(data, action=action)
 
+    def serialize_iter(self, data, action='default'):
+        """Return an iterator on the chunks of the serialized data.
+
+        The streamed lists of the data are read at once, unless the
+        serializer supports streaming.
+        """
+        data = dict((key, list(value) if isinstance(value, StreamedList)
+                     else value) for key, value in data.iteritems())
+        return iter([self.serialize(data, action)])
+
     def default(self, data):
         return ""
 
@@ -390,11 +415,45 @@ class DictSerializer(ActionDispatcher):
 class JSONDictSerializer(DictSerializer):
     """Default JSON request body serialization."""
 
+    # Size over which the serialized items are sent as a chunk
+    chunk_size = 65536
+
     def default(self, data):
         def sanitizer(obj):
             return unicode(obj)
         return jsonutils.dumps(data, default=sanitizer)
 
+    def serialize_iter(self, data, action='default'):
+        if action != 'default':
+            return super(JSONDictSerializer, self).serialize_iter(data,
+                                                                  action)
+        return self._iter_chunks(data)
+
+    def _iter_chunks(self, data):
+        chunk = []
+        size = 0
+        separator = '{'
+        for key, value in data.iteritems():
+            if isinstance(value, StreamedList):
+                chunk.append('%s%s: [' % (separator, self.default(key)))
+                item_separator = ''
+                for item in value:
+                    item = self.default(item)
+                    chunk.append(item_separator + item)
+                    item_separator = ', '
+                    size += len(item)
+                    if size >= self.chunk_size:
+                        yield ''.join(chunk)
+                        chunk = []
+                        size = 0
+                chunk.append(']')
+            else:
+                chunk.append('%s%s: %s' % (separator, self.default(key),
+                                           self.default(value)))
+            separator = ', '
+        chunk.append('}' if separator == ', ' else '{}')
+        yield ''.join(chunk)
+
 
 class XMLDictSerializer(DictSerializer):
 